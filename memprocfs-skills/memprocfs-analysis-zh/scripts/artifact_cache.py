@@ -0,0 +1,216 @@
+'''
+从内存映像中提取的工件的持久化磁盘缓存。
+
+工件 (进程列表、句柄表、解析后的 /sys 表等) 存储在 SQLite 数据库中，
+以映像文件指纹及其他 MemProcFS 选项、收集器名称、收集器版本和可选键作为键。指纹根据文件大小、
+文件头和固定数量的采样块计算，因此即使映像非常大也很快，并且同一转储的副本指纹相同。
+提升收集器的版本会使其已缓存的条目失效。当缓存超过其大小上限时，
+最久未使用的条目会被淘汰。
+
+供 system_classification.py 和 list_process_handles.py 使用；也可被自定义脚本导入。
+'''
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'memprocfs-skill')
+
+# 已缓存工件总大小的默认上限 (512 MiB)。
+DEFAULT_MAX_SIZE = 0x20000000
+
+# 计算指纹时在整个映像中采样的块数。
+FINGERPRINT_SAMPLES = 64
+FINGERPRINT_BLOCK_SIZE = 0x1000
+FINGERPRINT_HEADER_SIZE = 0x10000
+
+# 不改变从映像读取内容的 MemProcFS 选项 (详细程度、控制台输出)；它们不计入缓存键。
+IGNORED_OPTIONS = ('-v', '-vv', '-vvv', '-printf', '-loglevel', '-userinteract')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS artifacts (
+    image TEXT NOT NULL,
+    collector TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (image, collector, key)
+);
+CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed);
+'''
+
+
+def device_path(vmm_args):
+    '''
+    返回通过 -device 传入的映像文件；如果设备不是本地文件则返回 None。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    for i, arg in enumerate(vmm_args[:-1]):
+        if arg.lower() == '-device' and os.path.isfile(vmm_args[i + 1]):
+            return vmm_args[i + 1]
+    return None
+
+
+def image_fingerprint(image_file, samples=FINGERPRINT_SAMPLES):
+    '''
+    返回映像文件的 SHA-256 指纹，根据文件大小、文件头以及
+    在文件中均匀分布的 `samples` 个块计算。
+
+    :param image_file: 内存映像的路径。
+    :param samples: 采样块数。
+    '''
+    size = os.path.getsize(image_file)
+    sha256 = hashlib.sha256(str(size).encode('ascii'))
+    with open(image_file, 'rb') as f:
+        sha256.update(f.read(FINGERPRINT_HEADER_SIZE))
+        if size > FINGERPRINT_HEADER_SIZE:
+            step = max(FINGERPRINT_BLOCK_SIZE, (size - FINGERPRINT_BLOCK_SIZE) // samples)
+            for offset in range(FINGERPRINT_HEADER_SIZE, size, step):
+                f.seek(offset)
+                sha256.update(f.read(FINGERPRINT_BLOCK_SIZE))
+            f.seek(max(0, size - FINGERPRINT_BLOCK_SIZE))
+            sha256.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return sha256.hexdigest()
+
+
+def vmm_options(vmm_args):
+    '''
+    返回除 -device 外会改变从映像读取内容的 MemProcFS 选项 (例如 -forensic、
+    -pagefile0、符号选项)，并进行规范化：选项名转为小写，选项按顺序排序。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :return: [选项, 值...] 列表组成的列表。
+    '''
+    options = []
+    for arg in vmm_args:
+        if arg.startswith('-') or not options:
+            options.append([arg.lower()])
+        else:
+            options[-1].append(arg)
+    return sorted(option for option in options if option[0] != '-device' and option[0] not in IGNORED_OPTIONS)
+
+
+def image_key(vmm_args):
+    '''
+    返回使用给定 VMM 参数提取的工件的键：映像文件的指纹，存在其他选项
+    (见 vmm_options()) 时再附加这些选项的摘要。如果映像不是本地文件，则返回 None。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    image_file = device_path(vmm_args)
+    if image_file is None:
+        return None
+    key = image_fingerprint(image_file)
+    options = vmm_options(vmm_args)
+    if options:
+        key += ':' + hashlib.sha256(json.dumps(options).encode('utf-8')).hexdigest()[:16]
+    return key
+
+
+class ArtifactCache:
+    '''
+    单个内存映像的工件缓存。值以 zlib 压缩的 JSON 形式存储，
+    因此 json.dump() 接受的任何内容都可以缓存。该对象可以在线程之间共享。
+    '''
+
+    def __init__(self, image, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        '''
+        :param image: 映像键，参见 image_key()。
+        :param cache_dir: 保存缓存数据库的目录。
+        :param max_size: 已缓存工件的最大总大小 (字节)。
+        '''
+        os.makedirs(cache_dir, exist_ok=True)
+        self.image = image
+        self.max_size = max_size
+        self.path = os.path.join(cache_dir, 'artifacts.sqlite')
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def get(self, collector, version, key=''):
+        '''
+        返回已缓存的工件；如果没有该版本的缓存则返回 None。
+
+        :param collector: 收集器名称。
+        :param version: 工件存储时必须使用的收集器版本。
+        :param key: 收集器内的可选键，例如 PID。
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT version, data FROM artifacts WHERE image = ? AND collector = ? AND key = ?',
+                                  (self.image, collector, key)).fetchone()
+            if row is None:
+                return None
+            if row[0] != str(version):
+                with self.db:
+                    self.db.execute('DELETE FROM artifacts WHERE image = ? AND collector = ? AND key = ?',
+                                    (self.image, collector, key))
+                return None
+            with self.db:
+                self.db.execute('UPDATE artifacts SET accessed = ? WHERE image = ? AND collector = ? AND key = ?',
+                                (time.time(), self.image, collector, key))
+        return json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    def put(self, collector, version, value, key=''):
+        '''
+        存储工件；如果缓存超过大小上限，则淘汰最久未使用的条目。
+
+        :param collector: 收集器名称。
+        :param version: 收集器版本。
+        :param value: 可 JSON 序列化的值。
+        :param key: 收集器内的可选键，例如 PID。
+        '''
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (self.image, collector, key, str(version), data, len(data), now, now))
+            self._evict()
+
+    def _evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+        if total <= self.max_size:
+            return
+        for image, collector, key, size in self.db.execute(
+                'SELECT image, collector, key, size FROM artifacts ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM artifacts WHERE image = ? AND collector = ? AND key = ?',
+                            (image, collector, key))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        '''
+        删除该映像的所有已缓存工件。
+        '''
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM artifacts WHERE image = ?', (self.image,))
+
+    def close(self):
+        self.db.close()
+
+
+def open_cache(vmm_args, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+    '''
+    返回 VMM 参数中映像的 ArtifactCache；如果映像不是本地文件 (例如实时内存)
+    或无法打开缓存，则返回 None。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param cache_dir: 保存缓存数据库的目录。
+    :param max_size: 已缓存工件的最大总大小 (字节)。
+    '''
+    try:
+        image = image_key(vmm_args)
+        if image is None:
+            return None
+        return ArtifactCache(image, cache_dir, max_size)
+    except (OSError, sqlite3.Error):
+        return None
@@ -0,0 +1,669 @@
+'''
+用于基准测试的 memprocfs 包的合成替代品。
+
+它基于确定性的生成数据实现了脚本所用的 memprocfs API 子集 (进程、虚拟和物理内存读取、PFN 数据库、
+PTE/VAD 映射、句柄、模块和 VFS)，因此无需内存映像或原生库即可测量脚本。
+所有内容都不会预先生成：进程在列出时创建，内存内容、句柄表和 VFS 文件在读取时
+生成，因此即使配置 10,000 个进程、每个进程 100 GB 的稀疏地址空间，
+开销也只取决于实际读取的内容。
+
+将此目录放在 Python 路径的最前面，即可针对它运行任何脚本，
+并通过 MEMPROCFS_SYNTHETIC 环境变量进行配置:
+
+    MEMPROCFS_SYNTHETIC=processes=10000,address_space=100g \\
+        PYTHONPATH=benchmarks python handle_table.py --counts -device synthetic
+'''
+
+import os
+import re
+import random
+import time
+import zlib
+from bisect import bisect_right
+
+FLAG_NOCACHE = 0x0001
+FLAG_ZEROPAD_ON_FAIL = 0x0002
+
+OPT_REFRESH_ALL = 0x2001ffff
+
+PAGE_SIZE = 0x1000
+
+# 生成内存和文件内容所用的随机块大小 (1 MiB)。
+PATTERN_SIZE = 0x100000
+
+# 写入每第 marker_every 个区域的起始处，使 YARA 扫描能够产生匹配。
+MARKER = b'MEMPROCFS-SYNTHETIC-MARKER'
+
+# 合成系统的默认形态；大小可使用 k/m/g/t 后缀。
+DEFAULTS = {
+    'processes': 200,           # number of processes
+    'regions': 32,              # committed memory regions per process
+    'region_size': 0x100000,    # average size of a committed region
+    'address_space': 0x1000000000,  # span the regions are spread over (64 GiB)
+    'handles': 200,             # handles per process
+    'modules': 24,              # modules per process
+    'connections': 2000,        # rows of /sys/net/netstat.txt
+    'services': 300,            # rows of /sys/services/services.txt
+    'drivers': 200,             # rows of /sys/drivers/drivers.txt
+    'users': 8,                 # rows of /sys/users/users.txt
+    'timeline_rows': 100000,    # rows of /forensic/timeline/timeline.csv
+    'physical_memory': 0x10000000,  # bytes of physical memory (256 MiB)
+    'marker_every': 16,         # plant MARKER in every n-th region; 0 disables it
+    'attribute_cost': 0,        # microseconds a path or command line read takes, like reading the PEB
+    'zero_pages': 0,            # percent of the committed pages that read as zeros
+    'churn': 0,                 # percent of the processes changed by each refresh, see Vmm.set_config()
+    'threads': 16,              # rows of /pid/<pid>/threads/threads.txt
+    'vfs_cost': 0,              # microseconds a /pid/ VFS read or listing takes
+    'shared_pages': 100,        # percent of the committed pages alike in every process, like mapped DLLs
+    'seed': 1,
+}
+
+_SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+_PROCESS_NAMES = ('svchost.exe', 'explorer.exe', 'chrome.exe', 'RuntimeBroker.exe', 'conhost.exe',
+                  'dllhost.exe', 'msedge.exe', 'taskhostw.exe', 'sihost.exe', 'w3wp.exe', 'sqlservr.exe',
+                  'powershell.exe', 'cmd.exe', 'notepad.exe', 'OneDrive.exe', 'SearchHost.exe')
+
+_SYSTEM_DLLS = ('ntdll.dll', 'kernel32.dll', 'KernelBase.dll', 'user32.dll', 'gdi32.dll', 'advapi32.dll',
+                'msvcrt.dll', 'sechost.dll', 'rpcrt4.dll', 'combase.dll', 'ole32.dll', 'shell32.dll',
+                'ws2_32.dll', 'crypt32.dll', 'bcrypt.dll', 'ucrtbase.dll')
+
+_HANDLE_TYPES = ('File', 'Key', 'Event', 'Mutant', 'Section', 'Thread', 'Process', 'Semaphore',
+                 'ALPC Port', 'Directory')
+
+
+def parse_options(text):
+    '''
+    解析 'key=value,...' 选项，例如 'processes=10000,address_space=100g'。
+    '''
+    options = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        key, _, value = item.partition('=')
+        if key not in DEFAULTS:
+            raise ValueError(f"unknown synthetic option '{key}'")
+        value = value.strip().lower()
+        scale = _SUFFIXES.get(value[-1:], 1)
+        options[key] = int(value[:-1] if scale > 1 else value, 0) * scale
+    return options
+
+
+def _options():
+    options = dict(DEFAULTS)
+    options.update(parse_options(os.environ.get('MEMPROCFS_SYNTHETIC', '')))
+    return options
+
+
+def _pattern(seed):
+    rng = random.Random(seed)
+    block = rng.getrandbits(PATTERN_SIZE * 8).to_bytes(PATTERN_SIZE, 'little')
+    return block + block
+
+
+def _fill(pattern, out, offset, address, size):
+    '''
+    将从 address 处看到的重复模式的 size 个字节复制到 out[offset:]。
+    '''
+    while size > 0:
+        start = address % PATTERN_SIZE
+        count = min(size, PATTERN_SIZE)
+        out[offset:offset + count] = pattern[start:start + count]
+        offset += count
+        address += count
+        size -= count
+
+
+class errors:
+    class VmmError(Exception):
+        pass
+
+
+class VmmProcessMemory:
+    def __init__(self, process):
+        self.process = process
+
+    def read(self, address, size, flags=0):
+        '''
+        读取进程内存。已提交区域之外的字节在使用 FLAG_ZEROPAD_ON_FAIL 时读取为零，
+        否则引发 VmmError。
+        '''
+        out = bytearray(size)
+        end = address + size
+        covered = 0
+        vmm = self.process.vmm
+        marker_every = vmm.options['marker_every']
+        regions = self.process.regions()
+        index = max(0, bisect_right(self.process.bases, address) - 1)
+        for index in range(index, len(regions)):
+            base, length = regions[index]
+            if base >= end:
+                break
+            low, high = max(address, base), min(end, base + length)
+            if low >= high:
+                continue
+            _fill(vmm.pattern, out, low - address, low + self.process.pid * PAGE_SIZE, high - low)
+            if vmm.options['shared_pages'] < 100:
+                self._unique_pages(out, address, low, high)
+            if vmm.options['zero_pages']:
+                self._zero_pages(out, address, low, high)
+            if marker_every and index % marker_every == 0 and low <= base < high:
+                marker = MARKER[:high - base]
+                out[base - address:base - address + len(marker)] = marker
+            covered += high - low
+        if covered < size and not flags & FLAG_ZEROPAD_ON_FAIL:
+            raise errors.VmmError(f"failed to read {size} bytes at {address:#x}")
+        return bytes(out)
+
+    def _unique_pages(self, out, address, low, high):
+        '''
+        在 [low, high) 中未被选为共享的页面的最后几个字节写入 PID 和页号，
+        使其内容只出现在本进程中。其余每个页面都是某个模式页面的副本。
+        '''
+        pid = self.process.pid
+        shared_pages = self.process.vmm.options['shared_pages']
+        for page in range(low // PAGE_SIZE, (high + PAGE_SIZE - 1) // PAGE_SIZE):
+            if zlib.crc32(page.to_bytes(8, 'little'), pid ^ 0xffffffff) % 100 >= shared_pages:
+                stamp_address = (page + 1) * PAGE_SIZE - 16
+                stamp = pid.to_bytes(8, 'little') + page.to_bytes(8, 'little')
+                start, end = max(low, stamp_address), min(high, stamp_address + 16)
+                if start < end:
+                    out[start - address:end - address] = stamp[start - stamp_address:end - stamp_address]
+
+    def _zero_pages(self, out, address, low, high):
+        '''
+        将 [low, high) 中按 PID 和页面的哈希选中为零的页面清零。
+        '''
+        zero_pages = self.process.vmm.options['zero_pages']
+        for page in range(low // PAGE_SIZE, (high + PAGE_SIZE - 1) // PAGE_SIZE):
+            if zlib.crc32(page.to_bytes(8, 'little'), self.process.pid) % 100 < zero_pages:
+                start, end = max(low, page * PAGE_SIZE), min(high, (page + 1) * PAGE_SIZE)
+                out[start - address:end - address] = bytes(end - start)
+
+
+class VmmProcessMaps:
+    def __init__(self, process):
+        self.process = process
+
+    def pte(self):
+        return [{'va': base, 'size': size, 'pages': size // PAGE_SIZE, 'text': ''}
+                for base, size in self.process.regions()]
+
+    def vad(self):
+        # 保留范围是已提交大小的两倍，类似于部分提交的堆
+        return [{'start': base, 'end': base + 2 * size - 1} for base, size in self.process.regions()]
+
+
+class VmmProcessSearch:
+    def __init__(self, process):
+        self.process = process
+
+    def yara(self, rules):
+        '''
+        每个植入的标记报告一个匹配；规则本身不会被求值。
+        '''
+        marker_every = self.process.vmm.options['marker_every']
+        if not marker_every:
+            return []
+        return [{'rule': 'synthetic_marker', 'offset': base, 'data': MARKER}
+                for index, (base, _) in enumerate(self.process.regions()) if index % marker_every == 0]
+
+
+class VmmMemory:
+    '''
+    物理内存：一个低于 640 KiB 的低端范围和一个从 1 MiB 开始的范围。
+    MARKER 植入在每第 marker_every 个 MiB 的起始处。
+    '''
+
+    def __init__(self, vmm):
+        self.vmm = vmm
+        size = vmm.options['physical_memory']
+        self.ranges = [(0x1000, 0x9f000), (0x100000, size - 0x100000)] if size > 0x200000 else [(0, size)]
+
+    def read(self, address, size, flags=0):
+        '''
+        读取物理内存。内存映射之外的地址在使用 FLAG_ZEROPAD_ON_FAIL 时读取为零，
+        否则引发 VmmError。
+        '''
+        out = bytearray(size)
+        end = address + size
+        covered = 0
+        vmm = self.vmm
+        step = vmm.options['marker_every'] * 0x100000
+        for base, length in self.ranges:
+            low, high = max(address, base), min(end, base + length)
+            if low >= high:
+                continue
+            _fill(vmm.pattern, out, low - address, low, high - low)
+            covered += high - low
+            if step:
+                for marker_address in range((low + step - 1) // step * step, high, step):
+                    marker = MARKER[:high - marker_address]
+                    out[marker_address - address:marker_address - address + len(marker)] = marker
+        if covered < size and not flags & FLAG_ZEROPAD_ON_FAIL:
+            raise errors.VmmError(f"failed to read {size} bytes at {address:#x}")
+        return bytes(out)
+
+
+class VmmMaps:
+    def __init__(self, vmm):
+        self.vmm = vmm
+
+    def memmap(self):
+        return [{'pa': base, 'cb': size} for base, size in self.vmm.memory.ranges]
+
+    def pfn(self, pfns, extended=False):
+        '''
+        返回页帧号的 PFN 数据库条目；每四个页帧中有一个不属于任何进程。
+        '''
+        processes = self.vmm.options['processes']
+        return [{'pfn': pfn, 'pid': self.vmm.pid_at(pfn // 4 % processes) if pfn % 4 != 3 else 0,
+                 'va': 0x10000 + pfn % 0x10000 * PAGE_SIZE if pfn % 4 != 3 else 0, 'tp': 'Active'}
+                for pfn in pfns]
+
+
+class VmmHandle:
+    __slots__ = ('handle_value', 'type', 'name')
+
+    def __init__(self, handle_value, handle_type, name):
+        self.handle_value = handle_value
+        self.type = handle_type
+        self.name = name
+
+
+class VmmModule:
+    def __init__(self, name, fullname, base, image_size):
+        self.name = name
+        self.fullname = fullname
+        self.base = base
+        self.size = image_size
+        self.image_size = image_size
+        self.file_size = image_size
+
+
+class VmmProcess:
+    def __init__(self, vmm, pid, ppid, name):
+        self.vmm = vmm
+        self.pid = pid
+        self.pid_parent = ppid
+        self.name = name
+        self.memory = VmmProcessMemory(self)
+        self.maps = VmmProcessMaps(self)
+        self.search = VmmProcessSearch(self)
+        self._regions = None
+        self.bases = None
+
+    def _read_attribute(self):
+        cost = self.vmm.options['attribute_cost']
+        if cost:
+            time.sleep(cost / 1000000)
+
+    @property
+    def path(self):
+        self._read_attribute()
+        return f"\\Device\\HarddiskVolume3\\Windows\\System32\\{self.name}"
+
+    @property
+    def fullname(self):
+        return self.path
+
+    @property
+    def cmdline(self):
+        self._read_attribute()
+        return f"C:\\Windows\\System32\\{self.name}"
+
+    @property
+    def command_line(self):
+        return self.cmdline
+
+    def regions(self):
+        '''
+        返回已提交的 (base, size) 区域，它们分布在地址空间中，彼此之间有空洞。
+        '''
+        if self._regions is None:
+            options = self.vmm.options
+            rng = random.Random(options['seed'] * 1000003 + self.pid)
+            count = options['regions']
+            slot = max(PAGE_SIZE, options['address_space'] // max(1, count)) // PAGE_SIZE * PAGE_SIZE
+            average = max(PAGE_SIZE, options['region_size'])
+            regions = []
+            for i in range(count):
+                size = rng.randint(average // 2, average * 3 // 2) // PAGE_SIZE * PAGE_SIZE or PAGE_SIZE
+                size = min(size, slot)
+                base = 0x10000 + i * slot + rng.randint(0, (slot - size) // PAGE_SIZE) * PAGE_SIZE
+                regions.append((base, size))
+            self._regions = regions
+            self.bases = [base for base, _ in regions]
+        return self._regions
+
+    def handle_all(self):
+        rng = random.Random(self.vmm.options['seed'] * 7919 + self.pid)
+        handles = []
+        for i in range(self.vmm.options['handles']):
+            handle_type = _HANDLE_TYPES[rng.randrange(len(_HANDLE_TYPES))]
+            handles.append(VmmHandle(4 * (i + 1), handle_type, _handle_name(handle_type, rng.randrange(2000))))
+        # 刷新造成的每次变化都会多打开一个句柄
+        for i in range(self.vmm.changes(self.pid)):
+            handles.append(VmmHandle(4 * (len(handles) + 1), 'Event', f"\\BaseNamedObjects\\Refresh{i}"))
+        return handles
+
+    def module_all(self):
+        regions = self.regions()
+        names = [self.name] + list(_SYSTEM_DLLS)
+        names += [f"module{(self.pid + i) % 500}.dll" for i in range(max(0, self.vmm.options['modules'] - len(names)))]
+        modules = []
+        for i, name in enumerate(names[:self.vmm.options['modules']]):
+            base = regions[i % len(regions)][0] if regions else 0
+            modules.append(VmmModule(name, f"C:\\Windows\\System32\\{name}", base, _image_size(name)))
+        changes = self.vmm.changes(self.pid)
+        if changes:
+            # 每次变化都会替换它，类似于被重新加载的插件 DLL
+            name = f"refresh{changes}.dll"
+            modules.append(VmmModule(name, f"C:\\Windows\\Temp\\{name}", regions[-1][0], _image_size(name)))
+        return modules
+
+
+def _handle_name(handle_type, n):
+    if handle_type == 'File':
+        return f"\\Device\\HarddiskVolume3\\Windows\\System32\\file{n}.dat"
+    if handle_type == 'Key':
+        return f"\\REGISTRY\\MACHINE\\SOFTWARE\\Vendor\\Key{n}"
+    if handle_type in ('Mutant', 'Event', 'Semaphore', 'Section'):
+        return f"\\BaseNamedObjects\\{handle_type}{n}"
+    if handle_type in ('Thread', 'Process'):
+        return ''
+    return f"\\RPC Control\\Object{n}"
+
+
+def _image_size(name):
+    return (0x10 + zlib.crc32(name.lower().encode()) % 0x100) * PAGE_SIZE
+
+
+class _RowFile:
+    '''
+    由固定宽度的行组成、在切片时生成的文本文件，因此可以读取任意大小的文件
+    而无需将其保存在内存中。行内容每 ROW_POOL 行重复一次，
+    因此与读取方相比，生成它们的开销很小。
+    '''
+
+    ROW_POOL = 4096
+
+    def __init__(self, header, row, count, width):
+        self.header = (header + '\n').encode('utf-8')
+        self.count = count
+        self.width = width
+        self.rows = [row(i)[:width - 1].ljust(width - 1).encode('utf-8') + b'\n'
+                     for i in range(min(count, self.ROW_POOL))]
+
+    def __len__(self):
+        return len(self.header) + self.count * self.width
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        if start >= stop:
+            return b''
+        header = len(self.header)
+        first = max(0, (start - header) // self.width)
+        last = min(self.count, (stop - header + self.width - 1) // self.width)
+        rows = b''.join(self.rows[i % self.ROW_POOL] for i in range(first, last))
+        if start < header:
+            return (self.header + rows)[start:stop]
+        base = header + first * self.width
+        return rows[start - base:stop - base]
+
+
+class VmmVfs:
+    '''
+    生成的 VFS: /sys 表、FindEvil、时间线、每个模块的 pefile.dll 文件，
+    以及每个进程的 time-create.txt、内存映射、线程、模块、句柄和令牌文件。
+    '''
+
+    _MODULE_FILE = re.compile(r'^/pid/(\d+)/modules/([^/]+)/pefile\.dll$')
+    _CREATE_TIME_FILE = re.compile(r'^/pid/(\d+)/time-create\.txt$')
+    _PROCESS_DIR = re.compile(r'^/pid/(\d+)/(modules|handles|token)/$')
+    _PROCESS_FILE = re.compile(r'^/pid/(\d+)/(memmap/vad\.txt|threads/threads\.txt|token/[a-z]+\.txt)$')
+    _TOKEN_FILES = ('user.txt', 'sid.txt', 'integrity.txt')
+
+    # /pid/<pid>/handles/handles.txt 中一行的宽度；该文件会被列出，但不会生成。
+    HANDLE_ROW_WIDTH = 160
+
+    def __init__(self, vmm):
+        self.vmm = vmm
+        self._files = {}
+        self._generators = {
+            '/sys/sysinfo/sysinfo.txt': self._sysinfo,
+            '/sys/net/netstat.txt': self._netstat,
+            '/sys/users/users.txt': self._users,
+            '/sys/services/services.txt': self._services,
+            '/sys/drivers/drivers.txt': self._drivers,
+            '/forensic/findevil/summary.txt': self._findevil,
+            '/forensic/findevil/findevil.txt': self._findevil_table,
+            '/forensic/timeline/timeline.csv': self._timeline,
+        }
+
+    def _file(self, path):
+        data = self._files.get(path)
+        if data is None:
+            generator = self._generators.get(path)
+            if generator:
+                data = generator()
+                data = self._files[path] = data.encode('utf-8') if isinstance(data, str) else data
+            else:
+                m = self._CREATE_TIME_FILE.match(path)
+                if m:
+                    return self._create_time(int(m.group(1)))
+                m = self._PROCESS_FILE.match(path)
+                if m:
+                    return self._process_file(int(m.group(1)), m.group(2))
+                m = self._MODULE_FILE.match(path)
+                if not m:
+                    raise errors.VmmError(f"file not found: {path}")
+                size = _image_size(m.group(2))
+                data = bytearray(size)
+                _fill(self.vmm.pattern, data, 0, zlib.crc32(m.group(2).lower().encode()), size)
+                data = bytes(data)
+        return data
+
+    def _read_cost(self, path):
+        cost = self.vmm.options['vfs_cost']
+        if cost and path.startswith('/pid/'):
+            time.sleep(cost / 1000000)
+
+    def read(self, path, size=0x100000, offset=0):
+        self._read_cost(path)
+        return self._file(path)[offset:offset + size]
+
+    def readfile(self, path):
+        self._read_cost(path)
+        return bytes(self._file(path)[:])
+
+    def list(self, path):
+        self._read_cost(path)
+        path = path.rstrip('/') + '/'
+        entries = {}
+        for name in self._generators:
+            if name.startswith(path) and '/' not in name[len(path):]:
+                entries[name[len(path):]] = {'name': name[len(path):], 'size': len(self._file(name)),
+                                             'f_isdir': False}
+        m = self._MODULE_FILE.match(path + 'pefile.dll')
+        if m:
+            entries['pefile.dll'] = {'name': 'pefile.dll', 'size': _image_size(m.group(2)), 'f_isdir': False}
+        m = self._PROCESS_DIR.match(path)
+        if m:
+            process = self.vmm.process(int(m.group(1)))
+            if m.group(2) == 'handles':
+                size = (2 + self.vmm.options['handles'] + self.vmm.changes(process.pid)) * self.HANDLE_ROW_WIDTH
+                entries['handles.txt'] = {'name': 'handles.txt', 'size': size, 'f_isdir': False}
+            elif m.group(2) == 'token':
+                for name in self._TOKEN_FILES:
+                    size = len(self._process_file(process.pid, 'token/' + name))
+                    entries[name] = {'name': name, 'size': size, 'f_isdir': False}
+            else:
+                for module in process.module_all():
+                    entries[module.name] = {'name': module.name, 'size': 0, 'f_isdir': True}
+        return entries
+
+    def _create_time(self, pid):
+        index = self.vmm._index_of(pid)
+        if index is None:
+            raise errors.VmmError(f"process not found: {pid}")
+        t = 8 * 3600 + index
+        return f"2024-01-01 {t // 3600 % 24:02d}:{t // 60 % 60:02d}:{t % 60:02d} UTC\n".encode()
+
+    def _process_file(self, pid, name):
+        '''
+        生成进程的内存映射、线程表或令牌文件。
+        '''
+        process = self.vmm.process(pid)
+        if name == 'memmap/vad.txt':
+            rows = []
+            for i, (base, size) in enumerate(process.regions()):
+                image = i % 4 == 0
+                rows.append(f"{i:04x} {base:016x} {base + 2 * size - 1:016x} {'Image' if image else 'Private':<8} "
+                            f"{'r-x' if image else 'rw-'}  {size // PAGE_SIZE:8d} "
+                            f"{f'C:/Windows/System32/module{i}.dll' if image else ''}")
+            return self._table('   # Start            End              Type     Prot     Pages Description',
+                               rows).encode()
+        if name == 'threads/threads.txt':
+            rows = [f"{i:04x} {pid * 16 + i * 4:6d} {pid:6d} {'Running' if i == 0 else 'Waiting':<8} {8 + i % 8:8d} "
+                    f"{process.regions()[i % len(process.regions())][0]:016x}"
+                    for i in range(self.vmm.options['threads'])]
+            return self._table('   #    TID    PID State    Priority StartAddress', rows).encode()
+        index = self.vmm._index_of(pid)
+        if name == 'token/user.txt':
+            return f"{'SYSTEM' if index == 0 else f'user{index % 8}'}\n".encode()
+        if name == 'token/sid.txt':
+            return f"{'S-1-5-18' if index == 0 else f'S-1-5-21-1000-{1000 + index % 8}'}\n".encode()
+        if name == 'token/integrity.txt':
+            return f"{'system' if index == 0 else 'medium'}\n".encode()
+        raise errors.VmmError(f"file not found: /pid/{pid}/{name}")
+
+    def _table(self, header, rows):
+        return '\n'.join([header, '-' * len(header)] + rows) + '\n'
+
+    def _sysinfo(self):
+        options = self.vmm.options
+        return f"Synthetic system\nProcesses: {options['processes']}\nSeed: {options['seed']}\n"
+
+    def _netstat(self):
+        rows = []
+        for i in range(self.vmm.options['connections']):
+            pid = self.vmm.pid_at(i % self.vmm.options['processes'])
+            rows.append(f"{i:04x} {pid:6d} TCPv4  ESTABLISHED  10.0.{i // 250 % 250}.{i % 250}:{40000 + i % 20000:<16d}  "
+                        f"52.1.{i % 7}.{i % 200}:443           proc{pid}.exe         2024-01-01 10:00:00 UTC  "
+                        f"0xffffa000{i:08x}  C:\\Windows\\System32\\proc{pid}.exe")
+        return self._table('   #    PID Proto  State        Src                     Dst                     '
+                           'Process              Time                     Object Address      Process Path', rows)
+
+    def _users(self):
+        rows = [f"{i:04x} user{i:<28d} S-1-5-21-1000-{1000 + i}" for i in range(self.vmm.options['users'])]
+        return self._table('   # Username                         SID', rows)
+
+    def _services(self):
+        rows = [f"{i:04x} {self.vmm.pid_at(i % self.vmm.options['processes']):6d} AUTO_START   RUNNING  "
+                f"OWN_PROCESS  0xffffb000{i:08x} svc{i:<17d} LocalSystem  C:\\Windows\\System32\\svc{i}.exe"
+                for i in range(self.vmm.options['services'])]
+        return self._table('   #    PID Start Type   State    Type         Obj Address         '
+                           'Name                  User         Image Path', rows)
+
+    def _drivers(self):
+        rows = [f"{i:04x} ffff8000{i:08x}   drv{i:<14d} {0x1000 * (i + 1):8d} fffff800{i:08x}   "
+                f"fffff801{i:08x}   \\Device\\drv{i:<5d} \\SystemRoot\\system32\\drivers\\drv{i}.sys"
+                for i in range(self.vmm.options['drivers'])]
+        return self._table('   # Object Address     Driver              Size Start              End                '
+                           'Device Name     Path', rows)
+
+    def _findevil(self):
+        return 'FindEvil: no findings (synthetic)\n'
+
+    def _findevil_table(self):
+        # 每第 16 个进程有一个发现
+        rows = []
+        for n, i in enumerate(range(1, self.vmm.options['processes'], 16)):
+            process = self.vmm.process(self.vmm.pid_at(i))
+            rows.append(f"{n:04x} {process.pid:6d} {process.name:<18} PE_INJECT {process.regions()[0][0]:016x} "
+                        f"Injected PE in private memory")
+        return self._table('   #    PID Process            Type      Address          Description', rows)
+
+    def _timeline(self):
+        types = ('NTFS', 'PROC', 'THREAD', 'NET', 'REG', 'TASK')
+
+        def row(i):
+            # 时间分散，使各行并非已按时间排序
+            t = i * 7919 % 86400
+            pid = self.vmm.pid_at(i % self.vmm.options['processes'])
+            return (f"2024-01-01 {t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d} UTC,{types[i % len(types)]},MOD,"
+                    f"{pid},0,{i:#x},\\Windows\\Temp\\file{i}.tmp,")
+        return _RowFile('Time,Type,Action,PID,Value32,Value64,Text,Pad', row, self.vmm.options['timeline_rows'], 96)
+
+
+class Vmm:
+    def __init__(self, args=None):
+        self.args = list(args or [])
+        self.options = _options()
+        self.pattern = _pattern(self.options['seed'])
+        self.vfs = VmmVfs(self)
+        self.fs = self.vfs
+        self.memory = VmmMemory(self)
+        self.maps = VmmMaps(self)
+        self._processes = None
+        self.refreshes = 0
+
+    def set_config(self, option, value):
+        '''
+        使用 OPT_REFRESH_ALL 时，模拟实时目标上时间的流逝:
+        每次刷新会改变 churn% 的进程 (多一个句柄并替换一个模块)，
+        并启动 churn / 10 % 的新进程。
+        '''
+        if option == OPT_REFRESH_ALL:
+            self.refreshes += 1
+            self._processes = None
+
+    def changes(self, pid):
+        '''
+        返回有多少次刷新改变了某个进程；refreshes * churn 加上每个进程的相位
+        越过 100 的倍数时，该进程即被改变。
+        '''
+        churn = self.options['churn']
+        if not churn or not self.refreshes:
+            return 0
+        return (self.refreshes * churn + zlib.crc32(pid.to_bytes(4, 'little')) % 100) // 100
+
+    def process_count(self):
+        return self.options['processes'] + self.refreshes * self.options['processes'] * self.options['churn'] // 1000
+
+    def pid_at(self, index):
+        return 4 if index == 0 else 4 * (index + 100)
+
+    def _index_of(self, pid):
+        index = 0 if pid == 4 else pid // 4 - 100
+        if pid % 4 or not 0 <= index < self.process_count() or self.pid_at(index) != pid:
+            return None
+        return index
+
+    def _create_process(self, i):
+        if i == 0:
+            return VmmProcess(self, self.pid_at(i), 0, 'System')
+        return VmmProcess(self, self.pid_at(i), self.pid_at((i - 1) // 8), _PROCESS_NAMES[i % len(_PROCESS_NAMES)])
+
+    def pid_list(self):
+        return [self.pid_at(i) for i in range(self.process_count())]
+
+    def process_all(self):
+        if self._processes is None:
+            self._processes = [self._create_process(i) for i in range(self.process_count())]
+        return list(self._processes)
+
+    def process(self, pid_or_name):
+        if isinstance(pid_or_name, int):
+            index = self._index_of(pid_or_name)
+            if index is not None:
+                if self._processes is not None:
+                    return self._processes[index]
+                return self._create_process(index)
+        else:
+            for process in self.process_all():
+                if process.name.lower() == str(pid_or_name).lower():
+                    return process
+        raise errors.VmmError(f"process not found: {pid_or_name}")
+
+    def close(self):
+        pass
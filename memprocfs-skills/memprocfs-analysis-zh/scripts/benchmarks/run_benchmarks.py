@@ -0,0 +1,599 @@
+'''
+脚本热点路径的基准测试，针对本目录中的合成 memprocfs 替代品离线运行
+(参见 memprocfs.py)。
+
+每个基准测试都在独立的子进程中运行，因此其峰值 RSS 是单独测量的。
+经过一轮不计时的预热后，基准测试会重复执行，并报告最小和中位延迟、
+吞吐量以及峰值 RSS。结果可以保存为 JSON 并与之前的运行进行比较；
+当某个基准测试比基线变慢或内存占用增加超过阈值时，退出状态为 1。
+
+用法: python run_benchmarks.py [--scale quick|full] [--only <名称,...>] [--repeat <n>]
+           [--output <results.json>] [--compare <baseline.json>] [--threshold <百分比>]
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# 合成的 memprocfs 必须遮蔽真实的包，脚本作为同级模块导入。
+sys.path[:0] = [BENCHMARK_DIR, SCRIPTS_DIR]
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 20
+
+# 合成系统的形态，通过 MEMPROCFS_SYNTHETIC 传递给 memprocfs.py。
+SCALES = {
+    'quick': 'processes=200',
+    'full': 'processes=10000,regions=64,address_space=100g,connections=50000,services=2000,'
+            'drivers=1000,timeline_rows=1000000',
+}
+
+YARA_RULE = 'rule synthetic_marker { strings: $marker = "MEMPROCFS-SYNTHETIC-MARKER" condition: $marker }\n'
+
+BENCHMARKS = {}
+
+
+class Skipped(Exception):
+    pass
+
+
+def benchmark(name, unit):
+    '''
+    注册基准测试的装饰器。该函数接收 Vmm 和一个临时目录，
+    并返回其处理的单位数。
+
+    :param name: 基准测试名称。
+    :param unit: 吞吐量的单位，例如 'bytes' 或 'handles'。
+    '''
+    def decorator(func):
+        BENCHMARKS[name] = (func, unit)
+        return func
+    return decorator
+
+
+@benchmark('dump_process_memory', 'bytes')
+def bench_dump_process_memory(vmm, workdir):
+    from dump_process_memory import write_process_dump
+    return write_process_dump(vmm.process_all()[1], os.path.join(workdir, 'process.bin'))
+
+
+@benchmark('dump_process_memory_batch', 'bytes')
+def bench_dump_process_memory_batch(vmm, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from dump_process_memory import DEFAULT_THREADS, write_process_dump
+    written = 0
+    with ThreadPoolExecutor(max_workers=DEFAULT_THREADS) as pool:
+        for process in vmm.process_all()[1:9]:
+            written += write_process_dump(process, os.path.join(workdir, f"{process.pid}.bin"), pool=pool)
+    return written
+
+
+@benchmark('compressed_dump_write', 'bytes')
+def bench_compressed_dump_write(vmm, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from compressed_dump import write_compressed_dump
+    from dump_process_memory import DEFAULT_THREADS
+    # 大部分为零页，与真实的地址空间相似
+    vmm.options['zero_pages'] = 75
+    written = 0
+    with ThreadPoolExecutor(max_workers=DEFAULT_THREADS) as pool:
+        for process in vmm.process_all()[1:9]:
+            written += write_compressed_dump(process, os.path.join(workdir, f"{process.pid}.cdmp"), pool=pool)[0]
+    return written
+
+
+@benchmark('compressed_dump_read', 'reads')
+def bench_compressed_dump_read(vmm, workdir):
+    import random
+    from compressed_dump import CompressedDump, write_compressed_dump
+    dump_file = os.path.join(workdir, 'process.cdmp')
+    if not os.path.exists(dump_file):
+        # 在预热轮中只写入一次；计时轮只测量随机读取
+        vmm.options['zero_pages'] = 75
+        write_compressed_dump(vmm.process_all()[1], dump_file)
+    rng = random.Random(1)
+    with CompressedDump(dump_file) as dump:
+        regions = dump.regions()
+        for _ in range(10000):
+            base, size = regions[rng.randrange(len(regions))]
+            dump.read(base + rng.randrange(size) // 0x1000 * 0x1000, 0x1000)
+    return 10000
+
+
+@benchmark('yara_scan_chunked', 'bytes')
+def bench_yara_scan_chunked(vmm, workdir):
+    from yara_rules import load_rules, scan_process
+    rule_file = os.path.join(workdir, 'marker.yara')
+    with open(rule_file, 'w') as f:
+        f.write(YARA_RULE)
+    rules = load_rules(rule_file, os.path.join(workdir, 'yara-cache'))
+    if rules is None:
+        raise Skipped('yara-python is not installed')
+    stats = {}
+    matches = sum(1 for _ in scan_process(vmm.process_all()[1], rules, stats=stats))
+    if not matches:
+        raise RuntimeError('no synthetic markers found')
+    return stats['bytes_scanned']
+
+
+@benchmark('region_hashes_build', 'bytes')
+def bench_region_hashes_build(vmm, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from region_hashes import DEFAULT_THREADS, KnownGoodSet, iter_process_digests
+    known = KnownGoodSet()
+    hashed = 0
+    with ThreadPoolExecutor(max_workers=DEFAULT_THREADS) as pool:
+        for process in vmm.process_all()[1:9]:
+            for digests in iter_process_digests(process, known.hasher, pool):
+                known.update(digests)
+                hashed += len(digests) * 0x1000
+    return hashed
+
+
+@benchmark('yara_scan_known_good', 'bytes')
+def bench_yara_scan_known_good(vmm, workdir):
+    from region_hashes import KnownGoodSet, iter_process_digests
+    from yara_rules import load_rules, scan_process
+    # 大部分页面为共享映像页面或零页，与真实的地址空间相似
+    vmm.options['shared_pages'] = 60
+    vmm.options['zero_pages'] = 10
+    set_file = os.path.join(workdir, 'baseline.hashes')
+    if not os.path.exists(set_file):
+        # 在预热轮中从其他进程只构建一次；计时轮只测量过滤后的扫描
+        known = KnownGoodSet()
+        for process in vmm.process_all()[2:10]:
+            for digests in iter_process_digests(process, known.hasher):
+                known.update(digests)
+        known.save(set_file)
+    rule_file = os.path.join(workdir, 'marker.yara')
+    with open(rule_file, 'w') as f:
+        f.write(YARA_RULE)
+    rules = load_rules(rule_file, os.path.join(workdir, 'yara-cache'))
+    if rules is None:
+        raise Skipped('yara-python is not installed')
+    stats = {}
+    for _ in scan_process(vmm.process_all()[1], rules, stats=stats, known=KnownGoodSet.load(set_file)):
+        pass
+    if not stats.get('bytes_skipped'):
+        raise RuntimeError('no known-good pages skipped')
+    # 与 yara_scan_chunked 一样，按扫描覆盖的进程字节数计数
+    return stats['bytes_scanned'] + stats['bytes_skipped']
+
+
+@benchmark('list_process_handles', 'handles')
+def bench_list_process_handles(vmm, workdir):
+    from list_process_handles import collect_process_handles
+    return sum(len(collect_process_handles(vmm, process.pid)['handles']) for process in vmm.process_all()[:50])
+
+
+def handle_records(vmm):
+    from list_process_handles import collect_process_handles, handle_records
+    return [record for process in vmm.process_all()[:50]
+            for record in handle_records(collect_process_handles(vmm, process.pid))]
+
+
+@benchmark('result_writers_text', 'records')
+def bench_result_writers_text(vmm, workdir):
+    from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+    from result_writers import open_writer
+    records = handle_records(vmm)
+    for fmt in ('table', 'jsonl', 'csv'):
+        with open_writer(fmt, os.path.join(workdir, f"handles.{fmt}"), HANDLE_FIELDS, HANDLE_TYPES) as out:
+            out.write_many(records)
+    return 3 * len(records)
+
+
+@benchmark('result_writers_arrow', 'records')
+def bench_result_writers_arrow(vmm, workdir):
+    from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+    from result_writers import open_writer, pyarrow
+    if pyarrow is None:
+        raise Skipped('pyarrow is not installed')
+    records = handle_records(vmm)
+    with open_writer('arrow', os.path.join(workdir, 'handles.arrow'), HANDLE_FIELDS, HANDLE_TYPES) as out:
+        out.write_many(records)
+    return len(records)
+
+
+@benchmark('handle_table', 'handles')
+def bench_handle_table(vmm, workdir):
+    from handle_table import harvest_handles
+    table, errors = harvest_handles(vmm)
+    table.find_by_prefix('\\BaseNamedObjects\\')
+    return len(table)
+
+
+@benchmark('process_tree', 'processes')
+def bench_process_tree(vmm, workdir):
+    from process_tree import collect_process_graph
+    graph = collect_process_graph(vmm)
+    graph.spawned_by('explorer.exe')
+    graph.suspicious()
+    graph.to_dict()
+    return len(graph)
+
+
+@benchmark('lazy_processes', 'processes')
+def bench_lazy_processes(vmm, workdir):
+    from lazy_processes import LazyProcessTable
+    # system_classification.py 首屏之前的工作
+    table = LazyProcessTable(vmm)
+    for process in table.first(10):
+        process.name, process.ppid
+    return len(table)
+
+
+@benchmark('dump_modules', 'modules')
+def bench_dump_modules(vmm, workdir):
+    from dump_modules import dump_modules
+    output_dir = os.path.join(workdir, 'modules')
+    shutil.rmtree(output_dir, ignore_errors=True)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        dump_modules('all', output_dir, ['-device', 'synthetic'])
+    with open(os.path.join(output_dir, 'manifest.json')) as f:
+        return len(json.load(f)['references'])
+
+
+@benchmark('system_classification', 'rows')
+def bench_system_classification(vmm, workdir):
+    from system_classification import run_collectors
+    results, stages = run_collectors(vmm)
+    failed = [name for name, stage in stages.items() if stage['status'] != 'ok']
+    if failed:
+        raise RuntimeError(f"collectors failed: {', '.join(failed)}")
+    return sum(value['count'] if isinstance(value, dict) and 'count' in value else 1 for value in results.values())
+
+
+@benchmark('scan_physical_memory', 'bytes')
+def bench_scan_physical_memory(vmm, workdir):
+    from concurrent.futures import ProcessPoolExecutor
+    from scan_physical_memory import (DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, _init_worker, iter_batches,
+                                      iter_dump_hits)
+    import memprocfs
+    dump_file = os.path.join(workdir, 'physical.raw')
+    ranges = [(0, vmm.options['physical_memory'])]
+    if not os.path.exists(dump_file):
+        # 在预热轮中只写入一次；计时轮只测量扫描
+        with open(dump_file, 'wb') as f:
+            for start, end, _ in iter_batches(ranges, DEFAULT_BATCH_SIZE, 0):
+                f.write(vmm.memory.read(start, end - start, memprocfs.FLAG_ZEROPAD_ON_FAIL))
+    literals = [('string', memprocfs.MARKER), ('string', b'mimikatz'), ('wide', 'mimikatz'.encode('utf-16-le'))]
+    with ProcessPoolExecutor(max_workers=DEFAULT_WORKERS, initializer=_init_worker,
+                             initargs=(None, None, literals, dump_file)) as pool:
+        hits = sum(len(batch_hits) for _, batch_hits in iter_dump_hits(pool, list(iter_batches(ranges))))
+    if not hits:
+        raise RuntimeError('no synthetic markers found')
+    return ranges[0][1]
+
+
+@benchmark('sys_parsers_netstat', 'rows')
+def bench_sys_parsers_netstat(vmm, workdir):
+    from sys_parsers import iter_records
+    return sum(1 for _ in iter_records(vmm, 'network_connections'))
+
+
+@benchmark('network_analytics', 'connections')
+def bench_network_analytics(vmm, workdir):
+    import network_analytics
+    from network_analytics import NetworkTable, ProcessTable, rare_remotes, top_talkers
+    from sys_parsers import iter_records
+    if network_analytics.numpy is None:
+        raise Skipped('numpy is not installed')
+    table = NetworkTable.from_records(iter_records(vmm, 'network_connections'))
+    processes = ProcessTable(vmm.process_all())
+    top_talkers(table, processes, threshold=20)
+    rare_remotes(table, processes)
+    return len(table)
+
+
+# 多主机索引基准测试中存入的主机数。
+FLEET_HOSTS = 10
+
+
+@benchmark('fleet_index', 'observations')
+def bench_fleet_index(vmm, workdir):
+    from fleet_triage import FleetIndex, iter_observations
+    from system_classification import build_report, run_collectors
+    from handle_table import harvest_handles
+    observation_file = os.path.join(workdir, 'observations.json')
+    if not os.path.exists(observation_file):
+        # 在预热轮中只收集一次；计时轮只测量索引
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            results, stages = run_collectors(vmm, ['processes', 'network_connections', 'services', 'drivers', 'users'])
+        handles, _ = harvest_handles(vmm)
+        with open(observation_file, 'w') as f:
+            json.dump(sorted(set(iter_observations(build_report(results, stages, 0), handles))), f)
+    with open(observation_file) as f:
+        observations = json.load(f)
+    index_file = os.path.join(workdir, 'fleet_index.sqlite')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(index_file + suffix):
+            os.remove(index_file + suffix)
+    index = FleetIndex(index_file)
+    for host in range(FLEET_HOSTS):
+        index.store({'host': f"host{host:02d}", 'image': f"host{host:02d}.dmp", 'status': 'ok'}, observations)
+    for kind, value, _, _ in observations[::100]:
+        index.lookup(kind, value)
+    index.close()
+    return len(observations) * FLEET_HOSTS
+
+
+# 上一次轮询的快照，在预热轮次中创建。
+_previous_snapshot = []
+
+
+@benchmark('triage_diff_poll', 'processes')
+def bench_triage_diff_poll(vmm, workdir):
+    import memprocfs
+    from triage_diff import take_snapshot
+    # 每次刷新改变 5% 的进程；读取路径或命令行需要 50 微秒
+    vmm.options.update(churn=5, attribute_cost=50)
+    if not _previous_snapshot:
+        _previous_snapshot.append(take_snapshot(vmm)[0])
+    vmm.set_config(memprocfs.OPT_REFRESH_ALL, 1)
+    snapshot, _, errors = take_snapshot(vmm, _previous_snapshot[0])
+    if errors:
+        raise RuntimeError(f"processes failed: {len(errors)}")
+    _previous_snapshot[0] = snapshot
+    return len(snapshot.processes)
+
+
+@benchmark('triage_diff_merge', 'records')
+def bench_triage_diff_merge(vmm, workdir):
+    import memprocfs
+    from triage_diff import Snapshot, diff_snapshots, take_snapshot
+    old_file, new_file = os.path.join(workdir, 'old.snapshot'), os.path.join(workdir, 'new.snapshot')
+    if not os.path.exists(new_file):
+        # 在预热轮次中创建一次；计时轮次只测量加载和比较
+        vmm.options['churn'] = 5
+        take_snapshot(vmm)[0].save(old_file)
+        vmm.set_config(memprocfs.OPT_REFRESH_ALL, 1)
+        take_snapshot(vmm)[0].save(new_file)
+    old, new = Snapshot.load(old_file), Snapshot.load(new_file)
+    changes = diff_snapshots(old, new)
+    if not changes['handles']:
+        raise RuntimeError('no changes found')
+    return sum(old.counts().values()) + sum(new.counts().values())
+
+
+@benchmark('harvest_process_vfs', 'rows')
+def bench_harvest_process_vfs(vmm, workdir):
+    import asyncio
+    from harvest_process_vfs import ARTIFACTS, JsonlSink, harvest_async
+    # 每次 /pid/ 读取或列目录需要 500 微秒，类似于原生库中的页表遍历
+    vmm.options['vfs_cost'] = 500
+    sink = JsonlSink(os.path.join(workdir, 'processes.jsonl'))
+    try:
+        counts, errors = asyncio.run(harvest_async(vmm, sink, list(ARTIFACTS), vmm.pid_list()))
+    finally:
+        sink.close()
+    if errors:
+        raise RuntimeError(f"reads failed: {len(errors)}")
+    return sum(counts.values())
+
+
+@benchmark('vfs_stream_timeline', 'bytes')
+def bench_vfs_stream_timeline(vmm, workdir):
+    from vfs_stream import iter_lines
+    return sum(len(line) + 1 for line in iter_lines(vmm, '/forensic/timeline/timeline.csv', encoding=None))
+
+
+@benchmark('timeline_query', 'events')
+def bench_timeline_query(vmm, workdir):
+    from timeline_query import INDEX_NAME, TimelineIndex, build_timeline
+    if not os.path.exists(os.path.join(workdir, INDEX_NAME)):
+        # 在预热轮中只建立一次；计时轮只测量查询
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            build_timeline(workdir, ['-device', 'synthetic'])
+    events = 0
+    with TimelineIndex(workdir) as index:
+        start = index.meta['first']
+        pid = index.meta['pids'][len(index.meta['pids']) // 2]
+        for hour in range(24):
+            for position in index.positions(start + hour * 3600, start + hour * 3600 + 600, ['PROC', 'NET'], [pid]):
+                index.read_event(position)
+                events += 1
+            events += sum(1 for _ in index.positions(start + hour * 3600, start + hour * 3600 + 60))
+    return events
+
+
+def peak_rss():
+    '''
+    返回此进程的峰值常驻集大小 (字节)，如果无法测量则返回 None。
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_child(name, repeat):
+    '''
+    在此进程中运行一个基准测试，并将其结果打印为一行 JSON。
+    '''
+    import memprocfs
+    func, unit = BENCHMARKS[name]
+    workdir = tempfile.mkdtemp(prefix='memprocfs-bench-')
+    try:
+        vmm = memprocfs.Vmm(['-device', 'synthetic'])
+        result = {'name': name, 'unit': unit}
+        try:
+            func(vmm, workdir)
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                units = func(vmm, workdir)
+                latencies.append(time.perf_counter() - start)
+        except Skipped as e:
+            result['skipped'] = str(e)
+        else:
+            median = statistics.median(latencies)
+            result.update({'units': units, 'min': min(latencies), 'median': median,
+                           'throughput': units / median if median > 0 else None, 'peak_rss': peak_rss()})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def run_benchmark(name, scale, repeat):
+    '''
+    在子进程中运行一个基准测试并返回其结果字典。
+    '''
+    env = dict(os.environ, MEMPROCFS_SYNTHETIC=SCALES[scale])
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, '--repeat', str(repeat)],
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ['exit status %d' % completed.returncode])[-1]
+        return {'name': name, 'error': error}
+    return json.loads(lines[-1])
+
+
+def format_size(value):
+    for suffix in ('', 'K', 'M', 'G'):
+        if abs(value) < 1024 or suffix == 'G':
+            return f"{value:.1f}{suffix}" if suffix else f"{value:.0f}"
+        value /= 1024.0
+
+
+def compare(results, baseline, threshold):
+    '''
+    以消息列表的形式返回结果相对于基线的回归。
+
+    :param results: 本次运行的基准测试结果，按名称索引。
+    :param baseline: 基线运行的基准测试结果，按名称索引。
+    :param threshold: 允许的变慢或内存增长百分比。
+    '''
+    regressions = []
+    limit = 1 + threshold / 100.0
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or 'median' not in base or 'median' not in result:
+            continue
+        if result['median'] > base['median'] * limit:
+            regressions.append(f"{name}: median latency {result['median']:.3f}s vs {base['median']:.3f}s")
+        if result.get('peak_rss') and base.get('peak_rss') and result['peak_rss'] > base['peak_rss'] * limit:
+            regressions.append(f"{name}: peak RSS {format_size(result['peak_rss'])}B "
+                               f"vs {format_size(base['peak_rss'])}B")
+    return regressions
+
+
+def run_benchmarks(scale='quick', names=None, repeat=DEFAULT_REPEAT, output_file=None, baseline_file=None,
+                   threshold=DEFAULT_THRESHOLD):
+    '''
+    运行基准测试并打印汇总表。
+
+    :param scale: SCALES 的键。
+    :param names: 可选的基准测试名称列表；默认为所有基准测试。
+    :param repeat: 每个基准测试的计时轮数。
+    :param output_file: 可选的路径，用于将结果保存为 JSON。
+    :param baseline_file: 可选的路径，指向用于比较的先前结果。
+    :param threshold: 允许的变慢或内存增长百分比。
+    :return: 如果没有基准测试失败或回归，则为 True。
+    '''
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"错误: 未知的基准测试: {', '.join(unknown)} (可用: {', '.join(BENCHMARKS)})")
+        return False
+
+    print(f"以规模 '{scale}' ({SCALES[scale]}) 运行 {len(names)} 个基准测试，每个 {repeat} 轮")
+    print(f"{'benchmark':<28} {'min':>9} {'median':>9} {'throughput':>16} {'peak RSS':>9}")
+    results = {}
+    ok = True
+    for name in names:
+        result = results[name] = run_benchmark(name, scale, repeat)
+        if 'error' in result:
+            print(f"{name:<28} 失败: {result['error']}")
+            ok = False
+        elif 'skipped' in result:
+            print(f"{name:<28} 已跳过: {result['skipped']}")
+        else:
+            throughput = f"{format_size(result['throughput'])} {result['unit']}/s" if result['throughput'] else '-'
+            rss = format_size(result['peak_rss']) + 'B' if result['peak_rss'] else '-'
+            print(f"{name:<28} {result['min']:>8.3f}s {result['median']:>8.3f}s {throughput:>16} {rss:>9}")
+
+    report = {'scale': scale, 'options': SCALES[scale], 'python': sys.version.split()[0], 'results': results}
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已写入 {output_file}")
+
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != scale:
+            print(f"警告: 基线是以规模 '{baseline.get('scale')}' 记录的")
+        regressions = compare(results, baseline.get('results', {}), threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项回归超过 {threshold}%:")
+            for regression in regressions:
+                print(f"- {regression}")
+            ok = False
+        else:
+            print(f"\n与 {baseline_file} 相比没有超过 {threshold}% 的回归")
+    return ok
+
+
+if __name__ == "__main__":
+    scale_name = 'quick'
+    selected = None
+    rounds = DEFAULT_REPEAT
+    output = None
+    baseline_path = None
+    allowed = DEFAULT_THRESHOLD
+    child = None
+
+    # 解析参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--scale' and i + 1 < len(sys.argv):
+            scale_name = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--only' and i + 1 < len(sys.argv):
+            selected = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--repeat' and i + 1 < len(sys.argv):
+            rounds = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
+            output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--compare' and i + 1 < len(sys.argv):
+            baseline_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--threshold' and i + 1 < len(sys.argv):
+            allowed = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--child' and i + 1 < len(sys.argv):
+            child = sys.argv[i + 1]
+            i += 2
+        else:
+            print("用法: python run_benchmarks.py [--scale quick|full] [--only <名称,...>] [--repeat <n>]")
+            print("           [--output <results.json>] [--compare <baseline.json>] [--threshold <百分比>]")
+            print(f"基准测试: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+
+    if child:
+        run_child(child, rounds)
+        sys.exit(0)
+
+    if scale_name not in SCALES:
+        print(f"错误: 未知的规模 '{scale_name}' (可用: {', '.join(SCALES)})")
+        sys.exit(1)
+
+    sys.exit(0 if run_benchmarks(scale_name, selected, rounds, output, baseline_path, allowed) else 1)
@@ -0,0 +1,384 @@
+'''
+可寻址的压缩进程内存转储。
+
+原始转储占用的磁盘空间和 I/O 与已映射地址空间一样多，尽管其中大部分通常是零页
+或易于压缩的数据。压缩格式将已映射区域保存为独立压缩的帧，每帧最多一个读取块，
+并将连续的零页记录为不含任何数据的稀疏索引项。文件末尾的索引将每个帧映射到其
+虚拟地址，因此读取时只解压所涉及的帧。
+
+文件布局 (小端序):
+
+    header   MAGIC、格式版本、编解码器 id
+    frames   依次排列的压缩帧
+    index    zlib 压缩的 JSON: pid、名称、编解码器以及每帧一个
+             [va, 大小, 文件偏移, 压缩后大小] 项，按 va 排序；
+             压缩后大小为 0 表示一段零页
+    footer   索引偏移、索引大小、MAGIC
+
+安装可选的 zstandard 包 (pip install zstandard) 时使用 zstd 压缩帧，否则使用
+zlib；两者都会释放 GIL，因此帧在读取内存的线程池中压缩。由
+dump_process_memory.py (--compress) 使用；读取器也可以被自定义脚本导入：
+
+    with CompressedDump('lsass.cdmp') as dump:
+        data = dump.read(0x7ff6a0000000, 0x1000)
+
+用法: python compressed_dump.py <转储文件>
+      python compressed_dump.py <转储文件> --read <地址> <大小> [--output <文件>]
+      python compressed_dump.py <转储文件> --extract <输出文件> [--sparse]
+'''
+
+import sys
+import json
+import zlib
+import struct
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from memory_regions import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_INFLIGHT, PAGE_SIZE, get_memory_regions,
+                            iter_region_chunks, iter_region_chunks_parallel)
+from region_hashes import iter_unknown_chunks
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'MPFSCDMP'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+FOOTER = struct.Struct('<QQ8s')
+
+# 头部中的编解码器 id，按索引对应。
+CODECS = ('zlib', 'zstd')
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'zlib'
+DEFAULT_LEVELS = {'zlib': 1, 'zstd': 3}
+
+# 读取器保留的已解压帧数。
+DEFAULT_CACHE_FRAMES = 16
+
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+
+def _compressor(codec, level=None):
+    '''
+    返回一个压缩单个帧的线程安全函数。
+    '''
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == 'zlib':
+        return lambda data: zlib.compress(data, level)
+    if zstandard is None:
+        raise RuntimeError("zstd 压缩需要 zstandard (pip install zstandard)")
+    # ZstdCompressor 不能被两个线程同时使用
+    local = threading.local()
+
+    def compress(data):
+        compressor = getattr(local, 'compressor', None)
+        if compressor is None:
+            compressor = local.compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.compress(data)
+    return compress
+
+
+def _decompressor(codec):
+    if codec == 'zlib':
+        return zlib.decompress
+    if zstandard is None:
+        raise RuntimeError("读取 zstd 转储需要 zstandard (pip install zstandard)")
+    return zstandard.ZstdDecompressor().decompress
+
+
+def compress_chunk(compress, address, data):
+    '''
+    将一个块拆分为零页和非零页的连续段，并压缩每个非零段。
+
+    :param compress: _compressor() 返回的函数。
+    :param address: 块的虚拟地址。
+    :param data: 块数据。
+    :return: (va, 大小, 压缩数据) 元组列表；零页的数据为 None。
+    '''
+    if data == bytes(len(data)):
+        return [(address, len(data), None)]
+    frames = []
+    start = 0
+    zero = data[:PAGE_SIZE] == ZERO_PAGE
+    for offset in range(PAGE_SIZE, len(data), PAGE_SIZE):
+        page_zero = data[offset:offset + PAGE_SIZE] == ZERO_PAGE
+        if page_zero != zero:
+            frames.append((address + start, offset - start, None if zero else compress(data[start:offset])))
+            start, zero = offset, page_zero
+    frames.append((address + start, len(data) - start, None if zero else compress(data[start:])))
+    return frames
+
+
+def write_compressed_dump(process, output_file, chunk_size=DEFAULT_CHUNK_SIZE, pool=None,
+                          max_inflight=DEFAULT_MAX_INFLIGHT, codec=DEFAULT_CODEC, level=None, known=None, stats=None):
+    '''
+    将进程的已映射区域流式写入压缩转储文件。
+
+    使用线程池时，块在其线程上先于写入方被读取和压缩；除预读外，正在压缩的
+    字节数也受 max_inflight 限制。
+
+    :param process: memprocfs 进程对象。
+    :param output_file: 保存压缩转储的路径。
+    :param chunk_size: 一次读取和压缩的最大字节数。
+    :param pool: 可选的线程池，用于先于写入方读取和压缩块。
+    :param max_inflight: 使用线程池时预读或预先压缩的最大字节数。
+    :param codec: 'zstd' 或 'zlib'。
+    :param level: 可选的压缩级别；默认为该编解码器的快速级别。
+    :param known: 可选的 KnownGoodSet，其中的页面不写入转储 (参见 region_hashes.py)。
+    :param stats: 可选的 dict；其 'bytes_skipped' 条目会累加被略过的已知良好字节数。
+    :return: (已转储字节数, 已存储字节数) 元组；如果进程没有已映射区域则返回 None。
+    '''
+    regions = get_memory_regions(process)
+    if not regions:
+        return None
+
+    compress = _compressor(codec, level)
+    if known is not None:
+        source = iter_unknown_chunks(process, known, pool, regions, chunk_size, max_inflight, stats)
+    elif pool:
+        source = iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight)
+    else:
+        source = iter_region_chunks(process, regions, chunk_size)
+    if pool:
+        def compressed_chunks():
+            # 块被并发压缩，并按地址顺序写入
+            pending = deque()
+            inflight = 0
+            for address, data in source:
+                while pending and inflight + len(data) > max_inflight:
+                    size, future = pending.popleft()
+                    inflight -= size
+                    yield size, future.result()
+                pending.append((len(data), pool.submit(compress_chunk, compress, address, data)))
+                inflight += len(data)
+            while pending:
+                size, future = pending.popleft()
+                yield size, future.result()
+        chunks = compressed_chunks()
+    else:
+        chunks = ((len(data), compress_chunk(compress, address, data)) for address, data in source)
+
+    index = []
+    written = 0
+    with open(output_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS.index(codec)))
+        offset = HEADER.size
+        for size, frames in chunks:
+            written += size
+            for va, frame_size, payload in frames:
+                if payload is not None:
+                    index.append([va, frame_size, offset, len(payload)])
+                    f.write(payload)
+                    offset += len(payload)
+                elif index and index[-1][3] == 0 and index[-1][0] + index[-1][1] == va:
+                    index[-1][1] += frame_size
+                else:
+                    index.append([va, frame_size, 0, 0])
+        blob = zlib.compress(json.dumps({'pid': process.pid, 'name': process.name, 'codec': codec,
+                                         'frames': index}).encode('utf-8'))
+        f.write(blob)
+        f.write(FOOTER.pack(offset, len(blob), MAGIC))
+    return written, offset + len(blob) + FOOTER.size
+
+
+class CompressedDump:
+    '''
+    按虚拟地址随机访问压缩转储。只解压读取所涉及的帧；最近使用的帧会被缓存。
+    '''
+
+    def __init__(self, path, cache_frames=DEFAULT_CACHE_FRAMES):
+        '''
+        :param path: write_compressed_dump() 写入的文件路径。
+        :param cache_frames: 保留的已解压帧数。
+        '''
+        self.path = path
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+        try:
+            magic, version, codec = HEADER.unpack(self._file.read(HEADER.size))
+            self._file.seek(-FOOTER.size, 2)
+            index_offset, index_size, end_magic = FOOTER.unpack(self._file.read(FOOTER.size))
+            if magic != MAGIC or end_magic != MAGIC:
+                raise ValueError(f"{path} 不是压缩转储")
+            if version != VERSION:
+                raise ValueError(f"{path} 的格式版本为 {version}，应为 {VERSION}")
+            self._file.seek(index_offset)
+            index = json.loads(zlib.decompress(self._file.read(index_size)).decode('utf-8'))
+        except Exception:
+            self._file.close()
+            raise
+        self.pid = index['pid']
+        self.name = index['name']
+        self.codec = CODECS[codec]
+        self.frames = index['frames']
+        self._starts = [frame[0] for frame in self.frames]
+        self._decompress = _decompressor(self.codec)
+        self._cache = OrderedDict()
+        self._cache_frames = cache_frames
+
+    def regions(self):
+        '''
+        以排序的 (基址, 大小) 元组列表返回已映射区域，与 get_memory_regions() 相同。
+        '''
+        regions = []
+        for va, size, _, _ in self.frames:
+            if regions and regions[-1][0] + regions[-1][1] == va:
+                regions[-1] = (regions[-1][0], regions[-1][1] + size)
+            else:
+                regions.append((va, size))
+        return regions
+
+    def _frame(self, i):
+        data = self._cache.get(i)
+        if data is not None:
+            self._cache.move_to_end(i)
+            return data
+        _, _, offset, compressed_size = self.frames[i]
+        self._file.seek(offset)
+        data = self._decompress(self._file.read(compressed_size))
+        self._cache[i] = data
+        if len(self._cache) > self._cache_frames:
+            self._cache.popitem(last=False)
+        return data
+
+    def read(self, address, size):
+        '''
+        从转储中读取虚拟内存。零页和未映射的地址读取为零。
+
+        :param address: 要读取的虚拟地址。
+        :param size: 要读取的字节数。
+        '''
+        out = bytearray(size)
+        end = address + size
+        with self._lock:
+            for i in range(max(0, bisect_right(self._starts, address) - 1), len(self.frames)):
+                va, frame_size, _, compressed_size = self.frames[i]
+                if va >= end:
+                    break
+                low, high = max(address, va), min(end, va + frame_size)
+                if low < high and compressed_size:
+                    out[low - address:high - address] = self._frame(i)[low - va:high - va]
+        return bytes(out)
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        生成覆盖每个已映射区域的 (地址, 数据) 元组，与 iter_region_chunks() 相同。
+        '''
+        for base, size in self.regions():
+            for offset in range(0, size, chunk_size):
+                length = min(chunk_size, size - offset)
+                yield base + offset, self.read(base + offset, length)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def hexdump(address, data):
+    '''
+    生成数据的十六进制转储的各行，每行 16 字节。
+    '''
+    for offset in range(0, len(data), 16):
+        line = data[offset:offset + 16]
+        text = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in line)
+        yield f"{address + offset:016x}  {' '.join(f'{byte:02x}' for byte in line):<47}  {text}"
+
+
+def show_dump(dump_file, read_range=None, output_file=None, extract_file=None, sparse=False):
+    '''
+    打印压缩转储的摘要、从中读取地址范围，或将其提取为原始转储。
+
+    :param dump_file: 压缩转储的路径。
+    :param read_range: 可选的要读取的 (地址, 大小)。
+    :param output_file: 可选的文件，读取的范围写入该文件而不是以十六进制转储打印。
+    :param extract_file: 可选的原始转储路径，整个转储将提取到该路径。
+    :param sparse: 将区域提取到其虚拟地址处，而不是紧凑排列。
+    '''
+    try:
+        with CompressedDump(dump_file) as dump:
+            if read_range:
+                data = dump.read(*read_range)
+                if output_file:
+                    with open(output_file, 'wb') as f:
+                        f.write(data)
+                    print(f"已将 {read_range[0]:#x} 处的 {len(data)} 字节写入 {output_file}")
+                else:
+                    for line in hexdump(read_range[0], data):
+                        print(line)
+                return
+
+            if extract_file:
+                index = []
+                written = 0
+                with open(extract_file, 'wb') as f:
+                    for address, data in dump.iter_chunks():
+                        if sparse:
+                            f.seek(address)
+                        elif index and index[-1]['va'] + index[-1]['size'] == address:
+                            index[-1]['size'] += len(data)
+                        else:
+                            index.append({'va': address, 'size': len(data), 'offset': written})
+                        f.write(data)
+                        written += len(data)
+                if not sparse:
+                    with open(extract_file + '.regions.json', 'w') as f:
+                        json.dump({'pid': dump.pid, 'name': dump.name, 'regions': index}, f, indent=2)
+                print(f"已将 {dump.name} (PID: {dump.pid}) 的 {written} 字节提取到 {extract_file}")
+                return
+
+            regions = dump.regions()
+            mapped = sum(size for _, size in regions)
+            zero = sum(frame[1] for frame in dump.frames if not frame[3])
+            stored = sum(frame[3] for frame in dump.frames)
+            print(f"进程: {dump.name} (PID: {dump.pid})")
+            print(f"编解码器: {dump.codec}，{len(regions)} 个区域中共 {len(dump.frames)} 个帧")
+            print(f"已映射: {mapped} 字节，其中 {zero} 字节为零页")
+            print(f"已存储: {stored} 字节帧数据 (占已映射的 {stored / mapped * 100 if mapped else 0:.1f}%)")
+            for base, size in regions[:20]:
+                print(f"  {base:#018x} - {base + size:#018x}  {size} 字节")
+            if len(regions) > 20:
+                print(f"  ... 另有 {len(regions) - 20} 个区域")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python compressed_dump.py <转储文件>")
+        print("      python compressed_dump.py <转储文件> --read <地址> <大小> [--output <文件>]")
+        print("      python compressed_dump.py <转储文件> --extract <输出文件> [--sparse]")
+        print("示例: python compressed_dump.py dumps/lsass.exe_672.cdmp --read 0x7ff6a0000000 0x100")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    range_to_read = None
+    read_output = None
+    extract_output = None
+    sparse_output = False
+
+    # 解析参数
+    i = 1
+    while i < len(args):
+        if args[i] == '--read' and i + 2 < len(args):
+            range_to_read = (int(args[i + 1], 0), int(args[i + 2], 0))
+            i += 3
+        elif args[i] == '--output' and i + 1 < len(args):
+            read_output = args[i + 1]
+            i += 2
+        elif args[i] == '--extract' and i + 1 < len(args):
+            extract_output = args[i + 1]
+            i += 2
+        elif args[i] == '--sparse':
+            sparse_output = True
+            i += 1
+        else:
+            print(f"错误: 未知参数 '{args[i]}'。")
+            sys.exit(1)
+
+    show_dump(args[0], range_to_read, read_output, extract_output, sparse_output)
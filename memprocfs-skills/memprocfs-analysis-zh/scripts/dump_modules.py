@@ -0,0 +1,186 @@
+'''
+此脚本提取一个或多个进程已加载的模块 (主可执行文件及其 DLL)，
+每个唯一的模块映像只存储一次。
+
+首先根据完整路径、映像大小以及 PE 头中的 TimeDateStamp 和 CheckSum 为每个模块
+生成指纹，这些信息从进程内存中读取，无需访问模块文件。只有某个指纹第一次出现时
+才会从 /pid/<pid>/modules/<module>/pefile.dll 读取，在流式写入磁盘的同时计算
+哈希，并按内容寻址存储为 'objects/<sha256[:2]>/<sha256>'。之后的每次出现
+(例如每个进程中的 ntdll.dll) 只作为引用记录在 'manifest.json' 中。
+
+用法: python dump_modules.py <pid_list|name_glob|all> <输出目录> [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from vfs_stream import DEFAULT_BUFFER_SIZE, open_vfs
+from dump_process_memory import resolve_processes
+import sys
+import os
+import json
+import time
+import struct
+import hashlib
+import tempfile
+import memprocfs
+
+# 为解析 PE 头而从模块起始处读取的字节数。
+PE_HEADER_SIZE = 0x400
+
+def read_pe_header(process, module):
+    '''
+    从进程内存中读取模块 PE 头的 TimeDateStamp 和 CheckSum。
+
+    :param process: memprocfs 进程对象。
+    :param module: 该进程的 memprocfs 模块对象。
+    :return: (timestamp, checksum) 元组；如果无法读取该头则为 (None, None)。
+    '''
+    header = process.memory.read(module.base, PE_HEADER_SIZE, memprocfs.FLAG_ZEROPAD_ON_FAIL)
+    if header[:2] != b'MZ':
+        return None, None
+    pe_offset = struct.unpack_from('<I', header, 0x3c)[0]
+    # 签名 (4) + 文件头 (20) + 可选头中 CheckSum 之前的部分 (68)
+    if pe_offset + 0x5c > len(header) or header[pe_offset:pe_offset + 4] != b'PE\0\0':
+        return None, None
+    timestamp = struct.unpack_from('<I', header, pe_offset + 8)[0]
+    checksum = struct.unpack_from('<I', header, pe_offset + 0x58)[0]
+    return timestamp, checksum
+
+def module_fingerprint(process, module):
+    '''
+    返回在各进程间标识模块映像的指纹。
+
+    :param process: memprocfs 进程对象。
+    :param module: 该进程的 memprocfs 模块对象。
+    :return: (小写路径, 映像大小, timestamp, checksum) 元组。
+    '''
+    timestamp, checksum = read_pe_header(process, module)
+    path = getattr(module, 'fullname', None) or module.name
+    return path.lower(), module.image_size, timestamp, checksum
+
+def store_object(vmm, vfs_path, objects_dir, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    将 VFS 文件流式写入按内容寻址的对象存储。
+
+    文件在计算哈希的同时写入临时文件，然后移动到 'objects/<sha256[:2]>/<sha256>'。
+    如果已存储了内容相同的对象，则丢弃该临时文件。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param vfs_path: 文件的 VFS 路径。
+    :param objects_dir: 对象存储的根目录。
+    :param buffer_size: 每次从 VFS 读取的字节数。
+    :return: (sha256, size, stored) 元组；如果对象已存在，stored 为 False。
+    '''
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, temp_file = tempfile.mkstemp(dir=objects_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f, open_vfs(vmm, vfs_path, buffer_size) as source:
+            while True:
+                data = source.read(buffer_size)
+                if not data:
+                    break
+                sha256.update(data)
+                f.write(data)
+                size += len(data)
+        digest = sha256.hexdigest()
+        object_file = os.path.join(objects_dir, digest[:2], digest)
+        if os.path.exists(object_file):
+            os.remove(temp_file)
+            return digest, size, False
+        os.makedirs(os.path.dirname(object_file), exist_ok=True)
+        os.replace(temp_file, object_file)
+        return digest, size, True
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def dump_modules(target, output_dir, vmm_args):
+    '''
+    提取匹配进程的模块，每个唯一映像只存储一次。
+
+    :param target: 'all'，或以逗号分隔的 PID 和名称通配符列表。
+    :param output_dir: 保存对象存储和清单的目录。
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    try:
+        start_time = time.perf_counter()
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+
+        processes = resolve_processes(vmm, target)
+        if not processes:
+            print(f"错误: 没有与 '{target}' 匹配的进程。")
+            return
+
+        objects_dir = os.path.join(output_dir, 'objects')
+        os.makedirs(objects_dir, exist_ok=True)
+
+        # 指纹 -> 已存储映像的 sha256
+        seen = {}
+        objects = {}
+        references = []
+        failures = []
+        bytes_read = 0
+        bytes_stored = 0
+
+        for process in processes:
+            try:
+                modules = process.module_all()
+            except Exception as e:
+                print(f"  - {process.name} (PID: {process.pid}): 列出模块失败: {e}")
+                continue
+
+            for module in modules:
+                reference = {'pid': process.pid, 'process': process.name, 'module': module.name,
+                             'base': module.base, 'sha256': None}
+                try:
+                    fingerprint = module_fingerprint(process, module)
+                    if fingerprint not in seen:
+                        vfs_path = f"/pid/{process.pid}/modules/{module.name}/pefile.dll"
+                        digest, size, stored = store_object(vmm, vfs_path, objects_dir)
+                        bytes_read += size
+                        if stored:
+                            bytes_stored += size
+                        seen[fingerprint] = digest
+                        objects.setdefault(digest, {
+                            'path': getattr(module, 'fullname', None) or module.name,
+                            'size': size, 'image_size': module.image_size,
+                            'timestamp': fingerprint[2], 'checksum': fingerprint[3],
+                            'file': f"objects/{digest[:2]}/{digest}"})
+                    reference['sha256'] = seen[fingerprint]
+                except Exception as e:
+                    failures.append({'pid': process.pid, 'module': module.name, 'error': str(e)})
+                references.append(reference)
+
+        manifest = {'target': target, 'processes': len(processes), 'objects': objects,
+                    'references': references, 'failures': failures}
+        manifest_file = os.path.join(output_dir, 'manifest.json')
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        wall_time = time.perf_counter() - start_time
+        print(f"已在 {wall_time:.2f} 秒内处理 {len(processes)} 个进程的 {len(references)} 个模块")
+        print(f"  已存储的唯一映像: {len(objects)} ({bytes_stored} 字节，读取 {bytes_read} 字节)")
+        print(f"  记录为引用的重复项: {len(references) - len(seen) - len(failures)}")
+        if failures:
+            print(f"  失败: {len(failures)} 个模块 (参见清单)")
+        print(f"清单已写入 {manifest_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 4:
+        print("用法: python dump_modules.py <pid_list|name_glob|all> <输出目录> [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python dump_modules.py all modules/ -device memory.dmp")
+        print("示例: python dump_modules.py 'svchost.exe,1234' modules/ -device memory.dmp")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        dump_modules(sys.argv[1], sys.argv[2], sys.argv[3:])
@@ -1,23 +1,175 @@
 '''
 此脚本将指定进程的内存转储到文件以供离线分析。
 
-用法: python dump_process_memory.py <进程名或PID> <输出文件> [vmm_args...]
+内存按区域以有限大小的块读取并直接写入磁盘，
+因此无论进程多大，峰值内存占用都保持平稳。在批量模式下，
+所有进程共享同一个 MemProcFS 实例，区域读取分散到线程池中执行。
+
+批量模式会在输出目录中保存检查点日志 (参见 job_journal.py)：每个转储已到达的
+地址和文件偏移，以及已完成的进程。崩溃或中断后，使用 --resume 重新运行相同的
+命令会跳过已完成的进程，并从最后一个检查点继续被中断的转储。
+
+使用 --compress 时，转储改为以 compressed_dump.py 的可寻址压缩格式写入：
+零页作为稀疏索引项保存，其余页面在读取线程池中压缩。
+
+使用 --known-good 时，在已知良好哈希集合 (由 region_hashes.py 从干净的
+基线镜像构建) 中找到的页面不写入转储；页面在读取线程池中计算哈希。
+
+批量模式为每个进程报告一条记录 (状态、字节数、速率)，写为表格，或通过 --format
+写为 JSONL、CSV 或 Arrow，输出到 stdout，或通过 --output 输出到文件
+(参见 result_writers.py)。
+
+用法: python dump_process_memory.py <进程名或PID> <输出文件> [--sparse] [--compress] [--known-good <集合文件>] [--chunk-size <字节数>] [vmm_args...]
+      python dump_process_memory.py --batch <PID列表|名称通配符|all> <输出目录> [--threads <n>] [--max-inflight <MB>] [--sparse] [--compress] [--known-good <集合文件>] [--chunk-size <字节数>] [--resume] [--format <table|jsonl|csv|arrow>] [--output <文件>] [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
 '''
 
-import memprocfs
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import LazyProcessTable
+from job_journal import JobJournal, image_identity
+from compressed_dump import write_compressed_dump
+from region_hashes import KnownGoodSet, iter_unknown_chunks
+from result_writers import FORMATS, guess_format, open_writer
 import sys
+import os
+import json
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from memory_regions import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_INFLIGHT, get_memory_regions,
+                            iter_region_chunks, iter_region_chunks_parallel)
+
+DEFAULT_THREADS = 4
+
+# 批量转储两个检查点之间写入的字节数 (64 MiB)。
+CHECKPOINT_INTERVAL = 0x4000000
+
+JOURNAL_NAME = 'dump.journal'
+
+# 批量转储中每个进程记录的列。
+REPORT_FIELDS = ('pid', 'process', 'status', 'bytes', 'stored', 'skipped', 'seconds', 'mb_per_s', 'resumed_at',
+                 'file', 'error')
+REPORT_TYPES = {'pid': 'int', 'process': 'str', 'status': 'str', 'bytes': 'int', 'stored': 'int', 'skipped': 'int',
+                'seconds': 'float', 'mb_per_s': 'float', 'resumed_at': 'hex', 'file': 'str', 'error': 'str'}
+# 记录逐条写出，因此表格列为常见的值预留空间。
+REPORT_WIDTHS = {'process': 20, 'bytes': 12, 'stored': 12, 'skipped': 12, 'resumed_at': 12, 'file': 40}
+
+def write_process_dump(process, output_file, sparse=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                       pool=None, max_inflight=DEFAULT_MAX_INFLIGHT, checkpoint=None, resume_at=None,
+                       known=None, stats=None):
+    '''
+    将进程的已映射区域流式写入文件。
+
+    默认情况下，已映射区域依次紧凑地写入输出文件，并将区域索引
+    (虚拟地址、大小、文件偏移) 写入 '<output_file>.regions.json'。
+    当 sparse=True 时，每个区域写入到与其虚拟地址相等的文件偏移处
+    (类似 vmemd 文件)，未映射的空洞保留为稀疏空洞。
+
+    提供 checkpoint 回调时，每写入 CHECKPOINT_INTERVAL 字节输出就会刷新到磁盘，
+    并以转储已到达的地址调用 checkpoint(address, written)。将该值对作为 resume_at
+    传回即可从该处继续转储；输出文件中该位置之前的内容会被保留。
+
+    提供已知良好集合时，其中的页面不会写入；紧凑格式的转储不把它们列入区域索引，
+    稀疏格式的转储将它们保留为空洞。略过页面的紧凑格式转储不会继续，而是从头重新转储。
 
-def dump_process_memory(proc_identifier, output_file, vmm_args):
+    :param process: memprocfs 进程对象。
+    :param output_file: 保存内存转储的路径。
+    :param sparse: 按虚拟地址写入区域，而不是紧凑排列。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param pool: 可选的线程池，用于在写入之前预读块。
+    :param max_inflight: 使用线程池时预读的最大字节数。
+    :param checkpoint: 可选的 callable(address, written)，在 address 之前的输出写入磁盘后调用。
+    :param resume_at: 可选的被中断转储的最后一个检查点 (address, written)。
+    :param known: 可选的 KnownGoodSet，其中的页面不写入转储 (参见 region_hashes.py)。
+    :param stats: 可选的 dict；其 'bytes_skipped' 条目会累加被略过的已知良好字节数。
+    :return: 写入的字节数；如果进程没有已映射区域则返回 None。
+    '''
+    regions = get_memory_regions(process)
+    if not regions:
+        return None
+
+    # 继续转储要求输出在检查点之前完好无损；紧凑格式的转储还要求能重建
+    # 区域索引，而略过的页面使之无法重建
+    if resume_at is not None and (not os.path.exists(output_file) or
+                                  os.path.getsize(output_file) < resume_at[0 if sparse else 1] or
+                                  (known is not None and not sparse)):
+        resume_at = None
+
+    index = []
+    written = 0
+    if resume_at is not None:
+        # 检查点之前的区域已在磁盘上；只需重建它们的索引项
+        address, written = resume_at
+        remaining = []
+        offset = 0
+        for base, size in regions:
+            if base + size <= address:
+                index.append({'va': base, 'size': size, 'offset': offset})
+            elif base < address:
+                index.append({'va': base, 'size': address - base, 'offset': offset})
+                remaining.append((address, base + size - address))
+            else:
+                remaining.append((base, size))
+            offset += size
+        regions = remaining
+
+    if known is not None:
+        chunks = iter_unknown_chunks(process, known, pool, regions, chunk_size, max_inflight, stats)
+    elif pool:
+        chunks = iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight)
+    else:
+        chunks = iter_region_chunks(process, regions, chunk_size)
+
+    # 将每个块直接流式写入输出文件
+    unsaved = 0
+    with open(output_file, 'r+b' if resume_at is not None else 'wb') as f:
+        if resume_at is not None and not sparse:
+            f.seek(written)
+            f.truncate()
+        for address, data in chunks:
+            if sparse:
+                f.seek(address)
+            elif index and index[-1]['va'] + index[-1]['size'] == address:
+                index[-1]['size'] += len(data)
+            else:
+                index.append({'va': address, 'size': len(data), 'offset': written})
+            f.write(data)
+            written += len(data)
+            unsaved += len(data)
+            if checkpoint and unsaved >= CHECKPOINT_INTERVAL:
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint(address + len(data), written)
+                unsaved = 0
+        if checkpoint:
+            f.flush()
+            os.fsync(f.fileno())
+
+    if not sparse:
+        with open(output_file + '.regions.json', 'w') as f:
+            json.dump({'pid': process.pid, 'name': process.name, 'regions': index}, f, indent=2)
+    return written
+
+def dump_process_memory(proc_identifier, output_file, vmm_args, sparse=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                        compress=False, known_good=None):
     '''
     将进程的虚拟内存转储到文件。
 
     :param proc_identifier: 要转储的进程的名称或 PID。
     :param output_file: 保存内存转储的路径。
     :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param sparse: 按虚拟地址写入区域，而不是紧凑排列。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param compress: 以 compressed_dump.py 的可寻址压缩格式写入。
+    :param known_good: 可选的已知良好哈希集合路径；其中的页面不写入转储。
     '''
     try:
+        known = KnownGoodSet.load(known_good) if known_good else None
+
         # 初始化 VMM 实例
-        vmm = memprocfs.Vmm(vmm_args)
+        vmm = open_vmm(vmm_args)
         print(f"MemProcFS 已使用参数初始化: {vmm_args}")
 
         # 识别进程
@@ -32,37 +184,272 @@ def dump_process_memory(proc_identifier, output_file, vmm_args):
             return
 
         print(f"找到进程: {process.name} (PID: {process.pid})")
-
-        # 读取整个进程内存
-        # 这会将虚拟内存作为单个连续块读取，类似于 vmemd 文件。
         print("正在读取进程内存... 这可能需要一些时间。")
-        mem_data = process.memory.read(0, process.get_map_vmem().get('size', 0))
 
-        if not mem_data:
-            print("错误: 读取进程内存失败。")
+        stats = {'bytes_skipped': 0}
+        if compress:
+            written = write_compressed_dump(process, output_file, chunk_size, known=known, stats=stats)
+        else:
+            written = write_process_dump(process, output_file, sparse, chunk_size, known=known, stats=stats)
+        if written is None:
+            print("错误: 未找到该进程的已映射内存区域。")
             return
 
-        # 将内存写入输出文件
-        with open(output_file, 'wb') as f:
-            f.write(mem_data)
-        
-        print(f"已成功将 {process.name} 的 {len(mem_data)} 字节内存转储到 {output_file}")
+        if compress:
+            written, stored = written
+            print(f"已压缩为 {stored} 字节 ({stored / written * 100 if written else 0:.1f}%)")
+        elif not sparse:
+            print(f"区域索引已写入 {output_file}.regions.json")
+        print(f"已成功将 {process.name} 的 {written} 字节内存转储到 {output_file}")
+        if known is not None:
+            print(f"已略过 {stats['bytes_skipped']} 字节的已知良好页面")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+def resolve_processes(vmm, target):
+    '''
+    将批量目标解析为进程列表。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param target: 'all'，或以逗号分隔的 PID 和名称通配符列表
+                   (例如 '4,456' 或 'svchost*.exe,lsass.exe')。
+    :return: 按 PID 排序的 memprocfs 进程对象列表。
+    '''
+    if target.lower() == 'all':
+        return sorted(vmm.process_all(), key=lambda p: p.pid)
+
+    # 只枚举 PID；名称仅在使用名称通配符时读取，进程在匹配后才打开
+    table = LazyProcessTable(vmm)
+    items = [item.strip() for item in target.split(',') if item.strip()]
+    pids = {int(item) for item in items if item.isdigit()}
+    patterns = [item.lower() for item in items if not item.isdigit()]
+    return [p.process for p in table
+            if p.pid in pids or (patterns and p.name is not None
+                                 and any(fnmatch.fnmatch(p.name.lower(), pattern) for pattern in patterns))]
+
+def dump_processes(target, output_dir, vmm_args, threads=DEFAULT_THREADS, max_inflight=DEFAULT_MAX_INFLIGHT,
+                   sparse=False, chunk_size=DEFAULT_CHUNK_SIZE, resume=False, compress=False, known_good=None,
+                   report_format='table', report_file=None):
+    '''
+    使用同一个 MemProcFS 实例转储多个进程的虚拟内存。
+
+    每个进程写入 '<output_dir>/<name>_<pid>.bin'。块读取分散到线程池中执行，
+    写入端之前预读的字节数受 max_inflight 限制。
+
+    进度以检查点形式记录到 '<output_dir>/dump.journal'。resume=True 时，
+    日志中列为已完成的进程会被跳过，被中断的转储从其最后一个检查点继续。
+    压缩转储写入为 '<name>_<pid>.cdmp'；被中断的压缩转储会从头重新转储。
+
+    每个进程一经转储即写出一条记录，字段见 REPORT_FIELDS。
+
+    :param target: 'all'，或以逗号分隔的 PID 和名称通配符列表。
+    :param output_dir: 保存内存转储的目录。
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param threads: 读取内存的工作线程数。
+    :param max_inflight: 写入端之前预读的最大字节数。
+    :param sparse: 按虚拟地址写入区域，而不是紧凑排列。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param resume: 继续 output_dir 的日志中记录的任务。
+    :param compress: 以 compressed_dump.py 的可寻址压缩格式写入。
+    :param known_good: 可选的已知良好哈希集合路径；其中的页面不写入转储。
+    :param report_format: 'table'、'jsonl'、'csv' 或 'arrow'。
+    :param report_file: 可选的报告文件路径；默认为 stdout。
+    '''
+    try:
+        start_time = time.perf_counter()
+        known = KnownGoodSet.load(known_good) if known_good else None
+        report = open_writer(report_format, report_file, REPORT_FIELDS, REPORT_TYPES, widths=REPORT_WIDTHS)
+        with report:
+            dump_to_report(report, target, output_dir, vmm_args, threads, max_inflight, sparse, chunk_size, resume,
+                           compress, known_good, known, start_time)
+        if report_file:
+            print(f"已将 {report.count} 条进程记录写入 {report_file}")
 
     except Exception as e:
         print(f"发生错误: {e}")
 
+def process_record(process, status, written=None, stored=None, skipped=None, elapsed=None, rate=None,
+                   resumed_at=None, output_file=None, error=None):
+    '''
+    返回批量转储中某个进程的报告记录 (参见 REPORT_FIELDS)。
+    '''
+    return {'pid': process.pid, 'process': process.name, 'status': status, 'bytes': written, 'stored': stored,
+            'skipped': skipped, 'seconds': round(elapsed, 3) if elapsed is not None else None,
+            'mb_per_s': round(rate, 1) if rate is not None else None,
+            'resumed_at': resumed_at[0] if resumed_at else None, 'file': output_file, 'error': error}
+
+def dump_to_report(report, target, output_dir, vmm_args, threads, max_inflight, sparse, chunk_size, resume, compress,
+                   known_good, known, start_time):
+    '''
+    转储一批进程并将其记录写入结果写入器；消息输出到 report.messages。
+    参见 dump_processes()。
+
+    :param report: 已打开的 ResultWriter。
+    :param known: 已加载的 KnownGoodSet，或 None。
+    :param start_time: 批量任务开始时的 perf_counter() 值。
+    '''
+    messages = report.messages
+    vmm = open_vmm(vmm_args)
+    print(f"MemProcFS 已使用参数初始化: {vmm_args}", file=messages)
+
+    processes = resolve_processes(vmm, target)
+    if not processes:
+        print(f"错误: 没有与 '{target}' 匹配的进程。", file=messages)
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    journal = JobJournal(os.path.join(output_dir, JOURNAL_NAME),
+                         {'operation': 'dump', 'image': image_identity(vmm_args), 'target': target,
+                          'sparse': sparse, 'compress': compress, 'known_good': known_good},
+                         resume)
+    with journal:
+        # 已完成或没有内存的进程不会再次转储
+        finished = {pid: record for pid, record in journal.completed().items()
+                    if record['status'] in ('done', 'empty')}
+        checkpoints = journal.checkpoints()
+        total_written = sum(record.get('bytes', 0) for record in finished.values())
+        total_skipped = sum(record.get('skipped', 0) for record in finished.values())
+        if finished:
+            print(f"继续执行: 已转储 {len(finished)} 个进程，共 {total_written} 字节", file=messages)
+
+        pending = [process for process in processes if process.pid not in finished]
+        print(f"正在使用 {threads} 个线程将 {len(pending)} 个进程转储到 {output_dir}...", file=messages)
+        messages.flush()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for process in pending:
+                extension = 'cdmp' if compress else 'bin'
+                output_file = os.path.join(output_dir, f"{process.name}_{process.pid}.{extension}")
+                process_start = time.perf_counter()
+
+                def checkpoint(address, written, pid=process.pid):
+                    journal.append({'type': 'progress', 'pid': pid, 'address': address, 'written': written})
+
+                resume_at = None
+                if process.pid in checkpoints:
+                    resume_at = (checkpoints[process.pid]['address'], checkpoints[process.pid]['written'])
+                stored = None
+                stats = {'bytes_skipped': 0}
+                try:
+                    if compress:
+                        written = write_compressed_dump(process, output_file, chunk_size, pool, max_inflight,
+                                                        known=known, stats=stats)
+                        if written is not None:
+                            written, stored = written
+                    else:
+                        written = write_process_dump(process, output_file, sparse, chunk_size, pool, max_inflight,
+                                                     checkpoint, resume_at, known, stats)
+                except Exception as e:
+                    journal.append({'type': 'process', 'pid': process.pid, 'status': 'failed', 'error': str(e)})
+                    report.write(process_record(process, 'failed', resumed_at=resume_at, error=str(e)))
+                    report.flush()
+                    continue
+                if written is None:
+                    journal.append({'type': 'process', 'pid': process.pid, 'status': 'empty'})
+                    report.write(process_record(process, 'empty', resumed_at=resume_at))
+                    report.flush()
+                    continue
+                journal.append({'type': 'process', 'pid': process.pid, 'status': 'done', 'bytes': written,
+                                'stored': stored, 'skipped': stats['bytes_skipped']})
+                elapsed = time.perf_counter() - process_start
+                rate = written / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+                total_written += written
+                total_skipped += stats['bytes_skipped']
+                report.write(process_record(process, 'done', written, stored,
+                                            stats['bytes_skipped'] if known is not None else None, elapsed, rate,
+                                            resume_at, output_file))
+                # 每个进程一经转储即被报告
+                report.flush()
+
+    wall_time = time.perf_counter() - start_time
+    print(f"已在 {wall_time:.2f} 秒内成功从 {len(processes)} 个进程转储 {total_written} 字节",
+          file=messages)
+    if known is not None:
+        print(f"已略过 {total_skipped} 字节的已知良好页面", file=messages)
+
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 3:
-        print("用法: python dump_process_memory.py <进程名或PID> <输出文件> [vmm_args...]")
+        print("用法: python dump_process_memory.py <进程名或PID> <输出文件> [--sparse] [--compress] [--known-good <集合文件>] [--chunk-size <字节数>] [vmm_args...]")
+        print("      python dump_process_memory.py --batch <PID列表|名称通配符|all> <输出目录> [--threads <n>] [--max-inflight <MB>] [--compress] [--known-good <集合文件>] [--resume] [--format <table|jsonl|csv|arrow>] [--output <文件>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
         print("示例: python dump_process_memory.py lsass.exe lsass.dmp -device memory.dmp")
+        print("示例: python dump_process_memory.py --batch 'svchost.exe,lsass.exe' dumps/ --threads 8 -device memory.dmp")
+        print("示例: python dump_process_memory.py --batch all dumps/ --resume -device memory.dmp")
+        print("示例: python dump_process_memory.py --batch all dumps/ --compress -device memory.dmp")
+        print("示例: python dump_process_memory.py --batch all dumps/ --known-good baseline.hashes -device memory.dmp")
+        print("示例: python dump_process_memory.py --batch all dumps/ --output dumps.csv -device memory.dmp")
         sys.exit(1)
 
-    process_id = sys.argv[1]
-    out_file = sys.argv[2]
-    vmm_arguments = sys.argv[3:]
+    args = sys.argv[1:]
+    batch_target = None
+    if args[0] == '--batch':
+        batch_target = args[1]
+        args = args[2:]
+        if not args:
+            print("错误: --batch 需要一个目标和一个输出目录。")
+            sys.exit(1)
+
+    positional = args[:1] if batch_target else args[:2]
+    vmm_arguments = []
+    sparse_output = False
+    chunk = DEFAULT_CHUNK_SIZE
+    thread_count = DEFAULT_THREADS
+    inflight = DEFAULT_MAX_INFLIGHT
+    resume_job = False
+    compress_output = False
+    known_good_file = None
+    output_format = None
+    output_path = None
+
+    # 解析参数
+    i = len(positional)
+    while i < len(args):
+        if args[i] == '--sparse':
+            sparse_output = True
+            i += 1
+        elif args[i] == '--chunk-size' and i + 1 < len(args):
+            chunk = int(args[i + 1], 0)
+            i += 2
+        elif args[i] == '--threads' and i + 1 < len(args):
+            thread_count = int(args[i + 1])
+            i += 2
+        elif args[i] == '--max-inflight' and i + 1 < len(args):
+            inflight = int(args[i + 1]) * 1024 * 1024
+            i += 2
+        elif args[i] == '--resume':
+            resume_job = True
+            i += 1
+        elif args[i] == '--compress':
+            compress_output = True
+            i += 1
+        elif args[i] == '--known-good' and i + 1 < len(args):
+            known_good_file = args[i + 1]
+            i += 2
+        elif args[i] == '--format' and i + 1 < len(args):
+            output_format = args[i + 1]
+            i += 2
+        elif args[i] == '--output' and i + 1 < len(args):
+            output_path = args[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
 
     if not vmm_arguments:
         print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
         sys.exit(1)
 
-    dump_process_memory(process_id, out_file, vmm_arguments)
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"错误: 未知的输出格式 '{output_format}' (可用: {', '.join(FORMATS)})。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if batch_target:
+            dump_processes(batch_target, positional[0], vmm_arguments, thread_count, inflight, sparse_output, chunk,
+                           resume_job, compress_output, known_good_file, output_format, output_path)
+        else:
+            dump_process_memory(positional[0], positional[1], vmm_arguments, sparse_output, chunk, compress_output,
+                                known_good_file)
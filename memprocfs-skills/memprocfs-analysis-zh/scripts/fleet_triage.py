@@ -0,0 +1,623 @@
+'''
+此脚本同时分诊多台主机的内存映像，并将结果合并为一个跨主机索引，用于回答
+"哪些主机运行了这个可执行文件"或"哪些主机与这个 IP 通信"之类的问题。
+
+每个映像都会运行系统分类收集器 (参见 system_classification.py)、句柄收集
+(参见 handle_table.py)，使用 --yara 时还会对所有进程执行 YARA 扫描。每个映像
+都在拥有自己 Vmm 的独立工作进程中分诊，因此崩溃或泄漏的 MemProcFS 实例不会
+影响其他映像。每台主机都有自己的目录，保存分类报告、句柄和 YARA 行以及其工作
+进程的日志。
+
+运行受全局预算限制：
+
+- --images 限制同时分诊的映像数。
+- --max-memory 限制运行中映像预留的内存。只有当已有预留再加一份仍在预算之内
+  时才会启动新的映像；每个映像预留 --image-memory，如果已完成的工作进程报告的
+  最大峰值内存更高，则预留该峰值。
+- --max-io 限制所有工作进程的 YARA 扫描合计读取进程内存的速率。MemProcFS 为
+  收集器所做的读取不受限制。
+
+每个映像完成后，该主机的进程、可执行文件路径、远程地址、服务、驱动程序、用户
+帐户、命名句柄和 YARA 规则会存入 '<输出目录>/fleet_index.sqlite' (替换该主机
+之前的行)，供 --query 读取。
+
+用法: python fleet_triage.py <映像目录|清单.json> <输出目录> [--collectors <名称,...>] [--no-handles]
+          [--yara <规则文件>] [--images <n>] [--threads <n>] [--max-memory <MB>] [--image-memory <MB>]
+          [--max-io <MB/s>] [--timeout <秒数>] [--plugin <模块>] [--resume] [--no-cache]
+          [--cache-dir <目录>] [vmm_args...]
+      python fleet_triage.py --query <输出目录> <类型> <值>
+
+清单是映像路径或 {"host", "image", "vmm_args"} 对象的 JSON 列表；相对路径相对于
+清单所在目录。vmm_args 会添加到映像的 -device 参数之后，例如 ["-memmap", "auto"]。
+'''
+
+from vmm_session import open_vmm
+from system_classification import COLLECTORS, DEFAULT_WORKERS, build_report, run_cached_collectors
+from handle_table import HANDLE_TABLE_VERSION, HandleTable, harvest_handles
+from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+from result_writers import open_writer
+from yara_rules import DEFAULT_CACHE_DIR as DEFAULT_RULE_CACHE_DIR, load_rules
+from yara_scan_process import sweep_processes
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import importlib
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from contextlib import redirect_stdout, redirect_stderr
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 默认同时分诊的映像数。
+DEFAULT_IMAGES = 2
+
+# 在工作进程报告峰值之前默认为每个映像预留的内存 (2 GiB)。
+DEFAULT_IMAGE_MEMORY = 0x80000000
+
+# 映像目录中会被分诊的文件。
+IMAGE_EXTENSIONS = ('.dmp', '.raw', '.mem', '.vmem', '.img', '.lime')
+
+INDEX_NAME = 'fleet_index.sqlite'
+
+# 跨主机索引中值的类型。
+INDEX_KINDS = ('process', 'path', 'remote', 'service', 'driver', 'user', 'handle', 'yara')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    status TEXT NOT NULL,
+    triaged REAL NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER,
+    process TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_key ON observations (kind, key);
+CREATE INDEX IF NOT EXISTS observations_host ON observations (host);
+'''
+
+# 不能说明连接远端的地址。
+_NO_REMOTE = ('', '*', '0.0.0.0', '::', '[::]')
+
+
+class IoBudget:
+    '''
+    按共享速率控制各工作进程的读取节奏。每次读取都会按其大小预约下一个空闲
+    时间段，因此所有工作进程的读取合计永远不会超过该速率。
+    '''
+
+    def __init__(self, rate):
+        '''
+        :param rate: 共享速率 (字节/秒)。
+        '''
+        self.rate = rate
+        self._next = multiprocessing.Value('d', 0.0)
+
+    def consume(self, size):
+        '''
+        记录已读取的 size 字节，并休眠到预算允许下一次读取为止。
+        '''
+        with self._next.get_lock():
+            now = time.monotonic()
+            start = max(now, self._next.value)
+            self._next.value = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class FleetIndex:
+    '''
+    跨主机索引：一个 SQLite 数据库，每台主机一行，每个 (类型, 值, 主机, 进程)
+    观测一行。查找值时不区分大小写。
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: 索引数据库的路径。
+        '''
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def store(self, summary, observations):
+        '''
+        替换一台主机的行。
+
+        :param summary: triage_image() 返回的摘要字典。
+        :param observations: (kind, value, pid, process) 元组的可迭代对象。
+        '''
+        host = summary['host']
+        with self.db:
+            self.db.execute('DELETE FROM observations WHERE host = ?', (host,))
+            self.db.execute('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?, ?)',
+                            (host, summary['image'], summary['status'], time.time(), json.dumps(summary)))
+            self.db.executemany('INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?)',
+                                ((kind, value.lower(), value, host, pid, process)
+                                 for kind, value, pid, process in observations))
+
+    def hosts(self):
+        '''
+        按主机名返回已编入索引的主机的摘要。
+        '''
+        return {host: json.loads(summary) for host, summary in self.db.execute('SELECT host, summary FROM hosts')}
+
+    def lookup(self, kind, value):
+        '''
+        返回观测到某个值的主机。
+
+        :param kind: INDEX_KINDS 之一。
+        :param value: 值，例如 IP 地址或可执行文件路径。
+        :return: 将主机名映射到已排序的 (pid, 进程) 对列表的字典。
+        '''
+        hosts = {}
+        for host, pid, process in self.db.execute(
+                'SELECT host, pid, process FROM observations WHERE kind = ? AND key = ? ORDER BY host, pid',
+                (kind, value.lower())):
+            hosts.setdefault(host, []).append((pid, process))
+        return hosts
+
+    def close(self):
+        self.db.close()
+
+
+def load_images(source):
+    '''
+    列出一次多主机运行的映像。
+
+    :param source: 映像目录或 JSON 清单。
+    :return: 主机名唯一的 (host, image, vmm_args) 元组列表。
+    '''
+    if os.path.isdir(source):
+        base = ''
+        entries = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                   if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(source, name))]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as f:
+            entries = json.load(f)
+
+    images = []
+    hosts = set()
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'image': entry}
+        image = os.path.join(base, entry['image'])
+        host = entry.get('host') or os.path.splitext(os.path.basename(image))[0]
+        host = re.sub(r'[^\w.-]', '_', host)
+        unique, n = host, 2
+        while unique.lower() in hosts:
+            unique, n = f"{host}_{n}", n + 1
+        hosts.add(unique.lower())
+        images.append((unique, image, list(entry.get('vmm_args', []))))
+    return images
+
+
+def peak_memory():
+    '''
+    返回当前进程的峰值常驻内存 (字节)；如果不可用则返回 None。
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def iter_observations(report, handles=None, matches=()):
+    '''
+    生成一台主机用于索引的 (kind, value, pid, process) 元组。
+
+    :param report: 分类报告，参见 build_report()。
+    :param handles: 可选的该主机的 HandleTable。
+    :param matches: YARA 扫描的 (rule, pid, process) 元组。
+    '''
+    for process in report.get('processes') or []:
+        yield 'process', process['name'], process['pid'], process['name']
+        if process.get('path'):
+            yield 'path', process['path'], process['pid'], process['name']
+
+    columns = (report.get('network_connections') or {}).get('columns', {})
+    for address, pid, name in zip(columns.get('dst_address', ()), columns.get('pid', ()), columns.get('process', ())):
+        if address not in _NO_REMOTE:
+            yield 'remote', address, pid, name
+
+    columns = (report.get('services') or {}).get('columns', {})
+    for name, pid in zip(columns.get('name', ()), columns.get('pid', ())):
+        if name:
+            yield 'service', name, pid or None, None
+    for name in (report.get('drivers') or {}).get('columns', {}).get('name', ()):
+        if name:
+            yield 'driver', name, None, None
+    for name in (report.get('users') or {}).get('columns', {}).get('name', ()):
+        if name:
+            yield 'user', name, None, None
+
+    if handles is not None:
+        for name in handles.names:
+            if name:
+                for pid, process in handles.holders(handles.find_by_name(name)):
+                    yield 'handle', name, pid, process
+
+    yield from (('yara', rule, pid, process) for rule, pid, process in matches)
+
+
+# 工作进程的 I/O 预算，由 _worker() 设置。
+_io_budget = None
+
+
+def _paced(chunks):
+    # YARA 扫描的块钩子 (参见 yara_scan_process.sweep_processes())
+    for address, data in chunks:
+        if _io_budget is not None:
+            _io_budget.consume(len(data))
+        yield address, data
+
+
+def sweep_image(vmm, rule_file, output_file, threads=DEFAULT_WORKERS, cache_dir=DEFAULT_RULE_CACHE_DIR):
+    '''
+    使用 YARA 规则扫描一个映像中所有进程的内存，并写出与 yara_scan_process.py --sweep
+    相同的记录。读取速度受共享的 --max-io 预算限制。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param rule_file: YARA 规则文件的路径。
+    :param output_file: JSONL 输出的路径。
+    :param threads: 同时扫描的进程数。
+    :param cache_dir: 保存已编译规则的目录。
+    :return: (匹配数, 命中) 元组；命中中每个匹配的规则和进程对应一个 (rule, pid, process) 元组。
+    '''
+    rules = load_rules(rule_file, cache_dir)
+    if rules is None:
+        print("警告: 未安装 yara-python；MemProcFS 会为每个进程编译规则，"
+              "且 --max-io 不适用。")
+        with open(rule_file, 'r') as f:
+            rule_source = f.read()
+    else:
+        rule_source = None
+    lock = threading.Lock()
+    found = set()
+
+    with open(output_file, 'w') as output:
+        def emit(record):
+            with lock:
+                if record['type'] == 'match':
+                    found.add((record['rule'], record['pid'], record['process']))
+                output.write(json.dumps(record) + '\n')
+
+        total, _, _ = sweep_processes(vmm.process_all(), rules, emit, threads, rule_source=rule_source,
+                                      chunk_hook=_paced)
+    return total, sorted(found)
+
+
+def triage_image(host, image, vmm_args, host_dir, options):
+    '''
+    分诊一个映像；在工作进程中运行。其输出写入 '<host_dir>/triage.log'。
+
+    :param host: 主机名。
+    :param image: 内存映像的路径。
+    :param vmm_args: 用于初始化 MemProcFS 的其他参数。
+    :param host_dir: 保存该主机结果的目录。
+    :param options: 包含 'collectors'、'handles'、'rule_file'、'threads'、'timeout'、'use_cache' 和 'cache_dir' 的字典。
+    :return: (summary, observations) 元组。
+    '''
+    start_time = time.perf_counter()
+    summary = {'host': host, 'image': image, 'status': 'ok'}
+    observations = []
+    os.makedirs(host_dir, exist_ok=True)
+    with open(os.path.join(host_dir, 'triage.log'), 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        vmm = None
+        cache = None
+        try:
+            vmm_args = ['-device', image] + vmm_args
+
+            def get_vmm():
+                nonlocal vmm
+                if vmm is None:
+                    vmm = open_vmm(vmm_args)
+                    print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+                return vmm
+
+            cache = open_cache(vmm_args, options['cache_dir']) if options['use_cache'] else None
+            names = options['collectors'] or list(COLLECTORS)
+            results, stages = run_cached_collectors(names, get_vmm, options['threads'], options['timeout'], cache)
+            report = build_report(results, stages, time.perf_counter() - start_time)
+            report['host'] = host
+            with open(os.path.join(host_dir, 'classification.json'), 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            summary['processes'] = len(results.get('processes') or [])
+            summary['connections'] = (results.get('network_connections') or {}).get('count', 0)
+            summary['failed_stages'] = [name for name, stage in stages.items() if stage['status'] in ('error', 'timeout')]
+
+            handles = None
+            if options['handles']:
+                data = cache.get('handle_table', HANDLE_TABLE_VERSION) if cache else None
+                if data is not None:
+                    handles = HandleTable.from_dict(data)
+                else:
+                    handles, errors = harvest_handles(get_vmm(), options['threads'])
+                    for pid, error in errors.items():
+                        print(f"  警告: 无法读取 PID {pid} 的句柄: {error}")
+                    if cache and not errors:
+                        cache.put('handle_table', HANDLE_TABLE_VERSION, handles.to_dict())
+                with open_writer('jsonl', os.path.join(host_dir, 'handles.jsonl'), HANDLE_FIELDS, HANDLE_TYPES) as out:
+                    out.write_many(handles.rows())
+                summary['handles'] = len(handles)
+
+            matches = []
+            if options['rule_file']:
+                summary['yara_matches'], matches = sweep_image(get_vmm(), options['rule_file'],
+                                                               os.path.join(host_dir, 'yara.jsonl'), options['threads'])
+
+            observations = list(set(iter_observations(report, handles, matches)))
+        except Exception as e:
+            summary['status'] = 'error'
+            summary['error'] = str(e)
+            print(f"发生错误: {e}")
+        finally:
+            if cache:
+                cache.close()
+            if vmm is not None and hasattr(vmm, 'close'):
+                vmm.close()
+    summary['seconds'] = round(time.perf_counter() - start_time, 3)
+    summary['peak_memory'] = peak_memory()
+    return summary, observations
+
+
+def _worker(connection, io_budget, plugins, args):
+    '''
+    工作进程的入口：分诊一个映像并将结果发送给父进程。
+    '''
+    global _io_budget
+    _io_budget = io_budget
+    # 插件收集器也必须在工作进程中注册
+    for plugin in plugins:
+        importlib.import_module(plugin)
+    connection.send(triage_image(*args))
+    connection.close()
+
+
+def fleet_triage(source, output_dir, vmm_args=(), collectors=None, handles=True, rule_file=None,
+                 images=DEFAULT_IMAGES, threads=DEFAULT_WORKERS, max_memory=None, image_memory=DEFAULT_IMAGE_MEMORY,
+                 max_io=None, timeout=None, plugins=(), resume=False, use_cache=True, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    在各自独立的工作进程中分诊多台主机的映像，并将结果合并到多主机索引中。
+
+    :param source: 映像目录或 JSON 清单。
+    :param output_dir: 保存每台主机结果和索引的目录。
+    :param vmm_args: 添加到每个映像 -device 参数之后的参数。
+    :param collectors: 可选的要运行的收集器名称列表；默认为所有已注册的收集器。
+    :param handles: 收集每个映像的句柄。
+    :param rule_file: 可选的 YARA 规则文件，用于扫描每个映像。
+    :param images: 同时分诊的映像数。
+    :param threads: 每个映像使用的线程数。
+    :param max_memory: 可选的所有运行中映像的内存预算 (字节)。
+    :param image_memory: 在工作进程报告更高峰值之前为每个映像预留的内存。
+    :param max_io: 可选的所有 YARA 扫描读取进程内存的速率 (字节/秒)。
+    :param timeout: 可选的超时秒数，应用于每个收集器。
+    :param plugins: 注册其他收集器的模块，在每个工作进程中导入。
+    :param resume: 跳过索引中已成功分诊的主机。
+    :param use_cache: 复用结果并将其存入工件缓存。
+    :param cache_dir: 保存工件缓存的目录。
+    '''
+    try:
+        unknown = [name for name in (collectors or []) if name not in COLLECTORS]
+        if unknown:
+            print(f"错误: 未知的收集器: {', '.join(unknown)} (可用: {', '.join(COLLECTORS)})")
+            return
+        if rule_file and not os.path.isfile(rule_file):
+            print(f"错误: 未在 {rule_file} 找到 YARA 规则文件")
+            return
+
+        start_time = time.perf_counter()
+        os.makedirs(output_dir, exist_ok=True)
+        index = FleetIndex(os.path.join(output_dir, INDEX_NAME))
+        pending = deque(load_images(source))
+        if resume:
+            triaged = {host for host, summary in index.hosts().items() if summary['status'] == 'ok'}
+            pending = deque(item for item in pending if item[0] not in triaged)
+            print(f"继续执行: {len(triaged)} 台主机已分诊")
+        if not pending:
+            print(f"{source} 中没有要分诊的映像。")
+            index.close()
+            return
+
+        options = {'collectors': collectors, 'handles': handles, 'rule_file': rule_file and os.path.abspath(rule_file),
+                   'threads': threads, 'timeout': timeout, 'use_cache': use_cache, 'cache_dir': cache_dir}
+        budget = f"，内存预算 {max_memory // 0x100000} MB" if max_memory else ''
+        budget += f"，I/O 上限 {max_io / 0x100000:.0f} MB/s" if max_io else ''
+        print(f"正在分诊 {len(pending)} 个映像，每次 {images} 个{budget}...")
+
+        # 每个映像都使用新的工作进程，因此映像完成后其 Vmm 的内存会被归还，
+        # 原生库崩溃也只会丢失该映像
+        io_budget = IoBudget(max_io) if max_io else None
+        running = {}
+        reserved = 0
+        succeeded = 0
+        total = len(pending)
+        try:
+            while pending or running:
+                while pending and len(running) < images and \
+                        (not running or not max_memory or reserved + image_memory <= max_memory):
+                    host, image, extra_args = pending.popleft()
+                    receiver, sender = multiprocessing.Pipe(False)
+                    worker = multiprocessing.Process(target=_worker, args=(
+                        sender, io_budget, list(plugins),
+                        (host, image, list(vmm_args) + extra_args, os.path.join(output_dir, host), options)))
+                    worker.start()
+                    sender.close()
+                    running[receiver] = (host, image, worker, image_memory)
+                    reserved += image_memory
+
+                receiver = wait(list(running))[0]
+                host, image, worker, reservation = running.pop(receiver)
+                reserved -= reservation
+                try:
+                    summary, observations = receiver.recv()
+                except EOFError:
+                    worker.join()
+                    summary, observations = {'host': host, 'image': image, 'status': 'error',
+                                             'error': f"工作进程以退出码 {worker.exitcode} 退出"}, []
+                receiver.close()
+                worker.join()
+                if summary.get('peak_memory'):
+                    image_memory = max(image_memory, summary['peak_memory'])
+                index.store(summary, observations)
+
+                if summary['status'] == 'ok':
+                    succeeded += 1
+                    details = f"{summary['processes']} 个进程，{summary['connections']} 个连接"
+                    if 'handles' in summary:
+                        details += f"，{summary['handles']} 个句柄"
+                    if 'yara_matches' in summary:
+                        details += f"，{summary['yara_matches']} 个 YARA 匹配"
+                    if summary.get('peak_memory'):
+                        details += f"，峰值 {summary['peak_memory'] // 0x100000} MB"
+                    print(f"  [+] {summary['host']}: {details}，耗时 {summary['seconds']:.2f} 秒")
+                    if summary['failed_stages']:
+                        print(f"      警告: 失败的阶段: {', '.join(summary['failed_stages'])}")
+                else:
+                    print(f"  [-] {summary['host']}: {summary['error']}")
+        finally:
+            for _, _, worker, _ in running.values():
+                worker.terminate()
+                worker.join()
+            index.close()
+
+        wall_time = time.perf_counter() - start_time
+        print(f"已在 {wall_time:.2f} 秒内分诊 {total} 个映像中的 {succeeded} 个；"
+              f"索引: {os.path.join(output_dir, INDEX_NAME)}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+def query_index(output_dir, kind, value):
+    '''
+    打印观测到某个值的主机。
+
+    :param output_dir: 多主机运行的输出目录。
+    :param kind: INDEX_KINDS 之一。
+    :param value: 要查找的值 (不区分大小写)。
+    '''
+    try:
+        if kind not in INDEX_KINDS:
+            print(f"错误: 未知的类型 '{kind}' (可用: {', '.join(INDEX_KINDS)})")
+            return
+        path = os.path.join(output_dir, INDEX_NAME)
+        if not os.path.exists(path):
+            print(f"错误: {path} 处没有多主机索引")
+            return
+        index = FleetIndex(path)
+        hosts = index.lookup(kind, value)
+        total = len(index.hosts())
+        index.close()
+
+        print(f"{kind} '{value}': 在 {total} 台主机中的 {len(hosts)} 台上出现")
+        for host, entries in hosts.items():
+            processes = [f"{process} (PID: {pid})" if process else f"PID: {pid}"
+                         for pid, process in entries if process or pid is not None]
+            print(f"  - {host}" + (f": {', '.join(processes[:10])}" if processes else ''))
+            if len(processes) > 10:
+                print(f"      ... 另有 {len(processes) - 10} 个进程")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 5 and sys.argv[1] == '--query':
+        query_index(sys.argv[2], sys.argv[3], ' '.join(sys.argv[4:]))
+        sys.exit(0)
+
+    if len(sys.argv) < 3:
+        print("用法: python fleet_triage.py <映像目录|清单.json> <输出目录> [--collectors <名称,...>] [--no-handles]")
+        print("          [--yara <规则文件>] [--images <n>] [--threads <n>] [--max-memory <MB>] [--image-memory <MB>]")
+        print("          [--max-io <MB/s>] [--timeout <秒数>] [--plugin <模块>] [--resume] [--no-cache]")
+        print("          [--cache-dir <目录>] [vmm_args...]")
+        print("      python fleet_triage.py --query <输出目录> <类型> <值>")
+        print(f"类型: {', '.join(INDEX_KINDS)}")
+        print("示例: python fleet_triage.py images/ fleet/ --yara suspicious.yara --images 4 --max-memory 16384")
+        print("示例: python fleet_triage.py --query fleet/ remote 203.0.113.7")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    output_directory = sys.argv[2]
+    vmm_arguments = []
+    collector_names = None
+    harvest = True
+    rules_file = None
+    image_count = DEFAULT_IMAGES
+    thread_count = DEFAULT_WORKERS
+    memory_budget = None
+    memory_per_image = DEFAULT_IMAGE_MEMORY
+    io_rate = None
+    stage_timeout = None
+    plugin_modules = []
+    resume_run = False
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
+
+    # 解析参数
+    i = 3
+    while i < len(sys.argv):
+        if sys.argv[i] == '--collectors' and i + 1 < len(sys.argv):
+            collector_names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--no-handles':
+            harvest = False
+            i += 1
+        elif sys.argv[i] == '--yara' and i + 1 < len(sys.argv):
+            rules_file = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--images' and i + 1 < len(sys.argv):
+            image_count = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--threads' and i + 1 < len(sys.argv):
+            thread_count = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--max-memory' and i + 1 < len(sys.argv):
+            memory_budget = int(sys.argv[i + 1]) * 0x100000
+            i += 2
+        elif sys.argv[i] == '--image-memory' and i + 1 < len(sys.argv):
+            memory_per_image = int(sys.argv[i + 1]) * 0x100000
+            i += 2
+        elif sys.argv[i] == '--max-io' and i + 1 < len(sys.argv):
+            io_rate = float(sys.argv[i + 1]) * 0x100000
+            i += 2
+        elif sys.argv[i] == '--timeout' and i + 1 < len(sys.argv):
+            stage_timeout = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--plugin' and i + 1 < len(sys.argv):
+            # 插件模块在导入时调用 register_collector()
+            importlib.import_module(sys.argv[i + 1])
+            plugin_modules.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--resume':
+            resume_run = True
+            i += 1
+        elif sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    fleet_triage(source, output_directory, vmm_arguments, collector_names, harvest, rules_file, image_count,
+                 thread_count, memory_budget, memory_per_image, io_rate, stage_timeout, plugin_modules, resume_run,
+                 cache_enabled, cache_directory)
@@ -0,0 +1,418 @@
+'''
+此脚本将所有进程的打开句柄收集到一张表中，并回答反向查询，
+例如"哪些进程持有此文件、互斥体或注册表项的句柄"。
+
+该表基于数组：每个句柄一行，包含 PID、句柄值、驻留的类型 id 和驻留的名称 id。
+按对象名称和类型建立的倒排索引提供 O(1) 的精确查找和按类型计数，
+排序后的名称列表提供 O(log n) 的前缀查找。匹配的句柄以表格形式写出，或通过
+--format 写为 JSONL、CSV 或 Arrow，输出到 stdout 或通过 --output 写入文件
+(参见 result_writers.py)；安装 pyarrow 后也可以将整张表导出为 Parquet。
+该表按映像缓存 (参见 artifact_cache.py)。
+
+用法: python handle_table.py [--name <对象名称>] [--prefix <名称前缀>] [--type <类型>] [--counts]
+           [--format <table|jsonl|csv|arrow>] [--output <文件>] [--parquet <文件>] [--threads <n>]
+           [--no-cache] [--cache-dir <目录>] [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+from result_writers import FORMATS, guess_format, open_writer
+from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_THREADS = 4
+
+# 已缓存句柄表布局的版本。
+HANDLE_TABLE_VERSION = 1
+
+
+class HandleTable:
+    '''
+    带有按名称和类型倒排索引的句柄列式存储。
+    名称和类型经过驻留，因此每个不同的字符串只保存一次。
+    '''
+
+    def __init__(self):
+        self.pids = array('I')
+        self.handle_values = array('Q')
+        self.type_ids = array('H')
+        self.name_ids = array('I')
+        self.types = []
+        self.names = []
+        self.processes = {}
+        self._type_lookup = {}
+        self._name_lookup = {}
+        self._rows_by_type = []
+        self._rows_by_name = {}
+        self._rows_by_pid = {}
+        self._sorted_names = None
+
+    def __len__(self):
+        return len(self.pids)
+
+    def _intern_type(self, value):
+        type_id = self._type_lookup.get(value)
+        if type_id is None:
+            type_id = self._type_lookup[value] = len(self.types)
+            self.types.append(value)
+            self._rows_by_type.append(array('I'))
+        return type_id
+
+    def _intern_name(self, value):
+        name_id = self._name_lookup.get(value)
+        if name_id is None:
+            name_id = self._name_lookup[value] = len(self.names)
+            self.names.append(value)
+            self._sorted_names = None
+        return name_id
+
+    def add(self, pid, handle_value, handle_type, name):
+        '''
+        追加一个句柄并更新索引。
+
+        :param pid: 持有该句柄的进程的 PID。
+        :param handle_value: 句柄值。
+        :param handle_type: 对象类型，例如 'File' 或 'Mutant'。
+        :param name: 对象名称；可以为空。
+        '''
+        row = len(self.pids)
+        type_id = self._intern_type(handle_type or '')
+        name_id = self._intern_name(name or '')
+        self.pids.append(pid)
+        self.handle_values.append(handle_value)
+        self.type_ids.append(type_id)
+        self.name_ids.append(name_id)
+        self._rows_by_type[type_id].append(row)
+        if name:
+            self._rows_by_name.setdefault(name.lower(), array('I')).append(row)
+        self._rows_by_pid.setdefault(pid, array('I')).append(row)
+
+    def add_process(self, process):
+        '''
+        追加 memprocfs 进程对象的所有句柄。
+        '''
+        self.processes[process.pid] = process.name
+        for handle in process.handle_all():
+            self.add(process.pid, handle.handle_value, handle.type, handle.name)
+
+    def row(self, index):
+        '''
+        以包含 'pid'、'process'、'handle_value'、'type' 和 'name' 的字典形式返回一行。
+        '''
+        pid = self.pids[index]
+        return {'pid': pid, 'process': self.processes.get(pid, ''), 'handle_value': self.handle_values[index],
+                'type': self.types[self.type_ids[index]], 'name': self.names[self.name_ids[index]]}
+
+    def rows(self, indexes=None):
+        '''
+        以字典形式生成各行，参见 row()。
+
+        :param indexes: 可选的行索引可迭代对象；默认为所有行。
+        '''
+        for index in (range(len(self)) if indexes is None else indexes):
+            yield self.row(index)
+
+    def find_by_name(self, name):
+        '''
+        返回指向某个对象名称的句柄的行索引 (不区分大小写)。
+        '''
+        return self._rows_by_name.get(name.lower(), array('I'))
+
+    def find_by_prefix(self, prefix):
+        '''
+        返回对象名称以 prefix 开头的句柄的行索引 (不区分大小写)。
+        '''
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._rows_by_name)
+        prefix = prefix.lower()
+        rows = array('I')
+        for key in self._sorted_names[bisect_left(self._sorted_names, prefix):]:
+            if not key.startswith(prefix):
+                break
+            rows.extend(self._rows_by_name[key])
+        return sorted(rows)
+
+    def find_by_type(self, handle_type):
+        '''
+        返回某个对象类型的句柄的行索引。
+        '''
+        type_id = self._type_lookup.get(handle_type)
+        return self._rows_by_type[type_id] if type_id is not None else array('I')
+
+    def find_by_pid(self, pid):
+        '''
+        返回某个进程持有的句柄的行索引。
+        '''
+        return self._rows_by_pid.get(pid, array('I'))
+
+    def type_counts(self):
+        '''
+        返回将每个对象类型映射到其句柄数的字典。
+        '''
+        return {self.types[type_id]: len(rows) for type_id, rows in enumerate(self._rows_by_type)}
+
+    def holders(self, indexes):
+        '''
+        返回持有给定行的 (pid, 进程名) 对，已排序。
+        '''
+        pids = sorted({self.pids[index] for index in indexes})
+        return [(pid, self.processes.get(pid, '')) for pid in pids]
+
+    def to_dict(self):
+        '''
+        以可 JSON 序列化的列式形式返回该表。
+        '''
+        return {'processes': [[pid, name] for pid, name in self.processes.items()],
+                'types': self.types, 'names': self.names, 'pids': self.pids.tolist(),
+                'handle_values': self.handle_values.tolist(), 'type_ids': self.type_ids.tolist(),
+                'name_ids': self.name_ids.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        '''
+        根据 to_dict() 的输出重建表及其索引。
+        '''
+        table = cls()
+        table.processes = {pid: name for pid, name in data['processes']}
+        for pid, handle_value, type_id, name_id in zip(data['pids'], data['handle_values'],
+                                                       data['type_ids'], data['name_ids']):
+            table.add(pid, handle_value, data['types'][type_id], data['names'][name_id])
+        return table
+
+
+def harvest_handles(vmm, threads=DEFAULT_THREADS):
+    '''
+    将所有进程的句柄收集到 HandleTable 中。各进程的句柄表在线程池中读取，
+    并按 PID 顺序添加。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param threads: 读取句柄表的工作线程数。
+    :return: (table, errors) 元组；errors 将 PID 映射到错误信息。
+    '''
+    def read_handles(process):
+        return [(handle.handle_value, handle.type, handle.name) for handle in process.handle_all()]
+
+    table = HandleTable()
+    errors = {}
+    processes = sorted(vmm.process_all(), key=lambda p: p.pid)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [(process, pool.submit(read_handles, process)) for process in processes]
+        for process, future in futures:
+            table.processes[process.pid] = process.name
+            try:
+                handles = future.result()
+            except Exception as e:
+                errors[process.pid] = str(e)
+                continue
+            for handle_value, handle_type, name in handles:
+                table.add(process.pid, handle_value, handle_type, name)
+    return table, errors
+
+
+def write_parquet(table, output_file):
+    '''
+    将表写入 Parquet 文件。类型和名称写为字典编码的列，直接复用驻留的字符串列表。
+    需要可选的 pyarrow 包。
+
+    :param table: HandleTable。
+    :param output_file: Parquet 文件的路径。
+    '''
+    if pyarrow is None:
+        raise RuntimeError("Parquet 导出需要 pyarrow (pip install pyarrow)")
+    process_names = [table.processes.get(pid, '') for pid in table.pids]
+    arrow_table = pyarrow.table({
+        'pid': pyarrow.array(table.pids, type=pyarrow.uint32()),
+        'process': pyarrow.array(process_names).dictionary_encode(),
+        'handle_value': pyarrow.array(table.handle_values, type=pyarrow.uint64()),
+        'type': pyarrow.DictionaryArray.from_arrays(pyarrow.array(table.type_ids, type=pyarrow.uint16()),
+                                                    pyarrow.array(table.types)),
+        'name': pyarrow.DictionaryArray.from_arrays(pyarrow.array(table.name_ids, type=pyarrow.uint32()),
+                                                    pyarrow.array(table.names)),
+    })
+    pyarrow.parquet.write_table(arrow_table, output_file)
+
+
+def load_handle_table(vmm_args, threads=DEFAULT_THREADS, use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+                      messages=None):
+    '''
+    返回所有进程的 HandleTable，尽可能从工件缓存读取。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param threads: 读取句柄表的工作线程数。
+    :param use_cache: 复用该表并将其存入工件缓存。
+    :param cache_dir: 保存工件缓存的目录。
+    :param messages: 可选的进度消息输出流；默认为 stdout。
+    '''
+    cache = open_cache(vmm_args, cache_dir) if use_cache else None
+    try:
+        data = cache.get('handle_table', HANDLE_TABLE_VERSION) if cache else None
+        if data is not None:
+            table = HandleTable.from_dict(data)
+            print(f"已从工件缓存加载 {len(table)} 个句柄", file=messages)
+        else:
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS 已使用参数初始化: {vmm_args}", file=messages)
+            start_time = time.perf_counter()
+            table, errors = harvest_handles(vmm, threads)
+            elapsed = time.perf_counter() - start_time
+            print(f"已在 {elapsed:.2f} 秒内从 {len(table.processes)} 个进程收集 {len(table)} 个句柄", file=messages)
+            for pid, error in errors.items():
+                print(f"  警告: 无法读取 PID {pid} 的句柄: {error}", file=messages)
+            if cache and not errors:
+                cache.put('handle_table', HANDLE_TABLE_VERSION, table.to_dict())
+    finally:
+        if cache:
+            cache.close()
+    return table
+
+
+def handle_table(vmm_args, name=None, prefix=None, handle_type=None, counts=False, output_format='table',
+                 output_file=None, parquet_file=None, threads=DEFAULT_THREADS, use_cache=True,
+                 cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    收集所有进程的句柄并执行请求的查询。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param name: 可选的对象名称；列出持有其句柄的进程。
+    :param prefix: 可选的对象名称前缀，例如目录或注册表路径。
+    :param handle_type: 可选的对象类型；限制查询和导出的范围。
+    :param counts: 打印每种类型的句柄数。
+    :param output_format: 'table'、'jsonl'、'csv' 或 'arrow'。
+    :param output_file: 可选的输出文件路径，(匹配的) 句柄写入其中；默认为 stdout。
+    :param parquet_file: 可选的路径，用于将所有句柄导出为 Parquet。
+    :param threads: 读取句柄表的工作线程数。
+    :param use_cache: 复用该表并将其存入工件缓存。
+    :param cache_dir: 保存工件缓存的目录。
+    '''
+    try:
+        out = open_writer(output_format, output_file, HANDLE_FIELDS, HANDLE_TYPES)
+        with out:
+            table = load_handle_table(vmm_args, threads, use_cache, cache_dir, out.messages)
+
+            if counts:
+                print("\n--- 每种类型的句柄数 ---", file=out.messages)
+                for type_name, count in sorted(table.type_counts().items(), key=lambda x: -x[1]):
+                    print(f"  {type_name or '<unknown>'}: {count}", file=out.messages)
+
+            indexes = None
+            if name is not None:
+                indexes = table.find_by_name(name)
+            elif prefix is not None:
+                indexes = table.find_by_prefix(prefix)
+            if handle_type is not None:
+                type_id = table.types.index(handle_type) if handle_type in table.types else None
+                if indexes is None:
+                    indexes = table.find_by_type(handle_type)
+                else:
+                    indexes = [index for index in indexes if table.type_ids[index] == type_id]
+
+            if indexes is not None:
+                query = name if name is not None else (f"{prefix}*" if prefix is not None else '*')
+                print(f"\n--- 匹配 '{query}' 的 {len(indexes)} 个句柄"
+                      f"{f' (类型 {handle_type})' if handle_type else ''} ---", file=out.messages)
+                out.messages.flush()
+            # 没有查询时，只有写入文件或机器可读格式时才写出所有句柄
+            if indexes is not None or output_file or out.machine_readable:
+                out.write_many(table.rows(indexes))
+                out.flush()
+            if indexes is not None:
+                holders = table.holders(indexes)
+                print(f"由 {len(holders)} 个进程持有: {', '.join(f'{n} ({p})' for p, n in holders)}",
+                      file=out.messages)
+
+        if output_file:
+            print(f"\n{out.count} 个句柄已写入: {output_file}")
+
+        if parquet_file:
+            write_parquet(table, parquet_file)
+            print(f"\n{len(table)} 个句柄已写入: {parquet_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("用法: python handle_table.py [--name <对象名称>] [--prefix <名称前缀>] [--type <类型>] [--counts]")
+        print("           [--format <table|jsonl|csv|arrow>] [--output <文件>] [--parquet <文件>] [--threads <n>]")
+        print("           [--no-cache] [--cache-dir <目录>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python handle_table.py --name '\\BaseNamedObjects\\SM0:1234:304:WilStaging_02' -device memory.dmp")
+        print("示例: python handle_table.py --prefix '\\Device\\HarddiskVolume3\\Users\\' --type File -device memory.dmp")
+        print("示例: python handle_table.py --type Mutant --output mutants.csv -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    object_name = None
+    name_prefix = None
+    object_type = None
+    show_counts = False
+    output_format = None
+    output_path = None
+    parquet_output = None
+    thread_count = DEFAULT_THREADS
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
+
+    # 解析参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--name' and i + 1 < len(sys.argv):
+            object_name = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--prefix' and i + 1 < len(sys.argv):
+            name_prefix = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--type' and i + 1 < len(sys.argv):
+            object_type = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--counts':
+            show_counts = True
+            i += 1
+        elif sys.argv[i] == '--format' and i + 1 < len(sys.argv):
+            output_format = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
+            output_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--parquet' and i + 1 < len(sys.argv):
+            parquet_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--threads' and i + 1 < len(sys.argv):
+            thread_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
+        sys.exit(1)
+
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"错误: 未知的输出格式 '{output_format}' (可用: {', '.join(FORMATS)})。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        handle_table(vmm_arguments, object_name, name_prefix, object_type, show_counts, output_format,
+                     output_path, parquet_output, thread_count, cache_enabled, cache_directory)
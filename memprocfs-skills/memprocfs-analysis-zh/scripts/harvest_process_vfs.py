@@ -0,0 +1,356 @@
+'''
+此脚本收集每个进程的 VFS 工件 (内存映射、线程、令牌以及 FindEvil 发现)，
+并将解析后的行以流的方式写入一个 JSONL 或 Parquet 数据集。
+
+为数千个进程各读取几个文件，就是数千次阻塞的 VFS 读取。这些读取由 asyncio
+驱动，并在线程池上运行:
+
+- 一个 PID 的读取被合并为一次执行器调用，因此每个进程只需进入线程池一次，
+  而不是每个文件一次。
+- 最多同时处理 --concurrency 个 PID。解析后的行通过一个有界队列交给单个
+  写入器；当写入器跟不上时，队列被填满，处理中的 PID 等待交出其行，并且
+  不会启动新的 PID (背压)，因此无论进程有多少，内存都保持有界。
+- 失败的读取最多重试 --retries 次，并采用指数退避；只重新读取失败的工件。
+  仍然失败的读取会被报告，收集继续进行。
+
+文本表 (memmap、threads、findevil) 的每个表格行成为一行；令牌目录成为包含其
+文件内容的一行。FindEvil 发现列在一个全局表中，只读取一次并按 PID 拆分。
+每一行都有 pid、process、artifact、row (其在文件中的索引) 和 fields
+(列名 -> 文本) 字段。
+
+用法: python harvest_process_vfs.py <输出文件> [--artifacts <名称,...>] [--pid <pid,...>]
+          [--concurrency <n>] [--retries <n>] [--queue <n>] [vmm_args...]
+
+输出文件名以 .parquet 结尾时写为 Parquet (需要 pyarrow)，否则写为 JSONL。
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from sys_parsers import iter_table_rows
+from vfs_stream import iter_lines, read_text
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RETRIES = 2
+DEFAULT_QUEUE_SIZE = 64
+
+# 失败读取第一次重试前的延迟，之后每次重试加倍。
+RETRY_DELAY = 0.1
+
+# 每个 Parquet 行组的行数。
+ROW_GROUP_SIZE = 65536
+
+# 收集的工件: 名称 -> (VFS 路径, 类型)。含 {pid} 的路径对每个进程读取，其他路径只读取
+# 一次，其行按 PID 列分配给进程。'table' 的每个表格行解析为一行，'files' 目录解析为
+# 包含其文件内容的一行。
+ARTIFACTS = {
+    'memmap': ('/pid/{pid}/memmap/vad.txt', 'table'),
+    'threads': ('/pid/{pid}/threads/threads.txt', 'table'),
+    'token': ('/pid/{pid}/token', 'files'),
+    'findevil': ('/forensic/findevil/findevil.txt', 'table'),
+}
+
+
+def read_artifact(vmm, name, pid=None):
+    '''
+    读取并解析一个工件。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param name: ARTIFACTS 的键。
+    :param pid: 进程 ID，用于每个进程的工件。
+    :return: 列名到文本的字典列表。
+    '''
+    path, kind = ARTIFACTS[name]
+    path = path.format(pid=pid)
+    if kind == 'files':
+        return [{entry: read_text(vmm, f"{path}/{entry}").strip()
+                 for entry, info in sorted(vmm.vfs.list(path).items()) if not info['f_isdir']}]
+    return [{title.lower(): value for title, value in row.items()}
+            for row in iter_table_rows(iter_lines(vmm, path))]
+
+
+def read_process_batch(vmm, pid, names):
+    '''
+    在工作线程上一次性读取一个 PID 的进程工件。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param pid: 进程 ID。
+    :param names: 要读取的工件。
+    :return: (进程名称, rows, errors) 元组；rows 和 errors 将工件名称映射到解析后的行
+             和错误信息。
+    '''
+    try:
+        process_name = vmm.process(pid).name
+    except Exception as e:
+        return None, {}, {name: str(e) for name in names}
+    rows = {}
+    errors = {}
+    for name in names:
+        try:
+            rows[name] = read_artifact(vmm, name, pid)
+        except Exception as e:
+            errors[name] = str(e)
+    return process_name, rows, errors
+
+
+def _dataset_rows(pid, process_name, artifact, rows):
+    return [{'pid': pid, 'process': process_name, 'artifact': artifact, 'row': i, 'fields': fields}
+            for i, fields in enumerate(rows)]
+
+
+class JsonlSink:
+    '''
+    将数据集的行写为 JSON 行。
+    '''
+
+    def __init__(self, output_file):
+        self.file = open(output_file, 'w')
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    '''
+    将数据集的行写入 Parquet 文件，每 ROW_GROUP_SIZE 行一个行组。fields 是
+    映射列，因此列不同的工件可以共用一个模式。需要可选的 pyarrow 包。
+    '''
+
+    def __init__(self, output_file):
+        if pyarrow is None:
+            raise RuntimeError("Parquet 导出需要 pyarrow (pip install pyarrow)")
+        self.schema = pyarrow.schema([
+            ('pid', pyarrow.uint32()), ('process', pyarrow.string()), ('artifact', pyarrow.string()),
+            ('row', pyarrow.uint32()), ('fields', pyarrow.map_(pyarrow.string(), pyarrow.string())),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(output_file, self.schema)
+        self.pending = []
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        columns = {name: [row[name] for row in self.pending] for name in ('pid', 'process', 'artifact', 'row')}
+        columns['fields'] = [list(row['fields'].items()) for row in self.pending]
+        self.writer.write_table(pyarrow.table(columns, schema=self.schema))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_sink(output_file):
+    '''
+    文件名以 .parquet 结尾时返回 ParquetSink，否则返回 JsonlSink。
+    '''
+    if output_file.lower().endswith('.parquet'):
+        return ParquetSink(output_file)
+    return JsonlSink(output_file)
+
+
+async def harvest_async(vmm, sink, names, pids, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                        queue_size=DEFAULT_QUEUE_SIZE):
+    '''
+    将工件收集到 sink 中；参见模块文档字符串。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param sink: JsonlSink 或 ParquetSink。
+    :param names: 要收集的工件，ARTIFACTS 的键。
+    :param pids: 要收集的进程 ID。
+    :param concurrency: 同时读取的最大 PID 数。
+    :param retries: 失败读取的重试次数。
+    :param queue_size: 读取暂停前等待写入的行批次数。
+    :return: (counts, errors) 元组；counts 将工件名称映射到写入的行数，errors 将
+             (pid, artifact) 映射到错误信息。
+    '''
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    slots = asyncio.Semaphore(concurrency)
+    counts = {name: 0 for name in names}
+    errors = {}
+    per_process = [name for name in names if '{pid}' in ARTIFACTS[name][0]]
+    global_names = [name for name in names if '{pid}' not in ARTIFACTS[name][0]]
+    selected = set(pids)
+
+    async def read_with_retries(read, pending, pid):
+        # read(pending) 在线程池上运行并返回 (batches, failed)；失败的读取以退避方式重试
+        for attempt in range(retries + 1):
+            batches, failed = await loop.run_in_executor(executor, read, pending)
+            for batch in batches:
+                # 队列已满时等待，此时该 PID 的槽位仍被占用
+                await queue.put(batch)
+            if not failed or attempt == retries:
+                break
+            pending = list(failed)
+            await asyncio.sleep(RETRY_DELAY * 2 ** attempt)
+        for name, error in failed.items():
+            errors[(pid, name)] = error
+
+    def read_process(pid, pending):
+        process_name, rows, failed = read_process_batch(vmm, pid, pending)
+        return [(name, _dataset_rows(pid, process_name, name, parsed)) for name, parsed in rows.items()], failed
+
+    def read_global(name, pending):
+        try:
+            rows = read_artifact(vmm, name)
+        except Exception as e:
+            return [], {name: str(e)}
+        by_pid = {}
+        for fields in rows:
+            try:
+                pid = int(fields.get('pid'))
+            except (TypeError, ValueError):
+                continue
+            if pid in selected:
+                by_pid.setdefault(pid, []).append(fields)
+        return [(name, _dataset_rows(pid, parsed[0].get('process'), name, parsed))
+                for pid, parsed in sorted(by_pid.items())], {}
+
+    async def harvest_process(pid):
+        try:
+            await read_with_retries(lambda pending: read_process(pid, pending), per_process, pid)
+        finally:
+            slots.release()
+
+    async def produce():
+        tasks = [asyncio.ensure_future(read_with_retries(lambda pending, name=name: read_global(name, pending),
+                                                         [name], None))
+                 for name in global_names]
+        if per_process:
+            for pid in pids:
+                # 所有槽位被占用时等待，因此 PID 的启动速度不会超过行的写入速度
+                await slots.acquire()
+                tasks.append(asyncio.ensure_future(harvest_process(pid)))
+        await asyncio.gather(*tasks)
+        await queue.put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            name, rows = item
+            sink.write(rows)
+            counts[name] += len(rows)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(produce(), consume())
+    return counts, errors
+
+
+def harvest_process_vfs(vmm_args, output_file, names=None, pids=None, concurrency=DEFAULT_CONCURRENCY,
+                        retries=DEFAULT_RETRIES, queue_size=DEFAULT_QUEUE_SIZE):
+    '''
+    将每个进程的 VFS 工件收集到一个数据集中。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param output_file: JSONL 或 Parquet 数据集的路径。
+    :param names: 可选的工件列表；默认为所有 ARTIFACTS。
+    :param pids: 可选的进程 ID 列表；默认为所有进程。
+    :param concurrency: 同时读取的最大 PID 数。
+    :param retries: 失败读取的重试次数。
+    :param queue_size: 读取暂停前等待写入的行批次数。
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+        names = names or list(ARTIFACTS)
+        pids = sorted(pids or vmm.pid_list())
+        print(f"正在收集 {len(pids)} 个进程的 {', '.join(names)} (每次 {concurrency} 个)")
+
+        start_time = time.perf_counter()
+        sink = open_sink(output_file)
+        try:
+            counts, errors = asyncio.run(harvest_async(vmm, sink, names, pids, concurrency, retries, queue_size))
+        finally:
+            sink.close()
+        elapsed = time.perf_counter() - start_time
+
+        for name, count in counts.items():
+            print(f"- {name}: {count} 行")
+        print(f"已在 {elapsed:.2f} 秒内将 {sum(counts.values())} 行写入 {output_file}")
+        if errors:
+            print(f"\n重试 {retries} 次后仍无法读取 {len(errors)} 个工件:")
+            for (pid, name), error in sorted(errors.items(), key=lambda item: (item[0][0] or 0, item[0][1]))[:20]:
+                print(f"  - {f'PID {pid} 的 ' if pid is not None else ''}{name}: {error}")
+            if len(errors) > 20:
+                print(f"  ... 以及另外 {len(errors) - 20} 个")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("用法: python harvest_process_vfs.py <输出文件> [--artifacts <名称,...>] [--pid <pid,...>]")
+        print("          [--concurrency <n>] [--retries <n>] [--queue <n>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print(f"工件: {', '.join(ARTIFACTS)}")
+        print("示例: python harvest_process_vfs.py processes.jsonl -device memory.dmp -forensic 1")
+        print("示例: python harvest_process_vfs.py memmap.parquet --artifacts memmap,threads -device memory.dmp")
+        sys.exit(1)
+
+    output_path = sys.argv[1]
+    vmm_arguments = []
+    artifact_names = None
+    pid_list = None
+    concurrency_limit = DEFAULT_CONCURRENCY
+    retry_count = DEFAULT_RETRIES
+    queue_limit = DEFAULT_QUEUE_SIZE
+
+    # 解析参数
+    i = 2
+    while i < len(sys.argv):
+        if sys.argv[i] == '--artifacts' and i + 1 < len(sys.argv):
+            artifact_names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--pid' and i + 1 < len(sys.argv):
+            pid_list = [int(pid) for pid in sys.argv[i + 1].split(',') if pid.strip()]
+            i += 2
+        elif sys.argv[i] == '--concurrency' and i + 1 < len(sys.argv):
+            concurrency_limit = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--retries' and i + 1 < len(sys.argv):
+            retry_count = max(0, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--queue' and i + 1 < len(sys.argv):
+            queue_limit = max(1, int(sys.argv[i + 1]))
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if artifact_names:
+        unknown = [name for name in artifact_names if name not in ARTIFACTS]
+        if unknown:
+            print(f"错误: 未知的工件: {', '.join(unknown)} (可用: {', '.join(ARTIFACTS)})")
+            sys.exit(1)
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        harvest_process_vfs(vmm_arguments, output_path, artifact_names, pid_list, concurrency_limit,
+                            retry_count, queue_limit)
@@ -0,0 +1,121 @@
+'''
+长时间运行任务的检查点日志，使被中断的批量转储或 YARA 扫描可以继续执行，
+而不必从头开始。
+
+日志是保存在任务输出旁边的只追加 JSONL 文件。第一条记录描述任务 (操作、映像、
+目标以及会改变输出的选项)；之后的每条记录都是一个检查点，例如进程转储已到达的地址
+和输出偏移，或已完成的进程。调用方只在检查点所指的输出刷新到磁盘后才写入检查点，
+且每条记录都经过 fsync，因此日志记录的进度永远不会超过磁盘上的内容。写入中途
+崩溃留下的残缺末行会在重新打开日志时被丢弃。
+
+由 dump_process_memory.py (--batch ... --resume) 和 yara_scan_process.py
+(--sweep ... --resume) 使用；也可以被自定义脚本导入：
+
+    with JobJournal('dumps/dump.journal', {'operation': 'dump', 'target': 'all'}, resume=True) as journal:
+        done = journal.completed()
+        ...
+        journal.append({'type': 'process', 'pid': 4, 'status': 'done'})
+'''
+
+import os
+import json
+import threading
+from artifact_cache import image_key
+
+
+def read_journal(path):
+    '''
+    读取日志文件的记录。
+
+    :param path: 日志文件的路径。
+    :return: (records, size) 元组；size 是文件完好部分的长度，不含残缺的末行。
+    '''
+    records = []
+    size = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            size += len(line)
+    return records, size
+
+
+def image_identity(vmm_args):
+    '''
+    返回标识任务所读取内存的值，用于任务记录: 映像文件的指纹和会改变读取内容
+    的 MemProcFS 选项 (参见 artifact_cache.image_key())；设备不是本地文件时
+    返回参数本身。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    return image_key(vmm_args) or ' '.join(vmm_args)
+
+
+class JobJournal:
+    '''
+    只追加的检查点日志。可以从多个线程安全地追加。
+    '''
+
+    def __init__(self, path, job, resume=False):
+        '''
+        :param path: 日志文件的路径。
+        :param job: 描述任务的字典；继续执行的日志必须描述同一个任务。
+        :param resume: 继续现有的日志，而不是开始新的日志。
+        '''
+        self.path = path
+        self.job = dict(job, type='job')
+        self.records = []
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            records, size = read_journal(path)
+            if records and records[0] != self.job:
+                raise ValueError(f"{path} 由另一个任务写入；"
+                                 "请不带 --resume 重新运行以从头开始")
+            self.records = records[1:]
+            self._file = open(path, 'r+b')
+            self._file.truncate(size)
+            self._file.seek(size)
+            if not records:
+                self._write(self.job)
+        else:
+            self._file = open(path, 'wb')
+            self._write(self.job)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record).encode() + b'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, record):
+        '''
+        追加一条检查点记录并等待其写入磁盘。
+        '''
+        with self._lock:
+            self._write(record)
+            self.records.append(record)
+
+    def completed(self):
+        '''
+        按 PID 返回日志中的进程记录；进程较晚的记录会替换较早的记录。
+        '''
+        return {record['pid']: record for record in self.records if record.get('type') == 'process'}
+
+    def checkpoints(self):
+        '''
+        按 PID 返回每个进程的最后一条进度记录。
+        '''
+        return {record['pid']: record for record in self.records if record.get('type') == 'progress'}
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
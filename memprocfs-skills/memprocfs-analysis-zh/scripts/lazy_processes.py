@@ -0,0 +1,213 @@
+'''
+惰性进程表：预先只枚举 PID，进程属性仅在使用时才读取。
+
+对 memprocfs 进程对象的每次属性访问都可能是一次原生查找，当 Vmm 是会话代理时
+(参见 vmm_session.py) 还是一次往返。因此 LazyProcessTable 从 vmm.pid_list() (若可用) 开始，
+仅在首次使用时打开进程对象。每个属性 (名称、父 PID、路径、命令行、令牌、模块)
+在首次访问时读取并按进程记忆，因此只需要十个进程名称的使用方
+永远不必为数千个进程的路径付出代价。
+
+在自定义脚本中的用法:
+
+    table = process_table(vmm)              # 或使用 LazyProcessTable(vmm) 获得私有表
+    print(len(table))                       # 尚未打开任何进程
+    for process in table.first(10):
+        print(process.pid, process.name)    # 此时读取名称，之后记忆
+    table.prefetch(('name', 'path'))        # 在线程池上读取其余属性
+'''
+
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = 4
+
+# 每个 Vmm 的共享表。共享表通过弱代理引用其 Vmm，因此条目会随 Vmm 一起被丢弃。
+_tables = weakref.WeakKeyDictionary()
+_tables_lock = threading.Lock()
+
+
+def _token(process):
+    return {'sid': getattr(process, 'sid', None), 'integrity': getattr(process, 'integrity', None),
+            'session': getattr(process, 'session', None), 'luid': getattr(process, 'luid', None)}
+
+
+# 按需读取的进程属性：属性名 -> memprocfs 进程对象的函数。
+ATTRIBUTES = {
+    'name': lambda process: process.name,
+    'ppid': lambda process: process.pid_parent,
+    'path': lambda process: process.path,
+    'command_line': lambda process: getattr(process, 'cmdline', None),
+    'token': _token,
+    'modules': lambda process: [module.name for module in process.module_all()],
+}
+
+
+class LazyProcess:
+    '''
+    属性在首次访问时读取并记忆的进程。
+    无法读取的属性为 None；错误保存在 errors 中。
+    '''
+    __slots__ = ('pid', 'errors', '_vmm', '_process', '_values', '_keep')
+
+    def __init__(self, vmm, pid, process=None, keep=True):
+        self.pid = pid
+        self.errors = {}
+        self._vmm = vmm
+        self._process = process if keep else None
+        self._values = {}
+        self._keep = keep
+
+    @property
+    def process(self):
+        '''
+        memprocfs 进程对象，在首次使用时打开。只有在表保留进程对象时才会保留它。
+        '''
+        process = self._process
+        if process is None:
+            process = self._vmm.process(self.pid)
+            if self._keep:
+                self._process = process
+        return process
+
+    def get(self, name):
+        '''
+        返回一个属性，在首次访问时读取。
+
+        :param name: ATTRIBUTES 的键，例如 'path'。
+        '''
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        self.load((name,))
+        return self._values[name]
+
+    def load(self, fields):
+        '''
+        读取给定属性中尚未读取的属性，所有属性只打开一次进程对象。
+
+        :param fields: ATTRIBUTES 的键，例如 ('name', 'path')。
+        '''
+        missing = [name for name in fields if name not in self._values]
+        if not missing:
+            return
+        try:
+            process = self.process
+        except Exception as e:
+            for name in missing:
+                self.errors[name] = str(e)
+                self._values[name] = None
+            return
+        for name in missing:
+            try:
+                value = ATTRIBUTES[name](process)
+            except Exception as e:
+                self.errors[name] = str(e)
+                value = None
+            self._values[name] = value
+
+    def __getattr__(self, name):
+        if name in ATTRIBUTES:
+            return self.get(name)
+        raise AttributeError(name)
+
+    def is_loaded(self, name):
+        return name in self._values
+
+    def as_dict(self, fields):
+        '''
+        以字典形式返回给定属性，尚未读取的属性此时读取。
+        '''
+        return {field: self.pid if field == 'pid' else self.get(field) for field in fields}
+
+
+class LazyProcessTable:
+    '''
+    Vmm 的进程，按 PID 排序，其属性按需读取。
+    '''
+
+    def __init__(self, vmm, keep_processes=True):
+        '''
+        :param vmm: 已初始化的 memprocfs.Vmm 实例。
+        :param keep_processes: 保留为读取属性而打开的进程对象。共享表不保留，
+                               因为进程对象会引用其 Vmm。
+        '''
+        self.vmm = vmm
+        pid_list = getattr(vmm, 'pid_list', None)
+        if pid_list is not None:
+            self._processes = {pid: LazyProcess(vmm, pid, None, keep_processes) for pid in sorted(pid_list())}
+        else:
+            # 没有 pid_list() 时，进程对象随枚举一起获得
+            processes = sorted(vmm.process_all(), key=lambda process: process.pid)
+            self._processes = {process.pid: LazyProcess(vmm, process.pid, process, keep_processes)
+                               for process in processes}
+        self.pids = list(self._processes)
+
+    def __len__(self):
+        return len(self.pids)
+
+    def __iter__(self):
+        return iter(self._processes.values())
+
+    def __contains__(self, pid):
+        return pid in self._processes
+
+    def __getitem__(self, pid):
+        return self._processes[pid]
+
+    def first(self, count):
+        '''
+        返回 PID 最小的进程。
+        '''
+        return [self._processes[pid] for pid in self.pids[:count]]
+
+    def prefetch(self, fields, threads=DEFAULT_THREADS, pids=None):
+        '''
+        并发读取多个进程的属性；已记忆的属性会被跳过。
+
+        :param fields: 要读取的属性，例如 ('name', 'path')。
+        :param threads: 工作线程数。
+        :param pids: 可选，限定预取的 PID；默认为所有进程。
+        '''
+        processes = [self._processes[pid] for pid in (pids if pids is not None else self.pids)]
+
+        def load(chunk):
+            for process in chunk:
+                process.load(fields)
+
+        threads = max(1, min(threads, len(processes)))
+        if threads == 1:
+            load(processes)
+            return
+        # 每个线程一个分块，交错划分，使慢速进程分散到各线程
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for _ in pool.map(load, [processes[i::threads] for i in range(threads)]):
+                pass
+
+    def rows(self, fields, threads=DEFAULT_THREADS):
+        '''
+        为每个进程返回一个包含给定属性的字典，并发预取这些属性。
+
+        :param fields: 要包含的属性；'pid' 始终可用。
+        :param threads: 工作线程数。
+        '''
+        self.prefetch([field for field in fields if field != 'pid'], threads)
+        return [process.as_dict(fields) for process in self]
+
+
+def process_table(vmm):
+    '''
+    返回由所有调用方共享的 Vmm 的 LazyProcessTable，因此一个使用方读取过的属性
+    不会被下一个使用方再次读取。无法被弱引用的 Vmm 每次调用都会得到一张新表。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    '''
+    with _tables_lock:
+        try:
+            table = _tables.get(vmm)
+            if table is None:
+                table = _tables[vmm] = LazyProcessTable(weakref.proxy(vmm), keep_processes=False)
+        except TypeError:
+            table = LazyProcessTable(vmm)
+        return table
@@ -1,58 +1,155 @@
-
-'""" 
+'''
 此脚本列出指定进程的所有打开句柄。
 
-用法: python list_process_handles.py <进程名或PID> [vmm_args...]
-"""'
+句柄表按映像缓存 (参见 artifact_cache.py)，因此再次列出同一映像中同一进程的句柄时
+无需初始化 MemProcFS。
+
+句柄写为表格，或通过 --format 写为 JSONL、CSV 或 Arrow，输出到 stdout，或通过
+--output 输出到文件 (参见 result_writers.py)。
+
+用法: python list_process_handles.py <进程名或PID> [--no-cache] [--cache-dir <目录>] [--format <table|jsonl|csv|arrow>] [--output <文件>] [vmm_args...]
 
-import memprocfs
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+from result_writers import FORMATS, guess_format, open_writer
 import sys
 
-def list_process_handles(proc_identifier, vmm_args):
-    """
+# 已缓存句柄表布局的版本。
+HANDLES_VERSION = 1
+
+# 句柄记录的列。
+HANDLE_FIELDS = ('pid', 'process', 'handle_value', 'type', 'name')
+HANDLE_TYPES = {'pid': 'int', 'handle_value': 'hex', 'type': 'str', 'name': 'str'}
+
+def collect_process_handles(vmm, proc_identifier):
+    '''
+    收集进程的句柄表。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param proc_identifier: 进程的名称或 PID。
+    :return: 包含 'pid'、'name' 和 'handles' 的字典；未找到进程时返回 None。
+    '''
+    try:
+        pid = int(proc_identifier)
+        process = vmm.process(pid)
+    except ValueError:
+        process = vmm.process(proc_identifier)
+
+    if not process:
+        return None
+
+    handles = [{'handle_value': handle.handle_value, 'type': handle.type, 'name': handle.name}
+               for handle in process.handle_all()]
+    return {'pid': process.pid, 'name': process.name, 'handles': handles}
+
+def handle_records(table):
+    '''
+    为结果写入器逐个生成句柄表中每个句柄的记录。
+
+    :param table: collect_process_handles() 返回的句柄表。
+    '''
+    pid, name = table['pid'], table['name']
+    for handle in table['handles']:
+        yield {'pid': pid, 'process': name, 'handle_value': handle['handle_value'],
+               'type': handle['type'], 'name': handle['name']}
+
+def list_process_handles(proc_identifier, vmm_args, use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+                         output_format='table', output_file=None):
+    '''
     列出给定进程的所有打开句柄。
 
     :param proc_identifier: 进程的名称或 PID。
     :param vmm_args: 用于初始化 MemProcFS 的参数列表。
-    """
+    :param use_cache: 复用句柄表并将其存入工件缓存。
+    :param cache_dir: 保存工件缓存的目录。
+    :param output_format: 'table'、'jsonl'、'csv' 或 'arrow'。
+    :param output_file: 可选的输出文件路径；默认为 stdout。
+    '''
     try:
-        vmm = memprocfs.Vmm(vmm_args)
-        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+        out = open_writer(output_format, output_file, HANDLE_FIELDS, HANDLE_TYPES)
+        with out:
+            cache = open_cache(vmm_args, cache_dir) if use_cache else None
+            try:
+                table = cache.get('handles', HANDLES_VERSION, str(proc_identifier)) if cache else None
 
-        try:
-            pid = int(proc_identifier)
-            process = vmm.process(pid)
-        except ValueError:
-            process = vmm.process(proc_identifier)
+                if table is not None:
+                    print(f"已从工件缓存加载 '{proc_identifier}' 的句柄", file=out.messages)
+                else:
+                    vmm = open_vmm(vmm_args)
+                    print(f"MemProcFS 已使用参数初始化: {vmm_args}", file=out.messages)
 
-        if not process:
-            print(f"错误: 未找到进程 '{proc_identifier}'。")
-            return
+                    table = collect_process_handles(vmm, proc_identifier)
+                    if table is None:
+                        print(f"错误: 未找到进程 '{proc_identifier}'。", file=out.messages)
+                        return
+                    if cache:
+                        cache.put('handles', HANDLES_VERSION, table, str(proc_identifier))
+            finally:
+                if cache:
+                    cache.close()
 
-        print(f"--- {process.name} (PID: {process.pid}) 的句柄 ---")
+            print(f"--- {table['name']} (PID: {table['pid']}) 的句柄 ---", file=out.messages)
+            out.messages.flush()
 
-        handles = process.handle_all()
-        if not handles:
-            print("未找到打开的句柄。")
-            return
+            if not table['handles']:
+                print("未找到打开的句柄。", file=out.messages)
+                return
 
-        for handle in handles:
-            print(f"- 句柄: {handle.handle_value:#x}, 类型: {handle.type}, 名称: {handle.name}")
+            out.write_many(handle_records(table))
+
+        if output_file:
+            print(f"已将 {out.count} 个句柄写入 {output_file}")
 
     except Exception as e:
         print(f"发生错误: {e}")
 
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 2:
-        print("用法: python list_process_handles.py <进程名或PID> [vmm_args...]")
+        print("用法: python list_process_handles.py <进程名或PID> [--no-cache] [--cache-dir <目录>] [--format <table|jsonl|csv|arrow>] [--output <文件>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
         print("示例: python list_process_handles.py explorer.exe -device memory.dmp")
+        print("示例: python list_process_handles.py explorer.exe --output handles.csv -device memory.dmp")
         sys.exit(1)
 
     process_id = sys.argv[1]
-    vmm_arguments = sys.argv[2:]
+    vmm_arguments = []
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
+    output_format = None
+    output_path = None
+
+    # 解析参数
+    i = 2
+    while i < len(sys.argv):
+        if sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--format' and i + 1 < len(sys.argv):
+            output_format = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
+            output_path = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
 
     if not vmm_arguments:
         print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
         sys.exit(1)
 
-    list_process_handles(process_id, vmm_arguments)
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"错误: 未知的输出格式 '{output_format}' (可用: {', '.join(FORMATS)})。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        list_process_handles(process_id, vmm_arguments, cache_enabled, cache_directory, output_format, output_path)
@@ -0,0 +1,119 @@
+'''
+用于遍历进程已映射内存区域并按有限大小分块读取的辅助函数，
+调用方任何时候都只需在内存中保留一个块。
+
+供 dump_process_memory.py 使用；也可被自定义脚本导入。
+'''
+
+import memprocfs
+from collections import deque
+
+# 单次读取进程内存的默认大小 (1 MiB)。
+DEFAULT_CHUNK_SIZE = 0x100000
+
+# 线程池预读字节数的默认上限 (64 MiB)。
+DEFAULT_MAX_INFLIGHT = 0x4000000
+
+PAGE_SIZE = 0x1000
+
+
+def get_memory_regions(process):
+    '''
+    以排序后的 (base, size) 元组列表形式返回进程的已映射区域。
+
+    优先使用 PTE 映射，因为它只包含有页表支撑的范围；VAD 映射作为后备。
+    相邻区域会被合并，它们之间未映射的空洞会被跳过。
+
+    :param process: memprocfs 进程对象。
+    :return: 按基址排序的 (base, size) 元组列表。
+    '''
+    regions = []
+    try:
+        for entry in process.maps.pte():
+            regions.append((entry['va'], entry['size']))
+    except Exception:
+        regions = []
+
+    if not regions:
+        for entry in process.maps.vad():
+            regions.append((entry['start'], entry['end'] - entry['start'] + 1))
+
+    merged = []
+    for base, size in sorted(r for r in regions if r[1] > 0):
+        if merged and base <= merged[-1][0] + merged[-1][1]:
+            last_base, last_size = merged[-1]
+            merged[-1] = (last_base, max(last_size, base + size - last_base))
+        else:
+            merged.append((base, size))
+    return merged
+
+
+def iter_chunk_ranges(regions, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    将区域拆分为最多 chunk_size 字节的 (address, size) 范围。
+
+    :param regions: (base, size) 元组的可迭代对象。
+    :param chunk_size: 单个范围的最大大小。
+    '''
+    for base, size in regions:
+        offset = 0
+        while offset < size:
+            length = min(chunk_size, size - offset)
+            yield base + offset, length
+            offset += length
+
+
+def read_chunk(process, address, size):
+    '''
+    读取进程内存的单个块。无法读取的页以零填充，
+    因此返回的块始终具有请求的大小。
+
+    :param process: memprocfs 进程对象。
+    :param address: 要读取的虚拟地址。
+    :param size: 要读取的字节数。
+    :return: 以 bytes 形式返回的块数据。
+    '''
+    return process.memory.read(address, size, memprocfs.FLAG_ZEROPAD_ON_FAIL)
+
+
+def iter_region_chunks(process, regions=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    生成覆盖进程所有已映射区域的 (address, data) 元组。
+
+    :param process: memprocfs 进程对象。
+    :param regions: 可选的 (base, size) 元组列表；默认为 get_memory_regions() 的结果。
+    :param chunk_size: 单次读取的最大字节数。
+    '''
+    if regions is None:
+        regions = get_memory_regions(process)
+    for address, size in iter_chunk_ranges(regions, chunk_size):
+        yield address, read_chunk(process, address, size)
+
+
+def iter_region_chunks_parallel(process, pool, regions=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                                max_inflight=DEFAULT_MAX_INFLIGHT, read=read_chunk):
+    '''
+    与 iter_region_chunks() 相同，但块读取会提前提交到线程池。
+    块仍按地址顺序生成，并且只有在处理中的字节数低于 max_inflight 时才会提交新的读取。
+
+    :param process: memprocfs 进程对象。
+    :param pool: 用于读取的 concurrent.futures.ThreadPoolExecutor。
+    :param regions: 可选的 (base, size) 元组列表；默认为 get_memory_regions() 的结果。
+    :param chunk_size: 单次读取的最大字节数。
+    :param max_inflight: 已提交但尚未被消费的最大字节数。
+    :param read: 在线程池上对每个块运行的 callable(process, address, size)；产出其返回值。
+    '''
+    if regions is None:
+        regions = get_memory_regions(process)
+    pending = deque()
+    inflight = 0
+    for address, size in iter_chunk_ranges(regions, chunk_size):
+        while pending and inflight + size > max_inflight:
+            done_address, done_size, future = pending.popleft()
+            inflight -= done_size
+            yield done_address, future.result()
+        pending.append((address, size, pool.submit(read, process, address, size)))
+        inflight += size
+    while pending:
+        done_address, _, future = pending.popleft()
+        yield done_address, future.result()
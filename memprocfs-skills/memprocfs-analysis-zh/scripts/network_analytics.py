@@ -0,0 +1,446 @@
+'''
+此脚本一次性收集所有进程的网络连接，并回答有关它们的全主机问题：
+哪些进程超过连接数阈值、哪些进程连接最多，以及哪些公网远程地址只被一个或少数几个进程访问。
+
+连接通过一次遍历从 /sys/net/netstat.txt (参见 sys_parsers.py) 读入 NumPy 列：
+PID、协议和状态 ID、以整数表示的 IPv4 地址、端口以及驻留的地址 ID。
+分组、阈值、罕见远程地址检测以及与进程列表的连接均为向量化运算，
+因此在数万个套接字的情况下依然很快。需要 numpy；Parquet 导出还需要 pyarrow。
+
+用法: python network_analytics.py [--threshold <n>] [--top <n>] [--rare <n>] [--state <状态>]
+           [--subnet <cidr>] [--json <文件>] [--parquet <文件>] [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from sys_parsers import iter_records
+import sys
+import json
+import time
+import socket
+import ipaddress
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_THRESHOLD = 20
+DEFAULT_TOP = 10
+# 最多被这么多进程访问的远程地址被报告为罕见地址。
+DEFAULT_RARE = 1
+
+# 不可全局路由的 IPv4 网络：(网络, 子网掩码) 对。
+NON_PUBLIC_IPV4 = [(int(network.network_address), int(network.netmask)) for network in map(ipaddress.IPv4Network, (
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/24',
+    '192.0.2.0/24', '192.168.0.0/16', '198.18.0.0/15', '198.51.100.0/24', '203.0.113.0/24', '224.0.0.0/3'))]
+
+
+class NetworkTable:
+    '''
+    以 NumPy 列表示的所有进程的网络连接。
+
+    协议、状态和地址均被驻留：protocol、state、src_address 和 dst_address 列
+    保存 protocols、states 和 addresses 列表中的索引。src_ip 和 dst_ip 以整数
+    保存 IPv4 地址 (IPv6 和无法解析的地址为 0)。按地址 ID，address_ips 保存相同的整数，
+    is_public 表示该地址是否可全局路由。
+    '''
+
+    FIELDS = ('pid', 'protocol', 'state', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'src_address', 'dst_address')
+
+    def __init__(self, columns, protocols, states, addresses, address_ips):
+        self.columns = columns
+        self.protocols = protocols
+        self.states = states
+        self.addresses = addresses
+        self.address_ips = numpy.array(address_ips, dtype=numpy.uint32)
+        self.is_public = numpy.ones(len(addresses), dtype=bool)
+        for network, netmask in NON_PUBLIC_IPV4:
+            self.is_public &= (self.address_ips & numpy.uint32(netmask)) != numpy.uint32(network)
+        # 只有非 IPv4 地址需要逐个解析
+        for i in numpy.flatnonzero(self.address_ips == 0):
+            self.is_public[i] = _is_public(addresses[i])
+
+    def __len__(self):
+        return len(self.columns['pid'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @classmethod
+    def from_records(cls, records):
+        '''
+        从 NetConnection 记录构建表。
+        '''
+        # 先追加到类型化数组中，然后由 NumPy 无拷贝地包装
+        values = {'pid': array('I'), 'protocol': array('B'), 'state': array('B'), 'src_ip': array('I'),
+                  'src_port': array('H'), 'dst_ip': array('I'), 'dst_port': array('H'),
+                  'src_address': array('i'), 'dst_address': array('i')}
+        lookups = ({}, {}, {})
+        protocols, states, addresses = [], [], []
+        address_ips = []
+
+        def intern(lookup, names, name):
+            index = lookup.get(name)
+            if index is None:
+                index = lookup[name] = len(names)
+                names.append(name)
+                if names is addresses:
+                    address_ips.append(_ipv4(name))
+            return index
+
+        for record in records:
+            src = intern(lookups[2], addresses, record.src_address or '')
+            dst = intern(lookups[2], addresses, record.dst_address or '')
+            values['pid'].append(record.pid or 0)
+            values['protocol'].append(intern(lookups[0], protocols, record.protocol or ''))
+            values['state'].append(intern(lookups[1], states, record.state or ''))
+            values['src_ip'].append(address_ips[src])
+            values['src_port'].append(record.src_port or 0)
+            values['dst_ip'].append(address_ips[dst])
+            values['dst_port'].append(record.dst_port or 0)
+            values['src_address'].append(src)
+            values['dst_address'].append(dst)
+
+        columns = {field: numpy.frombuffer(values[field], dtype=values[field].typecode) if len(values[field])
+                   else numpy.zeros(0, dtype=values[field].typecode) for field in cls.FIELDS}
+        return cls(columns, protocols, states, addresses, address_ips)
+
+    def select(self, mask):
+        '''
+        返回由布尔掩码或索引数组选出的行组成的表。
+        '''
+        table = NetworkTable.__new__(NetworkTable)
+        table.columns = {field: values[mask] for field, values in self.columns.items()}
+        table.protocols, table.states, table.addresses = self.protocols, self.states, self.addresses
+        table.address_ips, table.is_public = self.address_ips, self.is_public
+        return table
+
+    def in_state(self, state):
+        '''
+        返回处于某状态 (例如 'ESTABLISHED'，不区分大小写) 的连接的布尔掩码。
+        '''
+        ids = [i for i, name in enumerate(self.states) if name.lower() == state.lower()]
+        return numpy.isin(self.state, ids)
+
+    def in_subnet(self, cidr):
+        '''
+        返回远程地址位于某子网 (例如 '10.0.0.0/8') 内的 IPv4 连接的布尔掩码。
+        '''
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        return (self.dst_ip & numpy.uint32(int(network.netmask))) == numpy.uint32(int(network.network_address))
+
+    def rows(self, indexes=None):
+        '''
+        以字典形式产生连接，并解析驻留的 ID。
+        '''
+        for i in range(len(self)) if indexes is None else indexes:
+            yield {'pid': int(self.pid[i]), 'protocol': self.protocols[self.protocol[i]],
+                   'state': self.states[self.state[i]],
+                   'src_address': self.addresses[self.src_address[i]], 'src_port': int(self.src_port[i]),
+                   'dst_address': self.addresses[self.dst_address[i]], 'dst_port': int(self.dst_port[i])}
+
+
+def _ipv4(address):
+    '''
+    以整数返回 IPv4 地址；不是 IPv4 地址时返回 0。
+    '''
+    if address.count('.') != 3:
+        return 0
+    try:
+        return int.from_bytes(socket.inet_aton(address), 'big')
+    except OSError:
+        return 0
+
+
+def _is_public(address):
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+
+class ProcessTable:
+    '''
+    进程列表的 PID、父 PID 和名称，按 PID 排序以便进行向量化连接。
+    '''
+
+    def __init__(self, processes):
+        processes = sorted(processes, key=lambda process: process.pid)
+        self.pids = numpy.array([process.pid for process in processes], dtype=numpy.uint32)
+        self.ppids = numpy.array([process.pid_parent for process in processes], dtype=numpy.uint32)
+        self.names = numpy.array([process.name for process in processes], dtype=object)
+
+    def lookup(self, pids):
+        '''
+        将 PID 与进程列表连接。
+
+        :param pids: PID 数组。
+        :return: (positions, found) 元组：每个 PID 在此表中的行，以及存在的 PID 的掩码。
+        '''
+        positions = numpy.searchsorted(self.pids, pids)
+        positions[positions == len(self.pids)] = 0
+        found = self.pids[positions] == pids if len(self.pids) else numpy.zeros(len(pids), dtype=bool)
+        return positions, found
+
+    def names_of(self, pids):
+        positions, found = self.lookup(pids)
+        names = self.names[positions] if len(self.pids) else numpy.empty(len(pids), dtype=object)
+        return numpy.where(found, names, '<不在进程列表中>')
+
+
+def connection_counts(table):
+    '''
+    返回 (PID、连接数、不同远程地址数) 数组，每个 PID 一项。
+    '''
+    pids, counts = numpy.unique(table.pid, return_counts=True)
+    # 不同的 (PID, 远程地址) 对，每个连接打包为一个 64 位键
+    pairs = numpy.unique((table.pid.astype(numpy.uint64) << numpy.uint64(32)) |
+                         table.dst_address.astype(numpy.uint64))
+    pair_pids, remotes = numpy.unique(pairs >> numpy.uint64(32), return_counts=True)
+    distinct = numpy.zeros(len(pids), dtype=numpy.int64)
+    distinct[numpy.searchsorted(pids, pair_pids.astype(numpy.uint32))] = remotes
+    return pids, counts, distinct
+
+
+def top_talkers(table, processes, count=DEFAULT_TOP, threshold=None):
+    '''
+    返回连接最多的进程，按连接数从多到少排列。
+
+    :param table: NetworkTable 对象。
+    :param processes: ProcessTable 对象。
+    :param count: 可选的返回进程数量上限。
+    :param threshold: 可选的下限；只返回连接数超过它的进程。
+    :return: 包含 pid、process、connections 和 remote_addresses 的字典列表。
+    '''
+    pids, counts, distinct = connection_counts(table)
+    order = numpy.lexsort((pids, -distinct, -counts))
+    if threshold is not None:
+        order = order[counts[order] > threshold]
+    if count is not None:
+        order = order[:count]
+    names = processes.names_of(pids[order])
+    return [{'pid': int(pid), 'process': name, 'connections': int(connections), 'remote_addresses': int(remotes)}
+            for pid, name, connections, remotes in zip(pids[order], names, counts[order], distinct[order])]
+
+
+def rare_remotes(table, processes, max_processes=DEFAULT_RARE):
+    '''
+    返回最多被 max_processes 个进程访问的公网远程地址。
+
+    :param table: NetworkTable 对象。
+    :param processes: ProcessTable 对象。
+    :param max_processes: 不同进程的最大数量。
+    :return: 包含 address、ports、connections 和 processes 的字典列表，最罕见的在前。
+    '''
+    public = table.is_public[table.dst_address]
+    dst, pid, port = table.dst_address[public], table.pid[public], table.dst_port[public]
+    pairs = numpy.unique((dst.astype(numpy.uint64) << numpy.uint64(32)) | pid.astype(numpy.uint64))
+    pair_addresses = (pairs >> numpy.uint64(32)).astype(numpy.int64)
+    process_counts = numpy.bincount(pair_addresses, minlength=len(table.addresses))
+    connection_totals = numpy.bincount(dst, minlength=len(table.addresses))
+    rare = numpy.flatnonzero((process_counts > 0) & (process_counts <= max_processes))
+    rare = rare[numpy.lexsort((-connection_totals[rare], process_counts[rare]))]
+
+    # 不同的 (地址, PID) 和 (地址, 端口) 对按地址排序，因此每个罕见地址的行
+    # 直接按其分组边界切片取出
+    port_pairs = numpy.unique((dst.astype(numpy.uint64) << numpy.uint64(32)) | port.astype(numpy.uint64))
+    port_addresses = (port_pairs >> numpy.uint64(32)).astype(numpy.int64)
+    pid_bounds = zip(numpy.searchsorted(pair_addresses, rare).tolist(),
+                     numpy.searchsorted(pair_addresses, rare, side='right').tolist())
+    port_bounds = zip(numpy.searchsorted(port_addresses, rare).tolist(),
+                      numpy.searchsorted(port_addresses, rare, side='right').tolist())
+    pair_pids = (pairs & numpy.uint64(0xFFFFFFFF)).astype(numpy.uint32)
+    pair_processes = [{'pid': p, 'process': name}
+                      for p, name in zip(pair_pids.tolist(), processes.names_of(pair_pids).tolist())]
+    ports = (port_pairs & numpy.uint64(0xFFFF)).tolist()
+
+    results = []
+    for address_id, (pid_start, pid_end), (port_start, port_end) in zip(rare.tolist(), pid_bounds, port_bounds):
+        results.append({'address': table.addresses[address_id],
+                        'ports': ports[port_start:port_end],
+                        'connections': int(connection_totals[address_id]),
+                        'processes': pair_processes[pid_start:pid_end]})
+    return results
+
+
+def unknown_process_connections(table, processes):
+    '''
+    返回 PID 不在进程列表中的连接，例如已终止或已断链进程的连接。
+    '''
+    _, found = processes.lookup(table.pid)
+    return list(table.rows(numpy.flatnonzero(~found)))
+
+
+def write_parquet(table, processes, output_file):
+    '''
+    将连接写入 Parquet 文件，并解析地址和名称 (需要 pyarrow)。
+    '''
+    if pyarrow is None:
+        raise RuntimeError("Parquet 导出需要 pyarrow (pip install pyarrow)")
+
+    def dictionary(ids, names):
+        return pyarrow.DictionaryArray.from_arrays(pyarrow.array(ids.astype(numpy.int32)), pyarrow.array(names))
+
+    arrow_table = pyarrow.table({
+        'pid': pyarrow.array(table.pid),
+        'process': pyarrow.array(processes.names_of(table.pid).astype(str)),
+        'protocol': dictionary(table.protocol, table.protocols),
+        'state': dictionary(table.state, table.states),
+        'src_address': dictionary(table.src_address, table.addresses),
+        'src_port': pyarrow.array(table.src_port),
+        'dst_address': dictionary(table.dst_address, table.addresses),
+        'dst_port': pyarrow.array(table.dst_port),
+        'src_ip': pyarrow.array(table.src_ip),
+        'dst_ip': pyarrow.array(table.dst_ip),
+    })
+    pyarrow.parquet.write_table(arrow_table, output_file)
+
+
+def network_analytics(vmm_args, threshold=DEFAULT_THRESHOLD, top=DEFAULT_TOP, rare=DEFAULT_RARE, state=None,
+                      subnet=None, json_file=None, parquet_file=None):
+    '''
+    收集所有进程的连接并打印网络报告。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param threshold: 报告连接数超过此值的进程。
+    :param top: 报告的连接最多进程的数量。
+    :param rare: 报告最多被这么多进程访问的公网远程地址。
+    :param state: 可选的连接状态，只分析该状态的连接，例如 'ESTABLISHED'。
+    :param subnet: 可选的远程 IPv4 子网，只分析连接到该子网的连接，例如 '10.0.0.0/8'。
+    :param json_file: 可选的路径，用于将报告保存为 JSON。
+    :param parquet_file: 可选的路径，用于将连接导出为 Parquet。
+    '''
+    if numpy is None:
+        print("错误: network_analytics.py 需要 numpy (pip install numpy)")
+        return
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+
+        start_time = time.perf_counter()
+        table = NetworkTable.from_records(iter_records(vmm, 'network_connections'))
+        processes = ProcessTable(vmm.process_all())
+        elapsed = time.perf_counter() - start_time
+        print(f"已收集 {len(table)} 个连接和 {len(processes.pids)} 个进程，耗时 {elapsed:.2f}s")
+
+        if state:
+            table = table.select(table.in_state(state))
+        if subnet:
+            table = table.select(table.in_subnet(subnet))
+        if state or subnet:
+            print(f"正在分析 {len(table)} 个连接"
+                  f"{f'，状态为 {state}' if state else ''}{f'，目标为 {subnet}' if subnet else ''}")
+
+        start_time = time.perf_counter()
+        report = {
+            'connections': len(table),
+            'processes_over_threshold': top_talkers(table, processes, None, threshold),
+            'top_talkers': top_talkers(table, processes, top),
+            'rare_remotes': rare_remotes(table, processes, rare),
+            'unknown_process_connections': unknown_process_connections(table, processes),
+        }
+        elapsed = time.perf_counter() - start_time
+
+        print(f"\n--- 连接数超过 {threshold} 的进程 ---")
+        for entry in report['processes_over_threshold']:
+            print(f"- {entry['process']} (PID: {entry['pid']}): {entry['connections']} 个连接，"
+                  f"{entry['remote_addresses']} 个远程地址")
+
+        print(f"\n--- 连接最多的 {top} 个进程 ---")
+        for entry in report['top_talkers']:
+            print(f"- {entry['process']} (PID: {entry['pid']}): {entry['connections']} 个连接，"
+                  f"{entry['remote_addresses']} 个远程地址")
+
+        print(f"\n--- 最多被 {rare} 个进程访问的公网远程地址 ---")
+        for entry in report['rare_remotes']:
+            ports = ','.join(str(port) for port in entry['ports'])
+            holders = ', '.join(f"{p['process']} ({p['pid']})" for p in entry['processes'])
+            print(f"- {entry['address']} 端口 {ports}: 来自 {holders} 的 {entry['connections']} 个连接")
+
+        if report['unknown_process_connections']:
+            print(f"\n--- 不在进程列表中的 PID 的 {len(report['unknown_process_connections'])} 个连接 ---")
+            for row in report['unknown_process_connections']:
+                print(f"- PID {row['pid']}: {row['protocol']} {row['src_address']}:{row['src_port']} -> "
+                      f"{row['dst_address']}:{row['dst_port']} ({row['state']})")
+
+        print(f"\n分析完成，耗时 {elapsed:.3f}s")
+
+        if json_file:
+            with open(json_file, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"报告已保存到: {json_file}")
+
+        if parquet_file:
+            write_parquet(table, processes, parquet_file)
+            print(f"{len(table)} 个连接已写入: {parquet_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("用法: python network_analytics.py [--threshold <n>] [--top <n>] [--rare <n>] [--state <状态>]")
+        print("           [--subnet <cidr>] [--json <文件>] [--parquet <文件>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python network_analytics.py -device memory.dmp")
+        print("示例: python network_analytics.py --state ESTABLISHED --threshold 100 --json network.json -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    connection_threshold = DEFAULT_THRESHOLD
+    top_count = DEFAULT_TOP
+    rare_processes = DEFAULT_RARE
+    connection_state = None
+    remote_subnet = None
+    json_output = None
+    parquet_output = None
+
+    # 解析参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--threshold' and i + 1 < len(sys.argv):
+            connection_threshold = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--top' and i + 1 < len(sys.argv):
+            top_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--rare' and i + 1 < len(sys.argv):
+            rare_processes = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--state' and i + 1 < len(sys.argv):
+            connection_state = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--subnet' and i + 1 < len(sys.argv):
+            remote_subnet = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--json' and i + 1 < len(sys.argv):
+            json_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--parquet' and i + 1 < len(sys.argv):
+            parquet_output = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如 '-device <path_to_dump>')。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        network_analytics(vmm_arguments, connection_threshold, top_count, rare_processes, connection_state,
+                          remote_subnet, json_output, parquet_output)
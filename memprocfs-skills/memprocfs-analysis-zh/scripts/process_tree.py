@@ -0,0 +1,382 @@
+'''
+此脚本构建所有进程的父子树并回答血缘问题：进程的祖先、其整个子树、
+由给定程序 (直接或间接) 派生的每个进程、父进程已不在进程列表中的孤立进程，
+以及对知名 Windows 系统进程而言不寻常的父进程。
+
+ProcessGraph 通过对进程列表的一次遍历构建：哈希索引将每个 PID 映射到其行，
+每个父 PID 与该索引连接，每个进程的子进程保存在一个邻接数组中 (CSR 形式)。
+祖先查询沿父行进行，子树和派生查询最多访问每个进程一次。
+由 system_classification.py 用于报告的进程树部分；也可以被自定义脚本导入。
+
+用法: python process_tree.py [--root <pid>] [--ancestors <pid>] [--descendants <pid>] [--spawned-by <名称通配符>]
+           [--orphans] [--suspicious] [--depth <n>] [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import LazyProcessTable
+import sys
+import fnmatch
+from array import array
+from collections import deque
+
+# Windows 系统进程的常见父进程 (小写名称)。父进程仍在运行但不属于其中之一的进程
+# 会被报告为可疑。
+EXPECTED_PARENTS = {
+    'smss.exe': ('system', 'smss.exe'),
+    'csrss.exe': ('smss.exe',),
+    'wininit.exe': ('smss.exe',),
+    'winlogon.exe': ('smss.exe',),
+    'services.exe': ('wininit.exe',),
+    'lsass.exe': ('wininit.exe',),
+    'lsaiso.exe': ('wininit.exe',),
+    'svchost.exe': ('services.exe',),
+    'spoolsv.exe': ('services.exe',),
+    'taskhostw.exe': ('svchost.exe',),
+    'runtimebroker.exe': ('svchost.exe',),
+    'userinit.exe': ('winlogon.exe',),
+    'dwm.exe': ('winlogon.exe',),
+    'explorer.exe': ('userinit.exe',),
+}
+
+# 同一时间只运行一个实例的系统进程。
+SINGLE_INSTANCE = ('wininit.exe', 'services.exe', 'lsass.exe', 'lsaiso.exe')
+
+
+class ProcessGraph:
+    '''
+    数组形式的进程树。
+
+    各行按 PID 排序。parents 保存每一行的父行 (根为 -1)，第 r 行的子进程为
+    child_rows[child_start[r]:child_start[r + 1]]，order 从根开始按广度优先列出所有行，
+    因此每个父进程都排在其子进程之前。
+    '''
+
+    def __init__(self, processes):
+        '''
+        :param processes: 包含 pid、ppid、name 和 path 的字典的可迭代对象，
+                          与 system_classification.collect_processes() 的返回值相同。
+        '''
+        processes = sorted(processes, key=lambda process: process['pid'])
+        self.pids = array('I', (process['pid'] for process in processes))
+        self.ppids = array('I', (process['ppid'] or 0 for process in processes))
+        self.names = [process['name'] or '' for process in processes]
+        self.paths = [process.get('path') for process in processes]
+        count = len(self.pids)
+
+        # 哈希索引 PID -> 行，然后将每个父 PID 与其进行哈希连接；
+        # 父 PID 为 0 表示该进程没有父进程
+        self.index = {}
+        for row, pid in enumerate(self.pids):
+            self.index.setdefault(pid, row)
+        self.parents = array('i', [-1]) * count
+        for row, ppid in enumerate(self.ppids):
+            parent = self.index.get(ppid, -1) if ppid else -1
+            if parent != row:
+                self.parents[row] = parent
+
+        # CSR 形式的子进程邻接数组，通过对父行的计数排序填充
+        self.child_start = array('I', [0]) * (count + 1)
+        for parent in self.parents:
+            if parent >= 0:
+                self.child_start[parent + 1] += 1
+        for row in range(count):
+            self.child_start[row + 1] += self.child_start[row]
+        self.child_rows = array('I', [0]) * self.child_start[count]
+        cursor = self.child_start[:count]
+        for row, parent in enumerate(self.parents):
+            if parent >= 0:
+                self.child_rows[cursor[parent]] = row
+                cursor[parent] += 1
+
+        # 从根开始的深度和广度优先顺序。位于父进程环 (PID 重用可能造成) 上的行
+        # 无法从根到达，因此成为根。
+        self.depths = array('i', [-1]) * count
+        self.order = array('I')
+        self._traverse(row for row in range(count) if self.parents[row] < 0)
+        if len(self.order) < count:
+            self._traverse(row for row in range(count) if self.depths[row] < 0)
+
+    def _traverse(self, roots):
+        for root in roots:
+            if self.depths[root] >= 0:
+                continue
+            self.depths[root] = 0
+            queue = deque([root])
+            while queue:
+                row = queue.popleft()
+                self.order.append(row)
+                for child in self.children_rows(row):
+                    if self.depths[child] < 0:
+                        self.depths[child] = self.depths[row] + 1
+                        queue.append(child)
+
+    def __len__(self):
+        return len(self.pids)
+
+    def __contains__(self, pid):
+        return pid in self.index
+
+    def children_rows(self, row):
+        return self.child_rows[self.child_start[row]:self.child_start[row + 1]]
+
+    def process(self, row):
+        '''
+        以字典形式返回一行。
+        '''
+        return {'pid': self.pids[row], 'ppid': self.ppids[row], 'name': self.names[row], 'path': self.paths[row],
+                'depth': self.depths[row]}
+
+    def children(self, pid):
+        '''
+        返回进程的直接子进程的行。
+        '''
+        return list(self.children_rows(self.index[pid]))
+
+    def ancestors(self, pid):
+        '''
+        返回进程的祖先的行，父进程在前。
+        '''
+        rows = []
+        seen = {self.index[pid]}
+        parent = self.parents[self.index[pid]]
+        while parent >= 0 and parent not in seen:
+            rows.append(parent)
+            seen.add(parent)
+            parent = self.parents[parent]
+        return rows
+
+    def descendants(self, pid):
+        '''
+        按广度优先返回进程下方所有进程的行。
+        '''
+        start = self.index[pid]
+        rows = []
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            for child in self.children_rows(queue.popleft()):
+                if child not in seen:
+                    seen.add(child)
+                    rows.append(child)
+                    queue.append(child)
+        return rows
+
+    def spawned_by(self, pattern):
+        '''
+        返回名称与通配符 (例如 'winword.exe') 匹配的进程的所有后代进程。
+
+        :param pattern: 进程名称通配符 (不区分大小写)。
+        :return: (行, 派生者行) 元组的列表；派生者是最近的匹配祖先。
+        '''
+        pattern = pattern.lower()
+        matches = [fnmatch.fnmatch(name.lower(), pattern) for name in self.names]
+        spawners = array('i', [-1]) * len(self)
+        # 广度优先顺序先访问父进程再访问子进程，因此一次遍历即可传播派生者
+        for row in self.order:
+            parent = self.parents[row]
+            if parent >= 0:
+                spawners[row] = parent if matches[parent] else spawners[parent]
+        return [(row, spawners[row]) for row in self.order if spawners[row] >= 0]
+
+    def roots(self):
+        return [row for row in self.order if self.depths[row] == 0]
+
+    def orphans(self):
+        '''
+        返回父 PID 不在进程列表中的进程的行，例如因为父进程已退出。
+        '''
+        return [row for row in range(len(self))
+                if self.parents[row] < 0 and self.ppids[row] not in (0, self.pids[row])]
+
+    def suspicious(self):
+        '''
+        返回父进程异常或存在多个实例的系统进程。
+
+        :return: (行, 原因) 元组的列表。
+        '''
+        findings = []
+        instances = {}
+        for row, name in enumerate(self.names):
+            name = name.lower()
+            parent = self.parents[row]
+            expected = EXPECTED_PARENTS.get(name)
+            if expected and parent >= 0 and self.names[parent].lower() not in expected:
+                findings.append((row, f"意外的父进程 {self.names[parent]} (PID: {self.pids[parent]})，"
+                                      f"应为 {' 或 '.join(expected)}"))
+            if name in SINGLE_INSTANCE:
+                instances.setdefault(name, []).append(row)
+        for name, rows in instances.items():
+            if len(rows) > 1:
+                findings.extend((row, f"{name} 有 {len(rows)} 个实例在运行") for row in rows)
+        return findings
+
+    def format_tree(self, pid=None, max_depth=None):
+        '''
+        以缩进行的形式产生树，从某个进程或所有根开始。
+
+        :param pid: 可选的起始进程 PID。
+        :param max_depth: 可选的起始进程下方打印的层数。
+        '''
+        starts = [self.index[pid]] if pid is not None else self.roots()
+        for start in starts:
+            seen = set()
+            stack = [(start, 0)]
+            while stack:
+                row, level = stack.pop()
+                if row in seen:
+                    continue
+                seen.add(row)
+                yield f"{'  ' * level}{self.names[row]} (PID: {self.pids[row]})"
+                if max_depth is None or level < max_depth:
+                    stack.extend((child, level + 1) for child in reversed(self.children_rows(row)))
+
+    def to_dict(self):
+        '''
+        返回用于分类报告的树：根、每个 PID 的子进程、孤立进程和可疑血缘。
+        '''
+        return {
+            'roots': [self.pids[row] for row in self.roots()],
+            'children': {str(self.pids[row]): [self.pids[child] for child in self.children_rows(row)]
+                         for row in range(len(self)) if self.child_start[row + 1] > self.child_start[row]},
+            'max_depth': max(self.depths) if len(self) else 0,
+            'orphans': [self.process(row) for row in self.orphans()],
+            'suspicious': [dict(self.process(row), reason=reason) for row, reason in self.suspicious()],
+        }
+
+
+def collect_process_graph(vmm):
+    '''
+    构建 memprocfs.Vmm 的 ProcessGraph。只读取每个进程的 PID、父 PID 和名称
+    (参见 lazy_processes.py)；不读取路径。
+    '''
+    return ProcessGraph(LazyProcessTable(vmm).rows(('pid', 'ppid', 'name')))
+
+
+def _describe(graph, row):
+    return f"{graph.names[row]} (PID: {graph.pids[row]}, PPID: {graph.ppids[row]})"
+
+
+def process_tree(vmm_args, root=None, ancestors_of=None, descendants_of=None, spawned_by=None, orphans=False,
+                 suspicious=False, max_depth=None):
+    '''
+    构建进程树并打印请求的视图。未给出查询时打印整棵树。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param root: 可选的 PID；打印此进程下方的树。
+    :param ancestors_of: 可选的 PID；打印此进程的祖先。
+    :param descendants_of: 可选的 PID；打印此进程下方的所有进程。
+    :param spawned_by: 可选的进程名称通配符；打印其直接或间接派生的每个进程。
+    :param orphans: 打印父进程不在进程列表中的进程。
+    :param suspicious: 打印父进程异常或存在多个实例的系统进程。
+    :param max_depth: 可选的打印树层数。
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+        graph = collect_process_graph(vmm)
+        print(f"进程树: {len(graph)} 个进程，{len(graph.roots())} 个根，"
+              f"最大深度 {max(graph.depths) if len(graph) else 0}")
+
+        for pid in (ancestors_of, descendants_of, root):
+            if pid is not None and pid not in graph:
+                print(f"错误: 未找到 PID 为 {pid} 的进程。")
+                return
+
+        if ancestors_of is not None:
+            rows = graph.ancestors(ancestors_of)
+            print(f"\n--- {_describe(graph, graph.index[ancestors_of])} 的祖先 ---")
+            for level, row in enumerate(rows, 1):
+                print(f"{'  ' * level}<- {_describe(graph, row)}")
+            if rows and graph.parents[rows[-1]] < 0 and graph.ppids[rows[-1]] not in (0, graph.pids[rows[-1]]):
+                print(f"{'  ' * (len(rows) + 1)}<- PID {graph.ppids[rows[-1]]} (不在进程列表中)")
+
+        if descendants_of is not None:
+            rows = graph.descendants(descendants_of)
+            print(f"\n--- {_describe(graph, graph.index[descendants_of])} 下方的 {len(rows)} 个进程 ---")
+            for line in graph.format_tree(descendants_of, max_depth):
+                print(line)
+
+        if spawned_by is not None:
+            pairs = graph.spawned_by(spawned_by)
+            print(f"\n--- 由 '{spawned_by}' 派生的 {len(pairs)} 个进程 ---")
+            for row, spawner in pairs:
+                print(f"- {_describe(graph, row)} <- {graph.names[spawner]} (PID: {graph.pids[spawner]})")
+
+        if orphans:
+            rows = graph.orphans()
+            print(f"\n--- 父进程不在进程列表中的 {len(rows)} 个进程 ---")
+            for row in rows:
+                print(f"- {_describe(graph, row)}")
+
+        if suspicious:
+            findings = graph.suspicious()
+            print(f"\n--- {len(findings)} 条可疑血缘发现 ---")
+            for row, reason in findings:
+                print(f"- {_describe(graph, row)}: {reason}")
+
+        queried = (ancestors_of, descendants_of, spawned_by)
+        if root is not None or not (any(query is not None for query in queried) or orphans or suspicious):
+            print()
+            for line in graph.format_tree(root, max_depth):
+                print(line)
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("用法: python process_tree.py [--root <pid>] [--ancestors <pid>] [--descendants <pid>] [--spawned-by <名称通配符>]")
+        print("           [--orphans] [--suspicious] [--depth <n>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python process_tree.py --depth 3 -device memory.dmp")
+        print("示例: python process_tree.py --spawned-by 'winword.exe' --suspicious -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    root_pid = None
+    ancestors_pid = None
+    descendants_pid = None
+    spawner_name = None
+    show_orphans = False
+    show_suspicious = False
+    tree_depth = None
+
+    # 解析参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--root' and i + 1 < len(sys.argv):
+            root_pid = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--ancestors' and i + 1 < len(sys.argv):
+            ancestors_pid = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--descendants' and i + 1 < len(sys.argv):
+            descendants_pid = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--spawned-by' and i + 1 < len(sys.argv):
+            spawner_name = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--orphans':
+            show_orphans = True
+            i += 1
+        elif sys.argv[i] == '--suspicious':
+            show_suspicious = True
+            i += 1
+        elif sys.argv[i] == '--depth' and i + 1 < len(sys.argv):
+            tree_depth = int(sys.argv[i + 1])
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如 '-device <path_to_dump>')。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        process_tree(vmm_arguments, root_pid, ancestors_pid, descendants_pid, spawner_name, show_orphans,
+                     show_suspicious, tree_depth)
@@ -0,0 +1,379 @@
+'''
+进程内存的页面哈希与已知良好过滤。
+
+进程的已映射内存大多是共享映像 (例如系统 DLL) 的页面和零页，它们在每台主机上
+都相同。此模块逐页计算进程内存的哈希，将干净基线镜像的页面摘要收集为已知良好
+集合，并从转储或 YARA 扫描读取的块中滤除在该集合中找到的页面，只写入或扫描
+其余页面组成的连续段。供 dump_process_memory.py 和 yara_scan_process.py
+(--known-good) 使用；也可被自定义脚本导入:
+
+    known = KnownGoodSet.load('baseline.hashes')
+    for address, data in iter_unknown_chunks(process, known):
+        ...
+
+默认使用快速的 128 位哈希计算页面哈希: 安装了可选的 xxhash 包
+(pip install xxhash) 时使用 xxh3，否则使用 blake2b。快速哈希能区分页面，
+但无法抵御精心构造的碰撞；当集合需要防御了解基线的攻击者时，请使用
+--sha256 构建集合。页面在读取内存的线程池中计算哈希。
+
+被略过的页面不会写入转储也不会被扫描，因此从已知良好页面跨入其他页面的
+YARA 匹配不会被发现。
+
+集合文件布局 (小端序):
+
+    header   MAGIC、格式版本、哈希 id、摘要数量
+    digests  排序后的页面摘要，依次排列
+
+加载的集合不会读入 Python 对象: 文件被映射到内存中并在原处查找。通过二分查找
+得到的索引记录了每个双字节前缀的摘要的起始位置，将一次查找缩小到少数几个摘要。
+包含数百万页面的集合，其开销仅略多于查找所触及的文件页面，且这些页面由加载
+同一文件的所有进程共享。
+
+用法: python region_hashes.py --build <集合文件> [--sha256] [--threads <n>] [vmm_args...]
+      python region_hashes.py --check <集合文件> [--threads <n>] [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+import os
+import sys
+import mmap
+import time
+import struct
+import hashlib
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from memory_regions import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_INFLIGHT, PAGE_SIZE, get_memory_regions,
+                            iter_chunk_ranges, iter_region_chunks_parallel, read_chunk)
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+MAGIC = b'MPFSHSET'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQ')
+
+# 头部中的哈希 id (按索引) 及其摘要大小。
+HASHES = ('xxh3', 'blake2b', 'sha256')
+DIGEST_SIZES = {'xxh3': 16, 'blake2b': 16, 'sha256': 32}
+DEFAULT_HASH = 'xxh3' if xxhash is not None else 'blake2b'
+
+DEFAULT_THREADS = 4
+
+
+def _hasher(hash_name):
+    '''
+    返回一个计算单个页面摘要的函数。
+    '''
+    if hash_name == 'xxh3':
+        if xxhash is None:
+            raise RuntimeError("xxh3 hash sets require xxhash (pip install xxhash)")
+        return xxhash.xxh3_128_digest
+    if hash_name == 'blake2b':
+        return lambda data: hashlib.blake2b(data, digest_size=16).digest()
+    return lambda data: hashlib.sha256(data).digest()
+
+
+def page_digests(hasher, data):
+    '''
+    逐页计算内存块的哈希。
+
+    :param hasher: _hasher() 返回的函数。
+    :param data: 块数据，从页面边界开始。
+    :return: 包含每个页面摘要的列表。
+    '''
+    view = memoryview(data)
+    return [hasher(view[offset:offset + PAGE_SIZE]) for offset in range(0, len(data), PAGE_SIZE)]
+
+
+class KnownGoodSet:
+    '''
+    已知良好内存的页面摘要集合，保存为一段排序的定长摘要。通过 update() 添加
+    的摘要在 save() 之前保存在 Python 集合中。过滤时只读取该集合，因此一个
+    实例可由所有线程共享。
+    '''
+
+    def __init__(self, hash_name=DEFAULT_HASH, digests=()):
+        self.hash_name = hash_name
+        self.hasher = _hasher(hash_name)
+        self.digest_size = DIGEST_SIZES[hash_name]
+        self._added = set()
+        digests = sorted(set(digests))
+        self._attach(b''.join(digests), 0, len(digests))
+
+    def _attach(self, buffer, offset, count):
+        '''
+        使用缓冲区 (bytes 或 mmap) 中从 offset 开始存放的 count 个排序摘要。
+        '''
+        size = self.digest_size
+        end = offset + count * size
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        # 每个双字节前缀的摘要的起始偏移
+        firsts = buffer[offset:end:size]
+        seconds = buffer[offset + 1:end:size]
+        self._bounds = bounds = []
+        for first in range(256):
+            lo = bisect_left(firsts, first)
+            hi = bisect_left(firsts, first + 1, lo)
+            if hi - lo < 256:
+                # 小的分桶只需遍历一次其第二个字节
+                row = []
+                for index in range(lo, hi):
+                    row.extend([offset + index * size] * (seconds[index] + 1 - len(row)))
+                row.extend([offset + hi * size] * (256 - len(row)))
+                bounds.extend(row)
+            else:
+                bounds.extend([offset + bisect_left(seconds, second, lo, hi) * size for second in range(256)])
+        bounds.append(end)
+
+    def __len__(self):
+        return self._count + len(self._added)
+
+    def __contains__(self, digest):
+        prefix = digest[0] << 8 | digest[1]
+        end = self._bounds[prefix + 1]
+        position = self._buffer.find(digest, self._bounds[prefix], end)
+        # 匹配必须从摘要边界开始
+        while position >= 0 and (position - self._offset) % self.digest_size:
+            position = self._buffer.find(digest, position + 1, end)
+        return position >= 0 or digest in self._added
+
+    def _iter_digests(self):
+        size = self.digest_size
+        for start in range(self._offset, self._offset + self._count * size, size):
+            yield self._buffer[start:start + size]
+
+    def update(self, digests):
+        self._added.update(digest for digest in digests if digest not in self)
+
+    def split(self, address, data):
+        '''
+        将块拆分为不在集合中的页面组成的连续段。
+
+        :param address: 块的虚拟地址。
+        :param data: 块数据。
+        :return: 按地址排序的 (address, data) 元组列表。
+        '''
+        contains = self.__contains__
+        runs = []
+        start = None
+        for i, digest in enumerate(page_digests(self.hasher, data)):
+            offset = i * PAGE_SIZE
+            if contains(digest):
+                if start is not None:
+                    runs.append((address + start, data[start:offset]))
+                    start = None
+            elif start is None:
+                start = offset
+        if start == 0:
+            runs.append((address, data))
+        elif start is not None:
+            runs.append((address + start, data[start:]))
+        return runs
+
+    def save(self, path):
+        '''
+        将集合写入文件，布局参见模块文档字符串。
+        '''
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, HASHES.index(self.hash_name), len(self)))
+            if self._added:
+                f.write(b''.join(sorted(self._added.union(self._iter_digests()))))
+            else:
+                f.write(self._buffer[self._offset:self._offset + self._count * self.digest_size])
+
+    @classmethod
+    def load(cls, path):
+        '''
+        将由 save() 写入的集合映射到内存。
+        '''
+        with open(path, 'rb') as f:
+            magic, version, hash_id, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or hash_id >= len(HASHES):
+                raise ValueError(f"{path} 不是已知良好哈希集合")
+            known = cls(HASHES[hash_id])
+            if os.fstat(f.fileno()).st_size < HEADER.size + count * known.digest_size:
+                raise ValueError(f"{path} 已被截断")
+            if count:
+                # 文件关闭后映射仍然有效
+                known._attach(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), HEADER.size, count)
+        return known
+
+
+def iter_process_digests(process, hasher, pool=None, regions=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         max_inflight=DEFAULT_MAX_INFLIGHT):
+    '''
+    产出进程已映射区域的页面摘要，每个块一个列表。
+
+    :param process: memprocfs 进程对象。
+    :param hasher: _hasher() 返回的函数。
+    :param pool: 可选的线程池，用于先于消费方读取块并计算哈希。
+    :param regions: 可选的 (base, size) 元组列表；默认为 get_memory_regions()。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param max_inflight: 使用线程池时预读的最大字节数。
+    '''
+    def read(process, address, size):
+        return page_digests(hasher, read_chunk(process, address, size))
+
+    if regions is None:
+        regions = get_memory_regions(process)
+    if pool:
+        for _, digests in iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight, read):
+            yield digests
+    else:
+        for address, size in iter_chunk_ranges(regions, chunk_size):
+            yield read(process, address, size)
+
+
+def iter_unknown_chunks(process, known, pool=None, regions=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                        max_inflight=DEFAULT_MAX_INFLIGHT, stats=None):
+    '''
+    与 iter_region_chunks() 相同，但会略过在已知良好集合中找到的页面；
+    每个块以其其余页面组成的连续段产出。
+
+    :param process: memprocfs 进程对象。
+    :param known: KnownGoodSet。
+    :param pool: 可选的线程池，用于先于消费方读取块并计算哈希。
+    :param regions: 可选的 (base, size) 元组列表；默认为 get_memory_regions()。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param max_inflight: 使用线程池时预读的最大字节数。
+    :param stats: 可选的 dict；读取时更新其 'bytes_skipped' 条目。
+    '''
+    def read(process, address, size):
+        return size, known.split(address, read_chunk(process, address, size))
+
+    if regions is None:
+        regions = get_memory_regions(process)
+    if pool:
+        results = (result for _, result in
+                   iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight, read))
+    else:
+        results = (read(process, address, size) for address, size in iter_chunk_ranges(regions, chunk_size))
+    for size, runs in results:
+        if stats is not None:
+            stats['bytes_skipped'] = stats.get('bytes_skipped', 0) + size - sum(len(data) for _, data in runs)
+        yield from runs
+
+
+def build_known_good(set_file, vmm_args, hash_name=DEFAULT_HASH, threads=DEFAULT_THREADS,
+                     chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    从干净基线镜像中每个进程的页面构建已知良好集合。
+
+    :param set_file: 保存集合的路径。
+    :param vmm_args: 用于以基线镜像初始化 MemProcFS 的参数列表。
+    :param hash_name: 'xxh3'、'blake2b' 或 'sha256'。
+    :param threads: 读取内存并计算哈希的工作线程数。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    '''
+    try:
+        start_time = time.perf_counter()
+        known = KnownGoodSet(hash_name)
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+
+        processes = sorted(vmm.process_all(), key=lambda p: p.pid)
+        print(f"正在使用 {threads} 个线程以 {hash_name} 计算 {len(processes)} 个进程的页面哈希...")
+        hashed = 0
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for process in processes:
+                try:
+                    for digests in iter_process_digests(process, known.hasher, pool, chunk_size=chunk_size):
+                        known.update(digests)
+                        hashed += len(digests) * PAGE_SIZE
+                except Exception as e:
+                    print(f"  - {process.name} (PID: {process.pid}): 失败: {e}")
+
+        known.save(set_file)
+        wall_time = time.perf_counter() - start_time
+        print(f"已在 {wall_time:.2f} 秒内计算 {hashed} 字节的哈希: {len(known)} 个不同页面已写入 {set_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+def check_known_good(set_file, vmm_args, threads=DEFAULT_THREADS, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    报告已知良好集合会略过每个进程的多少内存，以便在转储或扫描之前估算节省量。
+
+    :param set_file: 由 build_known_good() 写入的集合路径。
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param threads: 读取内存并计算哈希的工作线程数。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    '''
+    try:
+        start_time = time.perf_counter()
+        known = KnownGoodSet.load(set_file)
+        print(f"已从 {set_file} 加载 {len(known)} 个 {known.hash_name} 页面摘要")
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+
+        total_mapped = total_known = 0
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for process in sorted(vmm.process_all(), key=lambda p: p.pid):
+                mapped = matched = 0
+                try:
+                    for digests in iter_process_digests(process, known.hasher, pool, chunk_size=chunk_size):
+                        mapped += len(digests) * PAGE_SIZE
+                        matched += sum(PAGE_SIZE for digest in digests if digest in known)
+                except Exception as e:
+                    print(f"  - {process.name} (PID: {process.pid}): 失败: {e}")
+                    continue
+                if mapped:
+                    print(f"  - {process.name} (PID: {process.pid}): {mapped} 字节中 {matched} 字节为已知良好 "
+                          f"({matched / mapped * 100:.1f}%)")
+                total_mapped += mapped
+                total_known += matched
+
+        wall_time = time.perf_counter() - start_time
+        share = total_known / total_mapped * 100 if total_mapped else 0.0
+        print(f"{total_mapped} 字节中 {total_known} 字节为已知良好 ({share:.1f}%)，检查用时 {wall_time:.2f} 秒")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 3 or sys.argv[1] not in ('--build', '--check'):
+        print("用法: python region_hashes.py --build <集合文件> [--sha256] [--threads <n>] [vmm_args...]")
+        print("      python region_hashes.py --check <集合文件> [--threads <n>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python region_hashes.py --build baseline.hashes -device clean.dmp")
+        print("示例: python region_hashes.py --check baseline.hashes -device memory.dmp")
+        sys.exit(1)
+
+    mode, set_path = sys.argv[1], sys.argv[2]
+    args = sys.argv[3:]
+    vmm_arguments = []
+    hash_algorithm = DEFAULT_HASH
+    thread_count = DEFAULT_THREADS
+
+    # 解析参数
+    i = 0
+    while i < len(args):
+        if args[i] == '--sha256':
+            hash_algorithm = 'sha256'
+            i += 1
+        elif args[i] == '--threads' and i + 1 < len(args):
+            thread_count = int(args[i + 1])
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if mode == '--build':
+            build_known_good(set_path, vmm_arguments, hash_algorithm, thread_count)
+        else:
+            check_known_good(set_path, vmm_arguments, thread_count)
@@ -0,0 +1,283 @@
+'''
+脚本所报告记录的批量写入器: JSON 行、CSV、Arrow IPC 和对齐的文本表格。
+
+每条记录打印一个 f-string 意味着每个句柄或匹配都要一次格式化调用和一次终端
+写入。写入器将记录收集成批，每批只需一次调用即写入带缓冲的文件或 stdout，
+因此导出一台拥有数十万句柄的主机只需数秒。供 list_process_handles.py、
+handle_table.py、fleet_triage.py、yara_scan_process.py、dump_process_memory.py
+和 system_classification.py 使用；也可被自定义脚本导入:
+
+    with open_writer('csv', 'handles.csv') as out:
+        out.write_many(records)
+
+记录是 dict。CSV、Arrow 和表格格式的列是传给写入器的字段，或第一条记录的
+键。列类型可指定为 'int'、'hex' (在表格中以十六进制显示的整数)、'float'、
+'str' 或 'bool'；未指定的类型由 Arrow 从第一批推断。
+
+当记录以机器可读格式写入 stdout 时，脚本的消息输出到 stderr
+(参见 ResultWriter.messages)，以保持数据流干净。
+
+Arrow 输出使用 IPC 流格式，需要可选的 pyarrow 包 (pip install pyarrow):
+
+    with pyarrow.ipc.open_stream('handles.arrow') as reader:
+        table = reader.read_all()
+'''
+
+import sys
+import csv
+import json
+from itertools import islice
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+FORMATS = ('table', 'jsonl', 'csv', 'arrow')
+
+# 每种格式的文件扩展名，例如用于每个表一个文件。
+EXTENSIONS = {'table': 'txt', 'jsonl': 'jsonl', 'csv': 'csv', 'arrow': 'arrow'}
+
+# 一次调用写入的记录数。
+DEFAULT_BATCH_SIZE = 4096
+
+# 输出文件的缓冲区 (1 MiB)。
+BUFFER_SIZE = 0x100000
+
+
+def guess_format(output_file, default='table'):
+    '''
+    返回与输出文件扩展名匹配的格式。
+
+    :param output_file: 可选的输出文件路径。
+    :param default: 用于 stdout 和未知扩展名的格式。
+    '''
+    if output_file:
+        extension = output_file.rsplit('.', 1)[-1].lower()
+        for name, known in EXTENSIONS.items():
+            if extension == known and name != 'table':
+                return name
+    return default
+
+
+class ResultWriter:
+    '''
+    收集记录并批量写入。子类实现 _write_batch()，需要时还实现 _finish()。
+    '''
+    binary = False
+    newline = None
+    # 输出是否面向程序而非人
+    machine_readable = True
+
+    def __init__(self, output_file=None, fields=None, types=None, batch_size=DEFAULT_BATCH_SIZE, widths=None):
+        '''
+        :param output_file: 可选的输出文件路径；默认为 stdout。
+        :param fields: 可选的写入字段列表；默认为第一条记录的键。
+        :param types: 可选的 dict，将字段映射到 'int'、'hex'、'float'、'str' 或 'bool'。
+        :param batch_size: 一次调用写入的记录数。
+        :param widths: 可选的最小列宽 dict (表格格式)。
+        '''
+        self.output_file = output_file
+        self.fields = list(fields) if fields else None
+        self.types = dict(types or {})
+        self.min_widths = dict(widths or {})
+        self.batch_size = max(1, batch_size)
+        self.count = 0
+        self._batch = []
+        if output_file:
+            self._file = open(output_file, 'wb' if self.binary else 'w', buffering=BUFFER_SIZE,
+                              **({} if self.binary else {'encoding': 'utf-8', 'newline': self.newline}))
+        else:
+            self._file = sys.stdout.buffer if self.binary else sys.stdout
+        # 消息不能混入 stdout 上的机器可读数据流
+        self.messages = sys.stderr if output_file is None and self.machine_readable else sys.stdout
+
+    def write(self, record):
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records):
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.batch_size - len(self._batch)))
+            if not chunk:
+                break
+            self._batch.extend(chunk)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        '''
+        写入目前收集的记录。
+        '''
+        if self._batch:
+            if self.fields is None:
+                self.fields = list(self._batch[0])
+            self._write_batch(self._batch)
+            self.count += len(self._batch)
+            self._batch = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._finish()
+        if self.output_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonlWriter(ResultWriter):
+    '''
+    将每条记录及其所有键写为一行 JSON。
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def _write_batch(self, batch):
+        encode = self._encode
+        self._file.write('\n'.join([encode(record) for record in batch]) + '\n')
+
+
+class CsvWriter(ResultWriter):
+    '''
+    将记录写为带标题行的 CSV。缺失的值为空。
+    '''
+    newline = ''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._header = False
+
+    def _write_batch(self, batch):
+        fields = self.fields
+        if not self._header:
+            self._writer.writerow(fields)
+            self._header = True
+        self._writer.writerows(zip(*[[record.get(field) for record in batch] for field in fields]))
+
+    def _finish(self):
+        if not self._header and self.fields:
+            self._writer.writerow(self.fields)
+
+
+class TableWriter(ResultWriter):
+    '''
+    将记录写为文本表格。列宽取自标题、最小列宽和第一批记录；更长的值只会
+    加宽其所在的行。
+    '''
+    machine_readable = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._widths = None
+        self._format = None
+
+    def _column(self, field, batch):
+        '''
+        返回一批记录中某一列的单元格。
+        '''
+        convert = hex if self.types.get(field) == 'hex' else str
+        values = [record.get(field) for record in batch]
+        if None in values:
+            return ['-' if value is None else convert(value) for value in values]
+        return list(map(convert, values))
+
+    def _write_batch(self, batch):
+        fields = self.fields
+        # 逐列转换使每个值的处理留在 C 中
+        columns = [self._column(field, batch) for field in fields]
+        lines = []
+        if self._widths is None:
+            self._widths = [max([len(field), self.min_widths.get(field, 0)] + list(map(len, cells)))
+                            for field, cells in zip(fields, columns)]
+            # 最后一列不填充
+            self._format = '  '.join([f"{{:<{width}}}" for width in self._widths[:-1]] + ['{}'])
+            lines.append(self._format.format(*fields).rstrip())
+            lines.append(self._format.format(*['-' * width for width in self._widths]))
+        line_format = self._format.format
+        lines.extend([line_format(*row).rstrip() for row in zip(*columns)])
+        self._file.write('\n'.join(lines) + '\n')
+
+
+class ArrowWriter(ResultWriter):
+    '''
+    将每批记录写为 Arrow IPC 流的一个记录批次。需要可选的 pyarrow 包。
+    '''
+    binary = True
+
+    ARROW_TYPES = {'int': 'int64', 'hex': 'uint64', 'float': 'float64', 'str': 'string', 'bool': 'bool_'}
+
+    def __init__(self, *args, **kwargs):
+        if pyarrow is None:
+            raise RuntimeError("Arrow export requires pyarrow (pip install pyarrow)")
+        super().__init__(*args, **kwargs)
+        self._schema = None
+        self._stream = None
+
+    def _field_type(self, field, values):
+        '''
+        返回字段的 Arrow 类型: 指定的类型，否则为从其值推断的类型；大整数回退为
+        uint64，没有值的列回退为 string。
+        '''
+        if field in self.types:
+            return getattr(pyarrow, self.ARROW_TYPES[self.types[field]])()
+        try:
+            arrow_type = pyarrow.array(values).type
+        except (OverflowError, pyarrow.ArrowInvalid):
+            arrow_type = pyarrow.uint64()
+        return pyarrow.string() if arrow_type == pyarrow.null() else arrow_type
+
+    def _write_batch(self, batch):
+        columns = {field: [record.get(field) for record in batch] for field in self.fields}
+        if self._schema is None:
+            self._schema = pyarrow.schema([(field, self._field_type(field, values))
+                                           for field, values in columns.items()])
+            self._stream = pyarrow.ipc.new_stream(self._file, self._schema)
+        arrays = [pyarrow.array(columns[field.name], type=field.type) for field in self._schema]
+        self._stream.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def _finish(self):
+        if self._stream is None and self.fields:
+            # 空数据流仍带有 schema
+            self._schema = pyarrow.schema([(field, self._field_type(field, [])) for field in self.fields])
+            self._stream = pyarrow.ipc.new_stream(self._file, self._schema)
+        if self._stream is not None:
+            self._stream.close()
+
+
+WRITERS = {'table': TableWriter, 'jsonl': JsonlWriter, 'csv': CsvWriter, 'arrow': ArrowWriter}
+
+
+def open_writer(fmt, output_file=None, fields=None, types=None, batch_size=DEFAULT_BATCH_SIZE, widths=None):
+    '''
+    打开 FORMATS 中某一格式的写入器。
+
+    :param fmt: 'table'、'jsonl'、'csv' 或 'arrow'。
+    :param output_file: 可选的输出文件路径；默认为 stdout。
+    :param fields: 可选的写入字段列表；默认为第一条记录的键。
+    :param types: 可选的 dict，将字段映射到 'int'、'hex'、'float'、'str' 或 'bool'。
+    :param batch_size: 一次调用写入的记录数。
+    :param widths: 可选的最小列宽 dict (表格格式)。
+    :return: 一个 ResultWriter，需要关闭 (或用作上下文管理器)。
+    '''
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown output format '{fmt}' (available: {', '.join(FORMATS)})")
+    return WRITERS[fmt](output_file, fields, types, batch_size, widths)
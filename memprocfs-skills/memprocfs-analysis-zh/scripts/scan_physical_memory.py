@@ -0,0 +1,436 @@
+'''
+此脚本一次性在映像的物理内存中搜索多个模式，并尽可能将每个命中映射回拥有该页面的进程。
+
+对于原始转储文件 (没有崩溃转储、ELF core 或休眠文件头的 -device <文件>)，
+文件偏移即物理地址。每个工作进程对文件进行内存映射并就地扫描其负责的范围，
+因此进程之间不会复制内存。对于所有其他来源，物理内存映射通过 vmm.memory
+以大的对齐批次读取，工作进程在读取下一批次的同时匹配这些批次。
+
+模式为编译后的 YARA 规则 (参见 yara_rules.py；编译后的规则缓存在磁盘上)
+和/或字面字符串及十六进制字节序列。少量字面模式各自用 find() 搜索；
+更大的模式集被编译为一个正则表达式，一次遍历即可匹配全部模式。
+每个批次与下一批次的前 --overlap 个字节一起扫描，命中只由其起始所在的批次报告，
+因此跨越批次边界的命中恰好被找到一次。
+
+所有者在 PFN 数据库 (vmm.maps.pfn()) 中查找：位于进程私有内存页面中的命中
+会连同 PID、进程名称和虚拟地址一起报告。对于原始转储，MemProcFS 仅在扫描之后
+为此查找而初始化；--no-owners 会跳过查找。
+
+用法: python scan_physical_memory.py [--rules <YARA规则文件>] [--string <文本>] [--hex <十六进制字节>] [--workers <n>]
+           [--batch-size <字节数>] [--overlap <字节数>] [--vmm] [--no-owners] [--jsonl <输出文件>]
+           [--cache-dir <目录>] -device <内存源>
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import process_table
+from yara_rules import DEFAULT_CACHE_DIR, iter_match_hits, load_rules
+import os
+import re
+import sys
+import json
+import mmap
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import memprocfs
+
+DEFAULT_WORKERS = 4
+
+# 交给工作进程的物理范围大小；批次从其整数倍处开始 (16 MiB)。
+DEFAULT_BATCH_SIZE = 0x1000000
+
+# 与批次一起扫描的批次末尾之后的字节数；即可跨越边界的最长命中。
+DEFAULT_OVERLAP = 0x1000
+
+# 一次在 PFN 数据库中查找的页帧数。
+PFN_BATCH = 0x1000
+
+# 不超过此数量的字面模式逐个用 find() 搜索，
+# 每个模式的速度比正则表达式的分支匹配快数倍。
+MAX_FIND_PATTERNS = 16
+
+PAGE_SHIFT = 12
+
+# 文件偏移不是物理地址的内存映像格式的文件头。
+IMAGE_HEADERS = (b'PAGEDUMP', b'PAGEDU64', b'MDMP', b'\x7fELF', b'HIBR', b'hibr', b'WAKE', b'wake', b'EMiL')
+
+# 工作进程的匹配器和转储文件映射，由 _init_worker() 设置一次。
+_matcher = None
+_dump = None
+
+
+class PatternMatcher:
+    '''
+    在缓冲区中匹配编译后的 YARA 规则和字面字节模式。
+    '''
+
+    def __init__(self, rules=None, literals=()):
+        '''
+        :param rules: 可选的 yara.Rules 对象。
+        :param literals: (名称, 字节) 模式的列表，例如 ('string', b'mimikatz')。
+        '''
+        self.rules = rules
+        self.names = {}
+        for name, pattern in literals:
+            self.names.setdefault(pattern, name)
+        self.patterns = []
+        self.regex = None
+        if len(self.names) <= MAX_FIND_PATTERNS:
+            self.patterns = list(self.names)
+        else:
+            # 最长的在前：正则表达式随后在某个地址匹配最长的模式，
+            # 在该处匹配的其他每个模式都是它的前缀
+            patterns = sorted(self.names, key=len, reverse=True)
+            self.prefixes = {pattern: [other for other in patterns if pattern.startswith(other)]
+                             for pattern in patterns}
+            self.regex = re.compile(b'|'.join(re.escape(pattern) for pattern in patterns))
+
+    def scan(self, buffer, base, start, end, limit):
+        '''
+        生成缓冲区中起始于 [start, end) 的命中。
+
+        :param buffer: 保存从地址 base 开始的物理内存的字节串或 mmap。
+        :param base: buffer[0] 的物理地址。
+        :param start: 批次的第一个地址。
+        :param end: 批次的结束；起始于此处或之后的命中属于下一批次。
+        :param limit: 扫描数据的结束，即 end 加上重叠部分。
+        :return: 包含 'rule'、'identifier'、'address' 和 'data' 的字典的生成器。
+        '''
+        for pattern in self.patterns:
+            position = buffer.find(pattern, start - base, limit - base)
+            while position != -1 and base + position < end:
+                yield {'rule': self.names[pattern], 'identifier': pattern.hex(), 'address': base + position,
+                       'data': pattern}
+                position = buffer.find(pattern, position + 1, limit - base)
+        if self.regex is not None:
+            position = start - base
+            while True:
+                # 从下一个字节重新搜索，也能找到与命中重叠的模式
+                match = self.regex.search(buffer, position, limit - base)
+                if match is None or base + match.start() >= end:
+                    break
+                for data in self.prefixes[match.group()]:
+                    yield {'rule': self.names[data], 'identifier': data.hex(), 'address': base + match.start(),
+                           'data': data}
+                position = match.start() + 1
+        if self.rules is not None:
+            data = memoryview(buffer)[start - base:limit - base]
+            try:
+                matches = self.rules.match(data=data)
+            except TypeError:
+                # 较旧的 yara-python 版本只接受 bytes
+                matches = self.rules.match(data=data.tobytes())
+            for match in matches:
+                for identifier, offset, matched in iter_match_hits(match):
+                    if offset is None:
+                        # 规则级匹配：报告在批次的起点，而不是在重叠区域中。
+                        yield {'rule': match.rule, 'identifier': None, 'address': start, 'data': b''}
+                    elif start + offset < end:
+                        yield {'rule': match.rule, 'identifier': identifier, 'address': start + offset,
+                               'data': matched}
+
+
+def parse_literals(strings, hex_strings):
+    '''
+    以 (名称, 字节) 元组的形式返回 --string 和 --hex 的字面模式。
+
+    :param strings: 文本模式；每个都按 UTF-8 和 UTF-16LE 搜索。
+    :param hex_strings: 十六进制形式的字节模式，例如 '4d5a9000'。
+    '''
+    literals = []
+    for text in strings:
+        literals.append(('string', text.encode('utf-8')))
+        literals.append(('wide', text.encode('utf-16-le')))
+    for text in hex_strings:
+        literals.append(('hex', bytes.fromhex(text.replace(' ', ''))))
+    return literals
+
+
+def raw_dump_file(vmm_args):
+    '''
+    如果 -device 文件是原始转储 (其文件偏移即物理地址)，则返回该文件。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :return: 文件路径；对于其他映像格式和设备返回 None。
+    '''
+    try:
+        path = vmm_args[vmm_args.index('-device') + 1]
+    except (ValueError, IndexError):
+        return None
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as f:
+        header = f.read(8)
+    return None if header.startswith(IMAGE_HEADERS) else path
+
+
+def iter_batches(ranges, batch_size=DEFAULT_BATCH_SIZE, overlap=DEFAULT_OVERLAP):
+    '''
+    在 batch_size 的整数倍处将物理范围拆分为批次。
+
+    :param ranges: (base, size) 元组的可迭代对象。
+    :param batch_size: 批次的对齐和最大批次大小。
+    :param overlap: 与批次一起扫描的批次末尾之后的字节数。
+    :return: (start, end, limit) 元组的生成器；limit 是扫描数据的结束，
+             它不会超出范围，因为命中不能跨越空洞。
+    '''
+    for base, size in ranges:
+        start, stop = base, base + size
+        while start < stop:
+            end = min(stop, (start // batch_size + 1) * batch_size)
+            yield start, end, min(stop, end + overlap)
+            start = end
+
+
+def _init_worker(rule_file, cache_dir, literals, dump_file):
+    global _matcher, _dump
+    rules = load_rules(rule_file, cache_dir) if rule_file else None
+    _matcher = PatternMatcher(rules, literals)
+    if dump_file:
+        with open(dump_file, 'rb') as f:
+            _dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _scan_dump_batch(start, end, limit):
+    return list(_matcher.scan(_dump, 0, start, end, limit))
+
+
+def _scan_data_batch(data, start, end):
+    return list(_matcher.scan(data, start, start, end, start + len(data)))
+
+
+def iter_dump_hits(pool, batches):
+    '''
+    在工作进程上扫描原始转储的批次；每个工作进程读取自己的文件映射。
+
+    :param pool: 由 _init_worker() 使用转储文件设置的 ProcessPoolExecutor。
+    :param batches: (start, end, limit) 元组的列表，参见 iter_batches()。
+    :return: (已扫描字节数, 命中) 元组的生成器，每个批次一个。
+    '''
+    starts, ends, limits = zip(*batches)
+    for start, end, hits in zip(starts, ends, pool.map(_scan_dump_batch, starts, ends, limits)):
+        yield end - start, hits
+
+
+def iter_vmm_hits(pool, vmm, batches, workers):
+    '''
+    通过 vmm.memory 读取物理内存批次并在工作进程上扫描它们。
+    每个工作进程最多预读两个批次。
+
+    :param pool: 由 _init_worker() 设置的 ProcessPoolExecutor。
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param batches: (start, end, limit) 元组的列表，参见 iter_batches()。
+    :param workers: 工作进程数。
+    :return: (已扫描字节数, 命中) 元组的生成器，每个批次一个。
+    '''
+    pending = deque()
+    for start, end, limit in batches:
+        data = vmm.memory.read(start, limit - start, memprocfs.FLAG_ZEROPAD_ON_FAIL)
+        pending.append((end - start, pool.submit(_scan_data_batch, data, start, end)))
+        while len(pending) > 2 * workers:
+            scanned, future = pending.popleft()
+            yield scanned, future.result()
+    while pending:
+        scanned, future = pending.popleft()
+        yield scanned, future.result()
+
+
+def physical_ranges(vmm):
+    '''
+    以排序后的 (base, size) 元组列表形式返回 Vmm 的物理内存映射。
+    '''
+    return sorted((entry['pa'], entry['cb']) for entry in vmm.maps.memmap() if entry['cb'] > 0)
+
+
+def resolve_owners(vmm, hits):
+    '''
+    从 PFN 数据库为每个命中所在的页面添加所属进程：'pid'、'process' 和虚拟地址 'va'。
+    位于不属于任何进程的页面 (例如内核或文件缓存页面) 中的命中，pid 保持为 None。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param hits: 带有物理地址 'address' 的命中字典列表。
+    :return: 具有所有者的命中数。
+    '''
+    pfns = sorted({hit['address'] >> PAGE_SHIFT for hit in hits})
+    owners = {}
+    for i in range(0, len(pfns), PFN_BATCH):
+        for entry in vmm.maps.pfn(pfns[i:i + PFN_BATCH], True):
+            if entry.get('pid'):
+                owners[entry['pfn']] = (entry['pid'], entry.get('va'))
+
+    table = process_table(vmm)
+    resolved = 0
+    for hit in hits:
+        owner = owners.get(hit['address'] >> PAGE_SHIFT)
+        if owner is None:
+            continue
+        pid, va = owner
+        hit['pid'] = pid
+        hit['process'] = table[pid].name if pid in table else None
+        hit['va'] = va + (hit['address'] & ((1 << PAGE_SHIFT) - 1)) if va else None
+        resolved += 1
+    return resolved
+
+
+def scan_physical_memory(vmm_args, rule_file=None, strings=(), hex_strings=(), workers=DEFAULT_WORKERS,
+                         batch_size=DEFAULT_BATCH_SIZE, overlap=DEFAULT_OVERLAP, use_vmm=False, owners=True,
+                         jsonl_file=None, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    在工作进程池上扫描物理内存，匹配 YARA 规则和字面模式。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param rule_file: 可选的 YARA 规则文件路径；需要 yara-python。
+    :param strings: 文本模式，按 UTF-8 和 UTF-16LE 搜索。
+    :param hex_strings: 十六进制形式的字节模式。
+    :param workers: 匹配批次的工作进程数。
+    :param batch_size: 一次扫描的物理范围的大小和对齐。
+    :param overlap: 与批次一起扫描的批次之后的字节数，以便找到跨越边界的命中。
+    :param use_vmm: 即使设备是原始转储文件，也通过 vmm.memory 读取。
+    :param owners: 查找每个命中的所属进程。
+    :param jsonl_file: 可选，将命中写为 JSON 行的路径。
+    :param cache_dir: 保存已编译规则的目录。
+    '''
+    try:
+        start_time = time.perf_counter()
+        literals = parse_literals(strings, hex_strings)
+        if rule_file:
+            if load_rules(rule_file, cache_dir) is None:
+                print("错误: YARA 规则需要 yara-python 包 (pip install yara-python)；"
+                      "未安装时请使用 --string 或 --hex。")
+                return
+        elif not literals:
+            print("错误: 未给出模式 (请使用 --rules、--string 或 --hex)。")
+            return
+
+        dump_file = None if use_vmm else raw_dump_file(vmm_args)
+        vmm = None
+        if dump_file:
+            ranges = [(0, os.path.getsize(dump_file))]
+            print(f"正在使用 {workers} 个工作进程扫描原始转储 {dump_file} ({ranges[0][1]} 字节)...")
+        else:
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+            ranges = physical_ranges(vmm)
+            print(f"正在使用 {workers} 个工作进程扫描 {len(ranges)} 个范围中 "
+                  f"{sum(size for _, size in ranges)} 字节的物理内存...")
+
+        batches = list(iter_batches(ranges, batch_size, overlap))
+        hits = []
+        scanned = 0
+        with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker,
+                                 initargs=(rule_file, cache_dir, literals, dump_file)) as pool:
+            if not batches:
+                results = []
+            elif dump_file:
+                results = iter_dump_hits(pool, batches)
+            else:
+                results = iter_vmm_hits(pool, vmm, batches, workers)
+            for batch_bytes, batch_hits in results:
+                scanned += batch_bytes
+                hits.extend(batch_hits)
+        scan_time = time.perf_counter() - start_time
+        hits.sort(key=lambda hit: hit['address'])
+        print(f"在 {scan_time:.2f} 秒内扫描了 {scanned} 字节 "
+              f"({scanned / scan_time / 0x100000 if scan_time > 0 else 0:.0f} MiB/s): {len(hits)} 个命中")
+
+        if owners and hits:
+            if vmm is None:
+                vmm = open_vmm(vmm_args)
+                print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+            try:
+                resolved = resolve_owners(vmm, hits)
+                print(f"{len(hits)} 个命中中有 {resolved} 个找到了所属进程")
+            except Exception as e:
+                print(f"警告: 无法查找所属进程: {e}")
+
+        if hits:
+            print("\n--- 物理内存命中 ---")
+        for hit in hits:
+            owner = ''
+            if hit.get('pid') is not None:
+                va = f"，位于 {hit['va']:#x}" if hit.get('va') is not None else ''
+                owner = f"，进程: {hit['process']} (PID: {hit['pid']}){va}"
+            identifier = f" ({hit['identifier']})" if hit['identifier'] is not None else ''
+            print(f"规则: {hit['rule']}{identifier}，物理地址: {hit['address']:#x}{owner}")
+
+        if jsonl_file:
+            with open(jsonl_file, 'w') as f:
+                for hit in hits:
+                    f.write(json.dumps(dict(hit, data=hit['data'].hex())) + '\n')
+            print(f"\n{len(hits)} 个命中已写入: {jsonl_file}")
+
+    except FileNotFoundError as e:
+        print(f"错误: 未找到文件: {e.filename}")
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 3:
+        print("用法: python scan_physical_memory.py [--rules <YARA规则文件>] [--string <文本>] [--hex <十六进制字节>] [--workers <n>]")
+        print("           [--batch-size <字节数>] [--overlap <字节数>] [--vmm] [--no-owners] [--jsonl <输出文件>]")
+        print("           [--cache-dir <目录>] -device <内存源>")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python scan_physical_memory.py --rules suspicious.yara -device memory.raw")
+        print("示例: python scan_physical_memory.py --string mimikatz --hex 4d5a90000300 --jsonl hits.jsonl -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    rules_file = None
+    text_patterns = []
+    hex_patterns = []
+    worker_count = DEFAULT_WORKERS
+    batch = DEFAULT_BATCH_SIZE
+    overlap_size = DEFAULT_OVERLAP
+    read_through_vmm = False
+    find_owners = True
+    jsonl_output = None
+    rules_cache_dir = DEFAULT_CACHE_DIR
+
+    # 解析参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--rules' and i + 1 < len(sys.argv):
+            rules_file = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--string' and i + 1 < len(sys.argv):
+            text_patterns.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--hex' and i + 1 < len(sys.argv):
+            hex_patterns.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--workers' and i + 1 < len(sys.argv):
+            worker_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--batch-size' and i + 1 < len(sys.argv):
+            batch = int(sys.argv[i + 1], 0)
+            i += 2
+        elif sys.argv[i] == '--overlap' and i + 1 < len(sys.argv):
+            overlap_size = int(sys.argv[i + 1], 0)
+            i += 2
+        elif sys.argv[i] == '--vmm':
+            read_through_vmm = True
+            i += 1
+        elif sys.argv[i] == '--no-owners':
+            find_owners = False
+            i += 1
+        elif sys.argv[i] == '--jsonl' and i + 1 < len(sys.argv):
+            jsonl_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            rules_cache_dir = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        scan_physical_memory(vmm_arguments, rules_file, text_patterns, hex_patterns, worker_count, batch, overlap_size,
+                             read_through_vmm, find_owners, jsonl_output, rules_cache_dir)
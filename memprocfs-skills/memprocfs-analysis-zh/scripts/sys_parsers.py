@@ -0,0 +1,230 @@
+'''
+用于 MemProcFS 在 /sys/ 下提供的文本表的流式解析器。
+
+netstat、users、services 和 drivers 文件从 VFS 流式读取 (参见 vfs_stream.py)，
+并逐行解析为类型化记录。记录使用 __slots__，可以汇总为列式形式 (每个字段一个列表)
+或转换为供结果写入器使用的 dict (参见 result_writers.py)，因此大型表会被完整捕获，
+而无需保留原始文本。
+
+供 system_classification.py 使用；也可被自定义脚本导入。
+'''
+
+import re
+from bisect import bisect_right
+from vfs_stream import DEFAULT_BUFFER_SIZE, iter_lines
+
+_WORD = re.compile(r'\S+')
+
+
+def _int(value):
+    '''
+    将十进制或带 0x 前缀的十六进制字符串转换为 int，失败时返回 None。
+    '''
+    try:
+        return int(value, 0) if value.lower().startswith('0x') else int(value)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _hex(value):
+    '''
+    将十六进制字符串 (例如 '#' 列中的行号) 转换为 int，失败时返回 None。
+    '''
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def _endpoint(value):
+    '''
+    将 'address:port' 字符串拆分为 (address, port) 元组。
+    '''
+    if not value:
+        return None, None
+    address, sep, port = value.rpartition(':')
+    if not sep:
+        return value, None
+    return address.strip('[]'), _int(port)
+
+
+class Record:
+    '''
+    已解析表行的基类。子类在 __slots__ 中列出其字段，
+    并在 COLUMNS 中将表的列标题映射到这些字段。
+    '''
+    __slots__ = ()
+    COLUMNS = {}
+    INT_FIELDS = ()
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        for header, value in row.items():
+            field = self.COLUMNS.get(header.lower())
+            if field == 'index':
+                self.index = _hex(value)
+            elif field:
+                setattr(self, field, _int(value) if field in self.INT_FIELDS else value)
+
+    @classmethod
+    def titles(cls):
+        '''
+        返回表的已知列标题，最长的排在前面。
+        '''
+        return sorted(cls.COLUMNS, key=lambda title: -title.count(' '))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class NetConnection(Record):
+    '''
+    /sys/net/netstat.txt 的一行。
+    '''
+    __slots__ = ('index', 'pid', 'protocol', 'state', 'src_address', 'src_port',
+                 'dst_address', 'dst_port', 'process', 'time', 'object_address', 'path')
+    COLUMNS = {'#': 'index', 'pid': 'pid', 'proto': 'protocol', 'state': 'state', 'src': 'src_address',
+               'dst': 'dst_address', 'process': 'process', 'time': 'time',
+               'object address': 'object_address', 'process path': 'path'}
+    INT_FIELDS = ('pid',)
+
+    def __init__(self, row):
+        Record.__init__(self, row)
+        self.src_address, self.src_port = _endpoint(self.src_address)
+        self.dst_address, self.dst_port = _endpoint(self.dst_address)
+
+
+class UserAccount(Record):
+    '''
+    /sys/users/users.txt 的一行。
+    '''
+    __slots__ = ('index', 'name', 'sid')
+    COLUMNS = {'#': 'index', 'username': 'name', 'user': 'name', 'sid': 'sid'}
+
+
+class Service(Record):
+    '''
+    /sys/services/services.txt 的一行。
+    '''
+    __slots__ = ('index', 'pid', 'start_type', 'state', 'type', 'object_address', 'name', 'user',
+                 'image_path', 'command_line')
+    COLUMNS = {'#': 'index', 'pid': 'pid', 'start type': 'start_type', 'state': 'state', 'type': 'type',
+               'obj address': 'object_address', 'object address': 'object_address',
+               'name / display name': 'name', 'name': 'name', 'user': 'user', 'image path': 'image_path',
+               'object name / command line': 'command_line', 'command line': 'command_line'}
+    INT_FIELDS = ('pid',)
+
+
+class Driver(Record):
+    '''
+    /sys/drivers/drivers.txt 的一行。
+    '''
+    __slots__ = ('index', 'object_address', 'name', 'size', 'start', 'end', 'device', 'path')
+    COLUMNS = {'#': 'index', 'object address': 'object_address', 'driver': 'name', 'name': 'name',
+               'size': 'size', 'start': 'start', 'end': 'end', 'device name': 'device', 'device': 'device',
+               'path': 'path'}
+    INT_FIELDS = ('size',)
+
+
+# 已解析的表: 名称 -> (VFS 路径, 记录类)。
+TABLES = {
+    'network_connections': ('/sys/net/netstat.txt', NetConnection),
+    'users': ('/sys/users/users.txt', UserAccount),
+    'services': ('/sys/services/services.txt', Service),
+    'drivers': ('/sys/drivers/drivers.txt', Driver),
+}
+
+
+def _header_columns(header, titles):
+    '''
+    将表头拆分为 (offset, title) 列。构成已知标题 (例如 'object address') 的单词
+    保持在一起，其他每个单词各自成为一列。
+    '''
+    words = [(m.start(), m.group()) for m in _WORD.finditer(header)]
+    columns = []
+    i = 0
+    while i < len(words):
+        length = 1
+        for title in titles:
+            count = title.count(' ') + 1
+            if ' '.join(word for _, word in words[i:i + count]).lower() == title:
+                length = count
+                break
+        columns.append((words[i][0], ' '.join(word for _, word in words[i:i + length])))
+        i += length
+    return columns
+
+
+def iter_table_rows(lines, titles=()):
+    '''
+    将 MemProcFS 文本表解析为以列标题为键的字典。
+
+    表头是第一行短横线上方的那一行。每列拥有从其标题偏移到下一个标题之间的文本，
+    行中的每个单词归入与其重叠最多的列，因此右对齐的数字、空单元格
+    和包含空格的值都会落入正确的列。
+
+    :param lines: 文本行的可迭代对象。
+    :param titles: 小写的已知列标题，最长的排在前面。
+    '''
+    columns = None
+    previous = None
+    for line in lines:
+        if columns is None:
+            if previous is not None and line.strip() and set(line.strip()) == {'-'}:
+                columns = _header_columns(previous, titles)
+                starts = [0] + [start for start, _ in columns[1:]]
+            previous = line
+            continue
+        if not line.strip():
+            continue
+        values = [[] for _ in columns]
+        for m in _WORD.finditer(line):
+            start, end = m.span()
+            n = bisect_right(starts, start) - 1
+            # 跨越列边界的单词如果与下一列重叠更多，则将其右移
+            while n + 1 < len(starts) and end - starts[n + 1] > starts[n + 1] - max(start, starts[n]):
+                n += 1
+            values[n].append(m.group())
+        yield {title: ' '.join(words) or None for (_, title), words in zip(columns, values)}
+
+
+def iter_records(vmm, table, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    生成 TABLES 中某个表的记录。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param table: TABLES 的键，例如 'network_connections'。
+    :param buffer_size: 单次从 VFS 读取的字节数。
+    '''
+    path, record_class = TABLES[table]
+    for row in iter_table_rows(iter_lines(vmm, path, buffer_size), record_class.titles()):
+        yield record_class(row)
+
+
+def to_columns(records, record_class):
+    '''
+    将记录汇总为列式形式。
+
+    :param records: 记录的可迭代对象。
+    :param record_class: 记录类，决定字段顺序。
+    :return: 包含 'count' 和 'columns' (字段名 -> 值列表) 的字典。
+    '''
+    columns = {field: [] for field in record_class.__slots__}
+    count = 0
+    for record in records:
+        for field, values in columns.items():
+            values.append(getattr(record, field))
+        count += 1
+    return {'count': count, 'columns': columns}
+
+
+def iter_column_rows(table):
+    '''
+    以字典形式生成列式表的各行。
+
+    :param table: to_columns() 返回的字典。
+    '''
+    fields = list(table['columns'])
+    for values in zip(*table['columns'].values()):
+        yield dict(zip(fields, values))
@@ -1,98 +1,403 @@
 '''
-此脚本通过收集关于内存镜像的关键信息来执行初始系统分类，
-包括系统信息、运行进程、网络连接和用户帐户。
+此脚本通过收集内存映像的关键信息来执行初始系统分类，
+包括系统信息、运行进程、网络连接、用户帐户、服务、驱动程序和 FindEvil 结果。
 
-用法: python system_classification.py -device <内存源> [--output <报告文件>]
+每个收集器都是一个独立的阶段。各阶段在工作线程池上针对同一个 MemProcFS 实例并发运行，
+每个阶段有自己的超时，报告会记录每个阶段的耗时。更多收集器可以通过
+register_collector() 加入运行，既可以写在本文件中，也可以写在通过 --plugin 加载的插件模块中。
+
+网络连接、用户、服务和驱动程序会被解析为类型化记录 (参见 sys_parsers.py)，
+并以列式形式存储：每个字段一个值列表。使用 --jsonl 时，每个解析出的行还会写为一行 JSON；
+使用 --export 时，每个表写入 '<目录>/<表>.<扩展名>'，默认为 CSV，也可通过
+--export-format 写为 JSONL、Arrow 或文本表格 (参见 result_writers.py)。
+
+进程以惰性方式枚举 (参见 lazy_processes.py)：预先只列出 PID，因此在 MemProcFS
+初始化后、任何收集器运行之前，就会立即打印进程数量和最前面的进程。
+
+进程列表还会被构建为父子树 (参见 process_tree.py)；报告列出树的根、
+每个进程的子进程、孤立进程以及父进程异常的系统进程。
+
+收集器结果按映像缓存 (参见 artifact_cache.py)。当请求的所有收集器都已缓存时，
+报告的生成完全无需初始化 MemProcFS。
+
+用法: python system_classification.py -device <内存源> [--output <报告文件>] [--jsonl <行文件>]
+           [--export <目录>] [--export-format <table|jsonl|csv|arrow>]
+           [--collectors <名称,...>] [--workers <n>] [--timeout <秒数>] [--plugin <模块>]
+           [--no-cache] [--cache-dir <目录>]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
 '''
 
-import memprocfs
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from sys_parsers import TABLES, iter_records, to_columns, iter_column_rows
+from result_writers import EXTENSIONS, FORMATS, JsonlWriter, open_writer
+from process_tree import ProcessGraph
+from lazy_processes import process_table
+from vfs_stream import read_text
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+import os
 import sys
 import json
+import time
+import queue
+import importlib
+import threading
 from datetime import datetime
 
-def system_classification(vmm_args, output_file=None):
+# 同时运行的阶段的默认数量。
+DEFAULT_WORKERS = 4
+
+# 阶段被放弃之前允许运行的默认秒数。
+DEFAULT_STAGE_TIMEOUT = 120
+
+# 首屏和摘要中显示的进程数量。
+TOP_PROCESSES = 10
+
+# 按名称登记的收集器，保持注册顺序。
+COLLECTORS = {}
+
+
+class Collector:
     '''
-    执行全面的系统分类。
+    已注册的收集器阶段。
+    '''
+    __slots__ = ('name', 'func', 'title', 'timeout', 'default', 'version')
 
-    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
-    :param output_file: 可选的路径以将分类报告保存为 JSON。
+    def __init__(self, name, func, title, timeout, default, version):
+        self.name = name
+        self.func = func
+        self.title = title
+        self.timeout = timeout
+        self.default = default
+        self.version = version
+
+
+def register_collector(name, title=None, timeout=DEFAULT_STAGE_TIMEOUT, default=None, version=1):
+    '''
+    将函数注册为收集器阶段的装饰器。该函数以 Vmm 为参数调用，
+    其返回值以收集器名称为键存入报告。
+
+    :param name: 收集器名称，同时用作报告中的键。
+    :param title: 可选的描述，在阶段运行时打印。
+    :param timeout: 阶段允许运行的秒数。
+    :param default: 阶段失败或超时时报告中使用的值。
+    :param version: 收集器输出的版本；提升版本号会使已缓存的结果失效。
+    '''
+    def decorator(func):
+        COLLECTORS[name] = Collector(name, func, title or name, timeout, default, version)
+        return func
+    return decorator
+
+
+@register_collector('system_info', '系统信息', default={})
+def collect_system_info(vmm):
+    return {'raw': read_text(vmm, '/sys/sysinfo/sysinfo.txt')}
+
+
+@register_collector('processes', '运行进程', default=[])
+def collect_processes(vmm):
+    return process_table(vmm).rows(('pid', 'name', 'path', 'ppid'))
+
+
+def print_first_screen(vmm):
     '''
+    打印进程数量和 PID 最小的进程。只枚举 PID，并只读取所显示进程的名称和父进程；
+    进程收集器会重用这些值。
+    '''
+    table = process_table(vmm)
+    print(f"\n运行进程: {len(table)}")
+    print("顶部进程 (按 PID):")
+    for process in table.first(TOP_PROCESSES):
+        print(f"  - {process.name} (PID: {process.pid}, PPID: {process.ppid})")
+
+
+def collect_table(vmm, table):
+    '''
+    将 sys_parsers.TABLES 中的一个表解析为列式形式。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param table: sys_parsers.TABLES 的键。
+    '''
+    return to_columns(iter_records(vmm, table), TABLES[table][1])
+
+
+@register_collector('network_connections', '网络连接', default={})
+def collect_network_connections(vmm):
+    return collect_table(vmm, 'network_connections')
+
+
+@register_collector('users', '用户帐户', default={})
+def collect_users(vmm):
+    return collect_table(vmm, 'users')
+
+
+@register_collector('services', '服务', default={})
+def collect_services(vmm):
+    return collect_table(vmm, 'services')
+
+
+@register_collector('drivers', '内核驱动程序', default={})
+def collect_drivers(vmm):
+    return collect_table(vmm, 'drivers')
+
+
+@register_collector('findevil', 'FindEvil 结果', default={})
+def collect_findevil(vmm):
+    return {'raw': read_text(vmm, '/forensic/findevil/summary.txt')}
+
+
+class _Stage:
+    '''
+    流水线运行期间单个收集器的状态。
+    '''
+    __slots__ = ('collector', 'started', 'finished', 'result', 'error', 'abandoned', 'lock')
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.lock = threading.Lock()
+
+
+def _run_stage(stage, vmm, slots, done):
+    '''
+    在有空闲工作槽位时于守护线程上运行一个收集器，
+    因此挂起的阶段永远不会阻止解释器退出。
+    '''
+    slots.acquire()
     try:
-        vmm = memprocfs.Vmm(vmm_args)
-        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
-
-        classification_report = {
-            'timestamp': datetime.now().isoformat(),
-            'system_info': {},
-            'processes': [],
-            'network_connections': [],
-            'users': []
-        }
-
-        # 1. 系统信息
-        print("\n[*] 正在收集系统信息...")
+        stage.started = time.perf_counter()
         try:
-            sysinfo_path = '/sys/sysinfo'
-            sysinfo_data = vmm.vfs.readfile(sysinfo_path)
-            classification_report['system_info'] = {
-                'raw': sysinfo_data.decode('utf-8', errors='ignore')
-            }
-            print(f"    从 {sysinfo_path} 收集的系统信息")
+            stage.result = stage.collector.func(vmm)
         except Exception as e:
-            print(f"    警告: 无法收集系统信息: {e}")
+            stage.error = e
+        stage.finished = time.perf_counter()
+    finally:
+        with stage.lock:
+            if not stage.abandoned:
+                slots.release()
+        done.put(stage)
 
-        # 2. 运行进程
-        print("\n[*] 正在收集运行进程...")
-        try:
-            for process in vmm.process_all():
-                process_info = {
-                    'pid': process.pid,
-                    'name': process.name,
-                    'path': process.path,
-                    'ppid': process.pid_parent
-                }
-                classification_report['processes'].append(process_info)
-            print(f"    找到 {len(classification_report['processes'])} 个运行进程")
-        except Exception as e:
-            print(f"    警告: 无法收集进程列表: {e}")
 
-        # 3. 网络连接
-        print("\n[*] 正在收集网络连接...")
+def run_collectors(vmm, names=None, workers=DEFAULT_WORKERS, timeout=None):
+    '''
+    并发运行收集器，并等待每个收集器完成或超过其超时。
+    超时的阶段会被放弃：它在后台继续运行，但其工作槽位会交给下一个阶段。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param names: 可选的收集器名称列表；默认为所有已注册的收集器。
+    :param workers: 同时运行的阶段数。
+    :param timeout: 可选的超时秒数，覆盖各收集器自己的超时。
+    :return: (results, stages) 元组。results 将收集器名称映射到其值，
+             stages 将其映射到 {'status', 'seconds'}，失败时还包含 'error'。
+    '''
+    collectors = [COLLECTORS[name] for name in (names or COLLECTORS)]
+    slots = threading.Semaphore(max(1, workers))
+    done = queue.Queue()
+    pending = []
+    for collector in collectors:
+        stage = _Stage(collector)
+        threading.Thread(target=_run_stage, args=(stage, vmm, slots, done), daemon=True).start()
+        pending.append(stage)
+
+    results = {}
+    stages = {}
+    while pending:
         try:
-            net_path = '/sys/net'
-            net_data = vmm.vfs.readfile(net_path)
-            classification_report['network_connections'] = {
-                'raw': net_data.decode('utf-8', errors='ignore')[:1000]  # 前 1000 个字符
-            }
-            print(f"    从 {net_path} 收集的网络信息")
-        except Exception as e:
-            print(f"    警告: 无法收集网络信息: {e}")
+            finished = done.get(timeout=0.1)
+        except queue.Empty:
+            finished = None
+        if finished in pending:
+            pending.remove(finished)
+            name = finished.collector.name
+            seconds = round(finished.finished - finished.started, 3)
+            if finished.error is None:
+                results[name] = finished.result
+                stages[name] = {'status': 'ok', 'seconds': seconds}
+                print(f"    [+] 已在 {seconds:.2f} 秒内收集{finished.collector.title}")
+            else:
+                results[name] = finished.collector.default
+                stages[name] = {'status': 'error', 'seconds': seconds, 'error': str(finished.error)}
+                print(f"    警告: 无法收集{finished.collector.title}: {finished.error}")
+
+        now = time.perf_counter()
+        for stage in list(pending):
+            limit = timeout if timeout is not None else stage.collector.timeout
+            with stage.lock:
+                if stage.finished is not None or stage.started is None or now - stage.started <= limit:
+                    continue
+                stage.abandoned = True
+            slots.release()
+            pending.remove(stage)
+            name = stage.collector.name
+            results[name] = stage.collector.default
+            stages[name] = {'status': 'timeout', 'seconds': round(now - stage.started, 3),
+                            'error': f"超过 {limit} 秒超时"}
+            print(f"    警告: {limit} 秒后放弃收集{stage.collector.title}")
+
+    ordered = [collector.name for collector in collectors]
+    return ({name: results[name] for name in ordered}, {name: stages[name] for name in ordered})
+
+
+def run_cached_collectors(names, get_vmm, workers=DEFAULT_WORKERS, timeout=None, cache=None):
+    '''
+    运行收集器，并直接取用工件缓存中已有的该映像的结果。只有当某个收集器
+    未被缓存时才会请求 Vmm。
+
+    :param names: 收集器名称。
+    :param get_vmm: 返回已初始化的 memprocfs.Vmm 实例的函数。
+    :param workers: 同时运行的阶段数。
+    :param timeout: 可选的超时秒数，应用于每个收集器。
+    :param cache: 可选的该映像的 ArtifactCache；成功的结果会存入其中。
+    :return: 按 names 顺序排列的 (results, stages) 元组，参见 run_collectors()。
+    '''
+    # 取出缓存中已有的该映像的结果
+    results = {}
+    stages = {}
+    if cache:
+        for name in names:
+            value = cache.get(name, COLLECTORS[name].version)
+            if value is not None:
+                results[name] = value
+                stages[name] = {'status': 'cached', 'seconds': 0.0}
+        if results:
+            print(f"[*] 已从工件缓存加载 {len(results)} 个收集器: {', '.join(results)}")
+
+    missing = [name for name in names if name not in results]
+    if missing:
+        vmm = get_vmm()
+        if 'processes' in missing:
+            print_first_screen(vmm)
+        print(f"\n[*] Running {len(missing)} collectors with {workers} workers: {', '.join(missing)}")
+        collected, collected_stages = run_collectors(vmm, missing, workers, timeout)
+        results.update(collected)
+        stages.update(collected_stages)
+        if cache:
+            for name in missing:
+                if stages[name]['status'] == 'ok':
+                    cache.put(name, COLLECTORS[name].version, results[name])
+    return {name: results[name] for name in names}, {name: stages[name] for name in names}
+
+
+def build_report(results, stages, duration):
+    '''
+    由收集器结果组装分类报告。
+
+    :param results: 按名称排列的收集器结果。
+    :param stages: 按收集器名称排列的阶段记录，参见 run_collectors()。
+    :param duration: 本次运行的实际耗时 (秒)。
+    '''
+    report = {'timestamp': datetime.now().isoformat()}
+    report.update(results)
+    # 树由进程列表推导而来，因此对于缓存的结果同样可用
+    if results.get('processes'):
+        report['process_tree'] = ProcessGraph(results['processes']).to_dict()
+    report['stages'] = stages
+    report['duration'] = round(duration, 3)
+    return report
+
+
+def export_tables(results, export_dir, export_format='csv'):
+    '''
+    将结果中每个解析出的表写入 '<export_dir>/<表>.<扩展名>'。
+
+    :param results: 收集器结果。
+    :param export_dir: 写入表的目录。
+    :param export_format: 'table'、'jsonl'、'csv' 或 'arrow'。
+    :return: 将已写入的表映射到其行数的字典。
+    '''
+    os.makedirs(export_dir, exist_ok=True)
+    written = {}
+    for table, (_, record_class) in TABLES.items():
+        if not results.get(table):
+            continue
+        types = {field: 'int' for field in record_class.INT_FIELDS}
+        path = os.path.join(export_dir, f"{table}.{EXTENSIONS[export_format]}")
+        with open_writer(export_format, path, record_class.__slots__, types) as out:
+            out.write_many(iter_column_rows(results[table]))
+        written[table] = out.count
+    return written
+
+
+def system_classification(vmm_args, output_file=None, collectors=None, workers=DEFAULT_WORKERS, timeout=None,
+                          jsonl_file=None, use_cache=True, cache_dir=DEFAULT_CACHE_DIR, export_dir=None,
+                          export_format='csv'):
+    '''
+    执行全面的系统分类。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param output_file: 可选的路径以将分类报告保存为 JSON。
+    :param collectors: 可选的要运行的收集器名称列表；默认为所有已注册的收集器。
+    :param workers: 同时运行的收集器数。
+    :param timeout: 可选的超时秒数，应用于每个收集器。
+    :param jsonl_file: 可选的路径，用于将解析出的表行写为 JSON 行。
+    :param use_cache: 复用收集器结果并将其存入工件缓存。
+    :param cache_dir: 保存工件缓存的目录。
+    :param export_dir: 可选的目录，将每个解析出的表写入其中，每个表一个文件。
+    :param export_format: 'table'、'jsonl'、'csv' 或 'arrow'。
+    '''
+    try:
+        unknown = [name for name in (collectors or []) if name not in COLLECTORS]
+        if unknown:
+            print(f"错误: 未知的收集器: {', '.join(unknown)} (可用: {', '.join(COLLECTORS)})")
+            return
+
+        names = collectors or list(COLLECTORS)
+        start_time = time.perf_counter()
+        cache = open_cache(vmm_args, cache_dir) if use_cache else None
+
+        def get_vmm():
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+            return vmm
 
-        # 4. 用户帐户
-        print("\n[*] 正在收集用户帐户...")
         try:
-            users_path = '/sys/users'
-            users_data = vmm.vfs.readfile(users_path)
-            classification_report['users'] = {
-                'raw': users_data.decode('utf-8', errors='ignore')[:1000]
-            }
-            print(f"    从 {users_path} 收集的用户信息")
-        except Exception as e:
-            print(f"    警告: 无法收集用户信息: {e}")
+            results, stages = run_cached_collectors(names, get_vmm, workers, timeout, cache)
+        finally:
+            if cache:
+                cache.close()
+
+        wall_time = time.perf_counter() - start_time
+        classification_report = build_report(results, stages, wall_time)
 
         # 打印摘要
         print("\n" + "="*60)
         print("系统分类摘要")
         print("="*60)
         print(f"时间戳: {classification_report['timestamp']}")
-        print(f"运行进程: {len(classification_report['processes'])}")
-        print(f"网络连接: {'存在' if classification_report['network_connections'] else '不可用'}")
-        print(f"用户帐户: {'存在' if classification_report['users'] else '不可用'}")
+        if 'processes' in results:
+            print(f"运行进程: {len(results['processes'])}")
+        if 'network_connections' in results:
+            print(f"网络连接: {results['network_connections'].get('count', '不可用')}")
+        if 'users' in results:
+            print(f"用户帐户: {results['users'].get('count', '不可用')}")
+        if 'services' in results:
+            print(f"服务: {results['services'].get('count', '不可用')}")
+        if 'drivers' in results:
+            print(f"驱动程序: {results['drivers'].get('count', '不可用')}")
+
+        # 打印各阶段耗时
+        print(f"\n收集器阶段 (共 {wall_time:.2f} 秒):")
+        for name, stage in stages.items():
+            print(f"  - {name}: {stage['status']} ({stage['seconds']:.2f}s)")
+
+        # 打印主要进程，除非它们已在首屏显示
+        if results.get('processes') and stages['processes']['status'] == 'cached':
+            print("\n顶部进程 (按 PID):")
+            for proc in sorted(results['processes'], key=lambda x: x['pid'])[:TOP_PROCESSES]:
+                print(f"  - {proc['name']} (PID: {proc['pid']}, PPID: {proc['ppid']})")
 
-        # 打印顶部进程
-        print("\n顶部进程 (按 PID):")
-        for proc in sorted(classification_report['processes'], key=lambda x: x['pid'])[:10]:
-            print(f"  - {proc['name']} (PID: {proc['pid']}, PPID: {proc['ppid']})")
+        # 打印进程树及其可疑血缘
+        if 'process_tree' in classification_report:
+            tree = classification_report['process_tree']
+            print(f"\n进程树: {len(tree['roots'])} 个根，最大深度 {tree['max_depth']}，"
+                  f"{len(tree['orphans'])} 个进程的父进程不在运行")
+            for finding in tree['suspicious']:
+                print(f"  - {finding['name']} (PID: {finding['pid']}, PPID: {finding['ppid']}): {finding['reason']}")
 
         # 如果请求，保存报告
         if output_file:
@@ -100,17 +405,44 @@ def system_classification(vmm_args, output_file=None):
                 json.dump(classification_report, f, indent=2, ensure_ascii=False)
             print(f"\n报告已保存到: {output_file}")
 
+        # 如果请求，写入解析出的表行
+        if jsonl_file:
+            with JsonlWriter(jsonl_file) as out:
+                for table in TABLES:
+                    if results.get(table):
+                        out.write_many(dict(table=table, **row) for row in iter_column_rows(results[table]))
+            print(f"{out.count} 个表行已写入: {jsonl_file}")
+
+        # 如果请求，导出解析出的表
+        if export_dir:
+            written = export_tables(results, export_dir, export_format)
+            print(f"{len(written)} 个表的 {sum(written.values())} 行已导出到: {export_dir}")
+
     except Exception as e:
         print(f"发生错误: {e}")
 
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 2:
-        print("用法: python system_classification.py -device <内存源> [--output <报告文件>]")
+        print("用法: python system_classification.py -device <内存源> [--output <报告文件>] [--jsonl <行文件>]")
+        print("           [--export <目录>] [--export-format <table|jsonl|csv|arrow>]")
+        print("           [--collectors <名称,...>] [--workers <n>] [--timeout <秒数>] [--plugin <模块>]")
+        print("           [--no-cache] [--cache-dir <目录>]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
         print("示例: python system_classification.py -device memory.dmp --output classification.json")
+        print("示例: python system_classification.py -device memory.dmp --export tables --export-format arrow")
         sys.exit(1)
 
     vmm_arguments = []
     output_file = None
+    jsonl_output = None
+    export_directory = None
+    export_format = 'csv'
+    collector_names = None
+    worker_count = DEFAULT_WORKERS
+    stage_timeout = None
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
 
     # 解析参数
     i = 1
@@ -118,6 +450,35 @@ if __name__ == "__main__":
         if sys.argv[i] == '--output' and i + 1 < len(sys.argv):
             output_file = sys.argv[i + 1]
             i += 2
+        elif sys.argv[i] == '--jsonl' and i + 1 < len(sys.argv):
+            jsonl_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--export' and i + 1 < len(sys.argv):
+            export_directory = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--export-format' and i + 1 < len(sys.argv):
+            export_format = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--collectors' and i + 1 < len(sys.argv):
+            collector_names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--workers' and i + 1 < len(sys.argv):
+            worker_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--timeout' and i + 1 < len(sys.argv):
+            stage_timeout = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--plugin' and i + 1 < len(sys.argv):
+            # 插件模块在导入时调用 register_collector()
+            sys.modules.setdefault('system_classification', sys.modules[__name__])
+            importlib.import_module(sys.argv[i + 1])
+            i += 2
         else:
             vmm_arguments.append(sys.argv[i])
             i += 1
@@ -126,4 +487,10 @@ if __name__ == "__main__":
         print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
         sys.exit(1)
 
-    system_classification(vmm_arguments, output_file)
+    if export_format not in FORMATS:
+        print(f"错误: 未知的导出格式 '{export_format}' (可用: {', '.join(FORMATS)})。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        system_classification(vmm_arguments, output_file, collector_names, worker_count, stage_timeout, jsonl_output,
+                              cache_enabled, cache_directory, export_directory, export_format)
@@ -0,0 +1,444 @@
+'''
+此脚本为 MemProcFS 取证时间线建立一次索引，之后无需重新扫描 CSV
+即可回答时间范围查询，并可按事件类型和 PID 过滤。
+
+建立索引时通过固定缓冲区流式读取 /forensic/timeline/timeline.csv (参见
+vfs_stream.py)，将其复制到 '<timeline_dir>/timeline.csv'，并将紧凑的索引写入
+'<timeline_dir>/timeline.idx'：按升序排序的事件时间戳及每个事件所在行的字节偏移，
+以及按该顺序排列的每个类型和每个 PID 的位置列表。查询时对索引进行内存映射，
+用二分查找确定时间范围，只遍历匹配的位置并直接定位到对应的行，
+因此建立索引后不再需要 MemProcFS。
+
+用法: python timeline_query.py --build <时间线目录> [--csv <时间线CSV>] [vmm_args...]
+       python timeline_query.py <时间线目录> [--from <时间>] [--to <时间>] [--type <类型,...>] [--pid <PID,...>]
+           [--limit <n>] [--count] [--output <文件>]
+
+时间格式为 'YYYY-MM-DD[ HH:MM[:SS]]' (UTC) 或 Unix 时间戳。
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from vfs_stream import DEFAULT_BUFFER_SIZE, open_vfs
+import os
+import sys
+import json
+import mmap
+import time
+import heapq
+import calendar
+from array import array
+from bisect import bisect_left, bisect_right
+
+TIMELINE_PATH = '/forensic/timeline/timeline.csv'
+CSV_NAME = 'timeline.csv'
+INDEX_NAME = 'timeline.idx'
+
+INDEX_MAGIC = b'MEMPROCFS-TIMELINE-INDEX\n'
+INDEX_VERSION = 1
+
+# 无法解析时间的事件所用的时间戳；它们排在所有其他事件之前。
+UNKNOWN_TIME = -1
+
+
+def parse_time(value):
+    '''
+    将 'YYYY-MM-DD HH:MM:SS' 格式的时间线时间 (UTC) 转换为 Unix 时间戳，无法解析时返回 None。
+    缺失的时分秒字段按零计算。
+    '''
+    try:
+        return calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13] or 0),
+                                int(value[14:16] or 0), int(value[17:19] or 0), 0, 0, 0))
+    except ValueError:
+        return None
+
+
+def parse_time_argument(value):
+    '''
+    将命令行时间 (Unix 时间戳或 'YYYY-MM-DD[ HH:MM[:SS]]') 转换为 Unix 时间戳。
+    '''
+    if value.isdigit():
+        return int(value)
+    timestamp = parse_time(value.replace('T', ' '))
+    if timestamp is None:
+        raise ValueError(f"无效的时间 '{value}'")
+    return timestamp
+
+
+def format_time(timestamp):
+    if timestamp == UNKNOWN_TIME:
+        return 'unknown'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
+
+
+def _align(value):
+    return value + (-value % 8)
+
+
+def _iter_offsets(lines, copy=None):
+    '''
+    产生二进制行迭代器的 (偏移, 行) 对，并可选地将每一行复制到文件。
+    '''
+    offset = 0
+    for line in lines:
+        if copy is not None:
+            copy.write(line)
+        yield offset, line
+        offset += len(line)
+
+
+def build_index(lines, index_file, csv_file):
+    '''
+    为时间线 CSV 建立索引并写入索引文件。
+
+    :param lines: (偏移, 行) 对的可迭代对象，参见 _iter_offsets()。
+    :param index_file: 要写入的索引文件路径。
+    :param csv_file: 存储在索引中的 CSV 路径，相对于索引目录或为绝对路径。
+    :return: 索引元数据。
+    '''
+    times = array('q')
+    offsets = array('Q')
+    type_ids = array('H')
+    pids = array('I')
+    type_names = []
+    type_lookup = {}
+    header = None
+    columns = (0, 1, 3)
+
+    for offset, line in lines:
+        if header is None and line.startswith(b'Time'):
+            header = line.decode('utf-8', errors='ignore').rstrip('\r\n')
+            titles = [title.strip().lower() for title in header.split(',')]
+            if all(title in titles for title in ('time', 'type', 'pid')):
+                columns = (titles.index('time'), titles.index('type'), titles.index('pid'))
+            continue
+        fields = line.split(b',', max(columns) + 1)
+        if len(fields) <= max(columns):
+            continue
+        timestamp = parse_time(fields[columns[0]].decode('ascii', errors='ignore'))
+        event_type = fields[columns[1]].decode('utf-8', errors='ignore').strip()
+        type_id = type_lookup.get(event_type)
+        if type_id is None:
+            type_id = type_lookup[event_type] = len(type_names)
+            type_names.append(event_type)
+        pid = fields[columns[2]].strip()
+        times.append(UNKNOWN_TIME if timestamp is None else timestamp)
+        offsets.append(offset)
+        type_ids.append(type_id)
+        pids.append(int(pid) if pid.isdigit() else 0)
+
+    # 按时间对事件排序；下面的位置均指此顺序
+    order = sorted(range(len(times)), key=times.__getitem__)
+    arrays = {'times': array('q', (times[row] for row in order)),
+              'offsets': array('Q', (offsets[row] for row in order))}
+    by_type = [array('I') for _ in type_names]
+    by_pid = {}
+    for position, row in enumerate(order):
+        by_type[type_ids[row]].append(position)
+        positions = by_pid.get(pids[row])
+        if positions is None:
+            positions = by_pid[pids[row]] = array('I')
+        positions.append(position)
+    for type_id, positions in enumerate(by_type):
+        arrays[f"type:{type_names[type_id]}"] = positions
+    for pid, positions in by_pid.items():
+        arrays[f"pid:{pid}"] = positions
+
+    layout = {}
+    data_size = 0
+    for name, values in arrays.items():
+        layout[name] = [values.typecode, data_size, len(values)]
+        data_size = _align(data_size + len(values) * values.itemsize)
+    meta = {'version': INDEX_VERSION, 'byteorder': sys.byteorder, 'csv': csv_file, 'header': header,
+            'events': len(times), 'types': type_names, 'pids': sorted(by_pid),
+            'first': arrays['times'][0] if times else None, 'last': arrays['times'][-1] if times else None,
+            'arrays': layout}
+
+    # 先写入临时文件，因此失败的构建不会留下被截断的索引
+    temp_file = index_file + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(json.dumps(meta).encode('utf-8') + b'\n')
+        data_start = _align(f.tell())
+        for name, values in arrays.items():
+            f.seek(data_start + layout[name][1])
+            values.tofile(f)
+        f.truncate(data_start + data_size)
+    os.replace(temp_file, index_file)
+    return meta
+
+
+class TimelineIndex:
+    '''
+    内存映射的时间线索引及其 CSV。请在 with 语句中使用。
+    '''
+
+    def __init__(self, timeline_dir):
+        '''
+        :param timeline_dir: 包含 timeline.idx 的目录。
+        '''
+        self.file = open(os.path.join(timeline_dir, INDEX_NAME), 'rb')
+        self._views = []
+        try:
+            if self.file.readline() != INDEX_MAGIC:
+                raise ValueError(f"{timeline_dir} 不包含时间线索引")
+            self.meta = json.loads(self.file.readline().decode('utf-8'))
+            if self.meta['version'] != INDEX_VERSION or self.meta['byteorder'] != sys.byteorder:
+                raise ValueError("时间线索引由其他版本或平台构建；请重新构建")
+            self.data_start = _align(self.file.tell())
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+        self.csv_file = os.path.join(timeline_dir, self.meta['csv'])
+        self.types = {name.lower(): name for name in self.meta['types']}
+        self.times = self._array('times')
+        self.offsets = self._array('offsets')
+        self._csv = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.times)
+
+    def _array(self, name):
+        '''
+        以内存映射的零拷贝视图返回索引数组；不存在时返回空元组。
+        '''
+        entry = self.meta['arrays'].get(name)
+        if entry is None:
+            return ()
+        typecode, offset, count = entry
+        start = self.data_start + offset
+        view = memoryview(self.map)[start:start + count * array(typecode).itemsize].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def _positions(self, name, low, high):
+        positions = self._array(name)
+        positions = positions[bisect_left(positions, low):bisect_left(positions, high)]
+        if isinstance(positions, memoryview):
+            # 切片同样共享内存映射，必须在关闭映射之前释放
+            self._views.append(positions)
+        return positions
+
+    def positions(self, start=None, end=None, types=None, pids=None):
+        '''
+        按时间顺序产生匹配事件的位置。
+
+        :param start: 可选的 Unix 时间戳；该时间及之后的事件。
+        :param end: 可选的 Unix 时间戳；该时间及之前的事件。
+        :param types: 可选的事件类型列表 (不区分大小写)。
+        :param pids: 可选的 PID 列表。
+        '''
+        low = 0 if start is None else bisect_left(self.times, start)
+        high = len(self.times) if end is None else bisect_right(self.times, end)
+        selected = None
+        for names in ([f"type:{self.types.get(t.lower(), t)}" for t in types] if types else None,
+                      [f"pid:{pid}" for pid in pids] if pids else None):
+            if names is None:
+                continue
+            matching = heapq.merge(*(self._positions(name, low, high) for name in names))
+            selected = matching if selected is None else _intersect(selected, matching)
+        return iter(range(low, high)) if selected is None else selected
+
+    def read_event(self, position):
+        '''
+        返回某个位置上事件的 CSV 行，不含行尾。
+        '''
+        if self._csv is None:
+            self._csv = open(self.csv_file, 'rb')
+        self._csv.seek(self.offsets[position])
+        return self._csv.readline().rstrip(b'\r\n').decode('utf-8', errors='ignore')
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.map.close()
+        self.file.close()
+        if self._csv:
+            self._csv.close()
+
+
+def _intersect(a, b):
+    '''
+    产生同时出现在两个升序可迭代对象中的值。
+    '''
+    b = iter(b)
+    y = next(b, None)
+    for x in a:
+        while y is not None and y < x:
+            y = next(b, None)
+        if y is None:
+            return
+        if y == x:
+            yield x
+
+
+def build_timeline(timeline_dir, vmm_args=None, csv_file=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    从 MemProcFS 或本地时间线 CSV 构建时间线索引。
+
+    :param timeline_dir: 存放索引 (及复制的 CSV) 的目录。
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表；在 csv_file 为 None 时使用。
+    :param csv_file: 可选的本地时间线 CSV，直接为其建立索引。
+    :param buffer_size: 每次读取的字节数。
+    '''
+    try:
+        start_time = time.perf_counter()
+        os.makedirs(timeline_dir, exist_ok=True)
+        index_file = os.path.join(timeline_dir, INDEX_NAME)
+
+        if csv_file:
+            with open(csv_file, 'rb', buffering=buffer_size) as f:
+                meta = build_index(_iter_offsets(f), index_file, os.path.abspath(csv_file))
+            source = csv_file
+        else:
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+            # 在建立索引的同时复制 CSV，因此 VFS 文件只读取一次
+            with open_vfs(vmm, TIMELINE_PATH, buffer_size) as f, \
+                    open(os.path.join(timeline_dir, CSV_NAME), 'wb') as copy:
+                meta = build_index(_iter_offsets(f, copy), index_file, CSV_NAME)
+            source = TIMELINE_PATH
+
+        elapsed = time.perf_counter() - start_time
+        print(f"已为 {meta['events']} 个事件建立索引 ({len(meta['types'])} 个类型，{len(meta['pids'])} 个 PID)，"
+              f"来源 {source}，耗时 {elapsed:.2f}s")
+        if meta['events']:
+            print(f"时间范围: {format_time(meta['first'])} - {format_time(meta['last'])} UTC")
+        print(f"事件类型: {', '.join(meta['types'])}")
+        print(f"索引已写入 {index_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+def query_timeline(timeline_dir, start=None, end=None, types=None, pids=None, limit=None, count_only=False,
+                   output_file=None):
+    '''
+    打印或写出与查询匹配的时间线事件。
+
+    :param timeline_dir: 包含索引的目录。
+    :param start: 可选的 Unix 时间戳；该时间及之后的事件。
+    :param end: 可选的 Unix 时间戳；该时间及之前的事件。
+    :param types: 可选的事件类型列表。
+    :param pids: 可选的 PID 列表。
+    :param limit: 可选的返回事件数量上限。
+    :param count_only: 只打印匹配事件的数量。
+    :param output_file: 可选的路径，用于将匹配事件写为 CSV。
+    '''
+    try:
+        with TimelineIndex(timeline_dir) as index:
+            positions = index.positions(start, end, types, pids)
+            if count_only:
+                print(f"{sum(1 for _ in positions)} 个事件匹配")
+                return
+
+            out = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+            try:
+                if index.meta['header']:
+                    out.write(index.meta['header'] + '\n')
+                written = 0
+                for position in positions:
+                    if limit is not None and written >= limit:
+                        break
+                    out.write(index.read_event(position) + '\n')
+                    written += 1
+            finally:
+                if output_file:
+                    out.close()
+            if output_file:
+                print(f"{written} 个事件已写入 {output_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("用法: python timeline_query.py --build <时间线目录> [--csv <时间线CSV>] [vmm_args...]")
+        print("       python timeline_query.py <时间线目录> [--from <时间>] [--to <时间>] [--type <类型,...>] [--pid <PID,...>]")
+        print("           [--limit <n>] [--count] [--output <文件>]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python timeline_query.py --build timeline/ -device memory.dmp")
+        print("示例: python timeline_query.py timeline/ --from '2024-01-01 10:00' --to '2024-01-01 11:00' --pid 4242")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    build_dir = None
+    if args[0] == '--build':
+        if len(args) < 2:
+            print("错误: --build 需要一个时间线目录。")
+            sys.exit(1)
+        build_dir = args[1]
+        args = args[2:]
+    else:
+        query_dir = args[0]
+        args = args[1:]
+
+    vmm_arguments = []
+    local_csv = None
+    time_from = None
+    time_to = None
+    event_types = None
+    event_pids = None
+    max_events = None
+    count_events = False
+    output = None
+
+    # 解析参数
+    i = 0
+    while i < len(args):
+        if args[i] == '--csv' and i + 1 < len(args):
+            local_csv = args[i + 1]
+            i += 2
+        elif args[i] == '--from' and i + 1 < len(args):
+            time_from = args[i + 1]
+            i += 2
+        elif args[i] == '--to' and i + 1 < len(args):
+            time_to = args[i + 1]
+            i += 2
+        elif args[i] == '--type' and i + 1 < len(args):
+            event_types = [name.strip() for name in args[i + 1].split(',') if name.strip()]
+            i += 2
+        elif args[i] == '--pid' and i + 1 < len(args):
+            event_pids = [int(pid) for pid in args[i + 1].split(',') if pid.strip()]
+            i += 2
+        elif args[i] == '--limit' and i + 1 < len(args):
+            max_events = int(args[i + 1])
+            i += 2
+        elif args[i] == '--count':
+            count_events = True
+            i += 1
+        elif args[i] == '--output' and i + 1 < len(args):
+            output = args[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
+
+    if build_dir:
+        if not local_csv and not vmm_arguments:
+            print("错误: 除非给出 --csv，否则需要 VMM 参数 (例如 '-device <path_to_dump>')。")
+            sys.exit(1)
+        with profiled(**profile_options):
+            build_timeline(build_dir, vmm_arguments, local_csv)
+    else:
+        if vmm_arguments:
+            print(f"错误: 未知参数: {' '.join(vmm_arguments)}")
+            sys.exit(1)
+        try:
+            time_from = parse_time_argument(time_from) if time_from else None
+            time_to = parse_time_argument(time_to) if time_to else None
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        with profiled(**profile_options):
+            query_timeline(query_dir, time_from, time_to, event_types, event_pids, max_events, count_events, output)
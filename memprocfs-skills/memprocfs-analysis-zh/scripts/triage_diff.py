@@ -0,0 +1,481 @@
+'''
+此脚本为内存映像或实时目标的进程、模块、句柄和网络连接创建快照，并报告两个
+快照之间的变化：新增、移除或发生变化的实体。
+
+快照中每种实体类型对应一个由紧凑的带键记录组成的表，每个表都按键排序:
+
+    processes  (pid, create_time)                    -> name, ppid, path, command_line
+    modules    (pid, name, base)                     -> size, path
+    handles    (pid, handle_value)                   -> type, name
+    network    (pid, protocol, src, src_port, dst, dst_port, occurrence) -> state
+
+因此比较两个快照时，每个表只需一次归并遍历，耗时与其大小成线性关系。快照保存为
+zlib 压缩的 JSON；比较两个映像时，先分别为它们创建快照，再比较这两个快照。
+
+在实时模式下 (-device pmem 或 -device fpga) 会轮询目标。每次刷新 MemProcFS 之后，
+先读取每个进程的廉价指纹：创建时间、模块数以及 handles.txt 的大小。由于 VFS 为
+每个句柄写入一个固定宽度的行，该大小随句柄数增长。只有新进程和指纹发生变化的
+进程会被重新读取；其余进程的记录直接取自上一次轮询。因此，如果路径或命令行发生
+变化而指纹不变，则要到下一次指纹变化时才能发现。
+
+用法: python triage_diff.py --snapshot <快照文件> [--threads <n>] [vmm_args...]
+      python triage_diff.py --diff <旧快照> <新快照> [--json <文件>] [--limit <n>]
+      python triage_diff.py --live <秒数> [--count <n>] [--jsonl <文件>] [--limit <n>]
+          [--threads <n>] [vmm_args...]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import ATTRIBUTES
+from sys_parsers import iter_records
+from vfs_stream import read_text, vfs_file_size
+import memprocfs
+import sys
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = 4
+
+# 每个表打印的变化数；JSON 输出包含全部变化。
+DEFAULT_LIMIT = 20
+
+# 快照文件布局的版本。
+SNAPSHOT_VERSION = 2
+
+# 每个表的记录布局: (键字段, 值字段)。
+TABLES = {
+    'processes': (('pid', 'create_time'), ('name', 'ppid', 'path', 'command_line')),
+    'modules': (('pid', 'name', 'base'), ('size', 'path')),
+    'handles': (('pid', 'handle_value'), ('type', 'name')),
+    'network': (('pid', 'protocol', 'src', 'src_port', 'dst', 'dst_port', 'occurrence'), ('state',)),
+}
+
+# 记录属于某个进程、并随该进程一起重新读取的表。
+PROCESS_TABLES = ('processes', 'modules', 'handles')
+
+# 以十六进制打印的字段。
+HEX_FIELDS = ('base', 'handle_value', 'size')
+
+
+def fingerprint(vmm, pid):
+    '''
+    返回进程的 (创建时间, 模块数, handles.txt 大小) 指纹。它从 VFS 读取，
+    无需打开模块表或句柄表；无法读取的部分为 None。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param pid: 进程 ID。
+    '''
+    try:
+        create_time = read_text(vmm, f'/pid/{pid}/time-create.txt').strip()
+    except Exception:
+        create_time = None
+    try:
+        module_count = len(vmm.vfs.list(f'/pid/{pid}/modules'))
+    except Exception:
+        module_count = None
+    return create_time, module_count, vfs_file_size(vmm, f'/pid/{pid}/handles/handles.txt')
+
+
+def read_process(vmm, pid, create_time):
+    '''
+    读取一个进程的进程、模块和句柄记录。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param pid: 进程 ID。
+    :param create_time: 进程的创建时间，是其键的一部分。
+    :return: 将表名映射到该进程已排序记录的字典。
+    '''
+    process = vmm.process(pid)
+    values = tuple(ATTRIBUTES[field](process) for field in TABLES['processes'][1])
+    return {
+        'processes': [((pid, create_time or ''), values)],
+        'modules': sorted(((pid, module.name.lower(), module.base), (module.image_size, module.fullname))
+                          for module in process.module_all()),
+        'handles': sorted(((pid, handle.handle_value), (handle.type, handle.name))
+                          for handle in process.handle_all()),
+    }
+
+
+def read_network(vmm):
+    '''
+    返回 /sys/net/netstat.txt 的已排序记录。端点相同的连接 (例如绑定到同一
+    端口的多个套接字) 通过键末尾的出现序号区分。
+    '''
+    def port(value):
+        return value if value is not None else -1
+    connections = sorted(((c.pid or 0, c.protocol or '', c.src_address or '', port(c.src_port),
+                           c.dst_address or '', port(c.dst_port)), (c.state or '',))
+                         for c in iter_records(vmm, 'network_connections'))
+    records = []
+    previous = None
+    occurrence = 0
+    for key, value in connections:
+        occurrence = occurrence + 1 if key == previous else 0
+        previous = key
+        records.append((key + (occurrence,), value))
+    return records
+
+
+class Snapshot:
+    '''
+    某一时刻的表。记录按进程与其指纹一起保存，以便之后的轮询可以原样沿用。
+    '''
+
+    def __init__(self, processes, network, taken=None, source=None):
+        '''
+        :param processes: 将 PID 映射到 (fingerprint, records) 元组的字典，参见 read_process()。
+        :param network: 已排序的网络记录。
+        :param taken: 创建快照的时间，以自纪元以来的秒数表示。
+        :param source: 快照的 VMM 参数。
+        '''
+        self.processes = processes
+        self.network = network
+        self.taken = taken if taken is not None else time.time()
+        self.source = source
+
+    def table(self, name):
+        '''
+        返回一个表的已排序记录。进程相关表的键以 PID 开头，因此按 PID 顺序
+        排列的各进程记录本身就已排序。
+        '''
+        if name == 'network':
+            return self.network
+        records = []
+        for pid in sorted(self.processes):
+            records.extend(self.processes[pid][1][name])
+        return records
+
+    def counts(self):
+        return {name: len(self.table(name)) for name in TABLES}
+
+    def describe(self):
+        taken = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.taken))
+        return f"{taken} ({' '.join(self.source or [])})"
+
+    def save(self, output_file):
+        data = {
+            'version': SNAPSHOT_VERSION, 'taken': self.taken, 'source': self.source,
+            'processes': [[pid, fp, {name: records[name] for name in PROCESS_TABLES}]
+                          for pid, (fp, records) in sorted(self.processes.items())],
+            'network': self.network,
+        }
+        with open(output_file, 'wb') as f:
+            f.write(zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')))
+
+    @classmethod
+    def load(cls, input_file):
+        with open(input_file, 'rb') as f:
+            data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{input_file} 不是版本 {SNAPSHOT_VERSION} 的快照")
+
+        def records(rows):
+            return [(tuple(key), tuple(value)) for key, value in rows]
+        processes = {pid: (tuple(fp), {name: records(tables[name]) for name in PROCESS_TABLES})
+                     for pid, fp, tables in data['processes']}
+        return cls(processes, records(data['network']), data['taken'], data['source'])
+
+
+def take_snapshot(vmm, previous=None, threads=DEFAULT_THREADS, source=None):
+    '''
+    为进程、模块、句柄和网络连接创建快照。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param previous: 可选的同一目标的较早 Snapshot；指纹未变的进程的记录取自该快照。
+    :param threads: 读取进程的工作线程数。
+    :param source: VMM 参数，保存在快照中。
+    :return: (snapshot, reread, errors) 元组；reread 是读取的进程数，errors 将 PID
+             映射到错误信息。
+    '''
+    previous_processes = previous.processes if previous else {}
+
+    def read(pid):
+        fp = fingerprint(vmm, pid)
+        old = previous_processes.get(pid)
+        if old and old[0] == fp and any(part is not None for part in fp):
+            return fp, old[1], False
+        return fp, read_process(vmm, pid, fp[0]), True
+
+    processes = {}
+    errors = {}
+    reread = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [(pid, pool.submit(read, pid)) for pid in sorted(vmm.pid_list())]
+        for pid, future in futures:
+            try:
+                fp, records, fresh = future.result()
+            except Exception as e:
+                errors[pid] = str(e)
+                continue
+            processes[pid] = (fp, records)
+            reread += fresh
+    return Snapshot(processes, read_network(vmm), source=source), reread, errors
+
+
+def diff_records(old, new):
+    '''
+    通过一次归并遍历比较两个已排序的记录列表。
+
+    :param old: 较早快照的已排序 (key, value) 记录。
+    :param new: 较新快照的已排序 (key, value) 记录。
+    :return: (change, key, old_value, new_value) 元组的生成器，其中 change 为
+             'added'、'removed' 或 'changed'。
+    '''
+    i = j = 0
+    while i < len(old) and j < len(new):
+        old_key, old_value = old[i]
+        new_key, new_value = new[j]
+        if old_key == new_key:
+            if old_value != new_value:
+                yield 'changed', old_key, old_value, new_value
+            i += 1
+            j += 1
+        elif old_key < new_key:
+            yield 'removed', old_key, old_value, None
+            i += 1
+        else:
+            yield 'added', new_key, None, new_value
+            j += 1
+    for old_key, old_value in old[i:]:
+        yield 'removed', old_key, old_value, None
+    for new_key, new_value in new[j:]:
+        yield 'added', new_key, None, new_value
+
+
+def diff_snapshots(old, new):
+    '''
+    以字典形式返回两个快照之间的变化，将表名映射到
+    (change, key, old_value, new_value) 元组的列表。
+    '''
+    return {name: list(diff_records(old.table(name), new.table(name))) for name in TABLES}
+
+
+def _format(field, value):
+    if field in HEX_FIELDS and isinstance(value, int):
+        return f"{value:#x}"
+    return str(value)
+
+
+def format_change(table, change, key, old_value, new_value):
+    '''
+    将一个变化返回为一行文本：'+' 表示新增，'-' 表示移除，'~' 表示发生变化的
+    实体，后者只列出不同的字段。
+    '''
+    key_fields, value_fields = TABLES[table]
+    text = ', '.join(f"{field}: {_format(field, value)}" for field, value in zip(key_fields, key))
+    if change == 'changed':
+        fields = [f"{field}: {_format(field, a)} -> {_format(field, b)}"
+                  for field, a, b in zip(value_fields, old_value, new_value) if a != b]
+        return f"~ {text}: {'; '.join(fields)}"
+    value = new_value if change == 'added' else old_value
+    fields = ', '.join(f"{field}: {_format(field, v)}" for field, v in zip(value_fields, value))
+    return f"{'+' if change == 'added' else '-'} {text}, {fields}"
+
+
+def change_to_dict(table, change, key, old_value, new_value):
+    '''
+    将一个变化返回为可序列化为 JSON 的字典。
+    '''
+    key_fields, value_fields = TABLES[table]
+    row = {'table': table, 'change': change}
+    row.update(zip(key_fields, key))
+    if old_value is not None:
+        row['old'] = dict(zip(value_fields, old_value))
+    if new_value is not None:
+        row['new'] = dict(zip(value_fields, new_value))
+    return row
+
+
+def print_changes(changes, limit=DEFAULT_LIMIT):
+    '''
+    打印每个表的变化数以及每个表的前 limit 个变化。
+    '''
+    for table, rows in changes.items():
+        counts = {change: 0 for change in ('added', 'removed', 'changed')}
+        for row in rows:
+            counts[row[0]] += 1
+        print(f"--- {table}: 新增 {counts['added']}，移除 {counts['removed']}，变化 {counts['changed']} ---")
+        for row in rows[:limit]:
+            print(f"  {format_change(table, *row)}")
+        if len(rows) > limit:
+            print(f"  ... 以及另外 {len(rows) - limit} 个")
+
+
+def snapshot(vmm_args, output_file, threads=DEFAULT_THREADS):
+    '''
+    为内存映像或实时目标创建快照并保存。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param output_file: 快照文件的路径。
+    :param threads: 读取进程的工作线程数。
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+        start_time = time.perf_counter()
+        result, _, errors = take_snapshot(vmm, threads=threads, source=vmm_args)
+        elapsed = time.perf_counter() - start_time
+        for pid, error in errors.items():
+            print(f"  警告: 无法读取 PID {pid}: {error}")
+        result.save(output_file)
+        counts = ', '.join(f"{count} {name}" for name, count in result.counts().items())
+        print(f"已在 {elapsed:.2f} 秒内创建 {counts} 的快照并写入: {output_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+def diff(old_file, new_file, json_file=None, limit=DEFAULT_LIMIT):
+    '''
+    比较两个已保存的快照。
+
+    :param old_file: 较早快照的路径。
+    :param new_file: 较新快照的路径。
+    :param json_file: 可选的路径，用于将所有变化写入 JSON。
+    :param limit: 每个表打印的变化数。
+    '''
+    try:
+        old, new = Snapshot.load(old_file), Snapshot.load(new_file)
+        print(f"旧: {old.describe()}")
+        print(f"新: {new.describe()}")
+        start_time = time.perf_counter()
+        changes = diff_snapshots(old, new)
+        elapsed = time.perf_counter() - start_time
+        print(f"比较耗时 {elapsed:.3f} 秒\n")
+        print_changes(changes, limit)
+
+        if json_file:
+            with open(json_file, 'w') as f:
+                json.dump({'old': {'taken': old.taken, 'source': old.source},
+                           'new': {'taken': new.taken, 'source': new.source},
+                           'changes': [change_to_dict(table, *row) for table, rows in changes.items()
+                                       for row in rows]}, f, indent=2, ensure_ascii=False)
+            print(f"\n变化已写入: {json_file}")
+
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+
+def live(vmm_args, interval, count=None, jsonl_file=None, limit=DEFAULT_LIMIT, threads=DEFAULT_THREADS):
+    '''
+    轮询实时目标，并打印自上一次轮询以来的变化。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param interval: 两次轮询开始之间的秒数。
+    :param count: 可选的基线之后的轮询次数；默认一直轮询直到被中断。
+    :param jsonl_file: 可选的路径，用于将每次轮询的变化追加为 JSON 行。
+    :param limit: 每个表每次轮询打印的变化数。
+    :param threads: 读取进程的工作线程数。
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+        start_time = time.perf_counter()
+        previous, _, _ = take_snapshot(vmm, threads=threads, source=vmm_args)
+        elapsed = time.perf_counter() - start_time
+        print(f"已在 {elapsed:.2f} 秒内创建 {len(previous.processes)} 个进程的基线")
+
+        polls = 0
+        while count is None or polls < count:
+            time.sleep(max(0.0, interval - (time.perf_counter() - start_time)))
+            start_time = time.perf_counter()
+            vmm.set_config(memprocfs.OPT_REFRESH_ALL, 1)
+            current, reread, errors = take_snapshot(vmm, previous, threads, vmm_args)
+            changes = diff_snapshots(previous, current)
+            elapsed = time.perf_counter() - start_time
+            polls += 1
+            total = sum(len(rows) for rows in changes.values())
+            print(f"\n[{time.strftime('%H:%M:%S')}] 第 {polls} 次轮询: {total} 个变化，在 {elapsed:.2f} 秒内"
+                  f"重新读取了 {len(current.processes)} 个进程中的 {reread} 个")
+            if errors:
+                print(f"  警告: 无法读取 {len(errors)} 个进程")
+            if total:
+                print_changes({table: rows for table, rows in changes.items() if rows}, limit)
+            if jsonl_file and total:
+                with open(jsonl_file, 'a') as f:
+                    for table, rows in changes.items():
+                        for row in rows:
+                            f.write(json.dumps(dict(change_to_dict(table, *row), taken=current.taken),
+                                               ensure_ascii=False) + '\n')
+            previous = current
+
+    except KeyboardInterrupt:
+        print("\n已停止。")
+    except Exception as e:
+        print(f"发生错误: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 3:
+        print("用法: python triage_diff.py --snapshot <快照文件> [--threads <n>] [vmm_args...]")
+        print("      python triage_diff.py --diff <旧快照> <新快照> [--json <文件>] [--limit <n>]")
+        print("      python triage_diff.py --live <秒数> [--count <n>] [--jsonl <文件>] [--limit <n>]")
+        print("          [--threads <n>] [vmm_args...]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
+        print("示例: python triage_diff.py --snapshot before.snapshot -device memory.dmp")
+        print("示例: python triage_diff.py --diff before.snapshot after.snapshot --json changes.json")
+        print("示例: python triage_diff.py --live 30 --jsonl changes.jsonl -device pmem")
+        sys.exit(1)
+
+    vmm_arguments = []
+    snapshot_output = None
+    diff_files = None
+    poll_interval = None
+    poll_count = None
+    json_output = None
+    jsonl_output = None
+    change_limit = DEFAULT_LIMIT
+    thread_count = DEFAULT_THREADS
+
+    # 解析参数
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--snapshot' and i + 1 < len(sys.argv):
+            snapshot_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--diff' and i + 2 < len(sys.argv):
+            diff_files = (sys.argv[i + 1], sys.argv[i + 2])
+            i += 3
+        elif sys.argv[i] == '--live' and i + 1 < len(sys.argv):
+            poll_interval = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--count' and i + 1 < len(sys.argv):
+            poll_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--json' and i + 1 < len(sys.argv):
+            json_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--jsonl' and i + 1 < len(sys.argv):
+            jsonl_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--limit' and i + 1 < len(sys.argv):
+            change_limit = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--threads' and i + 1 < len(sys.argv):
+            thread_count = int(sys.argv[i + 1])
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if diff_files:
+        diff(diff_files[0], diff_files[1], json_output, change_limit)
+        sys.exit(0)
+
+    if snapshot_output is None and poll_interval is None:
+        print("错误: 需要 --snapshot、--diff 或 --live 之一。")
+        sys.exit(1)
+
+    if not vmm_arguments:
+        print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if snapshot_output:
+            snapshot(vmm_arguments, snapshot_output, thread_count)
+        else:
+            live(vmm_arguments, poll_interval, poll_count, jsonl_output, change_limit, thread_count)
@@ -0,0 +1,157 @@
+'''
+以类文件方式访问 MemProcFS 虚拟文件系统。
+
+vmm.vfs.readfile() 将整个文件作为一个 bytes 对象返回，这无法应对
+/forensic/timeline/timeline.csv 或恢复的 NTFS 文件等可能有数 GB 大的文件。
+这里的辅助函数基于偏移/长度读取将 VFS 文件公开为可定位的缓冲流，
+因此内存占用受缓冲区大小限制。
+
+在自定义脚本中的用法:
+
+    from vfs_stream import open_vfs, iter_lines, copy_to
+
+    for line in iter_lines(vmm, '/forensic/timeline/timeline.csv'):
+        ...
+    copy_to(vmm, '/forensic/timeline/timeline.csv', 'timeline.csv')
+'''
+
+import io
+import posixpath
+import shutil
+
+# 读取缓冲区的默认大小 (1 MiB)。
+DEFAULT_BUFFER_SIZE = 0x100000
+
+
+def vfs_file_size(vmm, path):
+    '''
+    根据目录列表返回 VFS 文件的大小；如果未列出则返回 None。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param path: 文件的 VFS 路径。
+    '''
+    directory, name = posixpath.split(path.rstrip('/'))
+    try:
+        entry = vmm.vfs.list(directory or '/').get(name)
+    except Exception:
+        return None
+    return entry['size'] if entry else None
+
+
+class VfsRawFile(io.RawIOBase):
+    '''
+    VFS 文件的无缓冲只读文件对象。每次读取都是在当前偏移处的一次
+    vmm.vfs.read() 调用。
+    '''
+
+    def __init__(self, vmm, path, size=None):
+        io.RawIOBase.__init__(self)
+        self.vmm = vmm
+        self.name = path
+        self.position = 0
+        self._size = size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def size(self):
+        '''
+        返回文件大小；无法确定时抛出 io.UnsupportedOperation。
+        '''
+        if self._size is None:
+            self._size = vfs_file_size(self.vmm, self.name)
+            if self._size is None:
+                raise io.UnsupportedOperation(f"size of {self.name} is unknown")
+        return self._size
+
+    def readall(self):
+        chunks = []
+        while True:
+            data = self.read(DEFAULT_BUFFER_SIZE)
+            if not data:
+                return b''.join(chunks)
+            chunks.append(data)
+
+    def readinto(self, buffer):
+        if self._size is not None and self.position >= self._size:
+            return 0
+        data = self.vmm.vfs.read(self.name, len(buffer), self.position)
+        count = len(data)
+        buffer[:count] = data
+        self.position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size() + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+
+def open_vfs(vmm, path, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    将 VFS 文件打开为可定位的缓冲二进制流。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param path: 文件的 VFS 路径。
+    :param buffer_size: 单次从 VFS 读取的字节数。
+    :return: io.BufferedReader；请在 with 语句中使用。
+    '''
+    return io.BufferedReader(VfsRawFile(vmm, path), buffer_size)
+
+
+def iter_lines(vmm, path, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+    '''
+    生成 VFS 文件的各行，不含行尾符。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param path: 文件的 VFS 路径。
+    :param buffer_size: 单次从 VFS 读取的字节数。
+    :param encoding: 文本编码；为 None 时生成每行的原始字节。
+    '''
+    with open_vfs(vmm, path, buffer_size) as f:
+        for line in f:
+            line = line.rstrip(b'\r\n')
+            yield line.decode(encoding, errors='ignore') if encoding else line
+
+
+def read_text(vmm, path, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+    '''
+    通过缓冲流将较小的 VFS 文件读取为文本。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param path: 文件的 VFS 路径。
+    :param buffer_size: 单次从 VFS 读取的字节数。
+    :param encoding: 文本编码。
+    '''
+    with open_vfs(vmm, path, buffer_size) as f:
+        return f.read().decode(encoding, errors='ignore')
+
+
+def copy_to(vmm, path, output_file, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    将 VFS 文件复制到本地文件，内存中最多只保留一个缓冲区。
+
+    :param vmm: 已初始化的 memprocfs.Vmm 实例。
+    :param path: 文件的 VFS 路径。
+    :param output_file: 要写入的本地路径。
+    :param buffer_size: 单次从 VFS 读取的字节数。
+    :return: 复制的字节数。
+    '''
+    with VfsRawFile(vmm, path) as source, open(output_file, 'wb') as f:
+        shutil.copyfileobj(source, f, buffer_size)
+        return source.tell()
@@ -0,0 +1,342 @@
+'''
+对脚本发出的 memprocfs API 调用进行可选的插桩。
+
+启用性能分析时，open_vmm() (参见 vmm_session.py) 返回包装在代理中的 Vmm，
+这些代理会对进程、内存、映射、搜索、句柄、模块和 VFS API 的每次调用计时。
+对于每个 API 以及每个 VFS 路径，会记录调用次数、失败次数、延迟直方图和读取的字节数。
+运行结束时，它们会写为 JSON 摘要和/或 OpenTelemetry (OTLP/JSON) 格式的跟踪文件，
+同时还可以写出整个运行过程的 cProfile 转储。
+
+各脚本接受相同的三个选项:
+
+    --api-stats <文件>   按 API 和 VFS 路径统计的 JSON 摘要
+    --trace <文件>       每次 API 调用一个 span 的 OTLP/JSON 跟踪
+    --profile <文件>     cProfile 转储 (pstats 格式)，例如用于 snakeviz 或 flameprof
+
+在自定义脚本中使用:
+
+    from vmm_profile import profiled
+    from vmm_session import open_vmm
+
+    with profiled(summary_file='api.json', profile_file='run.prof'):
+        vmm = open_vmm(['-device', 'memory.dmp'])
+        ...
+'''
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# 延迟直方图各桶的上限 (秒)；最后一个桶没有上限。
+LATENCY_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+# 为跟踪文件保留的最大 span 数；之后的调用只计数。
+MAX_TRACE_SPANS = 100000
+
+# split_profile_args() 从命令行中分离出的选项: 标志 -> profiled() 关键字参数。
+PROFILE_OPTIONS = {'--api-stats': 'summary_file', '--trace': 'trace_file', '--profile': 'profile_file'}
+
+# 每个被代理的 memprocfs 对象中插桩的方法和包装的子对象。
+_VMM_METHODS = ('process', 'process_all', 'pid_list')
+_VMM_CHILDREN = {'vfs': 'vfs', 'fs': 'vfs', 'memory': 'memory', 'maps': 'maps'}
+_PROCESS_METHODS = ('handle_all', 'module_all', 'module', 'thread_all')
+_PROCESS_CHILDREN = {'memory': 'memory', 'maps': 'maps', 'search': 'search'}
+_CHILD_METHODS = {
+    'vfs': ('read', 'readfile', 'list'),
+    'memory': ('read', 'read_scatter', 'read_type'),
+    'maps': ('pte', 'vad', 'heap', 'handle', 'module', 'thread', 'net', 'unloaded_module', 'memmap', 'pfn'),
+    'search': ('yara',),
+}
+
+_recorder = None
+
+
+def _bucket_label(index):
+    if index == len(LATENCY_BUCKETS):
+        return f"> {LATENCY_BUCKETS[-1]:g}s"
+    return f"<= {LATENCY_BUCKETS[index]:g}s"
+
+
+class ApiStats:
+    '''
+    单个 API 或 VFS 路径的调用统计。
+    '''
+    __slots__ = ('calls', 'failures', 'seconds', 'max_seconds', 'bytes', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, nbytes, failed):
+        self.calls += 1
+        self.failures += failed
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += nbytes
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.histogram[index] += 1
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'failure_rate': self.failures / self.calls if self.calls else 0.0,
+            'seconds': self.seconds,
+            'mean_seconds': self.seconds / self.calls if self.calls else 0.0,
+            'max_seconds': self.max_seconds,
+            'bytes': self.bytes,
+            'histogram': {_bucket_label(i): count for i, count in enumerate(self.histogram) if count},
+        }
+
+
+class Recorder:
+    '''
+    收集一次运行中的 API 调用。线程安全，因为有些脚本会从工作线程调用 API。
+    '''
+
+    def __init__(self, keep_spans=False):
+        '''
+        :param keep_spans: 为 write_trace() 保留每次调用的 span。
+        '''
+        self.lock = threading.Lock()
+        self.apis = {}
+        self.paths = {}
+        self.keep_spans = keep_spans
+        self.spans = []
+        self.dropped_spans = 0
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+
+    def record(self, api, start_ns, seconds, nbytes=0, failed=False, path=None):
+        '''
+        记录一次调用。
+
+        :param api: API 名称，例如 'process.memory.read'。
+        :param start_ns: 以纳秒为单位的挂钟开始时间。
+        :param seconds: 调用的持续时间。
+        :param nbytes: 返回的字节数。
+        :param failed: 调用是否引发了异常。
+        :param path: VFS 调用的 VFS 路径。
+        '''
+        with self.lock:
+            stats = self.apis.get(api)
+            if stats is None:
+                stats = self.apis[api] = ApiStats()
+            stats.add(seconds, nbytes, failed)
+            if path is not None:
+                stats = self.paths.get(path)
+                if stats is None:
+                    stats = self.paths[path] = ApiStats()
+                stats.add(seconds, nbytes, failed)
+            if self.keep_spans:
+                if len(self.spans) < MAX_TRACE_SPANS:
+                    self.spans.append((api, start_ns, int(seconds * 1e9), nbytes, failed, path,
+                                       threading.get_ident()))
+                else:
+                    self.dropped_spans += 1
+
+    def summary(self):
+        '''
+        返回按 API 和 VFS 路径统计的数据，按总时间排序。
+        '''
+        def ordered(table):
+            return {name: stats.as_dict()
+                    for name, stats in sorted(table.items(), key=lambda item: -item[1].seconds)}
+        with self.lock:
+            return {'wall_seconds': time.perf_counter() - self.start, 'apis': ordered(self.apis),
+                    'vfs_paths': ordered(self.paths), 'dropped_spans': self.dropped_spans}
+
+    def write_summary(self, output_file):
+        with open(output_file, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_trace(self, output_file, service_name='memprocfs-skill'):
+        '''
+        将记录的调用写为 OTLP/JSON 跟踪：整个运行一个根 span，每次 API 调用一个子 span。
+
+        :param output_file: 跟踪文件的路径。
+        :param service_name: service.name 资源属性。
+        '''
+        trace_id = os.urandom(16).hex()
+        root_id = os.urandom(8).hex()
+        end_ns = self.start_ns + int((time.perf_counter() - self.start) * 1e9)
+        spans = [{'traceId': trace_id, 'spanId': root_id, 'name': os.path.basename(sys.argv[0]) or 'run',
+                  'kind': 1, 'startTimeUnixNano': str(self.start_ns), 'endTimeUnixNano': str(end_ns),
+                  'attributes': [], 'status': {'code': 1}}]
+        with self.lock:
+            for api, start_ns, duration_ns, nbytes, failed, path, thread_id in self.spans:
+                attributes = [{'key': 'memprocfs.bytes', 'value': {'intValue': str(nbytes)}},
+                              {'key': 'thread.id', 'value': {'intValue': str(thread_id)}}]
+                if path is not None:
+                    attributes.append({'key': 'memprocfs.vfs.path', 'value': {'stringValue': path}})
+                spans.append({'traceId': trace_id, 'spanId': os.urandom(8).hex(), 'parentSpanId': root_id,
+                              'name': api, 'kind': 1, 'startTimeUnixNano': str(start_ns),
+                              'endTimeUnixNano': str(start_ns + duration_ns), 'attributes': attributes,
+                              'status': {'code': 2 if failed else 1}})
+        trace = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'vmm_profile'}, 'spans': spans}],
+        }]}
+        with open(output_file, 'w') as f:
+            json.dump(trace, f)
+
+
+def _size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
+class _Proxy:
+    '''
+    将属性访问转发给 memprocfs 对象，对列出的方法计时并包装列出的子对象。
+    '''
+
+    def __init__(self, target, recorder, prefix, methods, children, vfs=False):
+        self.__dict__.update(_target=target, _recorder=recorder, _prefix=prefix, _methods=methods,
+                             _children=children, _vfs=vfs)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name in self._children:
+            kind = self._children[name]
+            return _Proxy(value, self._recorder, f"{self._prefix}.{name}", _CHILD_METHODS[kind], {}, kind == 'vfs')
+        if name in self._methods and callable(value):
+            return self._timed(name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return repr(self._target)
+
+    def _timed(self, name, func):
+        api = f"{self._prefix}.{name}"
+        recorder = self._recorder
+        vfs = self._vfs
+
+        def call(*args, **kwargs):
+            path = args[0] if vfs and args else None
+            start_ns = time.time_ns()
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                recorder.record(api, start_ns, time.perf_counter() - start, 0, True, path)
+                raise
+            recorder.record(api, start_ns, time.perf_counter() - start, _size(result), False, path)
+            return self._wrap_result(name, result)
+        return call
+
+    def _wrap_result(self, name, result):
+        if self._prefix != 'vmm' or result is None:
+            return result
+        if name == 'process':
+            return instrument_process(result, self._recorder)
+        if name == 'process_all':
+            return [instrument_process(process, self._recorder) for process in result]
+        return result
+
+
+def instrument_process(process, recorder):
+    '''
+    包装 memprocfs 进程对象，以便记录其 API 调用。
+    '''
+    return _Proxy(process, recorder, 'process', _PROCESS_METHODS, _PROCESS_CHILDREN)
+
+
+def instrument(vmm, recorder=None):
+    '''
+    包装 Vmm，以便记录其 API 调用。未给出记录器且未启用性能分析时，原样返回 Vmm。
+
+    :param vmm: memprocfs.Vmm 实例或会话代理。
+    :param recorder: Recorder；默认为 profiled() 启用的记录器。
+    '''
+    recorder = recorder or _recorder
+    if recorder is None or isinstance(vmm, _Proxy):
+        return vmm
+    return _Proxy(vmm, recorder, 'vmm', _VMM_METHODS, _VMM_CHILDREN)
+
+
+def split_profile_args(argv):
+    '''
+    从命令行中移除性能分析选项。
+
+    :param argv: 命令行，例如 sys.argv。
+    :return: (剩余的 argv, profiled() 关键字参数) 元组。
+    '''
+    remaining = []
+    options = {}
+    i = 0
+    while i < len(argv):
+        if argv[i] in PROFILE_OPTIONS and i + 1 < len(argv):
+            options[PROFILE_OPTIONS[argv[i]]] = argv[i + 1]
+            i += 2
+        else:
+            remaining.append(argv[i])
+            i += 1
+    return remaining, options
+
+
+@contextmanager
+def profiled(summary_file=None, trace_file=None, profile_file=None):
+    '''
+    在 with 块执行期间启用插桩，并在其结束时写出请求的输出。未请求任何输出时不执行任何操作。
+
+    :param summary_file: 可选的路径，指向按 API 和 VFS 路径统计的 JSON 摘要。
+    :param trace_file: 可选的路径，指向 OTLP/JSON 跟踪文件。
+    :param profile_file: 可选的路径，指向 cProfile 转储；只分析调用线程。
+    '''
+    global _recorder
+    if not (summary_file or trace_file or profile_file):
+        yield None
+        return
+
+    recorder = Recorder(keep_spans=bool(trace_file))
+    previous, _recorder = _recorder, recorder
+    profiler = cProfile.Profile() if profile_file else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield recorder
+    finally:
+        if profiler:
+            profiler.disable()
+        _recorder = previous
+        if profiler:
+            profiler.dump_stats(profile_file)
+            print(f"cProfile 转储已写入 {profile_file}", file=sys.stderr)
+        if summary_file:
+            recorder.write_summary(summary_file)
+            print(f"API 统计已写入 {summary_file}", file=sys.stderr)
+        if trace_file:
+            recorder.write_trace(trace_file)
+            print(f"跟踪已写入 {trace_file}", file=sys.stderr)
+        print_summary(recorder, sys.stderr)
+
+
+def print_summary(recorder, f=sys.stdout, limit=10):
+    '''
+    打印总时间最高的 API。
+
+    :param recorder: Recorder。
+    :param f: 打印的目标流。
+    :param limit: 打印的 API 数量。
+    '''
+    summary = recorder.summary()
+    print(f"--- memprocfs API 调用 (挂钟时间 {summary['wall_seconds']:.2f} 秒) ---", file=f)
+    for api, stats in list(summary['apis'].items())[:limit]:
+        print(f"  {api:<28} {stats['calls']:>9} 次调用 {stats['seconds']:>9.3f}s "
+              f"{stats['bytes']:>14} 字节 {stats['failures']:>6} 次失败", file=f)
+
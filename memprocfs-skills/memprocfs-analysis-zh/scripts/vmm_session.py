@@ -0,0 +1,459 @@
+'''
+共享的 MemProcFS 会话代理。
+
+长期运行的会话守护进程为每个内存镜像持有一个已初始化的 memprocfs.Vmm，
+并通过 Unix 套接字提供服务。辅助脚本调用 open_vmm()，它会连接到相同 VMM
+参数的运行中会话；没有会话运行时则回退为进程内的 memprocfs.Vmm。
+这样在一次分诊过程中，后续命令可以完全跳过 MemProcFS 的初始化。
+
+会话返回的对象 (进程、模块、内存访问器等) 都是代理：属性读取和方法调用
+会被转发到守护进程，而普通值 (数字、字符串、bytes 以及由它们组成的列表和字典) 会被复制。
+
+用法: python vmm_session.py start [vmm_args...]
+      python vmm_session.py status [vmm_args...]
+      python vmm_session.py stop [vmm_args...]
+'''
+
+import memprocfs
+import sys
+import os
+import json
+import stat
+import socket
+import hashlib
+import inspect
+import tempfile
+import threading
+import itertools
+from collections import deque
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from vmm_profile import instrument
+
+# 每个连接的对象表中 Vmm 对象本身的句柄。
+ROOT_HANDLE = 0
+
+_PLAIN_TYPES = (type(None), bool, int, float, str, bytes)
+
+
+def sessions_supported():
+    '''
+    如果平台支持会话代理所需的 Unix 套接字，则返回 True。
+    '''
+    return hasattr(socket, 'AF_UNIX')
+
+
+def session_dir():
+    '''
+    返回存放会话套接字和认证密钥的每用户私有目录；设置了 $XDG_RUNTIME_DIR 时
+    位于其下。除非该目录属于当前用户且其他人无法访问，否则拒绝使用，因为控制
+    该目录的人可以提供脚本所连接的套接字。
+    '''
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'memprocfs-sessions')
+    else:
+        uid = os.getuid() if hasattr(os, 'getuid') else os.getlogin()
+        path = os.path.join(tempfile.gettempdir(), f"memprocfs-sessions-{uid}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # makedirs() accepts an existing path as it is, which may have been planted
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o077 or
+            (hasattr(os, 'getuid') and info.st_uid != os.getuid())):
+        raise PermissionError(f"{path} 不是当前用户的私有目录；不将其用于会话")
+    return path
+
+
+def session_address(vmm_args):
+    '''
+    返回为给定 VMM 参数提供服务的会话的 Unix 套接字路径。-device 之后的映像
+    文件以其真实路径作为键，因此从其他目录、或以相对路径和绝对路径指定的同一
+    映像对应同一个会话；pmem 或 fpga 等设备名称保持原样。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    args = list(vmm_args)
+    for i, arg in enumerate(args[:-1]):
+        if arg.lower() == '-device' and os.path.isfile(args[i + 1]):
+            args[i:i + 2] = ['-device', os.path.realpath(args[i + 1])]
+    digest = hashlib.sha1(json.dumps(args).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(session_dir(), f"{digest}.sock")
+
+
+def _session_authkey():
+    '''
+    返回当前用户所有会话共享的认证密钥，首次使用时创建。
+    '''
+    path = os.path.join(session_dir(), 'authkey')
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    # 密钥先写入临时文件，再完整地发布，因此并发的读取者不会读到不完整的密钥。
+    # 与 os.replace 不同，如果其他进程已先发布了密钥，链接会失败，此时使用该密钥。
+    fd, temp_path = tempfile.mkstemp(dir=session_dir(), prefix='authkey-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temp_path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class _Ref:
+    '''
+    当代理作为参数传回守护进程时，用于代替它发送的标记。
+    '''
+    __slots__ = ('handle',)
+
+    def __init__(self, handle):
+        self.handle = handle
+
+
+class _ObjectTable:
+    '''
+    交给一个客户端的对象，由该客户端的所有连接共享。客户端释放代理后，对应条目即被移除。
+    '''
+
+    def __init__(self, vmm):
+        self.objects = {ROOT_HANDLE: vmm}
+        self.handles = itertools.count(ROOT_HANDLE + 1)
+        self.connections = 0
+
+
+def _encode(value, table):
+    '''
+    为客户端编码结果。普通值会被复制，其他对象则存入客户端的对象表并以句柄形式发送。
+    '''
+    if isinstance(value, _PLAIN_TYPES):
+        return ('v', value)
+    if isinstance(value, (list, tuple)):
+        return ('l', [_encode(item, table) for item in value])
+    if isinstance(value, dict):
+        return ('d', {key: _encode(item, table) for key, item in value.items()})
+    if inspect.isroutine(value):
+        return ('m', None)
+    handle = next(table.handles)
+    table.objects[handle] = value
+    return ('o', handle)
+
+
+def _resolve(value, objects):
+    if isinstance(value, _Ref):
+        return objects[value.handle]
+    if isinstance(value, (list, tuple)):
+        return type(value)(_resolve(item, objects) for item in value)
+    if isinstance(value, dict):
+        return {key: _resolve(item, objects) for key, item in value.items()}
+    return value
+
+
+def _serve_connection(conn, vmm, shutdown, tables, tables_lock):
+    '''
+    为单个连接处理请求，直到其断开连接。客户端为每个线程打开一个连接；每个连接的
+    第一个 'attach' 请求指明所属的客户端，这些连接共享该客户端的对象表。
+    '''
+    token = None
+    table = _ObjectTable(vmm)
+    try:
+        while True:
+            op, handle, name, args, kwargs = conn.recv()
+            if op == 'shutdown':
+                conn.send(('v', None))
+                shutdown()
+                return
+            if op == 'attach':
+                with tables_lock:
+                    token = name
+                    table = tables.setdefault(token, table)
+                    table.connections += 1
+                conn.send(('v', None))
+                continue
+            if op == 'del':
+                # 已释放的代理；不发送响应
+                for released in args:
+                    table.objects.pop(released, None)
+                continue
+            objects = table.objects
+            try:
+                target = objects[handle]
+                if op == 'getattr':
+                    result = getattr(target, name)
+                elif op == 'call':
+                    result = getattr(target, name)(*_resolve(args, objects), **_resolve(kwargs, objects))
+                else:
+                    result = None
+                response = _encode(result, table)
+            except Exception as e:
+                response = ('e', e)
+            try:
+                conn.send(response)
+            except Exception:
+                # 异常本身无法被 pickle
+                conn.send(('e', RuntimeError(str(response[1]))))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+        if token is not None:
+            with tables_lock:
+                table.connections -= 1
+                if table.connections == 0:
+                    del tables[token]
+
+
+def serve(vmm_args):
+    '''
+    初始化 MemProcFS 并向客户端提供服务，直到收到 'stop' 请求。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    address = session_address(vmm_args)
+    if os.path.exists(address):
+        if ping(vmm_args):
+            print(f"错误: {vmm_args} 的会话已在 {address} 运行")
+            return
+        os.unlink(address)
+
+    vmm = memprocfs.Vmm(vmm_args)
+    print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+
+    listener = Listener(address, family='AF_UNIX', authkey=_session_authkey())
+    stopping = threading.Event()
+    tables = {}
+    tables_lock = threading.Lock()
+
+    def shutdown():
+        stopping.set()
+        # 关闭监听器不会唤醒主循环中阻塞的 accept()；建立一个连接可以唤醒它，
+        # 之后循环会看到该事件
+        try:
+            with socket.socket(socket.AF_UNIX) as wake:
+                wake.connect(address)
+        except OSError:
+            pass
+
+    print(f"会话正在 {address} 上监听 (停止命令: python vmm_session.py stop {' '.join(vmm_args)})")
+    try:
+        while not stopping.is_set():
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue
+            except OSError:
+                break
+            threading.Thread(target=_serve_connection, args=(conn, vmm, shutdown, tables, tables_lock),
+                             daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+    print("会话已停止。")
+
+
+class _Session:
+    '''
+    会话的客户端。每个线程通过自己的连接与守护进程通信，因此线程池中的线程
+    不必等待彼此的往返；所有连接共享守护进程中的同一个对象表。已被垃圾回收的
+    代理的句柄随下一个请求一起释放。
+    '''
+
+    def __init__(self, address):
+        self.address = address
+        self.authkey = _session_authkey()
+        self.token = os.urandom(16).hex()
+        self.local = threading.local()
+        self.connections = []
+        self.released = deque()
+
+    def connection(self):
+        '''
+        返回调用线程的连接，首次使用时打开。
+        '''
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            conn.send(('attach', ROOT_HANDLE, self.token, (), {}))
+            conn.recv()
+            self.local.conn = conn
+            self.connections.append(conn)
+        return conn
+
+    def release(self, handle):
+        # 由终结器调用，终结器可能在请求进行中运行
+        self.released.append(handle)
+
+    def request(self, op, owner=None, name=None, args=(), kwargs=None):
+        conn = self.connection()
+        if self.released:
+            handles = []
+            while self.released:
+                handles.append(self.released.popleft())
+            conn.send(('del', ROOT_HANDLE, None, handles, {}))
+        handle = owner._handle if owner is not None else ROOT_HANDLE
+        conn.send((op, handle, name, args, kwargs or {}))
+        return self.decode(conn.recv(), owner, name)
+
+    def decode(self, response, owner=None, name=None):
+        kind, value = response
+        if kind == 'v':
+            return value
+        if kind == 'l':
+            return [self.decode(item) for item in value]
+        if kind == 'd':
+            return {key: self.decode(item) for key, item in value.items()}
+        if kind == 'o':
+            return RemoteObject(self, value)
+        if kind == 'm':
+            return RemoteMethod(self, owner, name)
+        raise value
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
+def _to_wire(value):
+    if isinstance(value, RemoteObject):
+        return _Ref(value._handle)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_wire(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _to_wire(item) for key, item in value.items()}
+    return value
+
+
+class RemoteMethod:
+    '''
+    会话守护进程中对象方法的代理。它持有对象的代理，从而使其句柄保持有效。
+    '''
+    __slots__ = ('_session', '_owner', '_name')
+
+    def __init__(self, session, owner, name):
+        self._session = session
+        self._owner = owner
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return self._session.request('call', self._owner, self._name, _to_wire(args), _to_wire(kwargs))
+
+
+class RemoteObject:
+    '''
+    会话守护进程中对象的代理。代理被垃圾回收后，守护进程即丢弃该对象。
+    '''
+    __slots__ = ('_session', '_handle', '__weakref__')
+
+    def __init__(self, session, handle):
+        self._session = session
+        self._handle = handle
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._session.request('getattr', self, name)
+
+    def __del__(self):
+        if self._handle != ROOT_HANDLE:
+            self._session.release(self._handle)
+
+    def __repr__(self):
+        return f"<RemoteObject #{self._handle} via {self._session.address}>"
+
+
+def connect(vmm_args):
+    '''
+    连接到为给定 VMM 参数提供服务的会话。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :return: 会话中 Vmm 的 RemoteObject 代理。
+    '''
+    session = _Session(session_address(vmm_args))
+    # 立即连接，以便在此处报告会话不存在
+    session.connection()
+    return RemoteObject(session, ROOT_HANDLE)
+
+
+def ping(vmm_args):
+    '''
+    如果有会话正在为给定 VMM 参数提供服务，则返回 True。
+    '''
+    if not sessions_supported() or not os.path.exists(session_address(vmm_args)):
+        return False
+    try:
+        connect(vmm_args)._session.close()
+        return True
+    except (OSError, EOFError, AuthenticationError):
+        return False
+
+
+def open_vmm(vmm_args):
+    '''
+    返回给定参数的 Vmm：如果存在运行中的会话则返回其代理，否则返回新的进程内 memprocfs.Vmm。
+    启用性能分析时 (参见 vmm_profile.py)，会记录其 API 调用。
+
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    '''
+    address = None
+    if sessions_supported():
+        try:
+            address = session_address(vmm_args)
+        except PermissionError as e:
+            print(f"警告: {e}", file=sys.stderr)
+    if address and os.path.exists(address):
+        try:
+            vmm = connect(vmm_args)
+            print(f"已连接到 MemProcFS 会话 {vmm._session.address}", file=sys.stderr)
+            return instrument(vmm)
+        except (OSError, EOFError, AuthenticationError):
+            pass
+    return instrument(memprocfs.Vmm(vmm_args))
+
+
+def stop(vmm_args):
+    '''
+    请求为给定 VMM 参数提供服务的会话关闭。
+    '''
+    try:
+        vmm = connect(vmm_args)
+        vmm._session.request('shutdown')
+        vmm._session.close()
+        print(f"{vmm_args} 的会话已停止。")
+    except (OSError, EOFError, AuthenticationError):
+        print(f"错误: 没有 {vmm_args} 的会话在运行")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('start', 'status', 'stop'):
+        print("用法: python vmm_session.py start|status|stop [vmm_args...]")
+        print("示例: python vmm_session.py start -device memory.dmp")
+        sys.exit(1)
+
+    if not sessions_supported():
+        print("错误: 会话需要 Unix 套接字支持，而此平台不支持。")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    vmm_arguments = sys.argv[2:]
+
+    try:
+        # 在任何命令使用会话目录之前拒绝不安全的目录
+        session_dir()
+        if command == 'start':
+            serve(vmm_arguments)
+        elif command == 'status':
+            if ping(vmm_arguments):
+                print(f"会话正在 {session_address(vmm_arguments)} 运行")
+            else:
+                print(f"没有 {vmm_arguments} 的会话在运行")
+        else:
+            stop(vmm_arguments)
+    except PermissionError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
@@ -0,0 +1,204 @@
+'''
+用于一次性编译 YARA 规则并用其扫描进程内存的辅助函数。
+
+已编译的规则以规则文件的 SHA-256 哈希为键缓存在磁盘上，
+因此使用同一规则文件的重复扫描会跳过编译。扫描时按块读取进程的已映射区域
+(参见 memory_regions.py)，并对每个块运行已编译的规则。
+
+需要可选的 yara-python 包 (pip install yara-python)。未安装时，
+load_rules() 返回 None，调用方回退到 process.search.yara()。
+'''
+
+import os
+import hashlib
+from memory_regions import DEFAULT_CHUNK_SIZE, get_memory_regions, iter_region_chunks
+from region_hashes import iter_unknown_chunks
+
+try:
+    import yara
+except ImportError:
+    yara = None
+
+# 上一个块中与下一个块一起再次扫描的字节数，
+# 以便仍能找到跨越块边界的匹配。
+DEFAULT_OVERLAP = 0x1000
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'memprocfs-skill', 'yara')
+
+
+def rules_digest(rule_file):
+    '''
+    返回规则文件内容的 SHA-256 十六进制摘要。
+
+    :param rule_file: YARA 规则文件的路径。
+    '''
+    sha256 = hashlib.sha256()
+    with open(rule_file, 'rb') as f:
+        for block in iter(lambda: f.read(0x10000), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_rules(rule_file, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    返回规则文件对应的已编译 YARA 规则；只有在 cache_dir 中
+    没有相同文件内容的已编译副本时才会编译。
+
+    :param rule_file: YARA 规则文件的路径。
+    :param cache_dir: 存放已编译规则的目录。
+    :return: yara.Rules 对象；如果未安装 yara-python 则返回 None。
+    '''
+    if yara is None:
+        return None
+
+    version = getattr(yara, '__version__', 'unknown')
+    cached_file = os.path.join(cache_dir, f"{rules_digest(rule_file)}-{version}.yarc")
+    if os.path.exists(cached_file):
+        try:
+            return yara.load(cached_file)
+        except yara.Error:
+            pass
+
+    rules = yara.compile(filepath=rule_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_file = f"{cached_file}.{os.getpid()}.tmp"
+    rules.save(temp_file)
+    os.replace(temp_file, cached_file)
+    return rules
+
+
+def iter_string_matches(match):
+    '''
+    为 yara.Match 的每个字符串实例生成 (identifier, offset, data)。
+    同时支持 yara-python >= 4.3 的 StringMatch 对象和旧版本的元组。
+
+    :param match: yara.Match 对象。
+    '''
+    for string in match.strings:
+        if isinstance(string, tuple):
+            offset, identifier, data = string
+            yield identifier, offset, data
+        else:
+            for instance in string.instances:
+                yield string.identifier, instance.offset, instance.matched_data
+
+
+def iter_match_hits(match):
+    '''
+    为 yara.Match 的每个字符串实例生成 (identifier, offset, data)；
+    如果规则仅凭条件匹配（例如没有字符串的规则），则生成一个 (None, None, b'')，
+    以免丢失这类匹配。
+
+    :param match: yara.Match 对象。
+    '''
+    found = False
+    for hit in iter_string_matches(match):
+        found = True
+        yield hit
+    if not found:
+        yield None, None, b''
+
+
+def scan_chunks(rules, chunks, overlap=DEFAULT_OVERLAP):
+    '''
+    扫描一系列内存块，并且每个匹配只生成一次。
+
+    一个块的最后 `overlap` 字节会与下一个相邻的块一起再次扫描。
+    只有结束位置超过新块起点的匹配才会被报告，因此在重叠区域中重复找到的匹配会被丢弃。
+    没有字符串实例的规则匹配在每个块中报告一次，位置为新块的起点，
+    identifier 为 None，data 为空。
+
+    :param rules: yara.Rules 对象。
+    :param chunks: 按地址顺序排列的 (address, data) 元组的可迭代对象。
+    :param overlap: 从上一个块带入的字节数。
+    :return: 生成包含 'rule'、'identifier'、'offset' 和 'data' 的字典的生成器。
+    '''
+    tail_address, tail = None, b''
+    for address, data in chunks:
+        if tail and tail_address + len(tail) == address:
+            buffer_address, buffer = address - len(tail), tail + data
+        else:
+            buffer_address, buffer = address, data
+
+        for match in rules.match(data=buffer):
+            for identifier, offset, matched in iter_match_hits(match):
+                if offset is None:
+                    # 规则级匹配：报告在第一个新字节处，而不是在带入的重叠区域中。
+                    yield {'rule': match.rule, 'identifier': None, 'offset': address, 'data': b''}
+                elif buffer_address + offset + len(matched) > address or buffer_address == address:
+                    yield {'rule': match.rule, 'identifier': identifier,
+                           'offset': buffer_address + offset, 'data': matched}
+
+        if overlap:
+            tail = buffer[-overlap:]
+            tail_address = buffer_address + len(buffer) - len(tail)
+
+
+def limit_matches(matches, first_match=False, max_matches_per_rule=None, rule_count=None):
+    '''
+    对匹配流应用停止条件。由于匹配流是惰性的，一旦停止条件结束迭代，
+    就不会再读取更多内存。
+
+    :param matches: 匹配字典的可迭代对象，参见 scan_chunks()。
+    :param first_match: 在第一个匹配后停止。
+    :param max_matches_per_rule: 某条规则的匹配数达到该值后丢弃其后续匹配。
+    :param rule_count: 可选的规则数量；当每条规则都达到最大值时扫描停止。
+    '''
+    counts = {}
+    for match in matches:
+        count = counts.get(match['rule'], 0)
+        if max_matches_per_rule is not None and count >= max_matches_per_rule:
+            continue
+        counts[match['rule']] = count + 1
+        yield match
+        if first_match:
+            return
+        if (max_matches_per_rule is not None and rule_count is not None and len(counts) == rule_count
+                and all(n >= max_matches_per_rule for n in counts.values())):
+            return
+
+
+def count_rules(rules):
+    '''
+    返回 yara.Rules 对象中的规则数量；如果已安装的 yara-python
+    不支持遍历规则，则返回 None。
+    '''
+    try:
+        return sum(1 for _ in rules)
+    except TypeError:
+        return None
+
+
+def scan_process(process, rules, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, stats=None,
+                 first_match=False, max_matches_per_rule=None, known=None, chunk_hook=None):
+    '''
+    使用已编译的规则扫描进程的已映射内存。
+
+    :param process: memprocfs 进程对象。
+    :param rules: yara.Rules 对象。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param overlap: 相邻块之间带入的字节数。
+    :param stats: 可选的字典；扫描时会更新其 'bytes_scanned' 项。
+    :param first_match: 在第一个匹配后停止扫描。
+    :param max_matches_per_rule: 每条规则最多报告的匹配数。
+    :param known: 可选的 KnownGoodSet，其中的页面不扫描；stats['bytes_skipped'] 会累加略过的字节数。
+    :param chunk_hook: 可选的函数，包装 (address, data) 块的迭代器，例如用于限制读取速度。
+    :return: 匹配字典的生成器，参见 scan_chunks()。
+    '''
+    def counted(chunks):
+        for address, data in chunks:
+            if stats is not None:
+                stats['bytes_scanned'] = stats.get('bytes_scanned', 0) + len(data)
+            yield address, data
+
+    regions = get_memory_regions(process)
+    if known is not None:
+        chunks = iter_unknown_chunks(process, known, None, regions, chunk_size, stats=stats)
+    else:
+        chunks = iter_region_chunks(process, regions, chunk_size)
+    if chunk_hook is not None:
+        chunks = chunk_hook(chunks)
+    matches = scan_chunks(rules, counted(chunks), overlap)
+    if first_match or max_matches_per_rule is not None:
+        matches = limit_matches(matches, first_match, max_matches_per_rule, count_rules(rules))
+    return matches
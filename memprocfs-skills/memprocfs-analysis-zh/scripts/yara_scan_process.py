@@ -1,75 +1,442 @@
 '''
 此脚本对指定进程执行 YARA 扫描。
 
-用法: python yara_scan_process.py <进程名或PID> <yara_rule_file> [vmm_args...]
+在分块模式下，已提交的内存区域按相互重叠的块扫描，扫描运行期间匹配被分批写出，
+并可选择提前停止。在扫描模式 (sweep) 下，所有进程或经过筛选的一组进程由工作线程池扫描，
+规则只编译一次并缓存在磁盘上。扫描运行期间，匹配以 JSONL 形式流式输出。
+使用 --jsonl 时，每个完成的进程都会以检查点形式记录到 '<输出文件>.journal'
+(参见 job_journal.py)，使用 --resume 重新运行相同的扫描会跳过已扫描的进程。
+
+使用 --known-good 时，在已知良好哈希集合 (由 region_hashes.py 从干净的
+基线镜像构建) 中找到的页面不会被扫描 (分块和扫描模式，需要 yara-python)。
+
+单个进程的匹配写为表格，或通过 --format 写为 JSONL、CSV 或 Arrow，输出到
+stdout，或通过 --output 输出到文件 (参见 result_writers.py)。
+
+用法: python yara_scan_process.py <进程名或PID> <yara_rule_file> [--chunked] [--format <table|jsonl|csv|arrow>] [--output <文件>] [扫描选项...] [vmm_args...]
+      python yara_scan_process.py --sweep <PID列表|名称通配符|all> <yara_rule_file> [--workers <n>] [--jsonl <输出文件>] [--resume] [扫描选项...] [vmm_args...]
+
+扫描选项: [--chunk-size <字节数>] [--overlap <字节数>] [--first-match] [--max-matches-per-rule <n>] [--cache-dir <目录>] [--known-good <集合文件>]
+
+性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>] (参见 vmm_profile.py)
 '''
 
-import memprocfs
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
 import sys
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dump_process_memory import resolve_processes
+from memory_regions import DEFAULT_CHUNK_SIZE, get_memory_regions
+from yara_rules import DEFAULT_CACHE_DIR, DEFAULT_OVERLAP, load_rules, rules_digest, scan_process
+from job_journal import JobJournal, image_identity
+from region_hashes import KnownGoodSet
+from result_writers import FORMATS, guess_format, open_writer
 
-def yara_scan_process(proc_identifier, rule_file, vmm_args):
+DEFAULT_WORKERS = 4
+
+# 单个进程匹配记录的列。
+MATCH_FIELDS = ('pid', 'process', 'rule', 'identifier', 'offset', 'data', 'text')
+MATCH_TYPES = {'pid': 'int', 'rule': 'str', 'identifier': 'str', 'offset': 'hex', 'data': 'str', 'text': 'str'}
+
+# 可打印的 ASCII，匹配文本中的其他字节显示为 '.'。
+PRINTABLE = bytes(c if 0x20 <= c < 0x7f else 0x2e for c in range(256))
+
+def match_record(process, match):
+    '''
+    为结果写入器返回 YARA 匹配的记录。
+
+    :param process: 被扫描的进程。
+    :param match: 包含 'rule'、'offset'、'data' 以及可选 'identifier' 的匹配字典。
+    '''
+    data = bytes(match['data'])
+    return {'pid': process.pid, 'process': process.name, 'rule': match['rule'],
+            'identifier': match.get('identifier'), 'offset': match['offset'], 'data': data.hex(),
+            'text': data.translate(PRINTABLE).decode('ascii')}
+
+def yara_scan_process(proc_identifier, rule_file, vmm_args, chunked=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                      overlap=DEFAULT_OVERLAP, first_match=False, max_matches_per_rule=None,
+                      cache_dir=DEFAULT_CACHE_DIR, known_good=None, output_format='table', output_file=None):
     '''
     对进程内存执行 YARA 扫描。
 
+    在分块模式下，已映射的内存区域使用已编译的规则逐块读取和扫描，
+    匹配被分批写出。first_match 和 max_matches_per_rule 停止条件
+    会提前结束扫描，从而不再读取进程内存的其余部分。
+
     :param proc_identifier: 要扫描的进程的名称或 PID。
     :param rule_file: YARA 规则文件的路径。
     :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param chunked: 分块扫描内存区域，而不是使用 process.search.yara()。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param overlap: 相邻块共享的字节数，以保留跨越边界的匹配。
+    :param first_match: 在第一个匹配后停止扫描 (分块模式)。
+    :param max_matches_per_rule: 每条规则最多报告的匹配数 (分块模式)。
+    :param cache_dir: 存放已编译规则的目录。
+    :param known_good: 可选的已知良好哈希集合路径；其中的页面不扫描 (分块模式)。
+    :param output_format: 'table'、'jsonl'、'csv' 或 'arrow'。
+    :param output_file: 可选的输出文件路径；默认为 stdout。
     '''
     try:
         # 读取 YARA 规则
-        with open(rule_file, 'r') as f:
-            yara_rules = f.read()
+        if chunked:
+            known = KnownGoodSet.load(known_good) if known_good else None
+            rules = load_rules(rule_file, cache_dir)
+            if rules is None:
+                print("错误: 分块扫描需要 yara-python 包 (pip install yara-python)。")
+                return
+        else:
+            known = None
+            with open(rule_file, 'r') as f:
+                rules = f.read()
 
-        # 初始化 VMM
-        vmm = memprocfs.Vmm(vmm_args)
-        print(f"MemProcFS 已使用参数初始化: {vmm_args}")
+        out = open_writer(output_format, output_file, MATCH_FIELDS, MATCH_TYPES)
+        with out:
+            found = scan_to_writer(out, proc_identifier, rule_file, vmm_args, chunked, rules, chunk_size, overlap,
+                                   first_match, max_matches_per_rule, known)
+        if found is not None and output_file:
+            print(f"已将 {found} 个匹配写入 {output_file}")
 
-        # 查找进程
-        try:
-            pid = int(proc_identifier)
-            process = vmm.process(pid)
-        except ValueError:
-            process = vmm.process(proc_identifier)
+    except FileNotFoundError:
+        print(f"错误: 在 {rule_file} 未找到 YARA 规则文件")
+    except Exception as e:
+        print(f"发生错误: {e}")
 
-        if not process:
-            print(f"错误: 未找到进程 '{proc_identifier}'。")
-            return
+def scan_to_writer(out, proc_identifier, rule_file, vmm_args, chunked, rules, chunk_size, overlap, first_match,
+                   max_matches_per_rule, known):
+    '''
+    扫描进程并将其匹配写入结果写入器；消息输出到 out.messages。
 
-        print(f"正在使用 {rule_file} 中的规则扫描进程: {process.name} (PID: {process.pid})")
+    :param out: 已打开的 ResultWriter。
+    :param rules: 已编译的规则 (分块模式) 或规则源码 (process.search.yara())。
+    :return: 匹配数；未找到进程时返回 None。
+    '''
+    messages = out.messages
 
-        # 执行 YARA 扫描
-        matches = process.search.yara(yara_rules)
+    # 初始化 VMM
+    vmm = open_vmm(vmm_args)
+    print(f"MemProcFS 已使用参数初始化: {vmm_args}", file=messages)
 
-        if not matches:
-            print("未找到 YARA 匹配项。")
-            return
+    # 查找进程
+    try:
+        pid = int(proc_identifier)
+        process = vmm.process(pid)
+    except ValueError:
+        process = vmm.process(proc_identifier)
+
+    if not process:
+        print(f"错误: 未找到进程 '{proc_identifier}'。", file=messages)
+        return None
+
+    print(f"正在使用 {rule_file} 中的规则扫描进程: {process.name} (PID: {process.pid})", file=messages)
+
+    # 执行 YARA 扫描
+    stats = {'bytes_scanned': 0, 'bytes_skipped': 0}
+    if chunked:
+        matches = scan_process(process, rules, chunk_size, overlap, stats, first_match, max_matches_per_rule, known)
+    else:
+        matches = process.search.yara(rules) or []
+
+    messages.flush()
+    found = 0
+    for match in matches:
+        found += 1
+        out.write(match_record(process, match))
+    out.flush()
+
+    if found:
+        print(f"找到 {found} 个 YARA 匹配项。", file=messages)
+    else:
+        print("未找到 YARA 匹配项。", file=messages)
+    if chunked:
+        print(f"已扫描 {stats['bytes_scanned']} 字节的进程内存。", file=messages)
+        if known is not None:
+            print(f"已略过 {stats['bytes_skipped']} 字节的已知良好页面。", file=messages)
+    return found
+
+def drop_unfinished_records(jsonl_file, finished):
+    '''
+    只保留已完成进程的记录来重写扫描的 JSONL 文件，
+    从而使继续执行时重新扫描的进程不会被报告两次。
+
+    :param jsonl_file: 被中断的扫描的 JSONL 输出路径。
+    :param finished: 记录完整的进程的 PID。
+    '''
+    temp_file = f"{jsonl_file}.{os.getpid()}.tmp"
+    with open(jsonl_file, 'rb') as f, open(temp_file, 'wb') as out:
+        for line in f:
+            try:
+                if line.endswith(b'\n') and json.loads(line)['pid'] in finished:
+                    out.write(line)
+            except (ValueError, KeyError, TypeError):
+                pass
+    os.replace(temp_file, jsonl_file)
+
+def sweep_processes(processes, rules, emit, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                    overlap=DEFAULT_OVERLAP, first_match=False, max_matches_per_rule=None, known=None,
+                    rule_source=None, chunk_hook=None):
+    '''
+    在线程池上扫描进程，并将每条记录传给 emit()：每个匹配一条 'match' 记录，
+    然后每个进程一条 'process' 记录，包含匹配数、已扫描和已略过的字节数以及扫描时间；
+    进程无法扫描时则为一条 'error' 记录。emit() 在工作线程中调用。
+
+    :param processes: 要扫描的 memprocfs 进程对象。
+    :param rules: yara.Rules 对象，为 None 时使用 process.search.yara() 扫描。
+    :param emit: 对每条记录调用的函数。
+    :param workers: 同时扫描的进程数。
+    :param chunk_size: 一次从内存读取的最大字节数。
+    :param overlap: 相邻块共享的字节数，以保留跨越块边界的匹配。
+    :param first_match: 进程出现第一个匹配后即停止扫描该进程。
+    :param max_matches_per_rule: 每条规则和每个进程最多报告这么多个匹配。
+    :param known: 可选的 KnownGoodSet，其中的页面不扫描。
+    :param rule_source: 规则文本，在 rules 为 None 时使用。
+    :param chunk_hook: 可选的函数，包装每个进程的块迭代器，例如用于限制读取速度。
+    :return: 已扫描进程的 (匹配数, 已扫描字节数, 已略过字节数) 元组。
+    '''
+    def scan(process):
+        process_start = time.perf_counter()
+        stats = {'bytes_scanned': 0, 'bytes_skipped': 0}
+        if rules is not None:
+            matches = scan_process(process, rules, chunk_size, overlap, stats, first_match, max_matches_per_rule,
+                                   known, chunk_hook)
+        else:
+            stats['bytes_scanned'] = sum(size for _, size in get_memory_regions(process))
+            matches = process.search.yara(rule_source) or []
 
-        print("\n--- 发现 YARA 匹配项 ---")
+        count = 0
         for match in matches:
-            print(f"规则: {match['rule']}, 偏移量: {match['offset']:#x}")
-            # 以可读格式打印匹配的数据
+            count += 1
+            emit({'type': 'match', 'pid': process.pid, 'process': process.name,
+                  'rule': match['rule'], 'identifier': match.get('identifier'),
+                  'offset': match['offset'], 'data': match['data'].hex()})
+
+        emit({'type': 'process', 'pid': process.pid, 'process': process.name, 'matches': count,
+              'bytes_scanned': stats['bytes_scanned'], 'bytes_skipped': stats['bytes_skipped'],
+              'seconds': round(time.perf_counter() - process_start, 3)})
+        return count, stats['bytes_scanned'], stats['bytes_skipped']
+
+    total_matches = total_bytes = total_skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(scan, process): process for process in processes}
+        for future in as_completed(futures):
+            process = futures[future]
             try:
-                print(f"  匹配的字符串: {match['data'].decode('utf-8', errors='ignore')}")
-            except:
-                print(f"  匹配的数据 (十六进制): {match['data'].hex()}")
+                count, scanned, skipped = future.result()
+                total_matches += count
+                total_bytes += scanned
+                total_skipped += skipped
+            except Exception as e:
+                emit({'type': 'error', 'pid': process.pid, 'process': process.name, 'error': str(e)})
+    return total_matches, total_bytes, total_skipped
+
+def yara_sweep(target, rule_file, vmm_args, workers=DEFAULT_WORKERS, jsonl_file=None, cache_dir=DEFAULT_CACHE_DIR,
+               chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, first_match=False, max_matches_per_rule=None,
+               resume=False, known_good=None):
+    '''
+    并行地对多个进程的内存执行 YARA 扫描。
+
+    每个匹配一经发现就写为一条 JSONL 记录，每个进程扫描完后跟随一条记录，
+    包含匹配数、扫描的字节数和扫描时间。进度消息输出到标准错误，以保持 JSONL 流干净。
+
+    安装 yara-python 后，规则只编译一次 (并以规则文件的哈希缓存在磁盘上)，
+    进程内存按块扫描。未安装时，每个进程使用 process.search.yara() 扫描。
+
+    使用 JSONL 文件时，进程的记录写入磁盘后，该进程会被记录到 '<jsonl_file>.journal'。
+    继续执行时，被中断的进程的记录会从 JSONL 文件中删除，日志中列为已完成的进程
+    会被跳过，其余进程会被扫描并追加。
+
+    :param target: 'all'，或以逗号分隔的 PID 和名称通配符列表。
+    :param rule_file: YARA 规则文件的路径。
+    :param vmm_args: 用于初始化 MemProcFS 的参数列表。
+    :param workers: 同时扫描的进程数。
+    :param jsonl_file: 可选的 JSONL 输出路径；默认为标准输出。
+    :param cache_dir: 存放已编译规则的目录。
+    :param chunk_size: 单次从内存读取的最大字节数。
+    :param overlap: 相邻块共享的字节数，以保留跨越边界的匹配。
+    :param first_match: 在进程的第一个匹配后停止扫描该进程。
+    :param max_matches_per_rule: 每条规则在每个进程中最多报告的匹配数。
+    :param resume: 继续 jsonl_file 的日志中记录的扫描。
+    :param known_good: 可选的已知良好哈希集合路径；其中的页面不扫描。
+    '''
+    try:
+        start_time = time.perf_counter()
+        if resume and not jsonl_file:
+            print("错误: --resume 需要 --jsonl <输出文件>。", file=sys.stderr)
+            return
+
+        # 为整个扫描只编译 (或加载已缓存的) YARA 规则一次
+        rules = load_rules(rule_file, cache_dir)
+        rule_source = None
+        known = KnownGoodSet.load(known_good) if known_good else None
+        if rules is None and known is not None:
+            print("错误: --known-good 需要 yara-python 包 (pip install yara-python)。", file=sys.stderr)
+            return
+        if rules is None:
+            print("警告: 未安装 yara-python；MemProcFS 将为每个进程编译规则。", file=sys.stderr)
+            with open(rule_file, 'r') as f:
+                rule_source = f.read()
+
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS 已使用参数初始化: {vmm_args}", file=sys.stderr)
+
+        processes = resolve_processes(vmm, target)
+        if not processes:
+            print(f"错误: 没有与 '{target}' 匹配的进程。", file=sys.stderr)
+            return
+
+        journal = None
+        finished = {}
+        if jsonl_file:
+            journal = JobJournal(jsonl_file + '.journal',
+                                 {'operation': 'yara_sweep', 'image': image_identity(vmm_args), 'target': target,
+                                  'rules': rules_digest(rule_file), 'first_match': first_match,
+                                  'max_matches_per_rule': max_matches_per_rule, 'known_good': known_good},
+                                 resume)
+            finished = {pid: record for pid, record in journal.completed().items() if record['status'] == 'done'}
+            if resume and os.path.exists(jsonl_file):
+                drop_unfinished_records(jsonl_file, finished)
+            if finished:
+                print(f"继续执行: 已扫描 {len(finished)} 个进程", file=sys.stderr)
+        processes = [process for process in processes if process.pid not in finished]
+
+        print(f"正在使用 {workers} 个工作线程和 {rule_file} 中的规则扫描 {len(processes)} 个进程...", file=sys.stderr)
+
+        output = open(jsonl_file, 'a' if finished else 'w') if jsonl_file else sys.stdout
+        lock = threading.Lock()
+
+        def emit(record):
+            with lock:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+                # 进程的记录 (本条最后) 全部写入磁盘后，该进程即告完成
+                if journal and record['type'] == 'process':
+                    os.fsync(output.fileno())
+                    journal.append({'type': 'process', 'pid': record['pid'], 'status': 'done',
+                                    'matches': record['matches'], 'bytes_scanned': record['bytes_scanned'],
+                                    'bytes_skipped': record['bytes_skipped']})
+
+        total_matches = sum(record['matches'] for record in finished.values())
+        total_bytes = sum(record['bytes_scanned'] for record in finished.values())
+        total_skipped = sum(record.get('bytes_skipped', 0) for record in finished.values())
+        try:
+            matches, scanned, skipped = sweep_processes(processes, rules, emit, workers, chunk_size, overlap,
+                                                        first_match, max_matches_per_rule, known, rule_source)
+            total_matches += matches
+            total_bytes += scanned
+            total_skipped += skipped
+        finally:
+            if jsonl_file:
+                output.close()
+                journal.close()
+
+        wall_time = time.perf_counter() - start_time
+        skipped = f"，略过了 {total_skipped} 个已知良好字节" if known is not None else ""
+        print(f"扫描完成: {len(processes) + len(finished)} 个进程中共 {total_matches} 个匹配，"
+              f"{wall_time:.2f} 秒内扫描了 {total_bytes} 字节{skipped}", file=sys.stderr)
 
     except FileNotFoundError:
-        print(f"错误: 在 {rule_file} 未找到 YARA 规则文件")
+        print(f"错误: 在 {rule_file} 未找到 YARA 规则文件", file=sys.stderr)
     except Exception as e:
-        print(f"发生错误: {e}")
+        print(f"发生错误: {e}", file=sys.stderr)
 
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 4:
-        print("用法: python yara_scan_process.py <进程名或PID> <yara_rule_file> [vmm_args...]")
+        print("用法: python yara_scan_process.py <进程名或PID> <yara_rule_file> [--chunked] [--format <table|jsonl|csv|arrow>] [--output <文件>] [扫描选项...] [vmm_args...]")
+        print("      python yara_scan_process.py --sweep <PID列表|名称通配符|all> <yara_rule_file> [--workers <n>] [--jsonl <输出文件>] [--resume] [扫描选项...] [vmm_args...]")
+        print("扫描选项: [--chunk-size <字节数>] [--overlap <字节数>] [--first-match] [--max-matches-per-rule <n>] [--cache-dir <目录>] [--known-good <集合文件>]")
+        print("性能分析选项: [--api-stats <文件>] [--trace <文件>] [--profile <文件>]")
         print("示例: python yara_scan_process.py lsass.exe suspicious.yara -device memory.dmp")
+        print("示例: python yara_scan_process.py lsass.exe suspicious.yara --first-match -device memory.dmp")
+        print("示例: python yara_scan_process.py lsass.exe suspicious.yara --output matches.csv -device memory.dmp")
+        print("示例: python yara_scan_process.py --sweep all suspicious.yara --jsonl matches.jsonl -device memory.dmp")
+        print("示例: python yara_scan_process.py --sweep all suspicious.yara --jsonl matches.jsonl --resume -device memory.dmp")
+        print("示例: python yara_scan_process.py --sweep all suspicious.yara --known-good baseline.hashes -device memory.dmp")
         sys.exit(1)
 
-    process_id = sys.argv[1]
-    yara_file = sys.argv[2]
-    vmm_arguments = sys.argv[3:]
+    args = sys.argv[1:]
+    sweep_target = None
+    if args[0] == '--sweep':
+        sweep_target = args[1]
+        args = args[2:]
+
+    positional = args[:1] if sweep_target else args[:2]
+    vmm_arguments = []
+    worker_count = DEFAULT_WORKERS
+    jsonl_output = None
+    rules_cache_dir = DEFAULT_CACHE_DIR
+    chunked_scan = False
+    chunk = DEFAULT_CHUNK_SIZE
+    overlap_size = DEFAULT_OVERLAP
+    stop_at_first = False
+    max_per_rule = None
+    resume_job = False
+    known_good_file = None
+    output_format = None
+    output_path = None
+
+    # Parse arguments
+    i = len(positional)
+    while i < len(args):
+        if args[i] == '--workers' and i + 1 < len(args):
+            worker_count = int(args[i + 1])
+            i += 2
+        elif args[i] == '--jsonl' and i + 1 < len(args):
+            jsonl_output = args[i + 1]
+            i += 2
+        elif args[i] == '--cache-dir' and i + 1 < len(args):
+            rules_cache_dir = args[i + 1]
+            i += 2
+        elif args[i] == '--chunked':
+            chunked_scan = True
+            i += 1
+        elif args[i] == '--chunk-size' and i + 1 < len(args):
+            chunk = int(args[i + 1], 0)
+            i += 2
+        elif args[i] == '--overlap' and i + 1 < len(args):
+            overlap_size = int(args[i + 1], 0)
+            i += 2
+        elif args[i] == '--resume':
+            resume_job = True
+            i += 1
+        elif args[i] == '--first-match':
+            stop_at_first = True
+            i += 1
+        elif args[i] == '--max-matches-per-rule' and i + 1 < len(args):
+            max_per_rule = int(args[i + 1])
+            i += 2
+        elif args[i] == '--known-good' and i + 1 < len(args):
+            known_good_file = args[i + 1]
+            i += 2
+        elif args[i] == '--format' and i + 1 < len(args):
+            output_format = args[i + 1]
+            i += 2
+        elif args[i] == '--output' and i + 1 < len(args):
+            output_path = args[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
 
     if not vmm_arguments:
         print("错误: 需要 VMM 参数 (例如, '-device <转储路径>')。")
         sys.exit(1)
 
-    yara_scan_process(process_id, yara_file, vmm_arguments)
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"错误: 未知的输出格式 '{output_format}' (可用: {', '.join(FORMATS)})。")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if sweep_target:
+            yara_sweep(sweep_target, positional[0], vmm_arguments, worker_count, jsonl_output, rules_cache_dir,
+                       chunk, overlap_size, stop_at_first, max_per_rule, resume_job, known_good_file)
+        else:
+            # 停止条件和已知良好过滤只适用于分块扫描
+            chunked_scan = chunked_scan or stop_at_first or max_per_rule is not None or known_good_file is not None
+            yara_scan_process(positional[0], positional[1], vmm_arguments, chunked_scan, chunk, overlap_size,
+                              stop_at_first, max_per_rule, rules_cache_dir, known_good_file, output_format,
+                              output_path)
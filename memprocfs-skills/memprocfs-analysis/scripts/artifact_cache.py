@@ -0,0 +1,226 @@
+'''
+Persistent on-disk cache for artifacts extracted from a memory image.
+
+Artifacts (process lists, handle tables, parsed /sys tables, ...) are stored
+in a SQLite database, keyed by a fingerprint of the image file and the other
+MemProcFS options, the collector name, a collector version and an optional
+key. The fingerprint is computed
+from the file size, its header and a fixed number of sampled blocks, so it
+is fast even for very large images and identical for copies of the same dump.
+Bumping a collector's version invalidates its cached entries. When the cache
+grows beyond its size limit, the least recently used entries are evicted.
+
+Used by system_classification.py and list_process_handles.py; can also be
+imported by custom scripts.
+'''
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'memprocfs-skill')
+
+# Default limit of the total size of the cached artifacts (512 MiB).
+DEFAULT_MAX_SIZE = 0x20000000
+
+# Number of blocks sampled across the image for the fingerprint.
+FINGERPRINT_SAMPLES = 64
+FINGERPRINT_BLOCK_SIZE = 0x1000
+FINGERPRINT_HEADER_SIZE = 0x10000
+
+# MemProcFS options that do not change what is read from the image (verbosity,
+# console output); they are left out of the cache key.
+IGNORED_OPTIONS = ('-v', '-vv', '-vvv', '-printf', '-loglevel', '-userinteract')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS artifacts (
+    image TEXT NOT NULL,
+    collector TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (image, collector, key)
+);
+CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed);
+'''
+
+
+def device_path(vmm_args):
+    '''
+    Returns the image file passed with -device, or None if the device is not a local file.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    for i, arg in enumerate(vmm_args[:-1]):
+        if arg.lower() == '-device' and os.path.isfile(vmm_args[i + 1]):
+            return vmm_args[i + 1]
+    return None
+
+
+def image_fingerprint(image_file, samples=FINGERPRINT_SAMPLES):
+    '''
+    Returns a SHA-256 fingerprint of an image file computed from its size, its
+    header and `samples` blocks spread evenly over the file.
+
+    :param image_file: Path to the memory image.
+    :param samples: Number of sampled blocks.
+    '''
+    size = os.path.getsize(image_file)
+    sha256 = hashlib.sha256(str(size).encode('ascii'))
+    with open(image_file, 'rb') as f:
+        sha256.update(f.read(FINGERPRINT_HEADER_SIZE))
+        if size > FINGERPRINT_HEADER_SIZE:
+            step = max(FINGERPRINT_BLOCK_SIZE, (size - FINGERPRINT_BLOCK_SIZE) // samples)
+            for offset in range(FINGERPRINT_HEADER_SIZE, size, step):
+                f.seek(offset)
+                sha256.update(f.read(FINGERPRINT_BLOCK_SIZE))
+            f.seek(max(0, size - FINGERPRINT_BLOCK_SIZE))
+            sha256.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return sha256.hexdigest()
+
+
+def vmm_options(vmm_args):
+    '''
+    Returns the MemProcFS options other than -device that change what is read
+    from the image (e.g. -forensic, -pagefile0, symbol options), normalized:
+    option names are lowercased and the options sorted.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :return: A list of [option, values...] lists.
+    '''
+    options = []
+    for arg in vmm_args:
+        if arg.startswith('-') or not options:
+            options.append([arg.lower()])
+        else:
+            options[-1].append(arg)
+    return sorted(option for option in options if option[0] != '-device' and option[0] not in IGNORED_OPTIONS)
+
+
+def image_key(vmm_args):
+    '''
+    Returns the key of the artifacts extracted with the given VMM arguments:
+    the fingerprint of the image file, extended by a digest of the other
+    options (see vmm_options()) when there are any. Returns None if the image
+    is not a local file.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    image_file = device_path(vmm_args)
+    if image_file is None:
+        return None
+    key = image_fingerprint(image_file)
+    options = vmm_options(vmm_args)
+    if options:
+        key += ':' + hashlib.sha256(json.dumps(options).encode('utf-8')).hexdigest()[:16]
+    return key
+
+
+class ArtifactCache:
+    '''
+    Artifact cache for one memory image. Values are stored as zlib-compressed
+    JSON, so anything json.dump() accepts can be cached. The object may be
+    shared between threads.
+    '''
+
+    def __init__(self, image, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        '''
+        :param image: The image key, see image_key().
+        :param cache_dir: Directory holding the cache database.
+        :param max_size: The maximum total size of the cached artifacts in bytes.
+        '''
+        os.makedirs(cache_dir, exist_ok=True)
+        self.image = image
+        self.max_size = max_size
+        self.path = os.path.join(cache_dir, 'artifacts.sqlite')
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def get(self, collector, version, key=''):
+        '''
+        Returns a cached artifact, or None if it is not cached for this version.
+
+        :param collector: The collector name.
+        :param version: The collector version the artifact must have been stored with.
+        :param key: Optional key within the collector, e.g. a PID.
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT version, data FROM artifacts WHERE image = ? AND collector = ? AND key = ?',
+                                  (self.image, collector, key)).fetchone()
+            if row is None:
+                return None
+            if row[0] != str(version):
+                with self.db:
+                    self.db.execute('DELETE FROM artifacts WHERE image = ? AND collector = ? AND key = ?',
+                                    (self.image, collector, key))
+                return None
+            with self.db:
+                self.db.execute('UPDATE artifacts SET accessed = ? WHERE image = ? AND collector = ? AND key = ?',
+                                (time.time(), self.image, collector, key))
+        return json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    def put(self, collector, version, value, key=''):
+        '''
+        Stores an artifact and evicts the least recently used entries if the
+        cache exceeds its size limit.
+
+        :param collector: The collector name.
+        :param version: The collector version.
+        :param value: A JSON-serializable value.
+        :param key: Optional key within the collector, e.g. a PID.
+        '''
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (self.image, collector, key, str(version), data, len(data), now, now))
+            self._evict()
+
+    def _evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+        if total <= self.max_size:
+            return
+        for image, collector, key, size in self.db.execute(
+                'SELECT image, collector, key, size FROM artifacts ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM artifacts WHERE image = ? AND collector = ? AND key = ?',
+                            (image, collector, key))
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        '''
+        Removes every cached artifact of this image.
+        '''
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM artifacts WHERE image = ?', (self.image,))
+
+    def close(self):
+        self.db.close()
+
+
+def open_cache(vmm_args, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+    '''
+    Returns the ArtifactCache for the image in the VMM arguments, or None if the
+    image is not a local file (e.g. live memory) or the cache cannot be opened.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param cache_dir: Directory holding the cache database.
+    :param max_size: The maximum total size of the cached artifacts in bytes.
+    '''
+    try:
+        image = image_key(vmm_args)
+        if image is None:
+            return None
+        return ArtifactCache(image, cache_dir, max_size)
+    except (OSError, sqlite3.Error):
+        return None
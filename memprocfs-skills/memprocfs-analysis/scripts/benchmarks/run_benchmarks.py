@@ -0,0 +1,601 @@
+'''
+Benchmarks for the hot paths of the scripts, run offline against the
+synthetic memprocfs stand-in in this directory (see memprocfs.py).
+
+Every benchmark runs in a child process of its own, so its peak RSS is
+measured in isolation. After one untimed warm-up round the benchmark is
+repeated and the minimum and median latency, the throughput and the peak
+RSS are reported. Results can be saved as JSON and compared with an
+earlier run; the exit status is 1 when a benchmark got slower or used more
+memory than the baseline by more than the threshold.
+
+Usage: python run_benchmarks.py [--scale quick|full] [--only <name,...>] [--repeat <n>]
+           [--output <results.json>] [--compare <baseline.json>] [--threshold <percent>]
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# The synthetic memprocfs must shadow the real package, the scripts are imported as siblings.
+sys.path[:0] = [BENCHMARK_DIR, SCRIPTS_DIR]
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 20
+
+# Synthetic system shapes, passed to memprocfs.py through MEMPROCFS_SYNTHETIC.
+SCALES = {
+    'quick': 'processes=200',
+    'full': 'processes=10000,regions=64,address_space=100g,connections=50000,services=2000,'
+            'drivers=1000,timeline_rows=1000000',
+}
+
+YARA_RULE = 'rule synthetic_marker { strings: $marker = "MEMPROCFS-SYNTHETIC-MARKER" condition: $marker }\n'
+
+BENCHMARKS = {}
+
+
+class Skipped(Exception):
+    pass
+
+
+def benchmark(name, unit):
+    '''
+    Decorator registering a benchmark. The function takes the Vmm and a
+    scratch directory and returns the number of units it processed.
+
+    :param name: The benchmark name.
+    :param unit: The unit of the throughput, e.g. 'bytes' or 'handles'.
+    '''
+    def decorator(func):
+        BENCHMARKS[name] = (func, unit)
+        return func
+    return decorator
+
+
+@benchmark('dump_process_memory', 'bytes')
+def bench_dump_process_memory(vmm, workdir):
+    from dump_process_memory import write_process_dump
+    return write_process_dump(vmm.process_all()[1], os.path.join(workdir, 'process.bin'))
+
+
+@benchmark('dump_process_memory_batch', 'bytes')
+def bench_dump_process_memory_batch(vmm, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from dump_process_memory import DEFAULT_THREADS, write_process_dump
+    written = 0
+    with ThreadPoolExecutor(max_workers=DEFAULT_THREADS) as pool:
+        for process in vmm.process_all()[1:9]:
+            written += write_process_dump(process, os.path.join(workdir, f"{process.pid}.bin"), pool=pool)
+    return written
+
+
+@benchmark('compressed_dump_write', 'bytes')
+def bench_compressed_dump_write(vmm, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from compressed_dump import write_compressed_dump
+    from dump_process_memory import DEFAULT_THREADS
+    # Mostly zero pages, like a real address space
+    vmm.options['zero_pages'] = 75
+    written = 0
+    with ThreadPoolExecutor(max_workers=DEFAULT_THREADS) as pool:
+        for process in vmm.process_all()[1:9]:
+            written += write_compressed_dump(process, os.path.join(workdir, f"{process.pid}.cdmp"), pool=pool)[0]
+    return written
+
+
+@benchmark('compressed_dump_read', 'reads')
+def bench_compressed_dump_read(vmm, workdir):
+    import random
+    from compressed_dump import CompressedDump, write_compressed_dump
+    dump_file = os.path.join(workdir, 'process.cdmp')
+    if not os.path.exists(dump_file):
+        # Written once in the warm-up round; the timed rounds measure the random reads only
+        vmm.options['zero_pages'] = 75
+        write_compressed_dump(vmm.process_all()[1], dump_file)
+    rng = random.Random(1)
+    with CompressedDump(dump_file) as dump:
+        regions = dump.regions()
+        for _ in range(10000):
+            base, size = regions[rng.randrange(len(regions))]
+            dump.read(base + rng.randrange(size) // 0x1000 * 0x1000, 0x1000)
+    return 10000
+
+
+@benchmark('yara_scan_chunked', 'bytes')
+def bench_yara_scan_chunked(vmm, workdir):
+    from yara_rules import load_rules, scan_process
+    rule_file = os.path.join(workdir, 'marker.yara')
+    with open(rule_file, 'w') as f:
+        f.write(YARA_RULE)
+    rules = load_rules(rule_file, os.path.join(workdir, 'yara-cache'))
+    if rules is None:
+        raise Skipped('yara-python is not installed')
+    stats = {}
+    matches = sum(1 for _ in scan_process(vmm.process_all()[1], rules, stats=stats))
+    if not matches:
+        raise RuntimeError('no synthetic markers found')
+    return stats['bytes_scanned']
+
+
+@benchmark('region_hashes_build', 'bytes')
+def bench_region_hashes_build(vmm, workdir):
+    from concurrent.futures import ThreadPoolExecutor
+    from region_hashes import DEFAULT_THREADS, KnownGoodSet, iter_process_digests
+    known = KnownGoodSet()
+    hashed = 0
+    with ThreadPoolExecutor(max_workers=DEFAULT_THREADS) as pool:
+        for process in vmm.process_all()[1:9]:
+            for digests in iter_process_digests(process, known.hasher, pool):
+                known.update(digests)
+                hashed += len(digests) * 0x1000
+    return hashed
+
+
+@benchmark('yara_scan_known_good', 'bytes')
+def bench_yara_scan_known_good(vmm, workdir):
+    from region_hashes import KnownGoodSet, iter_process_digests
+    from yara_rules import load_rules, scan_process
+    # Most pages are shared image pages or zero pages, like a real address space
+    vmm.options['shared_pages'] = 60
+    vmm.options['zero_pages'] = 10
+    set_file = os.path.join(workdir, 'baseline.hashes')
+    if not os.path.exists(set_file):
+        # Built once in the warm-up round from other processes; the timed rounds measure the filtered scan
+        known = KnownGoodSet()
+        for process in vmm.process_all()[2:10]:
+            for digests in iter_process_digests(process, known.hasher):
+                known.update(digests)
+        known.save(set_file)
+    rule_file = os.path.join(workdir, 'marker.yara')
+    with open(rule_file, 'w') as f:
+        f.write(YARA_RULE)
+    rules = load_rules(rule_file, os.path.join(workdir, 'yara-cache'))
+    if rules is None:
+        raise Skipped('yara-python is not installed')
+    stats = {}
+    for _ in scan_process(vmm.process_all()[1], rules, stats=stats, known=KnownGoodSet.load(set_file)):
+        pass
+    if not stats.get('bytes_skipped'):
+        raise RuntimeError('no known-good pages skipped')
+    # Counted like yara_scan_chunked, as the bytes of the process covered by the scan
+    return stats['bytes_scanned'] + stats['bytes_skipped']
+
+
+@benchmark('list_process_handles', 'handles')
+def bench_list_process_handles(vmm, workdir):
+    from list_process_handles import collect_process_handles
+    return sum(len(collect_process_handles(vmm, process.pid)['handles']) for process in vmm.process_all()[:50])
+
+
+def handle_records(vmm):
+    from list_process_handles import collect_process_handles, handle_records
+    return [record for process in vmm.process_all()[:50]
+            for record in handle_records(collect_process_handles(vmm, process.pid))]
+
+
+@benchmark('result_writers_text', 'records')
+def bench_result_writers_text(vmm, workdir):
+    from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+    from result_writers import open_writer
+    records = handle_records(vmm)
+    for fmt in ('table', 'jsonl', 'csv'):
+        with open_writer(fmt, os.path.join(workdir, f"handles.{fmt}"), HANDLE_FIELDS, HANDLE_TYPES) as out:
+            out.write_many(records)
+    return 3 * len(records)
+
+
+@benchmark('result_writers_arrow', 'records')
+def bench_result_writers_arrow(vmm, workdir):
+    from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+    from result_writers import open_writer, pyarrow
+    if pyarrow is None:
+        raise Skipped('pyarrow is not installed')
+    records = handle_records(vmm)
+    with open_writer('arrow', os.path.join(workdir, 'handles.arrow'), HANDLE_FIELDS, HANDLE_TYPES) as out:
+        out.write_many(records)
+    return len(records)
+
+
+@benchmark('handle_table', 'handles')
+def bench_handle_table(vmm, workdir):
+    from handle_table import harvest_handles
+    table, errors = harvest_handles(vmm)
+    table.find_by_prefix('\\BaseNamedObjects\\')
+    return len(table)
+
+
+@benchmark('process_tree', 'processes')
+def bench_process_tree(vmm, workdir):
+    from process_tree import collect_process_graph
+    graph = collect_process_graph(vmm)
+    graph.spawned_by('explorer.exe')
+    graph.suspicious()
+    graph.to_dict()
+    return len(graph)
+
+
+@benchmark('lazy_processes', 'processes')
+def bench_lazy_processes(vmm, workdir):
+    from lazy_processes import LazyProcessTable
+    # The work before the first screen of system_classification.py
+    table = LazyProcessTable(vmm)
+    for process in table.first(10):
+        process.name, process.ppid
+    return len(table)
+
+
+@benchmark('dump_modules', 'modules')
+def bench_dump_modules(vmm, workdir):
+    from dump_modules import dump_modules
+    output_dir = os.path.join(workdir, 'modules')
+    shutil.rmtree(output_dir, ignore_errors=True)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        dump_modules('all', output_dir, ['-device', 'synthetic'])
+    with open(os.path.join(output_dir, 'manifest.json')) as f:
+        return len(json.load(f)['references'])
+
+
+@benchmark('system_classification', 'rows')
+def bench_system_classification(vmm, workdir):
+    from system_classification import run_collectors
+    results, stages = run_collectors(vmm)
+    failed = [name for name, stage in stages.items() if stage['status'] != 'ok']
+    if failed:
+        raise RuntimeError(f"collectors failed: {', '.join(failed)}")
+    return sum(value['count'] if isinstance(value, dict) and 'count' in value else 1 for value in results.values())
+
+
+@benchmark('scan_physical_memory', 'bytes')
+def bench_scan_physical_memory(vmm, workdir):
+    from concurrent.futures import ProcessPoolExecutor
+    from scan_physical_memory import (DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, _init_worker, iter_batches,
+                                      iter_dump_hits)
+    import memprocfs
+    dump_file = os.path.join(workdir, 'physical.raw')
+    ranges = [(0, vmm.options['physical_memory'])]
+    if not os.path.exists(dump_file):
+        # Written once in the warm-up round; the timed rounds measure the scan only
+        with open(dump_file, 'wb') as f:
+            for start, end, _ in iter_batches(ranges, DEFAULT_BATCH_SIZE, 0):
+                f.write(vmm.memory.read(start, end - start, memprocfs.FLAG_ZEROPAD_ON_FAIL))
+    literals = [('string', memprocfs.MARKER), ('string', b'mimikatz'), ('wide', 'mimikatz'.encode('utf-16-le'))]
+    with ProcessPoolExecutor(max_workers=DEFAULT_WORKERS, initializer=_init_worker,
+                             initargs=(None, None, literals, dump_file)) as pool:
+        hits = sum(len(batch_hits) for _, batch_hits in iter_dump_hits(pool, list(iter_batches(ranges))))
+    if not hits:
+        raise RuntimeError('no synthetic markers found')
+    return ranges[0][1]
+
+
+@benchmark('sys_parsers_netstat', 'rows')
+def bench_sys_parsers_netstat(vmm, workdir):
+    from sys_parsers import iter_records
+    return sum(1 for _ in iter_records(vmm, 'network_connections'))
+
+
+@benchmark('network_analytics', 'connections')
+def bench_network_analytics(vmm, workdir):
+    import network_analytics
+    from network_analytics import NetworkTable, ProcessTable, rare_remotes, top_talkers
+    from sys_parsers import iter_records
+    if network_analytics.numpy is None:
+        raise Skipped('numpy is not installed')
+    table = NetworkTable.from_records(iter_records(vmm, 'network_connections'))
+    processes = ProcessTable(vmm.process_all())
+    top_talkers(table, processes, threshold=20)
+    rare_remotes(table, processes)
+    return len(table)
+
+
+# Number of hosts stored in the fleet index benchmark.
+FLEET_HOSTS = 10
+
+
+@benchmark('fleet_index', 'observations')
+def bench_fleet_index(vmm, workdir):
+    from fleet_triage import FleetIndex, iter_observations
+    from system_classification import build_report, run_collectors
+    from handle_table import harvest_handles
+    observation_file = os.path.join(workdir, 'observations.json')
+    if not os.path.exists(observation_file):
+        # Collected once in the warm-up round; the timed rounds measure the index only
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            results, stages = run_collectors(vmm, ['processes', 'network_connections', 'services', 'drivers', 'users'])
+        handles, _ = harvest_handles(vmm)
+        with open(observation_file, 'w') as f:
+            json.dump(sorted(set(iter_observations(build_report(results, stages, 0), handles))), f)
+    with open(observation_file) as f:
+        observations = json.load(f)
+    index_file = os.path.join(workdir, 'fleet_index.sqlite')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(index_file + suffix):
+            os.remove(index_file + suffix)
+    index = FleetIndex(index_file)
+    for host in range(FLEET_HOSTS):
+        index.store({'host': f"host{host:02d}", 'image': f"host{host:02d}.dmp", 'status': 'ok'}, observations)
+    for kind, value, _, _ in observations[::100]:
+        index.lookup(kind, value)
+    index.close()
+    return len(observations) * FLEET_HOSTS
+
+
+# The snapshot of the previous poll, taken in the warm-up round.
+_previous_snapshot = []
+
+
+@benchmark('triage_diff_poll', 'processes')
+def bench_triage_diff_poll(vmm, workdir):
+    import memprocfs
+    from triage_diff import take_snapshot
+    # Each refresh changes 5% of the processes; a path or command line read takes 50 us
+    vmm.options.update(churn=5, attribute_cost=50)
+    if not _previous_snapshot:
+        _previous_snapshot.append(take_snapshot(vmm)[0])
+    vmm.set_config(memprocfs.OPT_REFRESH_ALL, 1)
+    snapshot, _, errors = take_snapshot(vmm, _previous_snapshot[0])
+    if errors:
+        raise RuntimeError(f"processes failed: {len(errors)}")
+    _previous_snapshot[0] = snapshot
+    return len(snapshot.processes)
+
+
+@benchmark('triage_diff_merge', 'records')
+def bench_triage_diff_merge(vmm, workdir):
+    import memprocfs
+    from triage_diff import Snapshot, diff_snapshots, take_snapshot
+    old_file, new_file = os.path.join(workdir, 'old.snapshot'), os.path.join(workdir, 'new.snapshot')
+    if not os.path.exists(new_file):
+        # Taken once in the warm-up round; the timed rounds measure loading and comparing them
+        vmm.options['churn'] = 5
+        take_snapshot(vmm)[0].save(old_file)
+        vmm.set_config(memprocfs.OPT_REFRESH_ALL, 1)
+        take_snapshot(vmm)[0].save(new_file)
+    old, new = Snapshot.load(old_file), Snapshot.load(new_file)
+    changes = diff_snapshots(old, new)
+    if not changes['handles']:
+        raise RuntimeError('no changes found')
+    return sum(old.counts().values()) + sum(new.counts().values())
+
+
+@benchmark('harvest_process_vfs', 'rows')
+def bench_harvest_process_vfs(vmm, workdir):
+    import asyncio
+    from harvest_process_vfs import ARTIFACTS, JsonlSink, harvest_async
+    # A /pid/ read or listing takes 500 us, like the page table walks in the native library
+    vmm.options['vfs_cost'] = 500
+    sink = JsonlSink(os.path.join(workdir, 'processes.jsonl'))
+    try:
+        counts, errors = asyncio.run(harvest_async(vmm, sink, list(ARTIFACTS), vmm.pid_list()))
+    finally:
+        sink.close()
+    if errors:
+        raise RuntimeError(f"reads failed: {len(errors)}")
+    return sum(counts.values())
+
+
+@benchmark('vfs_stream_timeline', 'bytes')
+def bench_vfs_stream_timeline(vmm, workdir):
+    from vfs_stream import iter_lines
+    return sum(len(line) + 1 for line in iter_lines(vmm, '/forensic/timeline/timeline.csv', encoding=None))
+
+
+@benchmark('timeline_query', 'events')
+def bench_timeline_query(vmm, workdir):
+    from timeline_query import INDEX_NAME, TimelineIndex, build_timeline
+    if not os.path.exists(os.path.join(workdir, INDEX_NAME)):
+        # Built once in the warm-up round; the timed rounds measure queries only
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            build_timeline(workdir, ['-device', 'synthetic'])
+    events = 0
+    with TimelineIndex(workdir) as index:
+        start = index.meta['first']
+        pid = index.meta['pids'][len(index.meta['pids']) // 2]
+        for hour in range(24):
+            for position in index.positions(start + hour * 3600, start + hour * 3600 + 600, ['PROC', 'NET'], [pid]):
+                index.read_event(position)
+                events += 1
+            events += sum(1 for _ in index.positions(start + hour * 3600, start + hour * 3600 + 60))
+    return events
+
+
+def peak_rss():
+    '''
+    Returns the peak resident set size of this process in bytes, or None if it cannot be measured.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_child(name, repeat):
+    '''
+    Runs one benchmark in this process and prints its result as a JSON line.
+    '''
+    import memprocfs
+    func, unit = BENCHMARKS[name]
+    workdir = tempfile.mkdtemp(prefix='memprocfs-bench-')
+    try:
+        vmm = memprocfs.Vmm(['-device', 'synthetic'])
+        result = {'name': name, 'unit': unit}
+        try:
+            func(vmm, workdir)
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                units = func(vmm, workdir)
+                latencies.append(time.perf_counter() - start)
+        except Skipped as e:
+            result['skipped'] = str(e)
+        else:
+            median = statistics.median(latencies)
+            result.update({'units': units, 'min': min(latencies), 'median': median,
+                           'throughput': units / median if median > 0 else None, 'peak_rss': peak_rss()})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def run_benchmark(name, scale, repeat):
+    '''
+    Runs one benchmark in a child process and returns its result dict.
+    '''
+    env = dict(os.environ, MEMPROCFS_SYNTHETIC=SCALES[scale])
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, '--repeat', str(repeat)],
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ['exit status %d' % completed.returncode])[-1]
+        return {'name': name, 'error': error}
+    return json.loads(lines[-1])
+
+
+def format_size(value):
+    for suffix in ('', 'K', 'M', 'G'):
+        if abs(value) < 1024 or suffix == 'G':
+            return f"{value:.1f}{suffix}" if suffix else f"{value:.0f}"
+        value /= 1024.0
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns the regressions of results against a baseline as a list of messages.
+
+    :param results: The benchmark results of this run, by name.
+    :param baseline: The benchmark results of the baseline run, by name.
+    :param threshold: The allowed slowdown or memory growth in percent.
+    '''
+    regressions = []
+    limit = 1 + threshold / 100.0
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or 'median' not in base or 'median' not in result:
+            continue
+        if result['median'] > base['median'] * limit:
+            regressions.append(f"{name}: median latency {result['median']:.3f}s vs {base['median']:.3f}s")
+        if result.get('peak_rss') and base.get('peak_rss') and result['peak_rss'] > base['peak_rss'] * limit:
+            regressions.append(f"{name}: peak RSS {format_size(result['peak_rss'])}B "
+                               f"vs {format_size(base['peak_rss'])}B")
+    return regressions
+
+
+def run_benchmarks(scale='quick', names=None, repeat=DEFAULT_REPEAT, output_file=None, baseline_file=None,
+                   threshold=DEFAULT_THRESHOLD):
+    '''
+    Runs the benchmarks and prints a summary table.
+
+    :param scale: A key of SCALES.
+    :param names: Optional list of benchmark names; defaults to all benchmarks.
+    :param repeat: The number of timed rounds per benchmark.
+    :param output_file: Optional path to save the results as JSON.
+    :param baseline_file: Optional path of earlier results to compare with.
+    :param threshold: The allowed slowdown or memory growth in percent.
+    :return: True if no benchmark failed or regressed.
+    '''
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Error: Unknown benchmarks: {', '.join(unknown)} (available: {', '.join(BENCHMARKS)})")
+        return False
+
+    print(f"Running {len(names)} benchmarks at scale '{scale}' ({SCALES[scale]}), {repeat} rounds each")
+    print(f"{'benchmark':<28} {'min':>9} {'median':>9} {'throughput':>16} {'peak RSS':>9}")
+    results = {}
+    ok = True
+    for name in names:
+        result = results[name] = run_benchmark(name, scale, repeat)
+        if 'error' in result:
+            print(f"{name:<28} failed: {result['error']}")
+            ok = False
+        elif 'skipped' in result:
+            print(f"{name:<28} skipped: {result['skipped']}")
+        else:
+            throughput = f"{format_size(result['throughput'])} {result['unit']}/s" if result['throughput'] else '-'
+            rss = format_size(result['peak_rss']) + 'B' if result['peak_rss'] else '-'
+            print(f"{name:<28} {result['min']:>8.3f}s {result['median']:>8.3f}s {throughput:>16} {rss:>9}")
+
+    report = {'scale': scale, 'options': SCALES[scale], 'python': sys.version.split()[0], 'results': results}
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output_file}")
+
+    if baseline_file:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != scale:
+            print(f"Warning: The baseline was recorded at scale '{baseline.get('scale')}'")
+        regressions = compare(results, baseline.get('results', {}), threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions beyond {threshold}%:")
+            for regression in regressions:
+                print(f"- {regression}")
+            ok = False
+        else:
+            print(f"\nNo regressions beyond {threshold}% against {baseline_file}")
+    return ok
+
+
+if __name__ == "__main__":
+    scale_name = 'quick'
+    selected = None
+    rounds = DEFAULT_REPEAT
+    output = None
+    baseline_path = None
+    allowed = DEFAULT_THRESHOLD
+    child = None
+
+    # Parse arguments
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--scale' and i + 1 < len(sys.argv):
+            scale_name = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--only' and i + 1 < len(sys.argv):
+            selected = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--repeat' and i + 1 < len(sys.argv):
+            rounds = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
+            output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--compare' and i + 1 < len(sys.argv):
+            baseline_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--threshold' and i + 1 < len(sys.argv):
+            allowed = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--child' and i + 1 < len(sys.argv):
+            child = sys.argv[i + 1]
+            i += 2
+        else:
+            print("Usage: python run_benchmarks.py [--scale quick|full] [--only <name,...>] [--repeat <n>]")
+            print("           [--output <results.json>] [--compare <baseline.json>] [--threshold <percent>]")
+            print(f"Benchmarks: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+
+    if child:
+        run_child(child, rounds)
+        sys.exit(0)
+
+    if scale_name not in SCALES:
+        print(f"Error: Unknown scale '{scale_name}' (available: {', '.join(SCALES)})")
+        sys.exit(1)
+
+    sys.exit(0 if run_benchmarks(scale_name, selected, rounds, output, baseline_path, allowed) else 1)
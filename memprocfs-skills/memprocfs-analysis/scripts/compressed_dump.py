@@ -0,0 +1,390 @@
+'''
+Compressed, seekable process memory dumps.
+
+A raw dump costs as much disk space and I/O as the mapped address space, even
+though most of it is usually zero pages or compresses well. The compressed
+format stores the mapped regions as independently compressed frames of at
+most one read chunk each, and records runs of zero pages as sparse index
+entries without any data. An index at the end of the file maps every frame to
+its virtual address, so a reader decompresses only the frames a read touches.
+
+File layout (little-endian):
+
+    header   MAGIC, format version, codec id
+    frames   the compressed frames, one after another
+    index    zlib-compressed JSON: pid, name, codec and one
+             [va, size, file offset, compressed size] entry per frame,
+             sorted by va; a compressed size of 0 marks a run of zero pages
+    footer   index offset, index size, MAGIC
+
+Frames are compressed with zstd when the optional zstandard package is
+installed (pip install zstandard) and with zlib otherwise; both release the
+GIL, so the frames are compressed on the thread pool that reads memory. Used
+by dump_process_memory.py (--compress); the reader can also be imported by
+custom scripts:
+
+    with CompressedDump('lsass.cdmp') as dump:
+        data = dump.read(0x7ff6a0000000, 0x1000)
+
+Usage: python compressed_dump.py <dump_file>
+       python compressed_dump.py <dump_file> --read <address> <size> [--output <file>]
+       python compressed_dump.py <dump_file> --extract <output_file> [--sparse]
+'''
+
+import sys
+import json
+import zlib
+import struct
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from memory_regions import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_INFLIGHT, PAGE_SIZE, get_memory_regions,
+                            iter_region_chunks, iter_region_chunks_parallel)
+from region_hashes import iter_unknown_chunks
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'MPFSCDMP'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+FOOTER = struct.Struct('<QQ8s')
+
+# Codec ids in the header, by index.
+CODECS = ('zlib', 'zstd')
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'zlib'
+DEFAULT_LEVELS = {'zlib': 1, 'zstd': 3}
+
+# Number of decompressed frames a reader keeps.
+DEFAULT_CACHE_FRAMES = 16
+
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+
+def _compressor(codec, level=None):
+    '''
+    Returns a thread-safe function compressing one frame.
+    '''
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == 'zlib':
+        return lambda data: zlib.compress(data, level)
+    if zstandard is None:
+        raise RuntimeError("zstd compression requires zstandard (pip install zstandard)")
+    # A ZstdCompressor must not be used by two threads at once
+    local = threading.local()
+
+    def compress(data):
+        compressor = getattr(local, 'compressor', None)
+        if compressor is None:
+            compressor = local.compressor = zstandard.ZstdCompressor(level=level)
+        return compressor.compress(data)
+    return compress
+
+
+def _decompressor(codec):
+    if codec == 'zlib':
+        return zlib.decompress
+    if zstandard is None:
+        raise RuntimeError("reading zstd dumps requires zstandard (pip install zstandard)")
+    return zstandard.ZstdDecompressor().decompress
+
+
+def compress_chunk(compress, address, data):
+    '''
+    Splits a chunk into runs of zero and non-zero pages and compresses each non-zero run.
+
+    :param compress: A function returned by _compressor().
+    :param address: The virtual address of the chunk.
+    :param data: The chunk data.
+    :return: A list of (va, size, compressed data) tuples; the data is None for zero pages.
+    '''
+    if data == bytes(len(data)):
+        return [(address, len(data), None)]
+    frames = []
+    start = 0
+    zero = data[:PAGE_SIZE] == ZERO_PAGE
+    for offset in range(PAGE_SIZE, len(data), PAGE_SIZE):
+        page_zero = data[offset:offset + PAGE_SIZE] == ZERO_PAGE
+        if page_zero != zero:
+            frames.append((address + start, offset - start, None if zero else compress(data[start:offset])))
+            start, zero = offset, page_zero
+    frames.append((address + start, len(data) - start, None if zero else compress(data[start:])))
+    return frames
+
+
+def write_compressed_dump(process, output_file, chunk_size=DEFAULT_CHUNK_SIZE, pool=None,
+                          max_inflight=DEFAULT_MAX_INFLIGHT, codec=DEFAULT_CODEC, level=None, known=None, stats=None):
+    '''
+    Streams the mapped regions of a process to a compressed dump file.
+
+    With a pool the chunks are read and compressed on its threads ahead of the
+    writer; the bytes being compressed are capped by max_inflight in addition
+    to the read-ahead.
+
+    :param process: A memprocfs process object.
+    :param output_file: The path to save the compressed dump.
+    :param chunk_size: The maximum number of bytes read and compressed at once.
+    :param pool: Optional thread pool used to read and compress chunks ahead of the writer.
+    :param max_inflight: The maximum number of bytes read ahead or compressed ahead when a pool is used.
+    :param codec: 'zstd' or 'zlib'.
+    :param level: Optional compression level; defaults to a fast level of the codec.
+    :param known: Optional KnownGoodSet of pages that are not written (see region_hashes.py).
+    :param stats: Optional dict; its 'bytes_skipped' entry is updated with the known-good bytes left out.
+    :return: A (bytes dumped, bytes stored) tuple, or None if the process has no mapped regions.
+    '''
+    regions = get_memory_regions(process)
+    if not regions:
+        return None
+
+    compress = _compressor(codec, level)
+    if known is not None:
+        source = iter_unknown_chunks(process, known, pool, regions, chunk_size, max_inflight, stats)
+    elif pool:
+        source = iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight)
+    else:
+        source = iter_region_chunks(process, regions, chunk_size)
+    if pool:
+        def compressed_chunks():
+            # Chunks are compressed concurrently and written in address order
+            pending = deque()
+            inflight = 0
+            for address, data in source:
+                while pending and inflight + len(data) > max_inflight:
+                    size, future = pending.popleft()
+                    inflight -= size
+                    yield size, future.result()
+                pending.append((len(data), pool.submit(compress_chunk, compress, address, data)))
+                inflight += len(data)
+            while pending:
+                size, future = pending.popleft()
+                yield size, future.result()
+        chunks = compressed_chunks()
+    else:
+        chunks = ((len(data), compress_chunk(compress, address, data)) for address, data in source)
+
+    index = []
+    written = 0
+    with open(output_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS.index(codec)))
+        offset = HEADER.size
+        for size, frames in chunks:
+            written += size
+            for va, frame_size, payload in frames:
+                if payload is not None:
+                    index.append([va, frame_size, offset, len(payload)])
+                    f.write(payload)
+                    offset += len(payload)
+                elif index and index[-1][3] == 0 and index[-1][0] + index[-1][1] == va:
+                    index[-1][1] += frame_size
+                else:
+                    index.append([va, frame_size, 0, 0])
+        blob = zlib.compress(json.dumps({'pid': process.pid, 'name': process.name, 'codec': codec,
+                                         'frames': index}).encode('utf-8'))
+        f.write(blob)
+        f.write(FOOTER.pack(offset, len(blob), MAGIC))
+    return written, offset + len(blob) + FOOTER.size
+
+
+class CompressedDump:
+    '''
+    Random access to a compressed dump by virtual address. Only the frames a
+    read touches are decompressed; the most recently used ones are cached.
+    '''
+
+    def __init__(self, path, cache_frames=DEFAULT_CACHE_FRAMES):
+        '''
+        :param path: Path of a file written by write_compressed_dump().
+        :param cache_frames: The number of decompressed frames kept.
+        '''
+        self.path = path
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+        try:
+            magic, version, codec = HEADER.unpack(self._file.read(HEADER.size))
+            self._file.seek(-FOOTER.size, 2)
+            index_offset, index_size, end_magic = FOOTER.unpack(self._file.read(FOOTER.size))
+            if magic != MAGIC or end_magic != MAGIC:
+                raise ValueError(f"{path} is not a compressed dump")
+            if version != VERSION:
+                raise ValueError(f"{path} has format version {version}, expected {VERSION}")
+            self._file.seek(index_offset)
+            index = json.loads(zlib.decompress(self._file.read(index_size)).decode('utf-8'))
+        except Exception:
+            self._file.close()
+            raise
+        self.pid = index['pid']
+        self.name = index['name']
+        self.codec = CODECS[codec]
+        self.frames = index['frames']
+        self._starts = [frame[0] for frame in self.frames]
+        self._decompress = _decompressor(self.codec)
+        self._cache = OrderedDict()
+        self._cache_frames = cache_frames
+
+    def regions(self):
+        '''
+        Returns the mapped regions as a sorted list of (base, size) tuples, like get_memory_regions().
+        '''
+        regions = []
+        for va, size, _, _ in self.frames:
+            if regions and regions[-1][0] + regions[-1][1] == va:
+                regions[-1] = (regions[-1][0], regions[-1][1] + size)
+            else:
+                regions.append((va, size))
+        return regions
+
+    def _frame(self, i):
+        data = self._cache.get(i)
+        if data is not None:
+            self._cache.move_to_end(i)
+            return data
+        _, _, offset, compressed_size = self.frames[i]
+        self._file.seek(offset)
+        data = self._decompress(self._file.read(compressed_size))
+        self._cache[i] = data
+        if len(self._cache) > self._cache_frames:
+            self._cache.popitem(last=False)
+        return data
+
+    def read(self, address, size):
+        '''
+        Reads virtual memory from the dump. Zero pages and unmapped addresses read as zeros.
+
+        :param address: The virtual address to read from.
+        :param size: The number of bytes to read.
+        '''
+        out = bytearray(size)
+        end = address + size
+        with self._lock:
+            for i in range(max(0, bisect_right(self._starts, address) - 1), len(self.frames)):
+                va, frame_size, _, compressed_size = self.frames[i]
+                if va >= end:
+                    break
+                low, high = max(address, va), min(end, va + frame_size)
+                if low < high and compressed_size:
+                    out[low - address:high - address] = self._frame(i)[low - va:high - va]
+        return bytes(out)
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        Yields (address, data) tuples covering every mapped region, like iter_region_chunks().
+        '''
+        for base, size in self.regions():
+            for offset in range(0, size, chunk_size):
+                length = min(chunk_size, size - offset)
+                yield base + offset, self.read(base + offset, length)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def hexdump(address, data):
+    '''
+    Yields the lines of a hex dump of data, 16 bytes per line.
+    '''
+    for offset in range(0, len(data), 16):
+        line = data[offset:offset + 16]
+        text = ''.join(chr(byte) if 32 <= byte < 127 else '.' for byte in line)
+        yield f"{address + offset:016x}  {' '.join(f'{byte:02x}' for byte in line):<47}  {text}"
+
+
+def show_dump(dump_file, read_range=None, output_file=None, extract_file=None, sparse=False):
+    '''
+    Prints a summary of a compressed dump, reads an address range from it or extracts it to a raw dump.
+
+    :param dump_file: Path of the compressed dump.
+    :param read_range: Optional (address, size) to read.
+    :param output_file: Optional file the read range is written to instead of printed as a hex dump.
+    :param extract_file: Optional path of a raw dump to extract the whole dump to.
+    :param sparse: Extract regions at their virtual address instead of packing them.
+    '''
+    try:
+        with CompressedDump(dump_file) as dump:
+            if read_range:
+                data = dump.read(*read_range)
+                if output_file:
+                    with open(output_file, 'wb') as f:
+                        f.write(data)
+                    print(f"Wrote {len(data)} bytes at {read_range[0]:#x} to {output_file}")
+                else:
+                    for line in hexdump(read_range[0], data):
+                        print(line)
+                return
+
+            if extract_file:
+                index = []
+                written = 0
+                with open(extract_file, 'wb') as f:
+                    for address, data in dump.iter_chunks():
+                        if sparse:
+                            f.seek(address)
+                        elif index and index[-1]['va'] + index[-1]['size'] == address:
+                            index[-1]['size'] += len(data)
+                        else:
+                            index.append({'va': address, 'size': len(data), 'offset': written})
+                        f.write(data)
+                        written += len(data)
+                if not sparse:
+                    with open(extract_file + '.regions.json', 'w') as f:
+                        json.dump({'pid': dump.pid, 'name': dump.name, 'regions': index}, f, indent=2)
+                print(f"Extracted {written} bytes of {dump.name} (PID: {dump.pid}) to {extract_file}")
+                return
+
+            regions = dump.regions()
+            mapped = sum(size for _, size in regions)
+            zero = sum(frame[1] for frame in dump.frames if not frame[3])
+            stored = sum(frame[3] for frame in dump.frames)
+            print(f"Process: {dump.name} (PID: {dump.pid})")
+            print(f"Codec: {dump.codec}, {len(dump.frames)} frames in {len(regions)} regions")
+            print(f"Mapped: {mapped} bytes, of which {zero} bytes are zero pages")
+            print(f"Stored: {stored} bytes of frame data ({stored / mapped * 100 if mapped else 0:.1f}% of mapped)")
+            for base, size in regions[:20]:
+                print(f"  {base:#018x} - {base + size:#018x}  {size} bytes")
+            if len(regions) > 20:
+                print(f"  ... {len(regions) - 20} more regions")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python compressed_dump.py <dump_file>")
+        print("       python compressed_dump.py <dump_file> --read <address> <size> [--output <file>]")
+        print("       python compressed_dump.py <dump_file> --extract <output_file> [--sparse]")
+        print("Example: python compressed_dump.py dumps/lsass.exe_672.cdmp --read 0x7ff6a0000000 0x100")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    range_to_read = None
+    read_output = None
+    extract_output = None
+    sparse_output = False
+
+    # Parse arguments
+    i = 1
+    while i < len(args):
+        if args[i] == '--read' and i + 2 < len(args):
+            range_to_read = (int(args[i + 1], 0), int(args[i + 2], 0))
+            i += 3
+        elif args[i] == '--output' and i + 1 < len(args):
+            read_output = args[i + 1]
+            i += 2
+        elif args[i] == '--extract' and i + 1 < len(args):
+            extract_output = args[i + 1]
+            i += 2
+        elif args[i] == '--sparse':
+            sparse_output = True
+            i += 1
+        else:
+            print(f"Error: Unknown argument '{args[i]}'.")
+            sys.exit(1)
+
+    show_dump(args[0], range_to_read, read_output, extract_output, sparse_output)
@@ -0,0 +1,189 @@
+'''
+This script extracts the loaded modules (the main executable and its DLLs) of
+one or more processes, storing every unique module image only once.
+
+Each module is first fingerprinted by its full path, its image size and the
+TimeDateStamp and CheckSum of its PE header, which are read from process memory
+without touching the module file. Only the first occurrence of a fingerprint is
+read from /pid/<pid>/modules/<module>/pefile.dll, hashed while it is streamed
+to disk and stored content-addressed as 'objects/<sha256[:2]>/<sha256>'. Every
+later occurrence, e.g. ntdll.dll in each process, is only recorded as a
+reference in 'manifest.json'.
+
+Usage: python dump_modules.py <pid_list|name_glob|all> <output_dir> [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from vfs_stream import DEFAULT_BUFFER_SIZE, open_vfs
+from dump_process_memory import resolve_processes
+import sys
+import os
+import json
+import time
+import struct
+import hashlib
+import tempfile
+import memprocfs
+
+# Number of bytes read from the start of a module to parse its PE header.
+PE_HEADER_SIZE = 0x400
+
+def read_pe_header(process, module):
+    '''
+    Reads the TimeDateStamp and CheckSum of a module's PE header from process memory.
+
+    :param process: A memprocfs process object.
+    :param module: A memprocfs module object of the process.
+    :return: A (timestamp, checksum) tuple; (None, None) if the header is not readable.
+    '''
+    header = process.memory.read(module.base, PE_HEADER_SIZE, memprocfs.FLAG_ZEROPAD_ON_FAIL)
+    if header[:2] != b'MZ':
+        return None, None
+    pe_offset = struct.unpack_from('<I', header, 0x3c)[0]
+    # Signature (4) + file header (20) + optional header up to CheckSum (68)
+    if pe_offset + 0x5c > len(header) or header[pe_offset:pe_offset + 4] != b'PE\0\0':
+        return None, None
+    timestamp = struct.unpack_from('<I', header, pe_offset + 8)[0]
+    checksum = struct.unpack_from('<I', header, pe_offset + 0x58)[0]
+    return timestamp, checksum
+
+def module_fingerprint(process, module):
+    '''
+    Returns the fingerprint identifying a module image across processes.
+
+    :param process: A memprocfs process object.
+    :param module: A memprocfs module object of the process.
+    :return: A (lowercase path, image size, timestamp, checksum) tuple.
+    '''
+    timestamp, checksum = read_pe_header(process, module)
+    path = getattr(module, 'fullname', None) or module.name
+    return path.lower(), module.image_size, timestamp, checksum
+
+def store_object(vmm, vfs_path, objects_dir, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    Streams a VFS file into the content-addressed object store.
+
+    The file is written to a temporary file while it is hashed and then moved
+    to 'objects/<sha256[:2]>/<sha256>'. If an object with the same content is
+    already stored, the temporary file is discarded.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param vfs_path: The VFS path of the file.
+    :param objects_dir: The root directory of the object store.
+    :param buffer_size: The number of bytes read from the VFS at once.
+    :return: A (sha256, size, stored) tuple; stored is False if the object already existed.
+    '''
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, temp_file = tempfile.mkstemp(dir=objects_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f, open_vfs(vmm, vfs_path, buffer_size) as source:
+            while True:
+                data = source.read(buffer_size)
+                if not data:
+                    break
+                sha256.update(data)
+                f.write(data)
+                size += len(data)
+        digest = sha256.hexdigest()
+        object_file = os.path.join(objects_dir, digest[:2], digest)
+        if os.path.exists(object_file):
+            os.remove(temp_file)
+            return digest, size, False
+        os.makedirs(os.path.dirname(object_file), exist_ok=True)
+        os.replace(temp_file, object_file)
+        return digest, size, True
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def dump_modules(target, output_dir, vmm_args):
+    '''
+    Extracts the modules of the matching processes, storing each unique image once.
+
+    :param target: 'all', or a comma-separated list of PIDs and name globs.
+    :param output_dir: The directory holding the object store and the manifest.
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    try:
+        start_time = time.perf_counter()
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+
+        processes = resolve_processes(vmm, target)
+        if not processes:
+            print(f"Error: No processes match '{target}'.")
+            return
+
+        objects_dir = os.path.join(output_dir, 'objects')
+        os.makedirs(objects_dir, exist_ok=True)
+
+        # fingerprint -> sha256 of the stored image
+        seen = {}
+        objects = {}
+        references = []
+        failures = []
+        bytes_read = 0
+        bytes_stored = 0
+
+        for process in processes:
+            try:
+                modules = process.module_all()
+            except Exception as e:
+                print(f"  - {process.name} (PID: {process.pid}): failed to list modules: {e}")
+                continue
+
+            for module in modules:
+                reference = {'pid': process.pid, 'process': process.name, 'module': module.name,
+                             'base': module.base, 'sha256': None}
+                try:
+                    fingerprint = module_fingerprint(process, module)
+                    if fingerprint not in seen:
+                        vfs_path = f"/pid/{process.pid}/modules/{module.name}/pefile.dll"
+                        digest, size, stored = store_object(vmm, vfs_path, objects_dir)
+                        bytes_read += size
+                        if stored:
+                            bytes_stored += size
+                        seen[fingerprint] = digest
+                        objects.setdefault(digest, {
+                            'path': getattr(module, 'fullname', None) or module.name,
+                            'size': size, 'image_size': module.image_size,
+                            'timestamp': fingerprint[2], 'checksum': fingerprint[3],
+                            'file': f"objects/{digest[:2]}/{digest}"})
+                    reference['sha256'] = seen[fingerprint]
+                except Exception as e:
+                    failures.append({'pid': process.pid, 'module': module.name, 'error': str(e)})
+                references.append(reference)
+
+        manifest = {'target': target, 'processes': len(processes), 'objects': objects,
+                    'references': references, 'failures': failures}
+        manifest_file = os.path.join(output_dir, 'manifest.json')
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        wall_time = time.perf_counter() - start_time
+        print(f"Processed {len(references)} modules from {len(processes)} processes in {wall_time:.2f}s")
+        print(f"  Unique images stored: {len(objects)} ({bytes_stored} bytes, {bytes_read} bytes read)")
+        print(f"  Duplicates recorded as references: {len(references) - len(seen) - len(failures)}")
+        if failures:
+            print(f"  Failed: {len(failures)} modules (see manifest)")
+        print(f"Manifest written to {manifest_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 4:
+        print("Usage: python dump_modules.py <pid_list|name_glob|all> <output_dir> [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python dump_modules.py all modules/ -device memory.dmp")
+        print("Example: python dump_modules.py 'svchost.exe,1234' modules/ -device memory.dmp")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        dump_modules(sys.argv[1], sys.argv[2], sys.argv[3:])
@@ -1,23 +1,183 @@
 '''
 This script dumps the memory of a specified process to a file for offline analysis.
 
-Usage: python dump_process_memory.py <process_name_or_pid> <output_file> [vmm_args...]
+Memory is read region by region in bounded chunks and written straight to disk,
+so peak memory use stays flat regardless of the process size. In batch mode a
+single MemProcFS instance is shared by all processes and the region reads are
+spread over a thread pool.
+
+Batch mode keeps a checkpoint journal in the output directory (see
+job_journal.py): the address and file offset each dump has reached, and the
+processes that are complete. After a crash or an interrupt, rerunning the same
+command with --resume skips the finished processes and continues the
+interrupted dump from its last checkpoint.
+
+With --compress the dump is written in the seekable compressed format of
+compressed_dump.py instead: zero pages are stored as sparse index entries and
+the other pages are compressed on the reading thread pool.
+
+With --known-good the pages found in a known-good hash set, built from a
+clean baseline image by region_hashes.py, are left out of the dump; the pages
+are hashed on the reading thread pool.
+
+Batch mode reports one record per process (status, bytes, rate) as a table,
+or as JSONL, CSV or Arrow with --format, to stdout or to a file with --output
+(see result_writers.py).
+
+Usage: python dump_process_memory.py <process_name_or_pid> <output_file> [--sparse] [--compress] [--known-good <set_file>] [--chunk-size <bytes>] [vmm_args...]
+       python dump_process_memory.py --batch <pid_list|name_glob|all> <output_dir> [--threads <n>] [--max-inflight <MB>] [--sparse] [--compress] [--known-good <set_file>] [--chunk-size <bytes>] [--resume] [--format <table|jsonl|csv|arrow>] [--output <file>] [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
 '''
 
-import memprocfs
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import LazyProcessTable
+from job_journal import JobJournal, image_identity
+from compressed_dump import write_compressed_dump
+from region_hashes import KnownGoodSet, iter_unknown_chunks
+from result_writers import FORMATS, guess_format, open_writer
 import sys
+import os
+import json
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from memory_regions import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_INFLIGHT, get_memory_regions,
+                            iter_region_chunks, iter_region_chunks_parallel)
+
+DEFAULT_THREADS = 4
+
+# Bytes written between two checkpoints of a batch dump (64 MiB).
+CHECKPOINT_INTERVAL = 0x4000000
+
+JOURNAL_NAME = 'dump.journal'
+
+# Columns of the per-process records of a batch dump.
+REPORT_FIELDS = ('pid', 'process', 'status', 'bytes', 'stored', 'skipped', 'seconds', 'mb_per_s', 'resumed_at',
+                 'file', 'error')
+REPORT_TYPES = {'pid': 'int', 'process': 'str', 'status': 'str', 'bytes': 'int', 'stored': 'int', 'skipped': 'int',
+                'seconds': 'float', 'mb_per_s': 'float', 'resumed_at': 'hex', 'file': 'str', 'error': 'str'}
+# The records are written one by one, so the table columns get room for typical values.
+REPORT_WIDTHS = {'process': 20, 'bytes': 12, 'stored': 12, 'skipped': 12, 'resumed_at': 12, 'file': 40}
+
+def write_process_dump(process, output_file, sparse=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                       pool=None, max_inflight=DEFAULT_MAX_INFLIGHT, checkpoint=None, resume_at=None,
+                       known=None, stats=None):
+    '''
+    Streams the mapped regions of a process to a file.
+
+    By default the mapped regions are packed one after another into the output
+    file and a region index (virtual address, size, file offset) is written to
+    '<output_file>.regions.json'. With sparse=True every region is written at
+    the file offset equal to its virtual address, like the vmemd file, and the
+    unmapped gaps are left as sparse holes.
+
+    With a checkpoint callback the output is flushed to disk every
+    CHECKPOINT_INTERVAL bytes and checkpoint(address, written) is called with
+    the address the dump has reached. Passing that pair back as resume_at
+    continues the dump from there; the output file is kept up to that point.
+
+    With a known-good set the pages found in it are not written; a packed dump
+    leaves them out of the region index, a sparse one leaves them as holes. A
+    packed dump that skips pages is not resumed but dumped again from its start.
 
-def dump_process_memory(proc_identifier, output_file, vmm_args):
+    :param process: A memprocfs process object.
+    :param output_file: The path to save the memory dump.
+    :param sparse: Write regions at their virtual address instead of packing them.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param pool: Optional thread pool used to read chunks ahead of the writer.
+    :param max_inflight: The maximum number of bytes read ahead when a pool is used.
+    :param checkpoint: Optional callable(address, written) called once the output up to address is on disk.
+    :param resume_at: Optional (address, written) of the last checkpoint of an interrupted dump.
+    :param known: Optional KnownGoodSet of pages that are not written (see region_hashes.py).
+    :param stats: Optional dict; its 'bytes_skipped' entry is updated with the known-good bytes left out.
+    :return: The number of bytes written, or None if the process has no mapped regions.
+    '''
+    regions = get_memory_regions(process)
+    if not regions:
+        return None
+
+    # A resumed dump needs its output intact up to the checkpoint, and a packed
+    # one a region index that can be rebuilt, which skipped pages rule out
+    if resume_at is not None and (not os.path.exists(output_file) or
+                                  os.path.getsize(output_file) < resume_at[0 if sparse else 1] or
+                                  (known is not None and not sparse)):
+        resume_at = None
+
+    index = []
+    written = 0
+    if resume_at is not None:
+        # Regions below the checkpoint are on disk already; only their index entries are rebuilt
+        address, written = resume_at
+        remaining = []
+        offset = 0
+        for base, size in regions:
+            if base + size <= address:
+                index.append({'va': base, 'size': size, 'offset': offset})
+            elif base < address:
+                index.append({'va': base, 'size': address - base, 'offset': offset})
+                remaining.append((address, base + size - address))
+            else:
+                remaining.append((base, size))
+            offset += size
+        regions = remaining
+
+    if known is not None:
+        chunks = iter_unknown_chunks(process, known, pool, regions, chunk_size, max_inflight, stats)
+    elif pool:
+        chunks = iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight)
+    else:
+        chunks = iter_region_chunks(process, regions, chunk_size)
+
+    # Stream each chunk straight to the output file
+    unsaved = 0
+    with open(output_file, 'r+b' if resume_at is not None else 'wb') as f:
+        if resume_at is not None and not sparse:
+            f.seek(written)
+            f.truncate()
+        for address, data in chunks:
+            if sparse:
+                f.seek(address)
+            elif index and index[-1]['va'] + index[-1]['size'] == address:
+                index[-1]['size'] += len(data)
+            else:
+                index.append({'va': address, 'size': len(data), 'offset': written})
+            f.write(data)
+            written += len(data)
+            unsaved += len(data)
+            if checkpoint and unsaved >= CHECKPOINT_INTERVAL:
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint(address + len(data), written)
+                unsaved = 0
+        if checkpoint:
+            f.flush()
+            os.fsync(f.fileno())
+
+    if not sparse:
+        with open(output_file + '.regions.json', 'w') as f:
+            json.dump({'pid': process.pid, 'name': process.name, 'regions': index}, f, indent=2)
+    return written
+
+def dump_process_memory(proc_identifier, output_file, vmm_args, sparse=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                        compress=False, known_good=None):
     '''
     Dumps the virtual memory of a process to a file.
 
     :param proc_identifier: The name or PID of the process to dump.
     :param output_file: The path to save the memory dump.
     :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param sparse: Write regions at their virtual address instead of packing them.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param compress: Write the compressed, seekable format of compressed_dump.py.
+    :param known_good: Optional path of a known-good hash set; its pages are left out of the dump.
     '''
     try:
+        known = KnownGoodSet.load(known_good) if known_good else None
+
         # Initialize the VMM instance
-        vmm = memprocfs.Vmm(vmm_args)
+        vmm = open_vmm(vmm_args)
         print(f"MemProcFS initialized with args: {vmm_args}")
 
         # Identify the process
@@ -32,37 +192,275 @@ def dump_process_memory(proc_identifier, output_file, vmm_args):
             return
 
         print(f"Found process: {process.name} (PID: {process.pid})")
-
-        # Read the entire process memory
-        # This reads the virtual memory as a single contiguous block, similar to vmemd file.
         print("Reading process memory... This may take a while.")
-        mem_data = process.memory.read(0, process.get_map_vmem().get('size', 0))
 
-        if not mem_data:
-            print("Error: Failed to read process memory.")
+        stats = {'bytes_skipped': 0}
+        if compress:
+            written = write_compressed_dump(process, output_file, chunk_size, known=known, stats=stats)
+        else:
+            written = write_process_dump(process, output_file, sparse, chunk_size, known=known, stats=stats)
+        if written is None:
+            print("Error: No mapped memory regions found for the process.")
             return
 
-        # Write the memory to the output file
-        with open(output_file, 'wb') as f:
-            f.write(mem_data)
-        
-        print(f"Successfully dumped {len(mem_data)} bytes of memory for {process.name} to {output_file}")
+        if compress:
+            written, stored = written
+            print(f"Compressed to {stored} bytes ({stored / written * 100 if written else 0:.1f}%)")
+        elif not sparse:
+            print(f"Region index written to {output_file}.regions.json")
+        print(f"Successfully dumped {written} bytes of memory for {process.name} to {output_file}")
+        if known is not None:
+            print(f"Skipped {stats['bytes_skipped']} bytes of known-good pages")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def resolve_processes(vmm, target):
+    '''
+    Resolves a batch target to a list of processes.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param target: 'all', or a comma-separated list of PIDs and name globs
+                   (e.g. '4,456' or 'svchost*.exe,lsass.exe').
+    :return: A list of memprocfs process objects sorted by PID.
+    '''
+    if target.lower() == 'all':
+        return sorted(vmm.process_all(), key=lambda p: p.pid)
+
+    # Only the PIDs are enumerated; names are read for name globs and processes opened once they match
+    table = LazyProcessTable(vmm)
+    items = [item.strip() for item in target.split(',') if item.strip()]
+    pids = {int(item) for item in items if item.isdigit()}
+    patterns = [item.lower() for item in items if not item.isdigit()]
+    return [p.process for p in table
+            if p.pid in pids or (patterns and p.name is not None
+                                 and any(fnmatch.fnmatch(p.name.lower(), pattern) for pattern in patterns))]
+
+def dump_processes(target, output_dir, vmm_args, threads=DEFAULT_THREADS, max_inflight=DEFAULT_MAX_INFLIGHT,
+                   sparse=False, chunk_size=DEFAULT_CHUNK_SIZE, resume=False, compress=False, known_good=None,
+                   report_format='table', report_file=None):
+    '''
+    Dumps the virtual memory of several processes with a single MemProcFS instance.
+
+    Each process is written to '<output_dir>/<name>_<pid>.bin'. The chunk reads
+    are spread over a thread pool, while the number of bytes read ahead of the
+    writer is capped by max_inflight.
+
+    Progress is checkpointed to '<output_dir>/dump.journal'. With resume=True
+    the processes the journal lists as complete are skipped and an interrupted
+    dump continues from its last checkpoint. Compressed dumps are written as
+    '<name>_<pid>.cdmp'; an interrupted one is dumped again from its start.
+
+    A record is written for every process as soon as it is dumped, with the
+    fields of REPORT_FIELDS.
+
+    :param target: 'all', or a comma-separated list of PIDs and name globs.
+    :param output_dir: The directory to save the memory dumps in.
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param threads: The number of worker threads reading memory.
+    :param max_inflight: The maximum number of bytes read ahead of the writer.
+    :param sparse: Write regions at their virtual address instead of packing them.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param resume: Continue the job recorded in the journal of output_dir.
+    :param compress: Write the compressed, seekable format of compressed_dump.py.
+    :param known_good: Optional path of a known-good hash set; its pages are left out of the dumps.
+    :param report_format: 'table', 'jsonl', 'csv' or 'arrow'.
+    :param report_file: Optional path of the report; defaults to stdout.
+    '''
+    try:
+        start_time = time.perf_counter()
+        known = KnownGoodSet.load(known_good) if known_good else None
+        report = open_writer(report_format, report_file, REPORT_FIELDS, REPORT_TYPES, widths=REPORT_WIDTHS)
+        with report:
+            dump_to_report(report, target, output_dir, vmm_args, threads, max_inflight, sparse, chunk_size, resume,
+                           compress, known_good, known, start_time)
+        if report_file:
+            print(f"Wrote {report.count} process records to {report_file}")
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
+def process_record(process, status, written=None, stored=None, skipped=None, elapsed=None, rate=None,
+                   resumed_at=None, output_file=None, error=None):
+    '''
+    Returns the report record of a process of a batch dump (see REPORT_FIELDS).
+    '''
+    return {'pid': process.pid, 'process': process.name, 'status': status, 'bytes': written, 'stored': stored,
+            'skipped': skipped, 'seconds': round(elapsed, 3) if elapsed is not None else None,
+            'mb_per_s': round(rate, 1) if rate is not None else None,
+            'resumed_at': resumed_at[0] if resumed_at else None, 'file': output_file, 'error': error}
+
+def dump_to_report(report, target, output_dir, vmm_args, threads, max_inflight, sparse, chunk_size, resume, compress,
+                   known_good, known, start_time):
+    '''
+    Dumps the processes of a batch and writes their records to a result
+    writer; messages go to report.messages. See dump_processes().
+
+    :param report: An open ResultWriter.
+    :param known: The loaded KnownGoodSet, or None.
+    :param start_time: The perf_counter() value the batch started at.
+    '''
+    messages = report.messages
+    vmm = open_vmm(vmm_args)
+    print(f"MemProcFS initialized with args: {vmm_args}", file=messages)
+
+    processes = resolve_processes(vmm, target)
+    if not processes:
+        print(f"Error: No processes match '{target}'.", file=messages)
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    journal = JobJournal(os.path.join(output_dir, JOURNAL_NAME),
+                         {'operation': 'dump', 'image': image_identity(vmm_args), 'target': target,
+                          'sparse': sparse, 'compress': compress, 'known_good': known_good},
+                         resume)
+    with journal:
+        # Processes that are complete or have no memory are not dumped again
+        finished = {pid: record for pid, record in journal.completed().items()
+                    if record['status'] in ('done', 'empty')}
+        checkpoints = journal.checkpoints()
+        total_written = sum(record.get('bytes', 0) for record in finished.values())
+        total_skipped = sum(record.get('skipped', 0) for record in finished.values())
+        if finished:
+            print(f"Resuming: {len(finished)} processes already dumped, {total_written} bytes", file=messages)
+
+        pending = [process for process in processes if process.pid not in finished]
+        print(f"Dumping {len(pending)} processes to {output_dir} using {threads} threads...", file=messages)
+        messages.flush()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for process in pending:
+                extension = 'cdmp' if compress else 'bin'
+                output_file = os.path.join(output_dir, f"{process.name}_{process.pid}.{extension}")
+                process_start = time.perf_counter()
+
+                def checkpoint(address, written, pid=process.pid):
+                    journal.append({'type': 'progress', 'pid': pid, 'address': address, 'written': written})
+
+                resume_at = None
+                if process.pid in checkpoints:
+                    resume_at = (checkpoints[process.pid]['address'], checkpoints[process.pid]['written'])
+                stored = None
+                stats = {'bytes_skipped': 0}
+                try:
+                    if compress:
+                        written = write_compressed_dump(process, output_file, chunk_size, pool, max_inflight,
+                                                        known=known, stats=stats)
+                        if written is not None:
+                            written, stored = written
+                    else:
+                        written = write_process_dump(process, output_file, sparse, chunk_size, pool, max_inflight,
+                                                     checkpoint, resume_at, known, stats)
+                except Exception as e:
+                    journal.append({'type': 'process', 'pid': process.pid, 'status': 'failed', 'error': str(e)})
+                    report.write(process_record(process, 'failed', resumed_at=resume_at, error=str(e)))
+                    report.flush()
+                    continue
+                if written is None:
+                    journal.append({'type': 'process', 'pid': process.pid, 'status': 'empty'})
+                    report.write(process_record(process, 'empty', resumed_at=resume_at))
+                    report.flush()
+                    continue
+                journal.append({'type': 'process', 'pid': process.pid, 'status': 'done', 'bytes': written,
+                                'stored': stored, 'skipped': stats['bytes_skipped']})
+                elapsed = time.perf_counter() - process_start
+                rate = written / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+                total_written += written
+                total_skipped += stats['bytes_skipped']
+                report.write(process_record(process, 'done', written, stored,
+                                            stats['bytes_skipped'] if known is not None else None, elapsed, rate,
+                                            resume_at, output_file))
+                # Each process is reported as soon as it is dumped
+                report.flush()
+
+    wall_time = time.perf_counter() - start_time
+    print(f"Successfully dumped {total_written} bytes from {len(processes)} processes in {wall_time:.2f}s",
+          file=messages)
+    if known is not None:
+        print(f"Skipped {total_skipped} bytes of known-good pages", file=messages)
+
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 3:
-        print("Usage: python dump_process_memory.py <process_name_or_pid> <output_file> [vmm_args...]")
+        print("Usage: python dump_process_memory.py <process_name_or_pid> <output_file> [--sparse] [--compress] [--known-good <set_file>] [--chunk-size <bytes>] [vmm_args...]")
+        print("       python dump_process_memory.py --batch <pid_list|name_glob|all> <output_dir> [--threads <n>] [--max-inflight <MB>] [--compress] [--known-good <set_file>] [--resume] [--format <table|jsonl|csv|arrow>] [--output <file>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
         print("Example: python dump_process_memory.py lsass.exe lsass.dmp -device memory.dmp")
+        print("Example: python dump_process_memory.py --batch 'svchost.exe,lsass.exe' dumps/ --threads 8 -device memory.dmp")
+        print("Example: python dump_process_memory.py --batch all dumps/ --resume -device memory.dmp")
+        print("Example: python dump_process_memory.py --batch all dumps/ --compress -device memory.dmp")
+        print("Example: python dump_process_memory.py --batch all dumps/ --known-good baseline.hashes -device memory.dmp")
+        print("Example: python dump_process_memory.py --batch all dumps/ --output dumps.csv -device memory.dmp")
         sys.exit(1)
 
-    process_id = sys.argv[1]
-    out_file = sys.argv[2]
-    vmm_arguments = sys.argv[3:]
+    args = sys.argv[1:]
+    batch_target = None
+    if args[0] == '--batch':
+        batch_target = args[1]
+        args = args[2:]
+        if not args:
+            print("Error: --batch requires a target and an output directory.")
+            sys.exit(1)
+
+    positional = args[:1] if batch_target else args[:2]
+    vmm_arguments = []
+    sparse_output = False
+    chunk = DEFAULT_CHUNK_SIZE
+    thread_count = DEFAULT_THREADS
+    inflight = DEFAULT_MAX_INFLIGHT
+    resume_job = False
+    compress_output = False
+    known_good_file = None
+    output_format = None
+    output_path = None
+
+    # Parse arguments
+    i = len(positional)
+    while i < len(args):
+        if args[i] == '--sparse':
+            sparse_output = True
+            i += 1
+        elif args[i] == '--chunk-size' and i + 1 < len(args):
+            chunk = int(args[i + 1], 0)
+            i += 2
+        elif args[i] == '--threads' and i + 1 < len(args):
+            thread_count = int(args[i + 1])
+            i += 2
+        elif args[i] == '--max-inflight' and i + 1 < len(args):
+            inflight = int(args[i + 1]) * 1024 * 1024
+            i += 2
+        elif args[i] == '--resume':
+            resume_job = True
+            i += 1
+        elif args[i] == '--compress':
+            compress_output = True
+            i += 1
+        elif args[i] == '--known-good' and i + 1 < len(args):
+            known_good_file = args[i + 1]
+            i += 2
+        elif args[i] == '--format' and i + 1 < len(args):
+            output_format = args[i + 1]
+            i += 2
+        elif args[i] == '--output' and i + 1 < len(args):
+            output_path = args[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
 
     if not vmm_arguments:
         print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
         sys.exit(1)
 
-    dump_process_memory(process_id, out_file, vmm_arguments)
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"Error: Unknown output format '{output_format}' (available: {', '.join(FORMATS)}).")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if batch_target:
+            dump_processes(batch_target, positional[0], vmm_arguments, thread_count, inflight, sparse_output, chunk,
+                           resume_job, compress_output, known_good_file, output_format, output_path)
+        else:
+            dump_process_memory(positional[0], positional[1], vmm_arguments, sparse_output, chunk, compress_output,
+                                known_good_file)
@@ -0,0 +1,634 @@
+'''
+This script triages the memory images of many hosts at once and merges the
+results into a single cross-host index, answering questions such as "which
+hosts run this executable" or "which hosts talk to this IP".
+
+Every image runs the system classification collectors (see
+system_classification.py), the handle harvest (see handle_table.py) and,
+with --yara, a YARA sweep of all processes. Each image is triaged in a
+worker process of its own with its own Vmm, so a crashed or leaking
+MemProcFS instance never affects the other images. Each host gets its own
+directory with the classification report, the handle and YARA rows and the
+log of its worker.
+
+The run is bounded by global budgets:
+
+- --images caps the number of images triaged at the same time.
+- --max-memory caps the memory reserved by the running images. An image is
+  started only while the reservations plus one more fit; an image reserves
+  --image-memory, or the largest peak memory a finished worker reported if
+  that is higher.
+- --max-io caps the rate at which the YARA sweeps of all workers together
+  read process memory. MemProcFS's own reads for the collectors are not
+  paced.
+
+After each image, the host's processes, executable paths, remote addresses,
+services, drivers, user accounts, named handles and YARA rules are stored in
+'<output_dir>/fleet_index.sqlite' (replacing the host's previous rows), which
+--query reads.
+
+Usage: python fleet_triage.py <image_dir|manifest.json> <output_dir> [--collectors <name,...>] [--no-handles]
+           [--yara <rule_file>] [--images <n>] [--threads <n>] [--max-memory <MB>] [--image-memory <MB>]
+           [--max-io <MB/s>] [--timeout <seconds>] [--plugin <module>] [--resume] [--no-cache]
+           [--cache-dir <dir>] [vmm_args...]
+       python fleet_triage.py --query <output_dir> <kind> <value>
+
+A manifest is a JSON list of image paths or of {"host", "image", "vmm_args"}
+objects; relative paths are relative to the manifest. The vmm_args are added
+to the image's -device argument, e.g. ["-memmap", "auto"].
+'''
+
+from vmm_session import open_vmm
+from system_classification import COLLECTORS, DEFAULT_WORKERS, build_report, run_cached_collectors
+from handle_table import HANDLE_TABLE_VERSION, HandleTable, harvest_handles
+from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+from result_writers import open_writer
+from yara_rules import DEFAULT_CACHE_DIR as DEFAULT_RULE_CACHE_DIR, load_rules
+from yara_scan_process import sweep_processes
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import importlib
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from contextlib import redirect_stdout, redirect_stderr
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Default number of images triaged at the same time.
+DEFAULT_IMAGES = 2
+
+# Default memory reserved for an image until a worker reports its peak (2 GiB).
+DEFAULT_IMAGE_MEMORY = 0x80000000
+
+# Files in an image directory that are triaged.
+IMAGE_EXTENSIONS = ('.dmp', '.raw', '.mem', '.vmem', '.img', '.lime')
+
+INDEX_NAME = 'fleet_index.sqlite'
+
+# Kinds of values in the cross-host index.
+INDEX_KINDS = ('process', 'path', 'remote', 'service', 'driver', 'user', 'handle', 'yara')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    status TEXT NOT NULL,
+    triaged REAL NOT NULL,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER,
+    process TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_key ON observations (kind, key);
+CREATE INDEX IF NOT EXISTS observations_host ON observations (host);
+'''
+
+# Addresses that say nothing about the remote end of a connection.
+_NO_REMOTE = ('', '*', '0.0.0.0', '::', '[::]')
+
+
+class IoBudget:
+    '''
+    Paces reads across worker processes to a shared rate. Every read
+    reserves the next free time slot of its size, so the reads of all
+    workers together never run ahead of the rate.
+    '''
+
+    def __init__(self, rate):
+        '''
+        :param rate: The shared rate in bytes per second.
+        '''
+        self.rate = rate
+        self._next = multiprocessing.Value('d', 0.0)
+
+    def consume(self, size):
+        '''
+        Accounts for size bytes read and sleeps until the budget allows the next read.
+        '''
+        with self._next.get_lock():
+            now = time.monotonic()
+            start = max(now, self._next.value)
+            self._next.value = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class FleetIndex:
+    '''
+    The cross-host index: a SQLite database with one row per host and one
+    row per (kind, value, host, process) observation. Values are looked up
+    case-insensitively.
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: Path of the index database.
+        '''
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def store(self, summary, observations):
+        '''
+        Replaces the rows of a host.
+
+        :param summary: The summary dict returned by triage_image().
+        :param observations: An iterable of (kind, value, pid, process) tuples.
+        '''
+        host = summary['host']
+        with self.db:
+            self.db.execute('DELETE FROM observations WHERE host = ?', (host,))
+            self.db.execute('INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?, ?)',
+                            (host, summary['image'], summary['status'], time.time(), json.dumps(summary)))
+            self.db.executemany('INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?)',
+                                ((kind, value.lower(), value, host, pid, process)
+                                 for kind, value, pid, process in observations))
+
+    def hosts(self):
+        '''
+        Returns the summaries of the indexed hosts by host name.
+        '''
+        return {host: json.loads(summary) for host, summary in self.db.execute('SELECT host, summary FROM hosts')}
+
+    def lookup(self, kind, value):
+        '''
+        Returns the hosts where a value was observed.
+
+        :param kind: One of INDEX_KINDS.
+        :param value: The value, e.g. an IP address or an executable path.
+        :return: A dict mapping host names to sorted lists of (pid, process) pairs.
+        '''
+        hosts = {}
+        for host, pid, process in self.db.execute(
+                'SELECT host, pid, process FROM observations WHERE kind = ? AND key = ? ORDER BY host, pid',
+                (kind, value.lower())):
+            hosts.setdefault(host, []).append((pid, process))
+        return hosts
+
+    def close(self):
+        self.db.close()
+
+
+def load_images(source):
+    '''
+    Lists the images of a fleet run.
+
+    :param source: A directory of images, or a JSON manifest.
+    :return: A list of (host, image, vmm_args) tuples with unique host names.
+    '''
+    if os.path.isdir(source):
+        base = ''
+        entries = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                   if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(source, name))]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as f:
+            entries = json.load(f)
+
+    images = []
+    hosts = set()
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'image': entry}
+        image = os.path.join(base, entry['image'])
+        host = entry.get('host') or os.path.splitext(os.path.basename(image))[0]
+        host = re.sub(r'[^\w.-]', '_', host)
+        unique, n = host, 2
+        while unique.lower() in hosts:
+            unique, n = f"{host}_{n}", n + 1
+        hosts.add(unique.lower())
+        images.append((unique, image, list(entry.get('vmm_args', []))))
+    return images
+
+
+def peak_memory():
+    '''
+    Returns the peak resident memory of the current process in bytes, or None if it is not available.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def iter_observations(report, handles=None, matches=()):
+    '''
+    Yields the (kind, value, pid, process) tuples of a host for the index.
+
+    :param report: A classification report, see build_report().
+    :param handles: Optional HandleTable of the host.
+    :param matches: (rule, pid, process) tuples of the YARA sweep.
+    '''
+    for process in report.get('processes') or []:
+        yield 'process', process['name'], process['pid'], process['name']
+        if process.get('path'):
+            yield 'path', process['path'], process['pid'], process['name']
+
+    columns = (report.get('network_connections') or {}).get('columns', {})
+    for address, pid, name in zip(columns.get('dst_address', ()), columns.get('pid', ()), columns.get('process', ())):
+        if address not in _NO_REMOTE:
+            yield 'remote', address, pid, name
+
+    columns = (report.get('services') or {}).get('columns', {})
+    for name, pid in zip(columns.get('name', ()), columns.get('pid', ())):
+        if name:
+            yield 'service', name, pid or None, None
+    for name in (report.get('drivers') or {}).get('columns', {}).get('name', ()):
+        if name:
+            yield 'driver', name, None, None
+    for name in (report.get('users') or {}).get('columns', {}).get('name', ()):
+        if name:
+            yield 'user', name, None, None
+
+    if handles is not None:
+        for name in handles.names:
+            if name:
+                for pid, process in handles.holders(handles.find_by_name(name)):
+                    yield 'handle', name, pid, process
+
+    yield from (('yara', rule, pid, process) for rule, pid, process in matches)
+
+
+# The I/O budget of a worker process, set by _worker().
+_io_budget = None
+
+
+def _paced(chunks):
+    # Chunk hook of the YARA sweep (see yara_scan_process.sweep_processes())
+    for address, data in chunks:
+        if _io_budget is not None:
+            _io_budget.consume(len(data))
+        yield address, data
+
+
+def sweep_image(vmm, rule_file, output_file, threads=DEFAULT_WORKERS, cache_dir=DEFAULT_RULE_CACHE_DIR):
+    '''
+    Scans the memory of all processes of an image with YARA rules and writes
+    the records yara_scan_process.py --sweep writes. The reads are paced by
+    the shared --max-io budget.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param rule_file: Path to the YARA rule file.
+    :param output_file: The path of the JSONL output.
+    :param threads: The number of processes scanned at the same time.
+    :param cache_dir: Directory holding the compiled rules.
+    :return: A (match count, hits) tuple; hits holds one (rule, pid, process) tuple per matching rule and process.
+    '''
+    rules = load_rules(rule_file, cache_dir)
+    if rules is None:
+        print("Warning: yara-python is not installed; MemProcFS compiles the rules for every process "
+              "and --max-io does not apply.")
+        with open(rule_file, 'r') as f:
+            rule_source = f.read()
+    else:
+        rule_source = None
+    lock = threading.Lock()
+    found = set()
+
+    with open(output_file, 'w') as output:
+        def emit(record):
+            with lock:
+                if record['type'] == 'match':
+                    found.add((record['rule'], record['pid'], record['process']))
+                output.write(json.dumps(record) + '\n')
+
+        total, _, _ = sweep_processes(vmm.process_all(), rules, emit, threads, rule_source=rule_source,
+                                      chunk_hook=_paced)
+    return total, sorted(found)
+
+
+def triage_image(host, image, vmm_args, host_dir, options):
+    '''
+    Triages one image; runs in a worker process. Its output goes to
+    '<host_dir>/triage.log'.
+
+    :param host: The host name.
+    :param image: Path of the memory image.
+    :param vmm_args: Further arguments to initialize MemProcFS with.
+    :param host_dir: Directory for the host's results.
+    :param options: A dict with 'collectors', 'handles', 'rule_file', 'threads', 'timeout', 'use_cache' and 'cache_dir'.
+    :return: A (summary, observations) tuple.
+    '''
+    start_time = time.perf_counter()
+    summary = {'host': host, 'image': image, 'status': 'ok'}
+    observations = []
+    os.makedirs(host_dir, exist_ok=True)
+    with open(os.path.join(host_dir, 'triage.log'), 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        vmm = None
+        cache = None
+        try:
+            vmm_args = ['-device', image] + vmm_args
+
+            def get_vmm():
+                nonlocal vmm
+                if vmm is None:
+                    vmm = open_vmm(vmm_args)
+                    print(f"MemProcFS initialized with args: {vmm_args}")
+                return vmm
+
+            cache = open_cache(vmm_args, options['cache_dir']) if options['use_cache'] else None
+            names = options['collectors'] or list(COLLECTORS)
+            results, stages = run_cached_collectors(names, get_vmm, options['threads'], options['timeout'], cache)
+            report = build_report(results, stages, time.perf_counter() - start_time)
+            report['host'] = host
+            with open(os.path.join(host_dir, 'classification.json'), 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            summary['processes'] = len(results.get('processes') or [])
+            summary['connections'] = (results.get('network_connections') or {}).get('count', 0)
+            summary['failed_stages'] = [name for name, stage in stages.items() if stage['status'] in ('error', 'timeout')]
+
+            handles = None
+            if options['handles']:
+                data = cache.get('handle_table', HANDLE_TABLE_VERSION) if cache else None
+                if data is not None:
+                    handles = HandleTable.from_dict(data)
+                else:
+                    handles, errors = harvest_handles(get_vmm(), options['threads'])
+                    for pid, error in errors.items():
+                        print(f"  Warning: Could not read the handles of PID {pid}: {error}")
+                    if cache and not errors:
+                        cache.put('handle_table', HANDLE_TABLE_VERSION, handles.to_dict())
+                with open_writer('jsonl', os.path.join(host_dir, 'handles.jsonl'), HANDLE_FIELDS, HANDLE_TYPES) as out:
+                    out.write_many(handles.rows())
+                summary['handles'] = len(handles)
+
+            matches = []
+            if options['rule_file']:
+                summary['yara_matches'], matches = sweep_image(get_vmm(), options['rule_file'],
+                                                               os.path.join(host_dir, 'yara.jsonl'), options['threads'])
+
+            observations = list(set(iter_observations(report, handles, matches)))
+        except Exception as e:
+            summary['status'] = 'error'
+            summary['error'] = str(e)
+            print(f"An error occurred: {e}")
+        finally:
+            if cache:
+                cache.close()
+            if vmm is not None and hasattr(vmm, 'close'):
+                vmm.close()
+    summary['seconds'] = round(time.perf_counter() - start_time, 3)
+    summary['peak_memory'] = peak_memory()
+    return summary, observations
+
+
+def _worker(connection, io_budget, plugins, args):
+    '''
+    Entry point of a worker process: triages one image and sends the result to the parent.
+    '''
+    global _io_budget
+    _io_budget = io_budget
+    # Plugin collectors must be registered in the worker as well
+    for plugin in plugins:
+        importlib.import_module(plugin)
+    connection.send(triage_image(*args))
+    connection.close()
+
+
+def fleet_triage(source, output_dir, vmm_args=(), collectors=None, handles=True, rule_file=None,
+                 images=DEFAULT_IMAGES, threads=DEFAULT_WORKERS, max_memory=None, image_memory=DEFAULT_IMAGE_MEMORY,
+                 max_io=None, timeout=None, plugins=(), resume=False, use_cache=True, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Triages the images of many hosts, each in a worker process of its own, and merges the results into the fleet index.
+
+    :param source: A directory of images, or a JSON manifest.
+    :param output_dir: Directory for the per-host results and the index.
+    :param vmm_args: Arguments added to the -device argument of every image.
+    :param collectors: Optional list of collector names to run; defaults to all registered collectors.
+    :param handles: Harvest the handles of every image.
+    :param rule_file: Optional YARA rule file to sweep every image with.
+    :param images: The number of images triaged at the same time.
+    :param threads: The number of threads each image uses.
+    :param max_memory: Optional memory budget in bytes for all running images.
+    :param image_memory: The memory reserved for an image until a worker reports a higher peak.
+    :param max_io: Optional rate in bytes per second for the process memory read by all YARA sweeps.
+    :param timeout: Optional timeout in seconds applied to every collector.
+    :param plugins: Modules registering further collectors, imported in every worker.
+    :param resume: Skip the hosts the index lists as triaged successfully.
+    :param use_cache: Reuse and store results in the artifact cache.
+    :param cache_dir: Directory holding the artifact cache.
+    '''
+    try:
+        unknown = [name for name in (collectors or []) if name not in COLLECTORS]
+        if unknown:
+            print(f"Error: Unknown collectors: {', '.join(unknown)} (available: {', '.join(COLLECTORS)})")
+            return
+        if rule_file and not os.path.isfile(rule_file):
+            print(f"Error: YARA rule file not found at {rule_file}")
+            return
+
+        start_time = time.perf_counter()
+        os.makedirs(output_dir, exist_ok=True)
+        index = FleetIndex(os.path.join(output_dir, INDEX_NAME))
+        pending = deque(load_images(source))
+        if resume:
+            triaged = {host for host, summary in index.hosts().items() if summary['status'] == 'ok'}
+            pending = deque(item for item in pending if item[0] not in triaged)
+            print(f"Resuming: {len(triaged)} hosts already triaged")
+        if not pending:
+            print(f"No images to triage in {source}.")
+            index.close()
+            return
+
+        options = {'collectors': collectors, 'handles': handles, 'rule_file': rule_file and os.path.abspath(rule_file),
+                   'threads': threads, 'timeout': timeout, 'use_cache': use_cache, 'cache_dir': cache_dir}
+        budget = f", memory budget {max_memory // 0x100000} MB" if max_memory else ''
+        budget += f", I/O cap {max_io / 0x100000:.0f} MB/s" if max_io else ''
+        print(f"Triaging {len(pending)} images, {images} at a time{budget}...")
+
+        # Every image gets a fresh worker process, so the memory of its Vmm is returned when the image is done
+        # and a crash of the native library only loses that image
+        io_budget = IoBudget(max_io) if max_io else None
+        running = {}
+        reserved = 0
+        succeeded = 0
+        total = len(pending)
+        try:
+            while pending or running:
+                while pending and len(running) < images and \
+                        (not running or not max_memory or reserved + image_memory <= max_memory):
+                    host, image, extra_args = pending.popleft()
+                    receiver, sender = multiprocessing.Pipe(False)
+                    worker = multiprocessing.Process(target=_worker, args=(
+                        sender, io_budget, list(plugins),
+                        (host, image, list(vmm_args) + extra_args, os.path.join(output_dir, host), options)))
+                    worker.start()
+                    sender.close()
+                    running[receiver] = (host, image, worker, image_memory)
+                    reserved += image_memory
+
+                receiver = wait(list(running))[0]
+                host, image, worker, reservation = running.pop(receiver)
+                reserved -= reservation
+                try:
+                    summary, observations = receiver.recv()
+                except EOFError:
+                    worker.join()
+                    summary, observations = {'host': host, 'image': image, 'status': 'error',
+                                             'error': f"worker exited with code {worker.exitcode}"}, []
+                receiver.close()
+                worker.join()
+                if summary.get('peak_memory'):
+                    image_memory = max(image_memory, summary['peak_memory'])
+                index.store(summary, observations)
+
+                if summary['status'] == 'ok':
+                    succeeded += 1
+                    details = f"{summary['processes']} processes, {summary['connections']} connections"
+                    if 'handles' in summary:
+                        details += f", {summary['handles']} handles"
+                    if 'yara_matches' in summary:
+                        details += f", {summary['yara_matches']} YARA matches"
+                    if summary.get('peak_memory'):
+                        details += f", peak {summary['peak_memory'] // 0x100000} MB"
+                    print(f"  [+] {summary['host']}: {details} in {summary['seconds']:.2f}s")
+                    if summary['failed_stages']:
+                        print(f"      Warning: Stages failed: {', '.join(summary['failed_stages'])}")
+                else:
+                    print(f"  [-] {summary['host']}: {summary['error']}")
+        finally:
+            for _, _, worker, _ in running.values():
+                worker.terminate()
+                worker.join()
+            index.close()
+
+        wall_time = time.perf_counter() - start_time
+        print(f"Triaged {succeeded} of {total} images in {wall_time:.2f}s; "
+              f"index: {os.path.join(output_dir, INDEX_NAME)}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def query_index(output_dir, kind, value):
+    '''
+    Prints the hosts where a value was observed.
+
+    :param output_dir: The output directory of a fleet run.
+    :param kind: One of INDEX_KINDS.
+    :param value: The value to look up (case-insensitive).
+    '''
+    try:
+        if kind not in INDEX_KINDS:
+            print(f"Error: Unknown kind '{kind}' (available: {', '.join(INDEX_KINDS)})")
+            return
+        path = os.path.join(output_dir, INDEX_NAME)
+        if not os.path.exists(path):
+            print(f"Error: No fleet index at {path}")
+            return
+        index = FleetIndex(path)
+        hosts = index.lookup(kind, value)
+        total = len(index.hosts())
+        index.close()
+
+        print(f"{kind} '{value}': seen on {len(hosts)} of {total} hosts")
+        for host, entries in hosts.items():
+            processes = [f"{process} (PID: {pid})" if process else f"PID: {pid}"
+                         for pid, process in entries if process or pid is not None]
+            print(f"  - {host}" + (f": {', '.join(processes[:10])}" if processes else ''))
+            if len(processes) > 10:
+                print(f"      ... {len(processes) - 10} more processes")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 5 and sys.argv[1] == '--query':
+        query_index(sys.argv[2], sys.argv[3], ' '.join(sys.argv[4:]))
+        sys.exit(0)
+
+    if len(sys.argv) < 3:
+        print("Usage: python fleet_triage.py <image_dir|manifest.json> <output_dir> [--collectors <name,...>] [--no-handles]")
+        print("           [--yara <rule_file>] [--images <n>] [--threads <n>] [--max-memory <MB>] [--image-memory <MB>]")
+        print("           [--max-io <MB/s>] [--timeout <seconds>] [--plugin <module>] [--resume] [--no-cache]")
+        print("           [--cache-dir <dir>] [vmm_args...]")
+        print("       python fleet_triage.py --query <output_dir> <kind> <value>")
+        print(f"Kinds: {', '.join(INDEX_KINDS)}")
+        print("Example: python fleet_triage.py images/ fleet/ --yara suspicious.yara --images 4 --max-memory 16384")
+        print("Example: python fleet_triage.py --query fleet/ remote 203.0.113.7")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    output_directory = sys.argv[2]
+    vmm_arguments = []
+    collector_names = None
+    harvest = True
+    rules_file = None
+    image_count = DEFAULT_IMAGES
+    thread_count = DEFAULT_WORKERS
+    memory_budget = None
+    memory_per_image = DEFAULT_IMAGE_MEMORY
+    io_rate = None
+    stage_timeout = None
+    plugin_modules = []
+    resume_run = False
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
+
+    # Parse arguments
+    i = 3
+    while i < len(sys.argv):
+        if sys.argv[i] == '--collectors' and i + 1 < len(sys.argv):
+            collector_names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--no-handles':
+            harvest = False
+            i += 1
+        elif sys.argv[i] == '--yara' and i + 1 < len(sys.argv):
+            rules_file = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--images' and i + 1 < len(sys.argv):
+            image_count = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--threads' and i + 1 < len(sys.argv):
+            thread_count = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--max-memory' and i + 1 < len(sys.argv):
+            memory_budget = int(sys.argv[i + 1]) * 0x100000
+            i += 2
+        elif sys.argv[i] == '--image-memory' and i + 1 < len(sys.argv):
+            memory_per_image = int(sys.argv[i + 1]) * 0x100000
+            i += 2
+        elif sys.argv[i] == '--max-io' and i + 1 < len(sys.argv):
+            io_rate = float(sys.argv[i + 1]) * 0x100000
+            i += 2
+        elif sys.argv[i] == '--timeout' and i + 1 < len(sys.argv):
+            stage_timeout = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--plugin' and i + 1 < len(sys.argv):
+            # Plugin modules call register_collector() when imported
+            importlib.import_module(sys.argv[i + 1])
+            plugin_modules.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--resume':
+            resume_run = True
+            i += 1
+        elif sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    fleet_triage(source, output_directory, vmm_arguments, collector_names, harvest, rules_file, image_count,
+                 thread_count, memory_budget, memory_per_image, io_rate, stage_timeout, plugin_modules, resume_run,
+                 cache_enabled, cache_directory)
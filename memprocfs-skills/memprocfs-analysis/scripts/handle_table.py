@@ -0,0 +1,422 @@
+'''
+This script collects the open handles of all processes into a single table and
+answers reverse lookups such as "which processes hold a handle to this file,
+mutex or registry key".
+
+The table is array-backed: one row per handle with the PID, the handle value,
+an interned type id and an interned name id. Inverted indexes by object name
+and by type give O(1) exact lookups and per-type counts, and a sorted name list
+gives O(log n) prefix lookups. The matching handles are written as a table,
+or as JSONL, CSV or Arrow with --format, to stdout or to a file with --output
+(see result_writers.py); the whole table can also be exported to Parquet when
+pyarrow is installed. The table is cached per image (see artifact_cache.py).
+
+Usage: python handle_table.py [--name <object_name>] [--prefix <name_prefix>] [--type <type>] [--counts]
+           [--format <table|jsonl|csv|arrow>] [--output <file>] [--parquet <file>] [--threads <n>]
+           [--no-cache] [--cache-dir <dir>] [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+from result_writers import FORMATS, guess_format, open_writer
+from list_process_handles import HANDLE_FIELDS, HANDLE_TYPES
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_THREADS = 4
+
+# Version of the cached handle table layout.
+HANDLE_TABLE_VERSION = 1
+
+
+class HandleTable:
+    '''
+    Column store of handles with inverted indexes by name and type.
+    Names and types are interned, so each distinct string is kept once.
+    '''
+
+    def __init__(self):
+        self.pids = array('I')
+        self.handle_values = array('Q')
+        self.type_ids = array('H')
+        self.name_ids = array('I')
+        self.types = []
+        self.names = []
+        self.processes = {}
+        self._type_lookup = {}
+        self._name_lookup = {}
+        self._rows_by_type = []
+        self._rows_by_name = {}
+        self._rows_by_pid = {}
+        self._sorted_names = None
+
+    def __len__(self):
+        return len(self.pids)
+
+    def _intern_type(self, value):
+        type_id = self._type_lookup.get(value)
+        if type_id is None:
+            type_id = self._type_lookup[value] = len(self.types)
+            self.types.append(value)
+            self._rows_by_type.append(array('I'))
+        return type_id
+
+    def _intern_name(self, value):
+        name_id = self._name_lookup.get(value)
+        if name_id is None:
+            name_id = self._name_lookup[value] = len(self.names)
+            self.names.append(value)
+            self._sorted_names = None
+        return name_id
+
+    def add(self, pid, handle_value, handle_type, name):
+        '''
+        Appends a handle and updates the indexes.
+
+        :param pid: The PID of the process holding the handle.
+        :param handle_value: The handle value.
+        :param handle_type: The object type, e.g. 'File' or 'Mutant'.
+        :param name: The object name; may be empty.
+        '''
+        row = len(self.pids)
+        type_id = self._intern_type(handle_type or '')
+        name_id = self._intern_name(name or '')
+        self.pids.append(pid)
+        self.handle_values.append(handle_value)
+        self.type_ids.append(type_id)
+        self.name_ids.append(name_id)
+        self._rows_by_type[type_id].append(row)
+        if name:
+            self._rows_by_name.setdefault(name.lower(), array('I')).append(row)
+        self._rows_by_pid.setdefault(pid, array('I')).append(row)
+
+    def add_process(self, process):
+        '''
+        Appends all handles of a memprocfs process object.
+        '''
+        self.processes[process.pid] = process.name
+        for handle in process.handle_all():
+            self.add(process.pid, handle.handle_value, handle.type, handle.name)
+
+    def row(self, index):
+        '''
+        Returns a row as a dict with 'pid', 'process', 'handle_value', 'type' and 'name'.
+        '''
+        pid = self.pids[index]
+        return {'pid': pid, 'process': self.processes.get(pid, ''), 'handle_value': self.handle_values[index],
+                'type': self.types[self.type_ids[index]], 'name': self.names[self.name_ids[index]]}
+
+    def rows(self, indexes=None):
+        '''
+        Yields rows as dicts, see row().
+
+        :param indexes: Optional iterable of row indexes; defaults to all rows.
+        '''
+        for index in (range(len(self)) if indexes is None else indexes):
+            yield self.row(index)
+
+    def find_by_name(self, name):
+        '''
+        Returns the row indexes of handles to an object name (case-insensitive).
+        '''
+        return self._rows_by_name.get(name.lower(), array('I'))
+
+    def find_by_prefix(self, prefix):
+        '''
+        Returns the row indexes of handles whose object name starts with prefix (case-insensitive).
+        '''
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._rows_by_name)
+        prefix = prefix.lower()
+        rows = array('I')
+        for key in self._sorted_names[bisect_left(self._sorted_names, prefix):]:
+            if not key.startswith(prefix):
+                break
+            rows.extend(self._rows_by_name[key])
+        return sorted(rows)
+
+    def find_by_type(self, handle_type):
+        '''
+        Returns the row indexes of handles of an object type.
+        '''
+        type_id = self._type_lookup.get(handle_type)
+        return self._rows_by_type[type_id] if type_id is not None else array('I')
+
+    def find_by_pid(self, pid):
+        '''
+        Returns the row indexes of the handles held by a process.
+        '''
+        return self._rows_by_pid.get(pid, array('I'))
+
+    def type_counts(self):
+        '''
+        Returns a dict mapping each object type to its number of handles.
+        '''
+        return {self.types[type_id]: len(rows) for type_id, rows in enumerate(self._rows_by_type)}
+
+    def holders(self, indexes):
+        '''
+        Returns the sorted (pid, process name) pairs holding the given rows.
+        '''
+        pids = sorted({self.pids[index] for index in indexes})
+        return [(pid, self.processes.get(pid, '')) for pid in pids]
+
+    def to_dict(self):
+        '''
+        Returns the table in a JSON-serializable columnar form.
+        '''
+        return {'processes': [[pid, name] for pid, name in self.processes.items()],
+                'types': self.types, 'names': self.names, 'pids': self.pids.tolist(),
+                'handle_values': self.handle_values.tolist(), 'type_ids': self.type_ids.tolist(),
+                'name_ids': self.name_ids.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        '''
+        Rebuilds a table, including its indexes, from to_dict() output.
+        '''
+        table = cls()
+        table.processes = {pid: name for pid, name in data['processes']}
+        for pid, handle_value, type_id, name_id in zip(data['pids'], data['handle_values'],
+                                                       data['type_ids'], data['name_ids']):
+            table.add(pid, handle_value, data['types'][type_id], data['names'][name_id])
+        return table
+
+
+def harvest_handles(vmm, threads=DEFAULT_THREADS):
+    '''
+    Collects the handles of all processes into a HandleTable. The per-process
+    handle tables are read on a thread pool and added in PID order.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param threads: The number of worker threads reading handle tables.
+    :return: A (table, errors) tuple; errors maps PIDs to error messages.
+    '''
+    def read_handles(process):
+        return [(handle.handle_value, handle.type, handle.name) for handle in process.handle_all()]
+
+    table = HandleTable()
+    errors = {}
+    processes = sorted(vmm.process_all(), key=lambda p: p.pid)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [(process, pool.submit(read_handles, process)) for process in processes]
+        for process, future in futures:
+            table.processes[process.pid] = process.name
+            try:
+                handles = future.result()
+            except Exception as e:
+                errors[process.pid] = str(e)
+                continue
+            for handle_value, handle_type, name in handles:
+                table.add(process.pid, handle_value, handle_type, name)
+    return table, errors
+
+
+def write_parquet(table, output_file):
+    '''
+    Writes the table to a Parquet file. Types and names are written as
+    dictionary-encoded columns that reuse the interned string lists.
+    Requires the optional pyarrow package.
+
+    :param table: A HandleTable.
+    :param output_file: The path of the Parquet file.
+    '''
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    process_names = [table.processes.get(pid, '') for pid in table.pids]
+    arrow_table = pyarrow.table({
+        'pid': pyarrow.array(table.pids, type=pyarrow.uint32()),
+        'process': pyarrow.array(process_names).dictionary_encode(),
+        'handle_value': pyarrow.array(table.handle_values, type=pyarrow.uint64()),
+        'type': pyarrow.DictionaryArray.from_arrays(pyarrow.array(table.type_ids, type=pyarrow.uint16()),
+                                                    pyarrow.array(table.types)),
+        'name': pyarrow.DictionaryArray.from_arrays(pyarrow.array(table.name_ids, type=pyarrow.uint32()),
+                                                    pyarrow.array(table.names)),
+    })
+    pyarrow.parquet.write_table(arrow_table, output_file)
+
+
+def load_handle_table(vmm_args, threads=DEFAULT_THREADS, use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+                      messages=None):
+    '''
+    Returns the HandleTable of all processes, from the artifact cache if possible.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param threads: The number of worker threads reading handle tables.
+    :param use_cache: Reuse and store the table in the artifact cache.
+    :param cache_dir: Directory holding the artifact cache.
+    :param messages: Optional stream for the progress messages; defaults to stdout.
+    '''
+    cache = open_cache(vmm_args, cache_dir) if use_cache else None
+    try:
+        data = cache.get('handle_table', HANDLE_TABLE_VERSION) if cache else None
+        if data is not None:
+            table = HandleTable.from_dict(data)
+            print(f"Loaded {len(table)} handles from the artifact cache", file=messages)
+        else:
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS initialized with args: {vmm_args}", file=messages)
+            start_time = time.perf_counter()
+            table, errors = harvest_handles(vmm, threads)
+            elapsed = time.perf_counter() - start_time
+            print(f"Collected {len(table)} handles from {len(table.processes)} processes in {elapsed:.2f}s",
+                  file=messages)
+            for pid, error in errors.items():
+                print(f"  Warning: Could not read the handles of PID {pid}: {error}", file=messages)
+            if cache and not errors:
+                cache.put('handle_table', HANDLE_TABLE_VERSION, table.to_dict())
+    finally:
+        if cache:
+            cache.close()
+    return table
+
+
+def handle_table(vmm_args, name=None, prefix=None, handle_type=None, counts=False, output_format='table',
+                 output_file=None, parquet_file=None, threads=DEFAULT_THREADS, use_cache=True,
+                 cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Collects the handles of all processes and runs the requested lookups.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param name: Optional object name; lists the processes holding a handle to it.
+    :param prefix: Optional object name prefix, e.g. a directory or registry path.
+    :param handle_type: Optional object type; restricts the lookups and the export.
+    :param counts: Print the number of handles per type.
+    :param output_format: 'table', 'jsonl', 'csv' or 'arrow'.
+    :param output_file: Optional path of the file the (matching) handles are written to; defaults to stdout.
+    :param parquet_file: Optional path to export all handles as Parquet.
+    :param threads: The number of worker threads reading handle tables.
+    :param use_cache: Reuse and store the table in the artifact cache.
+    :param cache_dir: Directory holding the artifact cache.
+    '''
+    try:
+        out = open_writer(output_format, output_file, HANDLE_FIELDS, HANDLE_TYPES)
+        with out:
+            table = load_handle_table(vmm_args, threads, use_cache, cache_dir, out.messages)
+
+            if counts:
+                print("\n--- Handles per type ---", file=out.messages)
+                for type_name, count in sorted(table.type_counts().items(), key=lambda x: -x[1]):
+                    print(f"  {type_name or '<unknown>'}: {count}", file=out.messages)
+
+            indexes = None
+            if name is not None:
+                indexes = table.find_by_name(name)
+            elif prefix is not None:
+                indexes = table.find_by_prefix(prefix)
+            if handle_type is not None:
+                type_id = table.types.index(handle_type) if handle_type in table.types else None
+                if indexes is None:
+                    indexes = table.find_by_type(handle_type)
+                else:
+                    indexes = [index for index in indexes if table.type_ids[index] == type_id]
+
+            if indexes is not None:
+                query = name if name is not None else (f"{prefix}*" if prefix is not None else '*')
+                print(f"\n--- {len(indexes)} handles matching '{query}'"
+                      f"{f' of type {handle_type}' if handle_type else ''} ---", file=out.messages)
+                out.messages.flush()
+            # Without a lookup, all handles are written only to a file or a machine-readable format
+            if indexes is not None or output_file or out.machine_readable:
+                out.write_many(table.rows(indexes))
+                out.flush()
+            if indexes is not None:
+                holders = table.holders(indexes)
+                print(f"Held by {len(holders)} processes: {', '.join(f'{n} ({p})' for p, n in holders)}",
+                      file=out.messages)
+
+        if output_file:
+            print(f"\n{out.count} handles written to: {output_file}")
+
+        if parquet_file:
+            write_parquet(table, parquet_file)
+            print(f"\n{len(table)} handles written to: {parquet_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("Usage: python handle_table.py [--name <object_name>] [--prefix <name_prefix>] [--type <type>] [--counts]")
+        print("           [--format <table|jsonl|csv|arrow>] [--output <file>] [--parquet <file>] [--threads <n>]")
+        print("           [--no-cache] [--cache-dir <dir>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python handle_table.py --name '\\BaseNamedObjects\\SM0:1234:304:WilStaging_02' -device memory.dmp")
+        print("Example: python handle_table.py --prefix '\\Device\\HarddiskVolume3\\Users\\' --type File -device memory.dmp")
+        print("Example: python handle_table.py --type Mutant --output mutants.csv -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    object_name = None
+    name_prefix = None
+    object_type = None
+    show_counts = False
+    output_format = None
+    output_path = None
+    parquet_output = None
+    thread_count = DEFAULT_THREADS
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
+
+    # Parse arguments
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--name' and i + 1 < len(sys.argv):
+            object_name = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--prefix' and i + 1 < len(sys.argv):
+            name_prefix = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--type' and i + 1 < len(sys.argv):
+            object_type = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--counts':
+            show_counts = True
+            i += 1
+        elif sys.argv[i] == '--format' and i + 1 < len(sys.argv):
+            output_format = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
+            output_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--parquet' and i + 1 < len(sys.argv):
+            parquet_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--threads' and i + 1 < len(sys.argv):
+            thread_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"Error: Unknown output format '{output_format}' (available: {', '.join(FORMATS)}).")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        handle_table(vmm_arguments, object_name, name_prefix, object_type, show_counts, output_format,
+                     output_path, parquet_output, thread_count, cache_enabled, cache_directory)
@@ -0,0 +1,363 @@
+'''
+This script harvests per-process VFS artifacts (the memory map, the threads,
+the token and the FindEvil findings) of every process and streams the parsed
+rows into one JSONL or Parquet dataset.
+
+Reading a few files for each of thousands of processes is thousands of
+blocking VFS reads. They are driven from asyncio and run on a thread pool:
+
+- The reads of one PID are batched into one executor call, so a process
+  costs one hop to the pool instead of one per file.
+- At most --concurrency PIDs are in flight. Parsed rows pass through a
+  bounded queue to a single writer; when the writer falls behind, the
+  queue fills up, in-flight PIDs wait to hand over their rows and no new
+  PIDs are started (backpressure), so memory stays bounded however many
+  processes there are.
+- Failed reads are retried up to --retries times with exponential backoff;
+  only the artifacts that failed are read again. Reads that still fail are
+  reported and the harvest goes on.
+
+Text tables (memmap, threads, findevil) become one row per table row; the
+token directory becomes one row with the contents of its files. FindEvil
+findings are listed in one global table, which is read once and split by PID.
+Every row has the fields pid, process, artifact, row (its index in the file)
+and fields (column name -> text).
+
+Usage: python harvest_process_vfs.py <output_file> [--artifacts <name,...>] [--pid <pid,...>]
+           [--concurrency <n>] [--retries <n>] [--queue <n>] [vmm_args...]
+
+The output is written as Parquet when its name ends with .parquet (requires pyarrow), as JSONL otherwise.
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from sys_parsers import iter_table_rows
+from vfs_stream import iter_lines, read_text
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RETRIES = 2
+DEFAULT_QUEUE_SIZE = 64
+
+# Delay before the first retry of a failed read, doubled for every further retry.
+RETRY_DELAY = 0.1
+
+# Rows per Parquet row group.
+ROW_GROUP_SIZE = 65536
+
+# Harvested artifacts: name -> (VFS path, kind). Paths with {pid} are read for every
+# process, other paths once; their rows are assigned to processes by their PID column.
+# A 'table' is parsed into one row per table row, a 'files' directory into one row
+# with the contents of its files.
+ARTIFACTS = {
+    'memmap': ('/pid/{pid}/memmap/vad.txt', 'table'),
+    'threads': ('/pid/{pid}/threads/threads.txt', 'table'),
+    'token': ('/pid/{pid}/token', 'files'),
+    'findevil': ('/forensic/findevil/findevil.txt', 'table'),
+}
+
+
+def read_artifact(vmm, name, pid=None):
+    '''
+    Reads and parses one artifact.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param name: A key of ARTIFACTS.
+    :param pid: The process ID, for per-process artifacts.
+    :return: A list of dicts of column name to text.
+    '''
+    path, kind = ARTIFACTS[name]
+    path = path.format(pid=pid)
+    if kind == 'files':
+        return [{entry: read_text(vmm, f"{path}/{entry}").strip()
+                 for entry, info in sorted(vmm.vfs.list(path).items()) if not info['f_isdir']}]
+    return [{title.lower(): value for title, value in row.items()}
+            for row in iter_table_rows(iter_lines(vmm, path))]
+
+
+def read_process_batch(vmm, pid, names):
+    '''
+    Reads the per-process artifacts of one PID in one go, on a worker thread.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param pid: The process ID.
+    :param names: The artifacts to read.
+    :return: A (process name, rows, errors) tuple; rows and errors map artifact names
+             to parsed rows and error messages.
+    '''
+    try:
+        process_name = vmm.process(pid).name
+    except Exception as e:
+        return None, {}, {name: str(e) for name in names}
+    rows = {}
+    errors = {}
+    for name in names:
+        try:
+            rows[name] = read_artifact(vmm, name, pid)
+        except Exception as e:
+            errors[name] = str(e)
+    return process_name, rows, errors
+
+
+def _dataset_rows(pid, process_name, artifact, rows):
+    return [{'pid': pid, 'process': process_name, 'artifact': artifact, 'row': i, 'fields': fields}
+            for i, fields in enumerate(rows)]
+
+
+class JsonlSink:
+    '''
+    Writes dataset rows as JSON lines.
+    '''
+
+    def __init__(self, output_file):
+        self.file = open(output_file, 'w')
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    '''
+    Writes dataset rows to a Parquet file, one row group per ROW_GROUP_SIZE
+    rows. The fields are a map column, so artifacts with different columns
+    share one schema. Requires the optional pyarrow package.
+    '''
+
+    def __init__(self, output_file):
+        if pyarrow is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        self.schema = pyarrow.schema([
+            ('pid', pyarrow.uint32()), ('process', pyarrow.string()), ('artifact', pyarrow.string()),
+            ('row', pyarrow.uint32()), ('fields', pyarrow.map_(pyarrow.string(), pyarrow.string())),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(output_file, self.schema)
+        self.pending = []
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        columns = {name: [row[name] for row in self.pending] for name in ('pid', 'process', 'artifact', 'row')}
+        columns['fields'] = [list(row['fields'].items()) for row in self.pending]
+        self.writer.write_table(pyarrow.table(columns, schema=self.schema))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_sink(output_file):
+    '''
+    Returns a ParquetSink for a .parquet file name and a JsonlSink otherwise.
+    '''
+    if output_file.lower().endswith('.parquet'):
+        return ParquetSink(output_file)
+    return JsonlSink(output_file)
+
+
+async def harvest_async(vmm, sink, names, pids, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                        queue_size=DEFAULT_QUEUE_SIZE):
+    '''
+    Harvests artifacts into a sink; see the module docstring.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param sink: A JsonlSink or ParquetSink.
+    :param names: The artifacts to harvest, keys of ARTIFACTS.
+    :param pids: The process IDs to harvest.
+    :param concurrency: The maximum number of PIDs read at the same time.
+    :param retries: The number of retries of a failed read.
+    :param queue_size: The number of row batches waiting for the writer before reads pause.
+    :return: A (counts, errors) tuple; counts maps artifact names to the number of rows
+             written, errors maps (pid, artifact) to error messages.
+    '''
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    slots = asyncio.Semaphore(concurrency)
+    counts = {name: 0 for name in names}
+    errors = {}
+    per_process = [name for name in names if '{pid}' in ARTIFACTS[name][0]]
+    global_names = [name for name in names if '{pid}' not in ARTIFACTS[name][0]]
+    selected = set(pids)
+
+    async def read_with_retries(read, pending, pid):
+        # read(pending) runs on the pool and returns (batches, failed); failed reads are retried with backoff
+        for attempt in range(retries + 1):
+            batches, failed = await loop.run_in_executor(executor, read, pending)
+            for batch in batches:
+                # Waits while the queue is full, which keeps this PID's slot taken
+                await queue.put(batch)
+            if not failed or attempt == retries:
+                break
+            pending = list(failed)
+            await asyncio.sleep(RETRY_DELAY * 2 ** attempt)
+        for name, error in failed.items():
+            errors[(pid, name)] = error
+
+    def read_process(pid, pending):
+        process_name, rows, failed = read_process_batch(vmm, pid, pending)
+        return [(name, _dataset_rows(pid, process_name, name, parsed)) for name, parsed in rows.items()], failed
+
+    def read_global(name, pending):
+        try:
+            rows = read_artifact(vmm, name)
+        except Exception as e:
+            return [], {name: str(e)}
+        by_pid = {}
+        for fields in rows:
+            try:
+                pid = int(fields.get('pid'))
+            except (TypeError, ValueError):
+                continue
+            if pid in selected:
+                by_pid.setdefault(pid, []).append(fields)
+        return [(name, _dataset_rows(pid, parsed[0].get('process'), name, parsed))
+                for pid, parsed in sorted(by_pid.items())], {}
+
+    async def harvest_process(pid):
+        try:
+            await read_with_retries(lambda pending: read_process(pid, pending), per_process, pid)
+        finally:
+            slots.release()
+
+    async def produce():
+        tasks = [asyncio.ensure_future(read_with_retries(lambda pending, name=name: read_global(name, pending),
+                                                         [name], None))
+                 for name in global_names]
+        if per_process:
+            for pid in pids:
+                # Waits while all slots are taken, so PIDs are started only as fast as rows are written
+                await slots.acquire()
+                tasks.append(asyncio.ensure_future(harvest_process(pid)))
+        await asyncio.gather(*tasks)
+        await queue.put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            name, rows = item
+            sink.write(rows)
+            counts[name] += len(rows)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(produce(), consume())
+    return counts, errors
+
+
+def harvest_process_vfs(vmm_args, output_file, names=None, pids=None, concurrency=DEFAULT_CONCURRENCY,
+                        retries=DEFAULT_RETRIES, queue_size=DEFAULT_QUEUE_SIZE):
+    '''
+    Harvests per-process VFS artifacts into one dataset.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param output_file: The path of the JSONL or Parquet dataset.
+    :param names: Optional list of artifacts; defaults to all ARTIFACTS.
+    :param pids: Optional list of process IDs; defaults to all processes.
+    :param concurrency: The maximum number of PIDs read at the same time.
+    :param retries: The number of retries of a failed read.
+    :param queue_size: The number of row batches waiting for the writer before reads pause.
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+        names = names or list(ARTIFACTS)
+        pids = sorted(pids or vmm.pid_list())
+        print(f"Harvesting {', '.join(names)} of {len(pids)} processes ({concurrency} at a time)")
+
+        start_time = time.perf_counter()
+        sink = open_sink(output_file)
+        try:
+            counts, errors = asyncio.run(harvest_async(vmm, sink, names, pids, concurrency, retries, queue_size))
+        finally:
+            sink.close()
+        elapsed = time.perf_counter() - start_time
+
+        for name, count in counts.items():
+            print(f"- {name}: {count} rows")
+        print(f"{sum(counts.values())} rows written to {output_file} in {elapsed:.2f}s")
+        if errors:
+            print(f"\nCould not read {len(errors)} artifacts after {retries} retries:")
+            for (pid, name), error in sorted(errors.items(), key=lambda item: (item[0][0] or 0, item[0][1]))[:20]:
+                print(f"  - {name}{f' of PID {pid}' if pid is not None else ''}: {error}")
+            if len(errors) > 20:
+                print(f"  ... and {len(errors) - 20} more")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("Usage: python harvest_process_vfs.py <output_file> [--artifacts <name,...>] [--pid <pid,...>]")
+        print("           [--concurrency <n>] [--retries <n>] [--queue <n>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print(f"Artifacts: {', '.join(ARTIFACTS)}")
+        print("Example: python harvest_process_vfs.py processes.jsonl -device memory.dmp -forensic 1")
+        print("Example: python harvest_process_vfs.py memmap.parquet --artifacts memmap,threads -device memory.dmp")
+        sys.exit(1)
+
+    output_path = sys.argv[1]
+    vmm_arguments = []
+    artifact_names = None
+    pid_list = None
+    concurrency_limit = DEFAULT_CONCURRENCY
+    retry_count = DEFAULT_RETRIES
+    queue_limit = DEFAULT_QUEUE_SIZE
+
+    # Parse arguments
+    i = 2
+    while i < len(sys.argv):
+        if sys.argv[i] == '--artifacts' and i + 1 < len(sys.argv):
+            artifact_names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--pid' and i + 1 < len(sys.argv):
+            pid_list = [int(pid) for pid in sys.argv[i + 1].split(',') if pid.strip()]
+            i += 2
+        elif sys.argv[i] == '--concurrency' and i + 1 < len(sys.argv):
+            concurrency_limit = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--retries' and i + 1 < len(sys.argv):
+            retry_count = max(0, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == '--queue' and i + 1 < len(sys.argv):
+            queue_limit = max(1, int(sys.argv[i + 1]))
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if artifact_names:
+        unknown = [name for name in artifact_names if name not in ARTIFACTS]
+        if unknown:
+            print(f"Error: Unknown artifacts: {', '.join(unknown)} (available: {', '.join(ARTIFACTS)})")
+            sys.exit(1)
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        harvest_process_vfs(vmm_arguments, output_path, artifact_names, pid_list, concurrency_limit,
+                            retry_count, queue_limit)
@@ -0,0 +1,126 @@
+'''
+Checkpoint journal for long-running jobs, so an interrupted batch dump or
+YARA sweep can be resumed instead of started over.
+
+The journal is an append-only JSONL file kept next to the job output. Its
+first record describes the job (operation, image, target and the options that
+change the output); every following record is a checkpoint, e.g. the address and
+output offset a process dump has reached, or a process that is complete.
+Callers write a checkpoint only after the output it refers to has been
+flushed to disk, and every record is fsync'd, so the journal never claims
+more than what is on disk. A torn last line, left by a crash in the middle of
+a write, is dropped when the journal is reopened.
+
+Used by dump_process_memory.py (--batch ... --resume) and yara_scan_process.py
+(--sweep ... --resume); can also be imported by custom scripts:
+
+    with JobJournal('dumps/dump.journal', {'operation': 'dump', 'target': 'all'}, resume=True) as journal:
+        done = journal.completed()
+        ...
+        journal.append({'type': 'process', 'pid': 4, 'status': 'done'})
+'''
+
+import os
+import json
+import threading
+from artifact_cache import image_key
+
+
+def read_journal(path):
+    '''
+    Reads the records of a journal file.
+
+    :param path: Path of the journal file.
+    :return: A (records, size) tuple; size is the length of the intact part of
+             the file, without a torn last line.
+    '''
+    records = []
+    size = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            size += len(line)
+    return records, size
+
+
+def image_identity(vmm_args):
+    '''
+    Returns what identifies the memory a job reads, for its job record: the
+    fingerprint of the image file and the MemProcFS options that change what
+    is read (see artifact_cache.image_key()), or the arguments themselves
+    when the device is not a local file.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    return image_key(vmm_args) or ' '.join(vmm_args)
+
+
+class JobJournal:
+    '''
+    An append-only checkpoint journal. Safe to append to from several threads.
+    '''
+
+    def __init__(self, path, job, resume=False):
+        '''
+        :param path: Path of the journal file.
+        :param job: A dict describing the job; a resumed journal must describe the same job.
+        :param resume: Continue the existing journal instead of starting a new one.
+        '''
+        self.path = path
+        self.job = dict(job, type='job')
+        self.records = []
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            records, size = read_journal(path)
+            if records and records[0] != self.job:
+                raise ValueError(f"{path} was written by a different job; "
+                                 "rerun without --resume to start over")
+            self.records = records[1:]
+            self._file = open(path, 'r+b')
+            self._file.truncate(size)
+            self._file.seek(size)
+            if not records:
+                self._write(self.job)
+        else:
+            self._file = open(path, 'wb')
+            self._write(self.job)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record).encode() + b'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, record):
+        '''
+        Appends a checkpoint record and waits until it is on disk.
+        '''
+        with self._lock:
+            self._write(record)
+            self.records.append(record)
+
+    def completed(self):
+        '''
+        Returns the process records of the journal by PID; a later record of a process replaces an earlier one.
+        '''
+        return {record['pid']: record for record in self.records if record.get('type') == 'process'}
+
+    def checkpoints(self):
+        '''
+        Returns the last progress record of every process by PID.
+        '''
+        return {record['pid']: record for record in self.records if record.get('type') == 'progress'}
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
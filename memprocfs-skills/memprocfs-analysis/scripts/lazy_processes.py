@@ -0,0 +1,220 @@
+'''
+Lazy process table: enumerates the PIDs up front and reads process attributes
+only when they are used.
+
+Every attribute access on a memprocfs process object can be a native lookup,
+or a round trip when the Vmm is a session proxy (see vmm_session.py). The
+LazyProcessTable therefore starts from vmm.pid_list(), where available, and
+opens a process object only on first use. Each attribute (name, parent PID,
+path, command line, token, modules) is read from it on first access and
+memoized per process, so a consumer that needs the names of ten processes
+never pays for the paths of thousands.
+
+Usage from a custom script:
+
+    table = process_table(vmm)              # or LazyProcessTable(vmm) for a private table
+    print(len(table))                       # no process has been opened yet
+    for process in table.first(10):
+        print(process.pid, process.name)    # name read now, then memoized
+    table.prefetch(('name', 'path'))        # read the rest on a thread pool
+'''
+
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = 4
+
+# The shared table of every Vmm. A shared table refers to its Vmm through a weak
+# proxy, so the entry is dropped together with the Vmm.
+_tables = weakref.WeakKeyDictionary()
+_tables_lock = threading.Lock()
+
+
+def _token(process):
+    return {'sid': getattr(process, 'sid', None), 'integrity': getattr(process, 'integrity', None),
+            'session': getattr(process, 'session', None), 'luid': getattr(process, 'luid', None)}
+
+
+# Process attributes read on demand: attribute name -> function of the memprocfs process object.
+ATTRIBUTES = {
+    'name': lambda process: process.name,
+    'ppid': lambda process: process.pid_parent,
+    'path': lambda process: process.path,
+    'command_line': lambda process: getattr(process, 'cmdline', None),
+    'token': _token,
+    'modules': lambda process: [module.name for module in process.module_all()],
+}
+
+
+class LazyProcess:
+    '''
+    A process whose attributes are read on first access and memoized.
+    Attributes that cannot be read are None; the error is kept in errors.
+    '''
+    __slots__ = ('pid', 'errors', '_vmm', '_process', '_values', '_keep')
+
+    def __init__(self, vmm, pid, process=None, keep=True):
+        self.pid = pid
+        self.errors = {}
+        self._vmm = vmm
+        self._process = process if keep else None
+        self._values = {}
+        self._keep = keep
+
+    @property
+    def process(self):
+        '''
+        The memprocfs process object, opened on first use. It is kept only if
+        the table keeps process objects.
+        '''
+        process = self._process
+        if process is None:
+            process = self._vmm.process(self.pid)
+            if self._keep:
+                self._process = process
+        return process
+
+    def get(self, name):
+        '''
+        Returns an attribute, reading it on first access.
+
+        :param name: A key of ATTRIBUTES, e.g. 'path'.
+        '''
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        self.load((name,))
+        return self._values[name]
+
+    def load(self, fields):
+        '''
+        Reads the given attributes that are not read yet, opening the process
+        object once for all of them.
+
+        :param fields: Keys of ATTRIBUTES, e.g. ('name', 'path').
+        '''
+        missing = [name for name in fields if name not in self._values]
+        if not missing:
+            return
+        try:
+            process = self.process
+        except Exception as e:
+            for name in missing:
+                self.errors[name] = str(e)
+                self._values[name] = None
+            return
+        for name in missing:
+            try:
+                value = ATTRIBUTES[name](process)
+            except Exception as e:
+                self.errors[name] = str(e)
+                value = None
+            self._values[name] = value
+
+    def __getattr__(self, name):
+        if name in ATTRIBUTES:
+            return self.get(name)
+        raise AttributeError(name)
+
+    def is_loaded(self, name):
+        return name in self._values
+
+    def as_dict(self, fields):
+        '''
+        Returns the given attributes as a dict, reading those not read yet.
+        '''
+        return {field: self.pid if field == 'pid' else self.get(field) for field in fields}
+
+
+class LazyProcessTable:
+    '''
+    The processes of a Vmm, sorted by PID, with their attributes read on demand.
+    '''
+
+    def __init__(self, vmm, keep_processes=True):
+        '''
+        :param vmm: An initialized memprocfs.Vmm instance.
+        :param keep_processes: Keep the process objects opened for reading attributes. The shared
+                               table does not, since process objects refer to their Vmm.
+        '''
+        self.vmm = vmm
+        pid_list = getattr(vmm, 'pid_list', None)
+        if pid_list is not None:
+            self._processes = {pid: LazyProcess(vmm, pid, None, keep_processes) for pid in sorted(pid_list())}
+        else:
+            # Without pid_list() the process objects come with the enumeration
+            processes = sorted(vmm.process_all(), key=lambda process: process.pid)
+            self._processes = {process.pid: LazyProcess(vmm, process.pid, process, keep_processes)
+                               for process in processes}
+        self.pids = list(self._processes)
+
+    def __len__(self):
+        return len(self.pids)
+
+    def __iter__(self):
+        return iter(self._processes.values())
+
+    def __contains__(self, pid):
+        return pid in self._processes
+
+    def __getitem__(self, pid):
+        return self._processes[pid]
+
+    def first(self, count):
+        '''
+        Returns the processes with the lowest PIDs.
+        '''
+        return [self._processes[pid] for pid in self.pids[:count]]
+
+    def prefetch(self, fields, threads=DEFAULT_THREADS, pids=None):
+        '''
+        Reads attributes of many processes concurrently; memoized attributes are skipped.
+
+        :param fields: The attributes to read, e.g. ('name', 'path').
+        :param threads: The number of worker threads.
+        :param pids: Optional PIDs to restrict the prefetch to; defaults to all processes.
+        '''
+        processes = [self._processes[pid] for pid in (pids if pids is not None else self.pids)]
+
+        def load(chunk):
+            for process in chunk:
+                process.load(fields)
+
+        threads = max(1, min(threads, len(processes)))
+        if threads == 1:
+            load(processes)
+            return
+        # One chunk per thread, interleaved so slow processes are spread over the threads
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for _ in pool.map(load, [processes[i::threads] for i in range(threads)]):
+                pass
+
+    def rows(self, fields, threads=DEFAULT_THREADS):
+        '''
+        Returns one dict per process with the given attributes, prefetching them concurrently.
+
+        :param fields: The attributes to include; 'pid' is always available.
+        :param threads: The number of worker threads.
+        '''
+        self.prefetch([field for field in fields if field != 'pid'], threads)
+        return [process.as_dict(fields) for process in self]
+
+
+def process_table(vmm):
+    '''
+    Returns the LazyProcessTable of a Vmm shared by all callers, so an
+    attribute read by one consumer is not read again by the next. A Vmm
+    that cannot be weakly referenced gets a table of its own on every call.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    '''
+    with _tables_lock:
+        try:
+            table = _tables.get(vmm)
+            if table is None:
+                table = _tables[vmm] = LazyProcessTable(weakref.proxy(vmm), keep_processes=False)
+        except TypeError:
+            table = LazyProcessTable(vmm)
+        return table
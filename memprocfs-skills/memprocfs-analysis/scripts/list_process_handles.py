@@ -1,58 +1,155 @@
-
-'"""
+'''
 This script lists all open handles for a specified process.
 
-Usage: python list_process_handles.py <process_name_or_pid> [vmm_args...]
-"""'
+The handle table is cached per image (see artifact_cache.py), so listing the
+same process of the same image again does not initialize MemProcFS.
+
+The handles are written as a table, or as JSONL, CSV or Arrow with --format,
+to stdout or to a file with --output (see result_writers.py).
+
+Usage: python list_process_handles.py <process_name_or_pid> [--no-cache] [--cache-dir <dir>] [--format <table|jsonl|csv|arrow>] [--output <file>] [vmm_args...]
 
-import memprocfs
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+from result_writers import FORMATS, guess_format, open_writer
 import sys
 
-def list_process_handles(proc_identifier, vmm_args):
-    """
+# Version of the cached handle table layout.
+HANDLES_VERSION = 1
+
+# Columns of the handle records.
+HANDLE_FIELDS = ('pid', 'process', 'handle_value', 'type', 'name')
+HANDLE_TYPES = {'pid': 'int', 'handle_value': 'hex', 'type': 'str', 'name': 'str'}
+
+def collect_process_handles(vmm, proc_identifier):
+    '''
+    Collects the handle table of a process.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param proc_identifier: The name or PID of the process.
+    :return: A dict with 'pid', 'name' and 'handles', or None if the process was not found.
+    '''
+    try:
+        pid = int(proc_identifier)
+        process = vmm.process(pid)
+    except ValueError:
+        process = vmm.process(proc_identifier)
+
+    if not process:
+        return None
+
+    handles = [{'handle_value': handle.handle_value, 'type': handle.type, 'name': handle.name}
+               for handle in process.handle_all()]
+    return {'pid': process.pid, 'name': process.name, 'handles': handles}
+
+def handle_records(table):
+    '''
+    Yields one record per handle of a handle table, for a result writer.
+
+    :param table: A handle table returned by collect_process_handles().
+    '''
+    pid, name = table['pid'], table['name']
+    for handle in table['handles']:
+        yield {'pid': pid, 'process': name, 'handle_value': handle['handle_value'],
+               'type': handle['type'], 'name': handle['name']}
+
+def list_process_handles(proc_identifier, vmm_args, use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+                         output_format='table', output_file=None):
+    '''
     Lists all open handles for a given process.
 
     :param proc_identifier: The name or PID of the process.
     :param vmm_args: A list of arguments to initialize MemProcFS.
-    """
+    :param use_cache: Reuse and store the handle table in the artifact cache.
+    :param cache_dir: Directory holding the artifact cache.
+    :param output_format: 'table', 'jsonl', 'csv' or 'arrow'.
+    :param output_file: Optional path of the output file; defaults to stdout.
+    '''
     try:
-        vmm = memprocfs.Vmm(vmm_args)
-        print(f"MemProcFS initialized with args: {vmm_args}")
+        out = open_writer(output_format, output_file, HANDLE_FIELDS, HANDLE_TYPES)
+        with out:
+            cache = open_cache(vmm_args, cache_dir) if use_cache else None
+            try:
+                table = cache.get('handles', HANDLES_VERSION, str(proc_identifier)) if cache else None
 
-        try:
-            pid = int(proc_identifier)
-            process = vmm.process(pid)
-        except ValueError:
-            process = vmm.process(proc_identifier)
+                if table is not None:
+                    print(f"Loaded handles of '{proc_identifier}' from the artifact cache", file=out.messages)
+                else:
+                    vmm = open_vmm(vmm_args)
+                    print(f"MemProcFS initialized with args: {vmm_args}", file=out.messages)
 
-        if not process:
-            print(f"Error: Process '{proc_identifier}' not found.")
-            return
+                    table = collect_process_handles(vmm, proc_identifier)
+                    if table is None:
+                        print(f"Error: Process '{proc_identifier}' not found.", file=out.messages)
+                        return
+                    if cache:
+                        cache.put('handles', HANDLES_VERSION, table, str(proc_identifier))
+            finally:
+                if cache:
+                    cache.close()
 
-        print(f"--- Handles for {process.name} (PID: {process.pid}) ---")
+            print(f"--- Handles for {table['name']} (PID: {table['pid']}) ---", file=out.messages)
+            out.messages.flush()
 
-        handles = process.handle_all()
-        if not handles:
-            print("No open handles found.")
-            return
+            if not table['handles']:
+                print("No open handles found.", file=out.messages)
+                return
 
-        for handle in handles:
-            print(f"- Handle: {handle.handle_value:#x}, Type: {handle.type}, Name: {handle.name}")
+            out.write_many(handle_records(table))
+
+        if output_file:
+            print(f"Wrote {out.count} handles to {output_file}")
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 2:
-        print("Usage: python list_process_handles.py <process_name_or_pid> [vmm_args...]")
+        print("Usage: python list_process_handles.py <process_name_or_pid> [--no-cache] [--cache-dir <dir>] [--format <table|jsonl|csv|arrow>] [--output <file>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
         print("Example: python list_process_handles.py explorer.exe -device memory.dmp")
+        print("Example: python list_process_handles.py explorer.exe --output handles.csv -device memory.dmp")
         sys.exit(1)
 
     process_id = sys.argv[1]
-    vmm_arguments = sys.argv[2:]
+    vmm_arguments = []
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
+    output_format = None
+    output_path = None
+
+    # Parse arguments
+    i = 2
+    while i < len(sys.argv):
+        if sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--format' and i + 1 < len(sys.argv):
+            output_format = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--output' and i + 1 < len(sys.argv):
+            output_path = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
 
     if not vmm_arguments:
         print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
         sys.exit(1)
 
-    list_process_handles(process_id, vmm_arguments)
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"Error: Unknown output format '{output_format}' (available: {', '.join(FORMATS)}).")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        list_process_handles(process_id, vmm_arguments, cache_enabled, cache_directory, output_format, output_path)
@@ -0,0 +1,121 @@
+'''
+Helpers for walking the mapped memory regions of a process and reading them
+in bounded chunks, so callers never hold more than one chunk in memory.
+
+Used by dump_process_memory.py; can also be imported by custom scripts.
+'''
+
+import memprocfs
+from collections import deque
+
+# Default size of a single read from process memory (1 MiB).
+DEFAULT_CHUNK_SIZE = 0x100000
+
+# Default cap on the bytes being read ahead by a thread pool (64 MiB).
+DEFAULT_MAX_INFLIGHT = 0x4000000
+
+PAGE_SIZE = 0x1000
+
+
+def get_memory_regions(process):
+    '''
+    Returns the mapped regions of a process as a sorted list of (base, size) tuples.
+
+    The PTE map is used first since it only contains ranges backed by page
+    tables; the VAD map is used as a fallback. Adjacent regions are merged and
+    unmapped gaps between them are left out.
+
+    :param process: A memprocfs process object.
+    :return: A list of (base, size) tuples sorted by base address.
+    '''
+    regions = []
+    try:
+        for entry in process.maps.pte():
+            regions.append((entry['va'], entry['size']))
+    except Exception:
+        regions = []
+
+    if not regions:
+        for entry in process.maps.vad():
+            regions.append((entry['start'], entry['end'] - entry['start'] + 1))
+
+    merged = []
+    for base, size in sorted(r for r in regions if r[1] > 0):
+        if merged and base <= merged[-1][0] + merged[-1][1]:
+            last_base, last_size = merged[-1]
+            merged[-1] = (last_base, max(last_size, base + size - last_base))
+        else:
+            merged.append((base, size))
+    return merged
+
+
+def iter_chunk_ranges(regions, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Splits regions into (address, size) ranges of at most chunk_size bytes.
+
+    :param regions: An iterable of (base, size) tuples.
+    :param chunk_size: The maximum size of a single range.
+    '''
+    for base, size in regions:
+        offset = 0
+        while offset < size:
+            length = min(chunk_size, size - offset)
+            yield base + offset, length
+            offset += length
+
+
+def read_chunk(process, address, size):
+    '''
+    Reads a single chunk of process memory. Pages that cannot be read are
+    returned as zeros so that the chunk always has the requested size.
+
+    :param process: A memprocfs process object.
+    :param address: The virtual address to read from.
+    :param size: The number of bytes to read.
+    :return: The chunk data as bytes.
+    '''
+    return process.memory.read(address, size, memprocfs.FLAG_ZEROPAD_ON_FAIL)
+
+
+def iter_region_chunks(process, regions=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Yields (address, data) tuples covering every mapped region of a process.
+
+    :param process: A memprocfs process object.
+    :param regions: Optional list of (base, size) tuples; defaults to get_memory_regions().
+    :param chunk_size: The maximum number of bytes read at once.
+    '''
+    if regions is None:
+        regions = get_memory_regions(process)
+    for address, size in iter_chunk_ranges(regions, chunk_size):
+        yield address, read_chunk(process, address, size)
+
+
+def iter_region_chunks_parallel(process, pool, regions=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                                max_inflight=DEFAULT_MAX_INFLIGHT, read=read_chunk):
+    '''
+    Same as iter_region_chunks(), but the chunk reads are submitted to a thread
+    pool ahead of the consumer. Chunks are still yielded in address order, and
+    reads are only submitted while the bytes in flight stay below max_inflight.
+
+    :param process: A memprocfs process object.
+    :param pool: A concurrent.futures.ThreadPoolExecutor used for the reads.
+    :param regions: Optional list of (base, size) tuples; defaults to get_memory_regions().
+    :param chunk_size: The maximum number of bytes read at once.
+    :param max_inflight: The maximum number of bytes submitted but not yet consumed.
+    :param read: The callable(process, address, size) run on the pool for each chunk; its result is yielded.
+    '''
+    if regions is None:
+        regions = get_memory_regions(process)
+    pending = deque()
+    inflight = 0
+    for address, size in iter_chunk_ranges(regions, chunk_size):
+        while pending and inflight + size > max_inflight:
+            done_address, done_size, future = pending.popleft()
+            inflight -= done_size
+            yield done_address, future.result()
+        pending.append((address, size, pool.submit(read, process, address, size)))
+        inflight += size
+    while pending:
+        done_address, _, future = pending.popleft()
+        yield done_address, future.result()
@@ -0,0 +1,452 @@
+'''
+This script collects the network connections of all processes at once and
+answers host-wide questions about them: which processes exceed a connection
+threshold, who the top talkers are, and which public remote addresses are
+contacted by only one or a few processes.
+
+The connections are read in a single pass from /sys/net/netstat.txt (see
+sys_parsers.py) into NumPy columns: PID, protocol and state ids, IPv4
+addresses as integers, ports and interned address ids. Grouping, thresholds,
+rare-remote detection and the join against the process list are vectorized,
+so they stay fast with tens of thousands of sockets. Requires numpy; the
+Parquet export also requires pyarrow.
+
+Usage: python network_analytics.py [--threshold <n>] [--top <n>] [--rare <n>] [--state <state>]
+           [--subnet <cidr>] [--json <file>] [--parquet <file>] [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from sys_parsers import iter_records
+import sys
+import json
+import time
+import socket
+import ipaddress
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_THRESHOLD = 20
+DEFAULT_TOP = 10
+# Remote addresses contacted by at most this many processes are reported as rare.
+DEFAULT_RARE = 1
+
+# IPv4 networks that are not globally routable: (network, netmask) pairs.
+NON_PUBLIC_IPV4 = [(int(network.network_address), int(network.netmask)) for network in map(ipaddress.IPv4Network, (
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12', '192.0.0.0/24',
+    '192.0.2.0/24', '192.168.0.0/16', '198.18.0.0/15', '198.51.100.0/24', '203.0.113.0/24', '224.0.0.0/3'))]
+
+
+class NetworkTable:
+    '''
+    The network connections of all processes as NumPy columns.
+
+    Protocols, states and addresses are interned: the protocol, state,
+    src_address and dst_address columns hold indexes into the protocols,
+    states and addresses lists. src_ip and dst_ip hold IPv4 addresses as
+    integers (0 for IPv6 and unparsed addresses). Per address id,
+    address_ips holds the same integers and is_public tells whether the
+    address is globally routable.
+    '''
+
+    FIELDS = ('pid', 'protocol', 'state', 'src_ip', 'src_port', 'dst_ip', 'dst_port', 'src_address', 'dst_address')
+
+    def __init__(self, columns, protocols, states, addresses, address_ips):
+        self.columns = columns
+        self.protocols = protocols
+        self.states = states
+        self.addresses = addresses
+        self.address_ips = numpy.array(address_ips, dtype=numpy.uint32)
+        self.is_public = numpy.ones(len(addresses), dtype=bool)
+        for network, netmask in NON_PUBLIC_IPV4:
+            self.is_public &= (self.address_ips & numpy.uint32(netmask)) != numpy.uint32(network)
+        # Only the addresses that are not IPv4 need to be parsed one by one
+        for i in numpy.flatnonzero(self.address_ips == 0):
+            self.is_public[i] = _is_public(addresses[i])
+
+    def __len__(self):
+        return len(self.columns['pid'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @classmethod
+    def from_records(cls, records):
+        '''
+        Builds the table from NetConnection records.
+        '''
+        # Appended to typed arrays first, which are then wrapped by NumPy without a copy
+        values = {'pid': array('I'), 'protocol': array('B'), 'state': array('B'), 'src_ip': array('I'),
+                  'src_port': array('H'), 'dst_ip': array('I'), 'dst_port': array('H'),
+                  'src_address': array('i'), 'dst_address': array('i')}
+        lookups = ({}, {}, {})
+        protocols, states, addresses = [], [], []
+        address_ips = []
+
+        def intern(lookup, names, name):
+            index = lookup.get(name)
+            if index is None:
+                index = lookup[name] = len(names)
+                names.append(name)
+                if names is addresses:
+                    address_ips.append(_ipv4(name))
+            return index
+
+        for record in records:
+            src = intern(lookups[2], addresses, record.src_address or '')
+            dst = intern(lookups[2], addresses, record.dst_address or '')
+            values['pid'].append(record.pid or 0)
+            values['protocol'].append(intern(lookups[0], protocols, record.protocol or ''))
+            values['state'].append(intern(lookups[1], states, record.state or ''))
+            values['src_ip'].append(address_ips[src])
+            values['src_port'].append(record.src_port or 0)
+            values['dst_ip'].append(address_ips[dst])
+            values['dst_port'].append(record.dst_port or 0)
+            values['src_address'].append(src)
+            values['dst_address'].append(dst)
+
+        columns = {field: numpy.frombuffer(values[field], dtype=values[field].typecode) if len(values[field])
+                   else numpy.zeros(0, dtype=values[field].typecode) for field in cls.FIELDS}
+        return cls(columns, protocols, states, addresses, address_ips)
+
+    def select(self, mask):
+        '''
+        Returns a table with the rows selected by a boolean mask or an index array.
+        '''
+        table = NetworkTable.__new__(NetworkTable)
+        table.columns = {field: values[mask] for field, values in self.columns.items()}
+        table.protocols, table.states, table.addresses = self.protocols, self.states, self.addresses
+        table.address_ips, table.is_public = self.address_ips, self.is_public
+        return table
+
+    def in_state(self, state):
+        '''
+        Returns a boolean mask of the connections in a state, e.g. 'ESTABLISHED' (case-insensitive).
+        '''
+        ids = [i for i, name in enumerate(self.states) if name.lower() == state.lower()]
+        return numpy.isin(self.state, ids)
+
+    def in_subnet(self, cidr):
+        '''
+        Returns a boolean mask of the IPv4 connections whose remote address is in a subnet, e.g. '10.0.0.0/8'.
+        '''
+        network = ipaddress.IPv4Network(cidr, strict=False)
+        return (self.dst_ip & numpy.uint32(int(network.netmask))) == numpy.uint32(int(network.network_address))
+
+    def rows(self, indexes=None):
+        '''
+        Yields connections as dicts, with the interned ids resolved.
+        '''
+        for i in range(len(self)) if indexes is None else indexes:
+            yield {'pid': int(self.pid[i]), 'protocol': self.protocols[self.protocol[i]],
+                   'state': self.states[self.state[i]],
+                   'src_address': self.addresses[self.src_address[i]], 'src_port': int(self.src_port[i]),
+                   'dst_address': self.addresses[self.dst_address[i]], 'dst_port': int(self.dst_port[i])}
+
+
+def _ipv4(address):
+    '''
+    Returns an IPv4 address as an int, or 0 if it is not an IPv4 address.
+    '''
+    if address.count('.') != 3:
+        return 0
+    try:
+        return int.from_bytes(socket.inet_aton(address), 'big')
+    except OSError:
+        return 0
+
+
+def _is_public(address):
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+
+class ProcessTable:
+    '''
+    PIDs, parent PIDs and names of the process list, sorted by PID for vectorized joins.
+    '''
+
+    def __init__(self, processes):
+        processes = sorted(processes, key=lambda process: process.pid)
+        self.pids = numpy.array([process.pid for process in processes], dtype=numpy.uint32)
+        self.ppids = numpy.array([process.pid_parent for process in processes], dtype=numpy.uint32)
+        self.names = numpy.array([process.name for process in processes], dtype=object)
+
+    def lookup(self, pids):
+        '''
+        Joins PIDs against the process list.
+
+        :param pids: An array of PIDs.
+        :return: A (positions, found) tuple: the row of each PID in this table, and a mask of the PIDs present.
+        '''
+        positions = numpy.searchsorted(self.pids, pids)
+        positions[positions == len(self.pids)] = 0
+        found = self.pids[positions] == pids if len(self.pids) else numpy.zeros(len(pids), dtype=bool)
+        return positions, found
+
+    def names_of(self, pids):
+        positions, found = self.lookup(pids)
+        names = self.names[positions] if len(self.pids) else numpy.empty(len(pids), dtype=object)
+        return numpy.where(found, names, '<not in process list>')
+
+
+def connection_counts(table):
+    '''
+    Returns (pids, connections, distinct remote addresses) arrays, one entry per PID.
+    '''
+    pids, counts = numpy.unique(table.pid, return_counts=True)
+    # Distinct (pid, remote address) pairs, packed into one 64-bit key per connection
+    pairs = numpy.unique((table.pid.astype(numpy.uint64) << numpy.uint64(32)) |
+                         table.dst_address.astype(numpy.uint64))
+    pair_pids, remotes = numpy.unique(pairs >> numpy.uint64(32), return_counts=True)
+    distinct = numpy.zeros(len(pids), dtype=numpy.int64)
+    distinct[numpy.searchsorted(pids, pair_pids.astype(numpy.uint32))] = remotes
+    return pids, counts, distinct
+
+
+def top_talkers(table, processes, count=DEFAULT_TOP, threshold=None):
+    '''
+    Returns the processes with the most connections, most first.
+
+    :param table: A NetworkTable.
+    :param processes: A ProcessTable.
+    :param count: Optional maximum number of processes returned.
+    :param threshold: Optional minimum; only processes with more connections are returned.
+    :return: A list of dicts with pid, process, connections and remote_addresses.
+    '''
+    pids, counts, distinct = connection_counts(table)
+    order = numpy.lexsort((pids, -distinct, -counts))
+    if threshold is not None:
+        order = order[counts[order] > threshold]
+    if count is not None:
+        order = order[:count]
+    names = processes.names_of(pids[order])
+    return [{'pid': int(pid), 'process': name, 'connections': int(connections), 'remote_addresses': int(remotes)}
+            for pid, name, connections, remotes in zip(pids[order], names, counts[order], distinct[order])]
+
+
+def rare_remotes(table, processes, max_processes=DEFAULT_RARE):
+    '''
+    Returns the public remote addresses contacted by at most max_processes processes.
+
+    :param table: A NetworkTable.
+    :param processes: A ProcessTable.
+    :param max_processes: The maximum number of distinct processes.
+    :return: A list of dicts with address, ports, connections and processes, rarest first.
+    '''
+    public = table.is_public[table.dst_address]
+    dst, pid, port = table.dst_address[public], table.pid[public], table.dst_port[public]
+    pairs = numpy.unique((dst.astype(numpy.uint64) << numpy.uint64(32)) | pid.astype(numpy.uint64))
+    pair_addresses = (pairs >> numpy.uint64(32)).astype(numpy.int64)
+    process_counts = numpy.bincount(pair_addresses, minlength=len(table.addresses))
+    connection_totals = numpy.bincount(dst, minlength=len(table.addresses))
+    rare = numpy.flatnonzero((process_counts > 0) & (process_counts <= max_processes))
+    rare = rare[numpy.lexsort((-connection_totals[rare], process_counts[rare]))]
+
+    # The distinct (address, PID) and (address, port) pairs are sorted by address, so the
+    # rows of each rare address are sliced out between its group boundaries
+    port_pairs = numpy.unique((dst.astype(numpy.uint64) << numpy.uint64(32)) | port.astype(numpy.uint64))
+    port_addresses = (port_pairs >> numpy.uint64(32)).astype(numpy.int64)
+    pid_bounds = zip(numpy.searchsorted(pair_addresses, rare).tolist(),
+                     numpy.searchsorted(pair_addresses, rare, side='right').tolist())
+    port_bounds = zip(numpy.searchsorted(port_addresses, rare).tolist(),
+                      numpy.searchsorted(port_addresses, rare, side='right').tolist())
+    pair_pids = (pairs & numpy.uint64(0xFFFFFFFF)).astype(numpy.uint32)
+    pair_processes = [{'pid': p, 'process': name}
+                      for p, name in zip(pair_pids.tolist(), processes.names_of(pair_pids).tolist())]
+    ports = (port_pairs & numpy.uint64(0xFFFF)).tolist()
+
+    results = []
+    for address_id, (pid_start, pid_end), (port_start, port_end) in zip(rare.tolist(), pid_bounds, port_bounds):
+        results.append({'address': table.addresses[address_id],
+                        'ports': ports[port_start:port_end],
+                        'connections': int(connection_totals[address_id]),
+                        'processes': pair_processes[pid_start:pid_end]})
+    return results
+
+
+def unknown_process_connections(table, processes):
+    '''
+    Returns the connections whose PID is not in the process list, e.g. of terminated or unlinked processes.
+    '''
+    _, found = processes.lookup(table.pid)
+    return list(table.rows(numpy.flatnonzero(~found)))
+
+
+def write_parquet(table, processes, output_file):
+    '''
+    Writes the connections to a Parquet file, with addresses and names resolved (requires pyarrow).
+    '''
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    def dictionary(ids, names):
+        return pyarrow.DictionaryArray.from_arrays(pyarrow.array(ids.astype(numpy.int32)), pyarrow.array(names))
+
+    arrow_table = pyarrow.table({
+        'pid': pyarrow.array(table.pid),
+        'process': pyarrow.array(processes.names_of(table.pid).astype(str)),
+        'protocol': dictionary(table.protocol, table.protocols),
+        'state': dictionary(table.state, table.states),
+        'src_address': dictionary(table.src_address, table.addresses),
+        'src_port': pyarrow.array(table.src_port),
+        'dst_address': dictionary(table.dst_address, table.addresses),
+        'dst_port': pyarrow.array(table.dst_port),
+        'src_ip': pyarrow.array(table.src_ip),
+        'dst_ip': pyarrow.array(table.dst_ip),
+    })
+    pyarrow.parquet.write_table(arrow_table, output_file)
+
+
+def network_analytics(vmm_args, threshold=DEFAULT_THRESHOLD, top=DEFAULT_TOP, rare=DEFAULT_RARE, state=None,
+                      subnet=None, json_file=None, parquet_file=None):
+    '''
+    Collects the connections of all processes and prints the network report.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param threshold: Report processes with more connections than this.
+    :param top: The number of top talkers to report.
+    :param rare: Report public remote addresses contacted by at most this many processes.
+    :param state: Optional connection state to restrict the analysis to, e.g. 'ESTABLISHED'.
+    :param subnet: Optional remote IPv4 subnet to restrict the analysis to, e.g. '10.0.0.0/8'.
+    :param json_file: Optional path to save the report as JSON.
+    :param parquet_file: Optional path to export the connections as Parquet.
+    '''
+    if numpy is None:
+        print("Error: network_analytics.py requires numpy (pip install numpy)")
+        return
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+
+        start_time = time.perf_counter()
+        table = NetworkTable.from_records(iter_records(vmm, 'network_connections'))
+        processes = ProcessTable(vmm.process_all())
+        elapsed = time.perf_counter() - start_time
+        print(f"Collected {len(table)} connections and {len(processes.pids)} processes in {elapsed:.2f}s")
+
+        if state:
+            table = table.select(table.in_state(state))
+        if subnet:
+            table = table.select(table.in_subnet(subnet))
+        if state or subnet:
+            print(f"Analyzing {len(table)} connections"
+                  f"{f' in state {state}' if state else ''}{f' to {subnet}' if subnet else ''}")
+
+        start_time = time.perf_counter()
+        report = {
+            'connections': len(table),
+            'processes_over_threshold': top_talkers(table, processes, None, threshold),
+            'top_talkers': top_talkers(table, processes, top),
+            'rare_remotes': rare_remotes(table, processes, rare),
+            'unknown_process_connections': unknown_process_connections(table, processes),
+        }
+        elapsed = time.perf_counter() - start_time
+
+        print(f"\n--- Processes with more than {threshold} connections ---")
+        for entry in report['processes_over_threshold']:
+            print(f"- {entry['process']} (PID: {entry['pid']}): {entry['connections']} connections, "
+                  f"{entry['remote_addresses']} remote addresses")
+
+        print(f"\n--- Top {top} talkers ---")
+        for entry in report['top_talkers']:
+            print(f"- {entry['process']} (PID: {entry['pid']}): {entry['connections']} connections, "
+                  f"{entry['remote_addresses']} remote addresses")
+
+        print(f"\n--- Public remote addresses contacted by at most {rare} process(es) ---")
+        for entry in report['rare_remotes']:
+            ports = ','.join(str(port) for port in entry['ports'])
+            holders = ', '.join(f"{p['process']} ({p['pid']})" for p in entry['processes'])
+            print(f"- {entry['address']} ports {ports}: {entry['connections']} connections from {holders}")
+
+        if report['unknown_process_connections']:
+            print(f"\n--- {len(report['unknown_process_connections'])} connections of PIDs not in the process list ---")
+            for row in report['unknown_process_connections']:
+                print(f"- PID {row['pid']}: {row['protocol']} {row['src_address']}:{row['src_port']} -> "
+                      f"{row['dst_address']}:{row['dst_port']} ({row['state']})")
+
+        print(f"\nAnalysis completed in {elapsed:.3f}s")
+
+        if json_file:
+            with open(json_file, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report saved to: {json_file}")
+
+        if parquet_file:
+            write_parquet(table, processes, parquet_file)
+            print(f"{len(table)} connections written to: {parquet_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("Usage: python network_analytics.py [--threshold <n>] [--top <n>] [--rare <n>] [--state <state>]")
+        print("           [--subnet <cidr>] [--json <file>] [--parquet <file>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python network_analytics.py -device memory.dmp")
+        print("Example: python network_analytics.py --state ESTABLISHED --threshold 100 --json network.json -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    connection_threshold = DEFAULT_THRESHOLD
+    top_count = DEFAULT_TOP
+    rare_processes = DEFAULT_RARE
+    connection_state = None
+    remote_subnet = None
+    json_output = None
+    parquet_output = None
+
+    # Parse arguments
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--threshold' and i + 1 < len(sys.argv):
+            connection_threshold = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--top' and i + 1 < len(sys.argv):
+            top_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--rare' and i + 1 < len(sys.argv):
+            rare_processes = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--state' and i + 1 < len(sys.argv):
+            connection_state = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--subnet' and i + 1 < len(sys.argv):
+            remote_subnet = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--json' and i + 1 < len(sys.argv):
+            json_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--parquet' and i + 1 < len(sys.argv):
+            parquet_output = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        network_analytics(vmm_arguments, connection_threshold, top_count, rare_processes, connection_state,
+                          remote_subnet, json_output, parquet_output)
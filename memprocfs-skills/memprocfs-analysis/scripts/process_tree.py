@@ -0,0 +1,387 @@
+'''
+This script builds the parent/child tree of all processes and answers lineage
+questions: the ancestors of a process, its whole subtree, every process spawned
+(directly or indirectly) by a given program, orphaned processes whose parent is
+no longer in the process list, and parents that are unusual for well-known
+Windows system processes.
+
+The ProcessGraph is built in one pass over the process list: a hash index maps
+each PID to its row, each parent PID is joined against that index, and the
+children of every process are stored as one adjacency array (CSR form).
+Ancestry queries then walk parent rows, subtree and spawned-by queries visit
+each process at most once. Used by system_classification.py for the process
+tree section of the report; can also be imported by custom scripts.
+
+Usage: python process_tree.py [--root <pid>] [--ancestors <pid>] [--descendants <pid>] [--spawned-by <name_glob>]
+           [--orphans] [--suspicious] [--depth <n>] [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import LazyProcessTable
+import sys
+import fnmatch
+from array import array
+from collections import deque
+
+# Usual parents of Windows system processes (lowercase names). A process whose
+# parent is still running but not one of these is reported as suspicious.
+EXPECTED_PARENTS = {
+    'smss.exe': ('system', 'smss.exe'),
+    'csrss.exe': ('smss.exe',),
+    'wininit.exe': ('smss.exe',),
+    'winlogon.exe': ('smss.exe',),
+    'services.exe': ('wininit.exe',),
+    'lsass.exe': ('wininit.exe',),
+    'lsaiso.exe': ('wininit.exe',),
+    'svchost.exe': ('services.exe',),
+    'spoolsv.exe': ('services.exe',),
+    'taskhostw.exe': ('svchost.exe',),
+    'runtimebroker.exe': ('svchost.exe',),
+    'userinit.exe': ('winlogon.exe',),
+    'dwm.exe': ('winlogon.exe',),
+    'explorer.exe': ('userinit.exe',),
+}
+
+# System processes of which only one instance runs at a time.
+SINGLE_INSTANCE = ('wininit.exe', 'services.exe', 'lsass.exe', 'lsaiso.exe')
+
+
+class ProcessGraph:
+    '''
+    The process tree in array form.
+
+    Rows are sorted by PID. parents holds the parent row of every row (-1 for
+    roots), the children of row r are child_rows[child_start[r]:child_start[r + 1]],
+    and order lists all rows breadth-first from the roots, so every parent
+    comes before its children.
+    '''
+
+    def __init__(self, processes):
+        '''
+        :param processes: An iterable of dicts with pid, ppid, name and path, as returned by
+                          system_classification.collect_processes().
+        '''
+        processes = sorted(processes, key=lambda process: process['pid'])
+        self.pids = array('I', (process['pid'] for process in processes))
+        self.ppids = array('I', (process['ppid'] or 0 for process in processes))
+        self.names = [process['name'] or '' for process in processes]
+        self.paths = [process.get('path') for process in processes]
+        count = len(self.pids)
+
+        # Hash index PID -> row, then a hash join of every parent PID against it;
+        # a parent PID of 0 means the process has no parent
+        self.index = {}
+        for row, pid in enumerate(self.pids):
+            self.index.setdefault(pid, row)
+        self.parents = array('i', [-1]) * count
+        for row, ppid in enumerate(self.ppids):
+            parent = self.index.get(ppid, -1) if ppid else -1
+            if parent != row:
+                self.parents[row] = parent
+
+        # Children adjacency in CSR form, filled with a counting sort over the parent rows
+        self.child_start = array('I', [0]) * (count + 1)
+        for parent in self.parents:
+            if parent >= 0:
+                self.child_start[parent + 1] += 1
+        for row in range(count):
+            self.child_start[row + 1] += self.child_start[row]
+        self.child_rows = array('I', [0]) * self.child_start[count]
+        cursor = self.child_start[:count]
+        for row, parent in enumerate(self.parents):
+            if parent >= 0:
+                self.child_rows[cursor[parent]] = row
+                cursor[parent] += 1
+
+        # Depths and breadth-first order from the roots. Rows on a parent cycle,
+        # which PID reuse can create, are not reachable from a root and become roots.
+        self.depths = array('i', [-1]) * count
+        self.order = array('I')
+        self._traverse(row for row in range(count) if self.parents[row] < 0)
+        if len(self.order) < count:
+            self._traverse(row for row in range(count) if self.depths[row] < 0)
+
+    def _traverse(self, roots):
+        for root in roots:
+            if self.depths[root] >= 0:
+                continue
+            self.depths[root] = 0
+            queue = deque([root])
+            while queue:
+                row = queue.popleft()
+                self.order.append(row)
+                for child in self.children_rows(row):
+                    if self.depths[child] < 0:
+                        self.depths[child] = self.depths[row] + 1
+                        queue.append(child)
+
+    def __len__(self):
+        return len(self.pids)
+
+    def __contains__(self, pid):
+        return pid in self.index
+
+    def children_rows(self, row):
+        return self.child_rows[self.child_start[row]:self.child_start[row + 1]]
+
+    def process(self, row):
+        '''
+        Returns a row as a dict.
+        '''
+        return {'pid': self.pids[row], 'ppid': self.ppids[row], 'name': self.names[row], 'path': self.paths[row],
+                'depth': self.depths[row]}
+
+    def children(self, pid):
+        '''
+        Returns the rows of the direct children of a process.
+        '''
+        return list(self.children_rows(self.index[pid]))
+
+    def ancestors(self, pid):
+        '''
+        Returns the rows of the ancestors of a process, its parent first.
+        '''
+        rows = []
+        seen = {self.index[pid]}
+        parent = self.parents[self.index[pid]]
+        while parent >= 0 and parent not in seen:
+            rows.append(parent)
+            seen.add(parent)
+            parent = self.parents[parent]
+        return rows
+
+    def descendants(self, pid):
+        '''
+        Returns the rows of all processes below a process, breadth-first.
+        '''
+        start = self.index[pid]
+        rows = []
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            for child in self.children_rows(queue.popleft()):
+                if child not in seen:
+                    seen.add(child)
+                    rows.append(child)
+                    queue.append(child)
+        return rows
+
+    def spawned_by(self, pattern):
+        '''
+        Returns every process descending from a process whose name matches a glob, e.g. 'winword.exe'.
+
+        :param pattern: A process name glob (case-insensitive).
+        :return: A list of (row, spawner row) tuples; the spawner is the nearest matching ancestor.
+        '''
+        pattern = pattern.lower()
+        matches = [fnmatch.fnmatch(name.lower(), pattern) for name in self.names]
+        spawners = array('i', [-1]) * len(self)
+        # Breadth-first order visits parents before their children, so one pass propagates the spawners
+        for row in self.order:
+            parent = self.parents[row]
+            if parent >= 0:
+                spawners[row] = parent if matches[parent] else spawners[parent]
+        return [(row, spawners[row]) for row in self.order if spawners[row] >= 0]
+
+    def roots(self):
+        return [row for row in self.order if self.depths[row] == 0]
+
+    def orphans(self):
+        '''
+        Returns the rows of processes whose parent PID is not in the process list, e.g. because the parent exited.
+        '''
+        return [row for row in range(len(self))
+                if self.parents[row] < 0 and self.ppids[row] not in (0, self.pids[row])]
+
+    def suspicious(self):
+        '''
+        Returns system processes with an unusual parent or more than one instance.
+
+        :return: A list of (row, reason) tuples.
+        '''
+        findings = []
+        instances = {}
+        for row, name in enumerate(self.names):
+            name = name.lower()
+            parent = self.parents[row]
+            expected = EXPECTED_PARENTS.get(name)
+            if expected and parent >= 0 and self.names[parent].lower() not in expected:
+                findings.append((row, f"unexpected parent {self.names[parent]} (PID: {self.pids[parent]}), "
+                                      f"expected {' or '.join(expected)}"))
+            if name in SINGLE_INSTANCE:
+                instances.setdefault(name, []).append(row)
+        for name, rows in instances.items():
+            if len(rows) > 1:
+                findings.extend((row, f"{len(rows)} instances of {name} running") for row in rows)
+        return findings
+
+    def format_tree(self, pid=None, max_depth=None):
+        '''
+        Yields the tree as indented lines, below one process or from all roots.
+
+        :param pid: Optional PID of the process to start from.
+        :param max_depth: Optional number of levels printed below the start.
+        '''
+        starts = [self.index[pid]] if pid is not None else self.roots()
+        for start in starts:
+            seen = set()
+            stack = [(start, 0)]
+            while stack:
+                row, level = stack.pop()
+                if row in seen:
+                    continue
+                seen.add(row)
+                yield f"{'  ' * level}{self.names[row]} (PID: {self.pids[row]})"
+                if max_depth is None or level < max_depth:
+                    stack.extend((child, level + 1) for child in reversed(self.children_rows(row)))
+
+    def to_dict(self):
+        '''
+        Returns the tree for the classification report: roots, children per PID, orphans and suspicious lineage.
+        '''
+        return {
+            'roots': [self.pids[row] for row in self.roots()],
+            'children': {str(self.pids[row]): [self.pids[child] for child in self.children_rows(row)]
+                         for row in range(len(self)) if self.child_start[row + 1] > self.child_start[row]},
+            'max_depth': max(self.depths) if len(self) else 0,
+            'orphans': [self.process(row) for row in self.orphans()],
+            'suspicious': [dict(self.process(row), reason=reason) for row, reason in self.suspicious()],
+        }
+
+
+def collect_process_graph(vmm):
+    '''
+    Builds the ProcessGraph of a memprocfs.Vmm. Only the PID, parent PID and
+    name of every process are read (see lazy_processes.py); the paths are not.
+    '''
+    return ProcessGraph(LazyProcessTable(vmm).rows(('pid', 'ppid', 'name')))
+
+
+def _describe(graph, row):
+    return f"{graph.names[row]} (PID: {graph.pids[row]}, PPID: {graph.ppids[row]})"
+
+
+def process_tree(vmm_args, root=None, ancestors_of=None, descendants_of=None, spawned_by=None, orphans=False,
+                 suspicious=False, max_depth=None):
+    '''
+    Builds the process tree and prints the requested views. Without a query, the whole tree is printed.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param root: Optional PID; print the tree below this process.
+    :param ancestors_of: Optional PID; print the ancestry of this process.
+    :param descendants_of: Optional PID; print all processes below this process.
+    :param spawned_by: Optional process name glob; print every process it spawned, directly or indirectly.
+    :param orphans: Print the processes whose parent is not in the process list.
+    :param suspicious: Print system processes with an unusual parent or several instances.
+    :param max_depth: Optional number of tree levels printed.
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+        graph = collect_process_graph(vmm)
+        print(f"Process tree: {len(graph)} processes, {len(graph.roots())} roots, "
+              f"max depth {max(graph.depths) if len(graph) else 0}")
+
+        for pid in (ancestors_of, descendants_of, root):
+            if pid is not None and pid not in graph:
+                print(f"Error: Process with PID {pid} not found.")
+                return
+
+        if ancestors_of is not None:
+            rows = graph.ancestors(ancestors_of)
+            print(f"\n--- Ancestry of {_describe(graph, graph.index[ancestors_of])} ---")
+            for level, row in enumerate(rows, 1):
+                print(f"{'  ' * level}<- {_describe(graph, row)}")
+            if rows and graph.parents[rows[-1]] < 0 and graph.ppids[rows[-1]] not in (0, graph.pids[rows[-1]]):
+                print(f"{'  ' * (len(rows) + 1)}<- PID {graph.ppids[rows[-1]]} (not in the process list)")
+
+        if descendants_of is not None:
+            rows = graph.descendants(descendants_of)
+            print(f"\n--- {len(rows)} processes below {_describe(graph, graph.index[descendants_of])} ---")
+            for line in graph.format_tree(descendants_of, max_depth):
+                print(line)
+
+        if spawned_by is not None:
+            pairs = graph.spawned_by(spawned_by)
+            print(f"\n--- {len(pairs)} processes spawned by '{spawned_by}' ---")
+            for row, spawner in pairs:
+                print(f"- {_describe(graph, row)} <- {graph.names[spawner]} (PID: {graph.pids[spawner]})")
+
+        if orphans:
+            rows = graph.orphans()
+            print(f"\n--- {len(rows)} processes whose parent is not in the process list ---")
+            for row in rows:
+                print(f"- {_describe(graph, row)}")
+
+        if suspicious:
+            findings = graph.suspicious()
+            print(f"\n--- {len(findings)} suspicious lineage findings ---")
+            for row, reason in findings:
+                print(f"- {_describe(graph, row)}: {reason}")
+
+        queried = (ancestors_of, descendants_of, spawned_by)
+        if root is not None or not (any(query is not None for query in queried) or orphans or suspicious):
+            print()
+            for line in graph.format_tree(root, max_depth):
+                print(line)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("Usage: python process_tree.py [--root <pid>] [--ancestors <pid>] [--descendants <pid>] [--spawned-by <name_glob>]")
+        print("           [--orphans] [--suspicious] [--depth <n>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python process_tree.py --depth 3 -device memory.dmp")
+        print("Example: python process_tree.py --spawned-by 'winword.exe' --suspicious -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    root_pid = None
+    ancestors_pid = None
+    descendants_pid = None
+    spawner_name = None
+    show_orphans = False
+    show_suspicious = False
+    tree_depth = None
+
+    # Parse arguments
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--root' and i + 1 < len(sys.argv):
+            root_pid = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--ancestors' and i + 1 < len(sys.argv):
+            ancestors_pid = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--descendants' and i + 1 < len(sys.argv):
+            descendants_pid = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--spawned-by' and i + 1 < len(sys.argv):
+            spawner_name = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--orphans':
+            show_orphans = True
+            i += 1
+        elif sys.argv[i] == '--suspicious':
+            show_suspicious = True
+            i += 1
+        elif sys.argv[i] == '--depth' and i + 1 < len(sys.argv):
+            tree_depth = int(sys.argv[i + 1])
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        process_tree(vmm_arguments, root_pid, ancestors_pid, descendants_pid, spawner_name, show_orphans,
+                     show_suspicious, tree_depth)
@@ -0,0 +1,385 @@
+'''
+Page hashing and known-good filtering of process memory.
+
+Most of the mapped memory of a process is usually pages of shared images,
+such as system DLLs, and zero pages, which look the same on every host. This
+module hashes process memory page by page, collects the page digests of a
+clean baseline image into a known-good set, and filters the pages found in
+such a set out of the chunks a dump or a YARA scan reads, so only the runs of
+remaining pages are written or scanned. Used by dump_process_memory.py and
+yara_scan_process.py (--known-good); can also be imported by custom scripts:
+
+    known = KnownGoodSet.load('baseline.hashes')
+    for address, data in iter_unknown_chunks(process, known):
+        ...
+
+Pages are hashed with a fast 128-bit hash by default: xxh3 when the optional
+xxhash package is installed (pip install xxhash), blake2b otherwise. A fast
+hash tells pages apart but does not resist crafted collisions; build the set
+with --sha256 when it has to hold against an attacker who knows the baseline.
+The pages are hashed on the thread pool that reads memory.
+
+A skipped page is left out of the dump and not scanned, so a YARA match
+crossing from a known-good page into another page is not found.
+
+Set file layout (little-endian):
+
+    header   MAGIC, format version, hash id, digest count
+    digests  the sorted page digests, one after another
+
+A loaded set is not read into Python objects: the file is mapped into memory
+and searched in place. An index of where the digests with each two-byte
+prefix start, found by binary search, narrows a lookup to a few digests. A
+set of millions of pages costs little more than the pages of the file that
+lookups touch, and those are shared by all processes loading the same file.
+
+Usage: python region_hashes.py --build <set_file> [--sha256] [--threads <n>] [vmm_args...]
+       python region_hashes.py --check <set_file> [--threads <n>] [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+import os
+import sys
+import mmap
+import time
+import struct
+import hashlib
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from memory_regions import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_INFLIGHT, PAGE_SIZE, get_memory_regions,
+                            iter_chunk_ranges, iter_region_chunks_parallel, read_chunk)
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+MAGIC = b'MPFSHSET'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQ')
+
+# Hash ids in the header, by index, and the size of their digests.
+HASHES = ('xxh3', 'blake2b', 'sha256')
+DIGEST_SIZES = {'xxh3': 16, 'blake2b': 16, 'sha256': 32}
+DEFAULT_HASH = 'xxh3' if xxhash is not None else 'blake2b'
+
+DEFAULT_THREADS = 4
+
+
+def _hasher(hash_name):
+    '''
+    Returns a function returning the digest of one page.
+    '''
+    if hash_name == 'xxh3':
+        if xxhash is None:
+            raise RuntimeError("xxh3 hash sets require xxhash (pip install xxhash)")
+        return xxhash.xxh3_128_digest
+    if hash_name == 'blake2b':
+        return lambda data: hashlib.blake2b(data, digest_size=16).digest()
+    return lambda data: hashlib.sha256(data).digest()
+
+
+def page_digests(hasher, data):
+    '''
+    Hashes a chunk of memory page by page.
+
+    :param hasher: A function returned by _hasher().
+    :param data: The chunk data, starting at a page boundary.
+    :return: A list with the digest of every page.
+    '''
+    view = memoryview(data)
+    return [hasher(view[offset:offset + PAGE_SIZE]) for offset in range(0, len(data), PAGE_SIZE)]
+
+
+class KnownGoodSet:
+    '''
+    A set of the page digests of known-good memory, kept as one sorted run of
+    fixed-size digests. Digests added with update() are kept in a Python set
+    until save(). The set is only read while filtering, so one instance can be
+    shared by all threads.
+    '''
+
+    def __init__(self, hash_name=DEFAULT_HASH, digests=()):
+        self.hash_name = hash_name
+        self.hasher = _hasher(hash_name)
+        self.digest_size = DIGEST_SIZES[hash_name]
+        self._added = set()
+        digests = sorted(set(digests))
+        self._attach(b''.join(digests), 0, len(digests))
+
+    def _attach(self, buffer, offset, count):
+        '''
+        Uses count sorted digests stored in a buffer (bytes or mmap) from offset.
+        '''
+        size = self.digest_size
+        end = offset + count * size
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        # Offsets where the digests with each two-byte prefix start
+        firsts = buffer[offset:end:size]
+        seconds = buffer[offset + 1:end:size]
+        self._bounds = bounds = []
+        for first in range(256):
+            lo = bisect_left(firsts, first)
+            hi = bisect_left(firsts, first + 1, lo)
+            if hi - lo < 256:
+                # Small buckets are filled in one pass over their second bytes
+                row = []
+                for index in range(lo, hi):
+                    row.extend([offset + index * size] * (seconds[index] + 1 - len(row)))
+                row.extend([offset + hi * size] * (256 - len(row)))
+                bounds.extend(row)
+            else:
+                bounds.extend([offset + bisect_left(seconds, second, lo, hi) * size for second in range(256)])
+        bounds.append(end)
+
+    def __len__(self):
+        return self._count + len(self._added)
+
+    def __contains__(self, digest):
+        prefix = digest[0] << 8 | digest[1]
+        end = self._bounds[prefix + 1]
+        position = self._buffer.find(digest, self._bounds[prefix], end)
+        # A match must start at a digest boundary
+        while position >= 0 and (position - self._offset) % self.digest_size:
+            position = self._buffer.find(digest, position + 1, end)
+        return position >= 0 or digest in self._added
+
+    def _iter_digests(self):
+        size = self.digest_size
+        for start in range(self._offset, self._offset + self._count * size, size):
+            yield self._buffer[start:start + size]
+
+    def update(self, digests):
+        self._added.update(digest for digest in digests if digest not in self)
+
+    def split(self, address, data):
+        '''
+        Splits a chunk into the runs of pages that are not in the set.
+
+        :param address: The virtual address of the chunk.
+        :param data: The chunk data.
+        :return: A list of (address, data) tuples in address order.
+        '''
+        contains = self.__contains__
+        runs = []
+        start = None
+        for i, digest in enumerate(page_digests(self.hasher, data)):
+            offset = i * PAGE_SIZE
+            if contains(digest):
+                if start is not None:
+                    runs.append((address + start, data[start:offset]))
+                    start = None
+            elif start is None:
+                start = offset
+        if start == 0:
+            runs.append((address, data))
+        elif start is not None:
+            runs.append((address + start, data[start:]))
+        return runs
+
+    def save(self, path):
+        '''
+        Writes the set to a file, see the layout in the module docstring.
+        '''
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, HASHES.index(self.hash_name), len(self)))
+            if self._added:
+                f.write(b''.join(sorted(self._added.union(self._iter_digests()))))
+            else:
+                f.write(self._buffer[self._offset:self._offset + self._count * self.digest_size])
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Maps a set written by save() into memory.
+        '''
+        with open(path, 'rb') as f:
+            magic, version, hash_id, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or hash_id >= len(HASHES):
+                raise ValueError(f"{path} is not a known-good hash set")
+            known = cls(HASHES[hash_id])
+            if os.fstat(f.fileno()).st_size < HEADER.size + count * known.digest_size:
+                raise ValueError(f"{path} is truncated")
+            if count:
+                # The mapping stays valid after the file is closed
+                known._attach(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), HEADER.size, count)
+        return known
+
+
+def iter_process_digests(process, hasher, pool=None, regions=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                         max_inflight=DEFAULT_MAX_INFLIGHT):
+    '''
+    Yields the page digests of the mapped regions of a process, one list per chunk.
+
+    :param process: A memprocfs process object.
+    :param hasher: A function returned by _hasher().
+    :param pool: Optional thread pool used to read and hash chunks ahead of the consumer.
+    :param regions: Optional list of (base, size) tuples; defaults to get_memory_regions().
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param max_inflight: The maximum number of bytes read ahead when a pool is used.
+    '''
+    def read(process, address, size):
+        return page_digests(hasher, read_chunk(process, address, size))
+
+    if regions is None:
+        regions = get_memory_regions(process)
+    if pool:
+        for _, digests in iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight, read):
+            yield digests
+    else:
+        for address, size in iter_chunk_ranges(regions, chunk_size):
+            yield read(process, address, size)
+
+
+def iter_unknown_chunks(process, known, pool=None, regions=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                        max_inflight=DEFAULT_MAX_INFLIGHT, stats=None):
+    '''
+    Same as iter_region_chunks(), but the pages found in a known-good set are
+    left out; a chunk is yielded as the runs of its remaining pages.
+
+    :param process: A memprocfs process object.
+    :param known: A KnownGoodSet.
+    :param pool: Optional thread pool used to read and hash chunks ahead of the consumer.
+    :param regions: Optional list of (base, size) tuples; defaults to get_memory_regions().
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param max_inflight: The maximum number of bytes read ahead when a pool is used.
+    :param stats: Optional dict; its 'bytes_skipped' entry is updated while reading.
+    '''
+    def read(process, address, size):
+        return size, known.split(address, read_chunk(process, address, size))
+
+    if regions is None:
+        regions = get_memory_regions(process)
+    if pool:
+        results = (result for _, result in
+                   iter_region_chunks_parallel(process, pool, regions, chunk_size, max_inflight, read))
+    else:
+        results = (read(process, address, size) for address, size in iter_chunk_ranges(regions, chunk_size))
+    for size, runs in results:
+        if stats is not None:
+            stats['bytes_skipped'] = stats.get('bytes_skipped', 0) + size - sum(len(data) for _, data in runs)
+        yield from runs
+
+
+def build_known_good(set_file, vmm_args, hash_name=DEFAULT_HASH, threads=DEFAULT_THREADS,
+                     chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Builds a known-good set from the pages of every process of a clean baseline image.
+
+    :param set_file: The path to save the set.
+    :param vmm_args: A list of arguments to initialize MemProcFS with the baseline image.
+    :param hash_name: 'xxh3', 'blake2b' or 'sha256'.
+    :param threads: The number of worker threads reading and hashing memory.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    '''
+    try:
+        start_time = time.perf_counter()
+        known = KnownGoodSet(hash_name)
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+
+        processes = sorted(vmm.process_all(), key=lambda p: p.pid)
+        print(f"Hashing the pages of {len(processes)} processes with {hash_name} using {threads} threads...")
+        hashed = 0
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for process in processes:
+                try:
+                    for digests in iter_process_digests(process, known.hasher, pool, chunk_size=chunk_size):
+                        known.update(digests)
+                        hashed += len(digests) * PAGE_SIZE
+                except Exception as e:
+                    print(f"  - {process.name} (PID: {process.pid}): failed: {e}")
+
+        known.save(set_file)
+        wall_time = time.perf_counter() - start_time
+        print(f"Hashed {hashed} bytes in {wall_time:.2f}s: {len(known)} distinct pages written to {set_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def check_known_good(set_file, vmm_args, threads=DEFAULT_THREADS, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Reports how much of the memory of every process a known-good set would
+    skip, to estimate what it saves before dumping or scanning.
+
+    :param set_file: Path of a set written by build_known_good().
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param threads: The number of worker threads reading and hashing memory.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    '''
+    try:
+        start_time = time.perf_counter()
+        known = KnownGoodSet.load(set_file)
+        print(f"Loaded {len(known)} {known.hash_name} page digests from {set_file}")
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+
+        total_mapped = total_known = 0
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for process in sorted(vmm.process_all(), key=lambda p: p.pid):
+                mapped = matched = 0
+                try:
+                    for digests in iter_process_digests(process, known.hasher, pool, chunk_size=chunk_size):
+                        mapped += len(digests) * PAGE_SIZE
+                        matched += sum(PAGE_SIZE for digest in digests if digest in known)
+                except Exception as e:
+                    print(f"  - {process.name} (PID: {process.pid}): failed: {e}")
+                    continue
+                if mapped:
+                    print(f"  - {process.name} (PID: {process.pid}): {matched} of {mapped} bytes known-good "
+                          f"({matched / mapped * 100:.1f}%)")
+                total_mapped += mapped
+                total_known += matched
+
+        wall_time = time.perf_counter() - start_time
+        share = total_known / total_mapped * 100 if total_mapped else 0.0
+        print(f"{total_known} of {total_mapped} bytes known-good ({share:.1f}%), checked in {wall_time:.2f}s")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 3 or sys.argv[1] not in ('--build', '--check'):
+        print("Usage: python region_hashes.py --build <set_file> [--sha256] [--threads <n>] [vmm_args...]")
+        print("       python region_hashes.py --check <set_file> [--threads <n>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python region_hashes.py --build baseline.hashes -device clean.dmp")
+        print("Example: python region_hashes.py --check baseline.hashes -device memory.dmp")
+        sys.exit(1)
+
+    mode, set_path = sys.argv[1], sys.argv[2]
+    args = sys.argv[3:]
+    vmm_arguments = []
+    hash_algorithm = DEFAULT_HASH
+    thread_count = DEFAULT_THREADS
+
+    # Parse arguments
+    i = 0
+    while i < len(args):
+        if args[i] == '--sha256':
+            hash_algorithm = 'sha256'
+            i += 1
+        elif args[i] == '--threads' and i + 1 < len(args):
+            thread_count = int(args[i + 1])
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if mode == '--build':
+            build_known_good(set_path, vmm_arguments, hash_algorithm, thread_count)
+        else:
+            check_known_good(set_path, vmm_arguments, thread_count)
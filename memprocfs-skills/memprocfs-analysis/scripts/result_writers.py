@@ -0,0 +1,292 @@
+'''
+Batched writers for the records the scripts report: JSON lines, CSV, Arrow
+IPC and aligned text tables.
+
+Printing one f-string per record costs a formatting call and a terminal write
+for every handle or match. The writers collect records in batches and write
+each batch with a single call to a buffered file or to stdout, so exporting a
+host with hundreds of thousands of handles takes seconds. Used by
+list_process_handles.py, handle_table.py, fleet_triage.py, yara_scan_process.py,
+dump_process_memory.py and system_classification.py; can also be imported by
+custom scripts:
+
+    with open_writer('csv', 'handles.csv') as out:
+        out.write_many(records)
+
+Records are dicts. The columns of the CSV, Arrow and table formats are the
+fields passed to the writer, or the keys of the first record. Column types can
+be given as 'int', 'hex' (an int shown in hexadecimal in tables), 'float',
+'str' or 'bool'; Arrow infers the types it is not given from the first batch.
+
+When records go to stdout in a machine-readable format, the messages of the
+script go to stderr (see ResultWriter.messages), so the stream stays clean.
+
+Arrow output uses the IPC stream format and requires the optional pyarrow
+package (pip install pyarrow):
+
+    with pyarrow.ipc.open_stream('handles.arrow') as reader:
+        table = reader.read_all()
+'''
+
+import sys
+import csv
+import json
+from itertools import islice
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+FORMATS = ('table', 'jsonl', 'csv', 'arrow')
+
+# File extension of each format, e.g. for one file per table.
+EXTENSIONS = {'table': 'txt', 'jsonl': 'jsonl', 'csv': 'csv', 'arrow': 'arrow'}
+
+# Records written with one call.
+DEFAULT_BATCH_SIZE = 4096
+
+# Buffer of an output file (1 MiB).
+BUFFER_SIZE = 0x100000
+
+
+def guess_format(output_file, default='table'):
+    '''
+    Returns the format matching the extension of an output file.
+
+    :param output_file: Optional path of the output file.
+    :param default: The format used for stdout and unknown extensions.
+    '''
+    if output_file:
+        extension = output_file.rsplit('.', 1)[-1].lower()
+        for name, known in EXTENSIONS.items():
+            if extension == known and name != 'table':
+                return name
+    return default
+
+
+class ResultWriter:
+    '''
+    Collects records and writes them in batches. Subclasses implement
+    _write_batch() and, if needed, _finish().
+    '''
+    binary = False
+    newline = None
+    # Whether the output is meant for programs rather than people
+    machine_readable = True
+
+    def __init__(self, output_file=None, fields=None, types=None, batch_size=DEFAULT_BATCH_SIZE, widths=None):
+        '''
+        :param output_file: Optional path of the output file; defaults to stdout.
+        :param fields: Optional list of the fields written; defaults to the keys of the first record.
+        :param types: Optional dict mapping fields to 'int', 'hex', 'float', 'str' or 'bool'.
+        :param batch_size: The number of records written with one call.
+        :param widths: Optional dict of minimum column widths (table format).
+        '''
+        self.output_file = output_file
+        self.fields = list(fields) if fields else None
+        self.types = dict(types or {})
+        self.min_widths = dict(widths or {})
+        self.batch_size = max(1, batch_size)
+        self.count = 0
+        self._batch = []
+        if output_file:
+            self._file = open(output_file, 'wb' if self.binary else 'w', buffering=BUFFER_SIZE,
+                              **({} if self.binary else {'encoding': 'utf-8', 'newline': self.newline}))
+        else:
+            self._file = sys.stdout.buffer if self.binary else sys.stdout
+        # Messages must not be mixed into a machine-readable stream on stdout
+        self.messages = sys.stderr if output_file is None and self.machine_readable else sys.stdout
+
+    def write(self, record):
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records):
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, self.batch_size - len(self._batch)))
+            if not chunk:
+                break
+            self._batch.extend(chunk)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        '''
+        Writes the records collected so far.
+        '''
+        if self._batch:
+            if self.fields is None:
+                self.fields = list(self._batch[0])
+            self._write_batch(self._batch)
+            self.count += len(self._batch)
+            self._batch = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._finish()
+        if self.output_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonlWriter(ResultWriter):
+    '''
+    Writes every record as one JSON line, with all of its keys.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def _write_batch(self, batch):
+        encode = self._encode
+        self._file.write('\n'.join([encode(record) for record in batch]) + '\n')
+
+
+class CsvWriter(ResultWriter):
+    '''
+    Writes the records as CSV with a header row. Missing values are empty.
+    '''
+    newline = ''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._header = False
+
+    def _write_batch(self, batch):
+        fields = self.fields
+        if not self._header:
+            self._writer.writerow(fields)
+            self._header = True
+        self._writer.writerows(zip(*[[record.get(field) for record in batch] for field in fields]))
+
+    def _finish(self):
+        if not self._header and self.fields:
+            self._writer.writerow(self.fields)
+
+
+class TableWriter(ResultWriter):
+    '''
+    Writes the records as a text table. The column widths are taken from the
+    header, the minimum widths and the first batch; longer values widen their
+    row only.
+    '''
+    machine_readable = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._widths = None
+        self._format = None
+
+    def _column(self, field, batch):
+        '''
+        Returns the cells of one column of a batch.
+        '''
+        convert = hex if self.types.get(field) == 'hex' else str
+        values = [record.get(field) for record in batch]
+        if None in values:
+            return ['-' if value is None else convert(value) for value in values]
+        return list(map(convert, values))
+
+    def _write_batch(self, batch):
+        fields = self.fields
+        # Converting column by column keeps the per-value work in C
+        columns = [self._column(field, batch) for field in fields]
+        lines = []
+        if self._widths is None:
+            self._widths = [max([len(field), self.min_widths.get(field, 0)] + list(map(len, cells)))
+                            for field, cells in zip(fields, columns)]
+            # The last column is not padded
+            self._format = '  '.join([f"{{:<{width}}}" for width in self._widths[:-1]] + ['{}'])
+            lines.append(self._format.format(*fields).rstrip())
+            lines.append(self._format.format(*['-' * width for width in self._widths]))
+        line_format = self._format.format
+        lines.extend([line_format(*row).rstrip() for row in zip(*columns)])
+        self._file.write('\n'.join(lines) + '\n')
+
+
+class ArrowWriter(ResultWriter):
+    '''
+    Writes each batch as one record batch of an Arrow IPC stream. Requires the
+    optional pyarrow package.
+    '''
+    binary = True
+
+    ARROW_TYPES = {'int': 'int64', 'hex': 'uint64', 'float': 'float64', 'str': 'string', 'bool': 'bool_'}
+
+    def __init__(self, *args, **kwargs):
+        if pyarrow is None:
+            raise RuntimeError("Arrow export requires pyarrow (pip install pyarrow)")
+        super().__init__(*args, **kwargs)
+        self._schema = None
+        self._stream = None
+
+    def _field_type(self, field, values):
+        '''
+        Returns the Arrow type of a field: the declared one, else the type
+        inferred from its values, falling back to uint64 for large integers
+        and string for columns without values.
+        '''
+        if field in self.types:
+            return getattr(pyarrow, self.ARROW_TYPES[self.types[field]])()
+        try:
+            arrow_type = pyarrow.array(values).type
+        except (OverflowError, pyarrow.ArrowInvalid):
+            arrow_type = pyarrow.uint64()
+        return pyarrow.string() if arrow_type == pyarrow.null() else arrow_type
+
+    def _write_batch(self, batch):
+        columns = {field: [record.get(field) for record in batch] for field in self.fields}
+        if self._schema is None:
+            self._schema = pyarrow.schema([(field, self._field_type(field, values))
+                                           for field, values in columns.items()])
+            self._stream = pyarrow.ipc.new_stream(self._file, self._schema)
+        arrays = [pyarrow.array(columns[field.name], type=field.type) for field in self._schema]
+        self._stream.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self._schema))
+
+    def _finish(self):
+        if self._stream is None and self.fields:
+            # An empty stream still carries the schema
+            self._schema = pyarrow.schema([(field, self._field_type(field, [])) for field in self.fields])
+            self._stream = pyarrow.ipc.new_stream(self._file, self._schema)
+        if self._stream is not None:
+            self._stream.close()
+
+
+WRITERS = {'table': TableWriter, 'jsonl': JsonlWriter, 'csv': CsvWriter, 'arrow': ArrowWriter}
+
+
+def open_writer(fmt, output_file=None, fields=None, types=None, batch_size=DEFAULT_BATCH_SIZE, widths=None):
+    '''
+    Opens a writer for one of FORMATS.
+
+    :param fmt: 'table', 'jsonl', 'csv' or 'arrow'.
+    :param output_file: Optional path of the output file; defaults to stdout.
+    :param fields: Optional list of the fields written; defaults to the keys of the first record.
+    :param types: Optional dict mapping fields to 'int', 'hex', 'float', 'str' or 'bool'.
+    :param batch_size: The number of records written with one call.
+    :param widths: Optional dict of minimum column widths (table format).
+    :return: A ResultWriter, to be closed (or used as a context manager).
+    '''
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown output format '{fmt}' (available: {', '.join(FORMATS)})")
+    return WRITERS[fmt](output_file, fields, types, batch_size, widths)
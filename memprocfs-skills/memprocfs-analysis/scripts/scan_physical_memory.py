@@ -0,0 +1,443 @@
+'''
+This script scans the physical memory of an image for many patterns at once
+and maps every hit back to the process owning the page, where possible.
+
+For a raw dump file (-device <file> without a crash dump, ELF core or
+hibernation file header) the file offset is the physical address. Every
+worker process memory-maps the file and scans its own ranges of it in place,
+so no memory is copied between processes. For all other sources the physical
+memory map is read through vmm.memory in large aligned batches, which are
+matched by the worker processes while the next batch is read.
+
+Patterns are compiled YARA rules (see yara_rules.py; the compiled rules are
+cached on disk) and/or literal strings and hex byte sequences. A few literals
+are each searched with find(); larger sets are compiled into one regular
+expression matching all of them in a single pass.
+Each batch is scanned together with the first --overlap bytes of the next one,
+and a hit is only reported by the batch it starts in, so hits crossing a batch
+boundary are found exactly once.
+
+Owners are looked up in the PFN database (vmm.maps.pfn()): a hit in a page of
+a process's private memory is reported with the PID, the process name and
+the virtual address. For a raw dump MemProcFS is only initialized for this
+lookup, after the scan; --no-owners skips it.
+
+Usage: python scan_physical_memory.py [--rules <yara_rule_file>] [--string <text>] [--hex <hex_bytes>] [--workers <n>]
+           [--batch-size <bytes>] [--overlap <bytes>] [--vmm] [--no-owners] [--jsonl <output_file>]
+           [--cache-dir <dir>] -device <memory_source>
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import process_table
+from yara_rules import DEFAULT_CACHE_DIR, iter_match_hits, load_rules
+import os
+import re
+import sys
+import json
+import mmap
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import memprocfs
+
+DEFAULT_WORKERS = 4
+
+# Size of the physical ranges handed to a worker; batches start at multiples of it (16 MiB).
+DEFAULT_BATCH_SIZE = 0x1000000
+
+# Bytes past the end of a batch that are scanned with it; the longest hit that can cross a boundary.
+DEFAULT_OVERLAP = 0x1000
+
+# Number of page frames looked up in the PFN database at once.
+PFN_BATCH = 0x1000
+
+# Up to this many literal patterns are searched one by one with find(), which is
+# several times faster per pattern than a regular expression alternation.
+MAX_FIND_PATTERNS = 16
+
+PAGE_SHIFT = 12
+
+# Headers of memory image formats whose file offsets are not physical addresses.
+IMAGE_HEADERS = (b'PAGEDUMP', b'PAGEDU64', b'MDMP', b'\x7fELF', b'HIBR', b'hibr', b'WAKE', b'wake', b'EMiL')
+
+# Matcher and dump file mapping of a worker process, set up once by _init_worker().
+_matcher = None
+_dump = None
+
+
+class PatternMatcher:
+    '''
+    Matches compiled YARA rules and literal byte patterns in a buffer.
+    '''
+
+    def __init__(self, rules=None, literals=()):
+        '''
+        :param rules: Optional yara.Rules object.
+        :param literals: A list of (name, bytes) patterns, e.g. ('string', b'mimikatz').
+        '''
+        self.rules = rules
+        self.names = {}
+        for name, pattern in literals:
+            self.names.setdefault(pattern, name)
+        self.patterns = []
+        self.regex = None
+        if len(self.names) <= MAX_FIND_PATTERNS:
+            self.patterns = list(self.names)
+        else:
+            # Longest first: the regex then matches the longest pattern at an address,
+            # and every other pattern matching there is one of its prefixes
+            patterns = sorted(self.names, key=len, reverse=True)
+            self.prefixes = {pattern: [other for other in patterns if pattern.startswith(other)]
+                             for pattern in patterns}
+            self.regex = re.compile(b'|'.join(re.escape(pattern) for pattern in patterns))
+
+    def scan(self, buffer, base, start, end, limit):
+        '''
+        Yields the hits starting in [start, end) of a buffer.
+
+        :param buffer: Bytes, or an mmap, holding physical memory from address base on.
+        :param base: The physical address of buffer[0].
+        :param start: The first address of the batch.
+        :param end: The end of the batch; hits starting here or later belong to the next batch.
+        :param limit: The end of the data scanned, i.e. end plus the overlap.
+        :return: A generator of dicts with 'rule', 'identifier', 'address' and 'data'.
+        '''
+        for pattern in self.patterns:
+            position = buffer.find(pattern, start - base, limit - base)
+            while position != -1 and base + position < end:
+                yield {'rule': self.names[pattern], 'identifier': pattern.hex(), 'address': base + position,
+                       'data': pattern}
+                position = buffer.find(pattern, position + 1, limit - base)
+        if self.regex is not None:
+            position = start - base
+            while True:
+                # Searching again from the next byte also finds patterns overlapping a hit
+                match = self.regex.search(buffer, position, limit - base)
+                if match is None or base + match.start() >= end:
+                    break
+                for data in self.prefixes[match.group()]:
+                    yield {'rule': self.names[data], 'identifier': data.hex(), 'address': base + match.start(),
+                           'data': data}
+                position = match.start() + 1
+        if self.rules is not None:
+            data = memoryview(buffer)[start - base:limit - base]
+            try:
+                matches = self.rules.match(data=data)
+            except TypeError:
+                # Older yara-python versions only accept bytes
+                matches = self.rules.match(data=data.tobytes())
+            for match in matches:
+                for identifier, offset, matched in iter_match_hits(match):
+                    if offset is None:
+                        # Rule-level match: report it at the start of the batch, not in the overlap.
+                        yield {'rule': match.rule, 'identifier': None, 'address': start, 'data': b''}
+                    elif start + offset < end:
+                        yield {'rule': match.rule, 'identifier': identifier, 'address': start + offset,
+                               'data': matched}
+
+
+def parse_literals(strings, hex_strings):
+    '''
+    Returns the literal patterns of --string and --hex as (name, bytes) tuples.
+
+    :param strings: Text patterns; each is searched as UTF-8 and as UTF-16LE.
+    :param hex_strings: Byte patterns in hex, e.g. '4d5a9000'.
+    '''
+    literals = []
+    for text in strings:
+        literals.append(('string', text.encode('utf-8')))
+        literals.append(('wide', text.encode('utf-16-le')))
+    for text in hex_strings:
+        literals.append(('hex', bytes.fromhex(text.replace(' ', ''))))
+    return literals
+
+
+def raw_dump_file(vmm_args):
+    '''
+    Returns the -device file if it is a raw dump, whose file offsets are physical addresses.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :return: The file path, or None for other image formats and devices.
+    '''
+    try:
+        path = vmm_args[vmm_args.index('-device') + 1]
+    except (ValueError, IndexError):
+        return None
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as f:
+        header = f.read(8)
+    return None if header.startswith(IMAGE_HEADERS) else path
+
+
+def iter_batches(ranges, batch_size=DEFAULT_BATCH_SIZE, overlap=DEFAULT_OVERLAP):
+    '''
+    Splits physical ranges at multiples of batch_size into batches.
+
+    :param ranges: An iterable of (base, size) tuples.
+    :param batch_size: The batch alignment and maximum batch size.
+    :param overlap: Bytes past the end of a batch scanned with it.
+    :return: A generator of (start, end, limit) tuples; limit is the end of the
+             scanned data, which never extends past the range, as a hit cannot span a hole.
+    '''
+    for base, size in ranges:
+        start, stop = base, base + size
+        while start < stop:
+            end = min(stop, (start // batch_size + 1) * batch_size)
+            yield start, end, min(stop, end + overlap)
+            start = end
+
+
+def _init_worker(rule_file, cache_dir, literals, dump_file):
+    global _matcher, _dump
+    rules = load_rules(rule_file, cache_dir) if rule_file else None
+    _matcher = PatternMatcher(rules, literals)
+    if dump_file:
+        with open(dump_file, 'rb') as f:
+            _dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _scan_dump_batch(start, end, limit):
+    return list(_matcher.scan(_dump, 0, start, end, limit))
+
+
+def _scan_data_batch(data, start, end):
+    return list(_matcher.scan(data, start, start, end, start + len(data)))
+
+
+def iter_dump_hits(pool, batches):
+    '''
+    Scans batches of a raw dump on the worker processes; each worker reads its own mapping of the file.
+
+    :param pool: A ProcessPoolExecutor set up by _init_worker() with the dump file.
+    :param batches: A list of (start, end, limit) tuples, see iter_batches().
+    :return: A generator of (bytes_scanned, hits) tuples, one per batch.
+    '''
+    starts, ends, limits = zip(*batches)
+    for start, end, hits in zip(starts, ends, pool.map(_scan_dump_batch, starts, ends, limits)):
+        yield end - start, hits
+
+
+def iter_vmm_hits(pool, vmm, batches, workers):
+    '''
+    Reads batches of physical memory through vmm.memory and scans them on the
+    worker processes. At most two batches per worker are read ahead.
+
+    :param pool: A ProcessPoolExecutor set up by _init_worker().
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param batches: A list of (start, end, limit) tuples, see iter_batches().
+    :param workers: The number of worker processes.
+    :return: A generator of (bytes_scanned, hits) tuples, one per batch.
+    '''
+    pending = deque()
+    for start, end, limit in batches:
+        data = vmm.memory.read(start, limit - start, memprocfs.FLAG_ZEROPAD_ON_FAIL)
+        pending.append((end - start, pool.submit(_scan_data_batch, data, start, end)))
+        while len(pending) > 2 * workers:
+            scanned, future = pending.popleft()
+            yield scanned, future.result()
+    while pending:
+        scanned, future = pending.popleft()
+        yield scanned, future.result()
+
+
+def physical_ranges(vmm):
+    '''
+    Returns the physical memory map of a Vmm as a sorted list of (base, size) tuples.
+    '''
+    return sorted((entry['pa'], entry['cb']) for entry in vmm.maps.memmap() if entry['cb'] > 0)
+
+
+def resolve_owners(vmm, hits):
+    '''
+    Adds the owning process of every hit's page from the PFN database: 'pid',
+    'process' and the virtual address 'va'. Hits in pages not owned by a
+    process, e.g. kernel or file cache pages, keep pid None.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param hits: A list of hit dicts with a physical 'address'.
+    :return: The number of hits with an owner.
+    '''
+    pfns = sorted({hit['address'] >> PAGE_SHIFT for hit in hits})
+    owners = {}
+    for i in range(0, len(pfns), PFN_BATCH):
+        for entry in vmm.maps.pfn(pfns[i:i + PFN_BATCH], True):
+            if entry.get('pid'):
+                owners[entry['pfn']] = (entry['pid'], entry.get('va'))
+
+    table = process_table(vmm)
+    resolved = 0
+    for hit in hits:
+        owner = owners.get(hit['address'] >> PAGE_SHIFT)
+        if owner is None:
+            continue
+        pid, va = owner
+        hit['pid'] = pid
+        hit['process'] = table[pid].name if pid in table else None
+        hit['va'] = va + (hit['address'] & ((1 << PAGE_SHIFT) - 1)) if va else None
+        resolved += 1
+    return resolved
+
+
+def scan_physical_memory(vmm_args, rule_file=None, strings=(), hex_strings=(), workers=DEFAULT_WORKERS,
+                         batch_size=DEFAULT_BATCH_SIZE, overlap=DEFAULT_OVERLAP, use_vmm=False, owners=True,
+                         jsonl_file=None, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Scans physical memory for YARA rules and literal patterns on a pool of worker processes.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param rule_file: Optional path to a YARA rule file; requires yara-python.
+    :param strings: Text patterns, searched as UTF-8 and UTF-16LE.
+    :param hex_strings: Byte patterns in hex.
+    :param workers: The number of worker processes matching batches.
+    :param batch_size: The size and alignment of the physical ranges scanned at once.
+    :param overlap: Bytes past a batch scanned with it, so hits crossing the boundary are found.
+    :param use_vmm: Read through vmm.memory even if the device is a raw dump file.
+    :param owners: Look up the owning process of every hit.
+    :param jsonl_file: Optional path to write the hits as JSON lines.
+    :param cache_dir: Directory holding the compiled rules.
+    '''
+    try:
+        start_time = time.perf_counter()
+        literals = parse_literals(strings, hex_strings)
+        if rule_file:
+            if load_rules(rule_file, cache_dir) is None:
+                print("Error: YARA rules require the yara-python package (pip install yara-python); "
+                      "use --string or --hex without it.")
+                return
+        elif not literals:
+            print("Error: No patterns given (use --rules, --string or --hex).")
+            return
+
+        dump_file = None if use_vmm else raw_dump_file(vmm_args)
+        vmm = None
+        if dump_file:
+            ranges = [(0, os.path.getsize(dump_file))]
+            print(f"Scanning raw dump {dump_file} ({ranges[0][1]} bytes) with {workers} workers...")
+        else:
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS initialized with args: {vmm_args}")
+            ranges = physical_ranges(vmm)
+            print(f"Scanning {sum(size for _, size in ranges)} bytes of physical memory in {len(ranges)} ranges "
+                  f"with {workers} workers...")
+
+        batches = list(iter_batches(ranges, batch_size, overlap))
+        hits = []
+        scanned = 0
+        with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker,
+                                 initargs=(rule_file, cache_dir, literals, dump_file)) as pool:
+            if not batches:
+                results = []
+            elif dump_file:
+                results = iter_dump_hits(pool, batches)
+            else:
+                results = iter_vmm_hits(pool, vmm, batches, workers)
+            for batch_bytes, batch_hits in results:
+                scanned += batch_bytes
+                hits.extend(batch_hits)
+        scan_time = time.perf_counter() - start_time
+        hits.sort(key=lambda hit: hit['address'])
+        print(f"Scanned {scanned} bytes in {scan_time:.2f}s "
+              f"({scanned / scan_time / 0x100000 if scan_time > 0 else 0:.0f} MiB/s): {len(hits)} hits")
+
+        if owners and hits:
+            if vmm is None:
+                vmm = open_vmm(vmm_args)
+                print(f"MemProcFS initialized with args: {vmm_args}")
+            try:
+                resolved = resolve_owners(vmm, hits)
+                print(f"Owning process found for {resolved} of {len(hits)} hits")
+            except Exception as e:
+                print(f"Warning: Could not look up the owning processes: {e}")
+
+        if hits:
+            print("\n--- Physical Memory Hits ---")
+        for hit in hits:
+            owner = ''
+            if hit.get('pid') is not None:
+                va = f" at {hit['va']:#x}" if hit.get('va') is not None else ''
+                owner = f", Process: {hit['process']} (PID: {hit['pid']}){va}"
+            identifier = f" ({hit['identifier']})" if hit['identifier'] is not None else ''
+            print(f"Rule: {hit['rule']}{identifier}, Physical: {hit['address']:#x}{owner}")
+
+        if jsonl_file:
+            with open(jsonl_file, 'w') as f:
+                for hit in hits:
+                    f.write(json.dumps(dict(hit, data=hit['data'].hex())) + '\n')
+            print(f"\n{len(hits)} hits written to: {jsonl_file}")
+
+    except FileNotFoundError as e:
+        print(f"Error: File not found: {e.filename}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 3:
+        print("Usage: python scan_physical_memory.py [--rules <yara_rule_file>] [--string <text>] [--hex <hex_bytes>] [--workers <n>]")
+        print("           [--batch-size <bytes>] [--overlap <bytes>] [--vmm] [--no-owners] [--jsonl <output_file>]")
+        print("           [--cache-dir <dir>] -device <memory_source>")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python scan_physical_memory.py --rules suspicious.yara -device memory.raw")
+        print("Example: python scan_physical_memory.py --string mimikatz --hex 4d5a90000300 --jsonl hits.jsonl -device memory.dmp")
+        sys.exit(1)
+
+    vmm_arguments = []
+    rules_file = None
+    text_patterns = []
+    hex_patterns = []
+    worker_count = DEFAULT_WORKERS
+    batch = DEFAULT_BATCH_SIZE
+    overlap_size = DEFAULT_OVERLAP
+    read_through_vmm = False
+    find_owners = True
+    jsonl_output = None
+    rules_cache_dir = DEFAULT_CACHE_DIR
+
+    # Parse arguments
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--rules' and i + 1 < len(sys.argv):
+            rules_file = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--string' and i + 1 < len(sys.argv):
+            text_patterns.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--hex' and i + 1 < len(sys.argv):
+            hex_patterns.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--workers' and i + 1 < len(sys.argv):
+            worker_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--batch-size' and i + 1 < len(sys.argv):
+            batch = int(sys.argv[i + 1], 0)
+            i += 2
+        elif sys.argv[i] == '--overlap' and i + 1 < len(sys.argv):
+            overlap_size = int(sys.argv[i + 1], 0)
+            i += 2
+        elif sys.argv[i] == '--vmm':
+            read_through_vmm = True
+            i += 1
+        elif sys.argv[i] == '--no-owners':
+            find_owners = False
+            i += 1
+        elif sys.argv[i] == '--jsonl' and i + 1 < len(sys.argv):
+            jsonl_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            rules_cache_dir = sys.argv[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        scan_physical_memory(vmm_arguments, rules_file, text_patterns, hex_patterns, worker_count, batch, overlap_size,
+                             read_through_vmm, find_owners, jsonl_output, rules_cache_dir)
@@ -0,0 +1,233 @@
+'''
+Streaming parsers for the text tables MemProcFS exposes under /sys/.
+
+The netstat, users, services and drivers files are streamed from the VFS
+(see vfs_stream.py) and parsed line by line into typed records. Records use
+__slots__ and can be collected into a columnar form (one list per field)
+or converted to dicts for the result writers (see result_writers.py), so
+large tables are captured in full without keeping the raw text around.
+
+Used by system_classification.py; can also be imported by custom scripts.
+'''
+
+import re
+from bisect import bisect_right
+from vfs_stream import DEFAULT_BUFFER_SIZE, iter_lines
+
+_WORD = re.compile(r'\S+')
+
+
+def _int(value):
+    '''
+    Converts a decimal or 0x-prefixed hex string to an int, or returns None.
+    '''
+    try:
+        return int(value, 0) if value.lower().startswith('0x') else int(value)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _hex(value):
+    '''
+    Converts a hex string, like the row numbers in the '#' column, to an int, or returns None.
+    '''
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+def _endpoint(value):
+    '''
+    Splits an 'address:port' string into an (address, port) tuple.
+    '''
+    if not value:
+        return None, None
+    address, sep, port = value.rpartition(':')
+    if not sep:
+        return value, None
+    return address.strip('[]'), _int(port)
+
+
+class Record:
+    '''
+    Base class of the parsed table rows. Subclasses list their fields in
+    __slots__ and map the table's column headers to them in COLUMNS.
+    '''
+    __slots__ = ()
+    COLUMNS = {}
+    INT_FIELDS = ()
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        for header, value in row.items():
+            field = self.COLUMNS.get(header.lower())
+            if field == 'index':
+                self.index = _hex(value)
+            elif field:
+                setattr(self, field, _int(value) if field in self.INT_FIELDS else value)
+
+    @classmethod
+    def titles(cls):
+        '''
+        Returns the known column headers of the table, longest first.
+        '''
+        return sorted(cls.COLUMNS, key=lambda title: -title.count(' '))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class NetConnection(Record):
+    '''
+    A row of /sys/net/netstat.txt.
+    '''
+    __slots__ = ('index', 'pid', 'protocol', 'state', 'src_address', 'src_port',
+                 'dst_address', 'dst_port', 'process', 'time', 'object_address', 'path')
+    COLUMNS = {'#': 'index', 'pid': 'pid', 'proto': 'protocol', 'state': 'state', 'src': 'src_address',
+               'dst': 'dst_address', 'process': 'process', 'time': 'time',
+               'object address': 'object_address', 'process path': 'path'}
+    INT_FIELDS = ('pid',)
+
+    def __init__(self, row):
+        Record.__init__(self, row)
+        self.src_address, self.src_port = _endpoint(self.src_address)
+        self.dst_address, self.dst_port = _endpoint(self.dst_address)
+
+
+class UserAccount(Record):
+    '''
+    A row of /sys/users/users.txt.
+    '''
+    __slots__ = ('index', 'name', 'sid')
+    COLUMNS = {'#': 'index', 'username': 'name', 'user': 'name', 'sid': 'sid'}
+
+
+class Service(Record):
+    '''
+    A row of /sys/services/services.txt.
+    '''
+    __slots__ = ('index', 'pid', 'start_type', 'state', 'type', 'object_address', 'name', 'user',
+                 'image_path', 'command_line')
+    COLUMNS = {'#': 'index', 'pid': 'pid', 'start type': 'start_type', 'state': 'state', 'type': 'type',
+               'obj address': 'object_address', 'object address': 'object_address',
+               'name / display name': 'name', 'name': 'name', 'user': 'user', 'image path': 'image_path',
+               'object name / command line': 'command_line', 'command line': 'command_line'}
+    INT_FIELDS = ('pid',)
+
+
+class Driver(Record):
+    '''
+    A row of /sys/drivers/drivers.txt.
+    '''
+    __slots__ = ('index', 'object_address', 'name', 'size', 'start', 'end', 'device', 'path')
+    COLUMNS = {'#': 'index', 'object address': 'object_address', 'driver': 'name', 'name': 'name',
+               'size': 'size', 'start': 'start', 'end': 'end', 'device name': 'device', 'device': 'device',
+               'path': 'path'}
+    INT_FIELDS = ('size',)
+
+
+# Parsed tables: name -> (VFS path, record class).
+TABLES = {
+    'network_connections': ('/sys/net/netstat.txt', NetConnection),
+    'users': ('/sys/users/users.txt', UserAccount),
+    'services': ('/sys/services/services.txt', Service),
+    'drivers': ('/sys/drivers/drivers.txt', Driver),
+}
+
+
+def _header_columns(header, titles):
+    '''
+    Splits a table header into (offset, title) columns. Words forming one of
+    the known titles (e.g. 'object address') are kept together, any other
+    word is a column of its own.
+    '''
+    words = [(m.start(), m.group()) for m in _WORD.finditer(header)]
+    columns = []
+    i = 0
+    while i < len(words):
+        length = 1
+        for title in titles:
+            count = title.count(' ') + 1
+            if ' '.join(word for _, word in words[i:i + count]).lower() == title:
+                length = count
+                break
+        columns.append((words[i][0], ' '.join(word for _, word in words[i:i + length])))
+        i += length
+    return columns
+
+
+def iter_table_rows(lines, titles=()):
+    '''
+    Parses a MemProcFS text table into dicts keyed by column header.
+
+    The header is the line above the first line of dashes. Every column owns
+    the text from its header offset up to the next header, and each word of a
+    row goes to the column it overlaps most, so right-aligned numbers, empty
+    cells and values containing spaces all end up in the right column.
+
+    :param lines: An iterable of text lines.
+    :param titles: Known column headers in lowercase, longest first.
+    '''
+    columns = None
+    previous = None
+    for line in lines:
+        if columns is None:
+            if previous is not None and line.strip() and set(line.strip()) == {'-'}:
+                columns = _header_columns(previous, titles)
+                starts = [0] + [start for start, _ in columns[1:]]
+            previous = line
+            continue
+        if not line.strip():
+            continue
+        values = [[] for _ in columns]
+        for m in _WORD.finditer(line):
+            start, end = m.span()
+            n = bisect_right(starts, start) - 1
+            # Move a word spanning a column boundary right if it overlaps the next column more
+            while n + 1 < len(starts) and end - starts[n + 1] > starts[n + 1] - max(start, starts[n]):
+                n += 1
+            values[n].append(m.group())
+        yield {title: ' '.join(words) or None for (_, title), words in zip(columns, values)}
+
+
+def iter_records(vmm, table, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    Yields the records of one of the TABLES.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param table: A key of TABLES, e.g. 'network_connections'.
+    :param buffer_size: The number of bytes read from the VFS at once.
+    '''
+    path, record_class = TABLES[table]
+    for row in iter_table_rows(iter_lines(vmm, path, buffer_size), record_class.titles()):
+        yield record_class(row)
+
+
+def to_columns(records, record_class):
+    '''
+    Collects records into columnar form.
+
+    :param records: An iterable of records.
+    :param record_class: The record class, which defines the field order.
+    :return: A dict with 'count' and 'columns' (field name -> list of values).
+    '''
+    columns = {field: [] for field in record_class.__slots__}
+    count = 0
+    for record in records:
+        for field, values in columns.items():
+            values.append(getattr(record, field))
+        count += 1
+    return {'count': count, 'columns': columns}
+
+
+def iter_column_rows(table):
+    '''
+    Yields the rows of a columnar table as dicts.
+
+    :param table: A dict returned by to_columns().
+    '''
+    fields = list(table['columns'])
+    for values in zip(*table['columns'].values()):
+        yield dict(zip(fields, values))
@@ -1,117 +1,458 @@
 '''
 This script performs an initial system classification by collecting key information
 about the memory image, including system info, running processes, network connections,
-and user accounts.
+user accounts, services, drivers and FindEvil results.
 
-Usage: python system_classification.py -device <memory_source> [--output <report_file>]
+Every collector is an independent stage. The stages run concurrently on a pool of
+worker threads against a single MemProcFS instance, each stage has its own
+timeout, and the report records how long every stage took. Further collectors
+can join the run through register_collector(), either in this file or in a
+plugin module loaded with --plugin.
+
+The network connections, users, services and drivers are parsed into typed
+records (see sys_parsers.py) and stored in columnar form: one list of values
+per field. With --jsonl every parsed row is also written as one JSON line, and
+with --export every table is written to '<dir>/<table>.<ext>' as CSV, or as
+JSONL, Arrow or a text table with --export-format (see result_writers.py).
+
+Processes are enumerated lazily (see lazy_processes.py): only the PIDs are
+listed up front, so the process count and the first processes are printed
+right after MemProcFS is initialized, before any collector runs.
+
+The process list is also turned into a parent/child tree (see process_tree.py);
+the report lists its roots, the children of every process, orphaned processes
+and system processes with an unusual parent.
+
+Collector results are cached per image (see artifact_cache.py). When every
+requested collector is cached, the report is built without initializing
+MemProcFS at all.
+
+Usage: python system_classification.py -device <memory_source> [--output <report_file>] [--jsonl <rows_file>]
+           [--export <dir>] [--export-format <table|jsonl|csv|arrow>]
+           [--collectors <name,...>] [--workers <n>] [--timeout <seconds>] [--plugin <module>]
+           [--no-cache] [--cache-dir <dir>]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
 '''
 
-import memprocfs
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from sys_parsers import TABLES, iter_records, to_columns, iter_column_rows
+from result_writers import EXTENSIONS, FORMATS, JsonlWriter, open_writer
+from process_tree import ProcessGraph
+from lazy_processes import process_table
+from vfs_stream import read_text
+from artifact_cache import DEFAULT_CACHE_DIR, open_cache
+import os
 import sys
 import json
+import time
+import queue
+import importlib
+import threading
 from datetime import datetime
 
-def system_classification(vmm_args, output_file=None):
+# Default number of stages running at the same time.
+DEFAULT_WORKERS = 4
+
+# Default time in seconds a stage may run before it is abandoned.
+DEFAULT_STAGE_TIMEOUT = 120
+
+# Number of processes shown on the first screen and in the summary.
+TOP_PROCESSES = 10
+
+# Registered collectors by name, in registration order.
+COLLECTORS = {}
+
+
+class Collector:
     '''
-    Performs comprehensive system classification.
+    A registered collector stage.
+    '''
+    __slots__ = ('name', 'func', 'title', 'timeout', 'default', 'version')
 
-    :param vmm_args: A list of arguments to initialize MemProcFS.
-    :param output_file: Optional path to save the classification report as JSON.
+    def __init__(self, name, func, title, timeout, default, version):
+        self.name = name
+        self.func = func
+        self.title = title
+        self.timeout = timeout
+        self.default = default
+        self.version = version
+
+
+def register_collector(name, title=None, timeout=DEFAULT_STAGE_TIMEOUT, default=None, version=1):
+    '''
+    Decorator registering a function as a collector stage. The function is
+    called with the Vmm and its return value is stored in the report under
+    the collector name.
+
+    :param name: The collector name, also used as the report key.
+    :param title: Optional description printed while the stage runs.
+    :param timeout: The number of seconds the stage may run.
+    :param default: The report value used when the stage fails or times out.
+    :param version: The version of the collector's output; bump it to invalidate cached results.
+    '''
+    def decorator(func):
+        COLLECTORS[name] = Collector(name, func, title or name, timeout, default, version)
+        return func
+    return decorator
+
+
+@register_collector('system_info', 'system information', default={})
+def collect_system_info(vmm):
+    return {'raw': read_text(vmm, '/sys/sysinfo/sysinfo.txt')}
+
+
+@register_collector('processes', 'running processes', default=[])
+def collect_processes(vmm):
+    return process_table(vmm).rows(('pid', 'name', 'path', 'ppid'))
+
+
+def print_first_screen(vmm):
     '''
+    Prints the process count and the processes with the lowest PIDs. Only
+    the PIDs are enumerated and the names and parents of the shown processes
+    read; the processes collector reuses them.
+    '''
+    table = process_table(vmm)
+    print(f"\nRunning Processes: {len(table)}")
+    print("Top Processes (by PID):")
+    for process in table.first(TOP_PROCESSES):
+        print(f"  - {process.name} (PID: {process.pid}, PPID: {process.ppid})")
+
+
+def collect_table(vmm, table):
+    '''
+    Parses one of the sys_parsers.TABLES into columnar form.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param table: A key of sys_parsers.TABLES.
+    '''
+    return to_columns(iter_records(vmm, table), TABLES[table][1])
+
+
+@register_collector('network_connections', 'network connections', default={})
+def collect_network_connections(vmm):
+    return collect_table(vmm, 'network_connections')
+
+
+@register_collector('users', 'user accounts', default={})
+def collect_users(vmm):
+    return collect_table(vmm, 'users')
+
+
+@register_collector('services', 'services', default={})
+def collect_services(vmm):
+    return collect_table(vmm, 'services')
+
+
+@register_collector('drivers', 'kernel drivers', default={})
+def collect_drivers(vmm):
+    return collect_table(vmm, 'drivers')
+
+
+@register_collector('findevil', 'FindEvil results', default={})
+def collect_findevil(vmm):
+    return {'raw': read_text(vmm, '/forensic/findevil/summary.txt')}
+
+
+class _Stage:
+    '''
+    State of one collector during a pipeline run.
+    '''
+    __slots__ = ('collector', 'started', 'finished', 'result', 'error', 'abandoned', 'lock')
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.lock = threading.Lock()
+
+
+def _run_stage(stage, vmm, slots, done):
+    '''
+    Runs one collector on a daemon thread once a worker slot is free, so a
+    hung stage never keeps the interpreter from exiting.
+    '''
+    slots.acquire()
     try:
-        vmm = memprocfs.Vmm(vmm_args)
-        print(f"MemProcFS initialized with args: {vmm_args}")
-
-        classification_report = {
-            'timestamp': datetime.now().isoformat(),
-            'system_info': {},
-            'processes': [],
-            'network_connections': [],
-            'users': []
-        }
-
-        # 1. System Information
-        print("\n[*] Collecting system information...")
+        stage.started = time.perf_counter()
         try:
-            sysinfo_path = '/sys/sysinfo'
-            sysinfo_data = vmm.vfs.readfile(sysinfo_path)
-            classification_report['system_info'] = {
-                'raw': sysinfo_data.decode('utf-8', errors='ignore')
-            }
-            print(f"    System info collected from {sysinfo_path}")
+            stage.result = stage.collector.func(vmm)
         except Exception as e:
-            print(f"    Warning: Could not collect system info: {e}")
+            stage.error = e
+        stage.finished = time.perf_counter()
+    finally:
+        with stage.lock:
+            if not stage.abandoned:
+                slots.release()
+        done.put(stage)
 
-        # 2. Running Processes
-        print("\n[*] Collecting running processes...")
-        try:
-            for process in vmm.process_all():
-                process_info = {
-                    'pid': process.pid,
-                    'name': process.name,
-                    'path': process.path,
-                    'ppid': process.pid_parent
-                }
-                classification_report['processes'].append(process_info)
-            print(f"    Found {len(classification_report['processes'])} running processes")
-        except Exception as e:
-            print(f"    Warning: Could not collect process list: {e}")
 
-        # 3. Network Connections
-        print("\n[*] Collecting network connections...")
+def run_collectors(vmm, names=None, workers=DEFAULT_WORKERS, timeout=None):
+    '''
+    Runs collectors concurrently and waits for each until it completes or
+    exceeds its timeout. A timed-out stage is abandoned: it keeps running in
+    the background, but its worker slot is handed to the next stage.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param names: Optional list of collector names; defaults to all registered collectors.
+    :param workers: The number of stages running at the same time.
+    :param timeout: Optional timeout in seconds overriding the per-collector timeouts.
+    :return: A (results, stages) tuple. results maps collector names to their
+             values, stages maps them to {'status', 'seconds'} and an 'error' on failure.
+    '''
+    collectors = [COLLECTORS[name] for name in (names or COLLECTORS)]
+    slots = threading.Semaphore(max(1, workers))
+    done = queue.Queue()
+    pending = []
+    for collector in collectors:
+        stage = _Stage(collector)
+        threading.Thread(target=_run_stage, args=(stage, vmm, slots, done), daemon=True).start()
+        pending.append(stage)
+
+    results = {}
+    stages = {}
+    while pending:
         try:
-            net_path = '/sys/net'
-            net_data = vmm.vfs.readfile(net_path)
-            classification_report['network_connections'] = {
-                'raw': net_data.decode('utf-8', errors='ignore')[:1000]  # First 1000 chars
-            }
-            print(f"    Network info collected from {net_path}")
-        except Exception as e:
-            print(f"    Warning: Could not collect network info: {e}")
+            finished = done.get(timeout=0.1)
+        except queue.Empty:
+            finished = None
+        if finished in pending:
+            pending.remove(finished)
+            name = finished.collector.name
+            seconds = round(finished.finished - finished.started, 3)
+            if finished.error is None:
+                results[name] = finished.result
+                stages[name] = {'status': 'ok', 'seconds': seconds}
+                print(f"    [+] {finished.collector.title} collected in {seconds:.2f}s")
+            else:
+                results[name] = finished.collector.default
+                stages[name] = {'status': 'error', 'seconds': seconds, 'error': str(finished.error)}
+                print(f"    Warning: Could not collect {finished.collector.title}: {finished.error}")
+
+        now = time.perf_counter()
+        for stage in list(pending):
+            limit = timeout if timeout is not None else stage.collector.timeout
+            with stage.lock:
+                if stage.finished is not None or stage.started is None or now - stage.started <= limit:
+                    continue
+                stage.abandoned = True
+            slots.release()
+            pending.remove(stage)
+            name = stage.collector.name
+            results[name] = stage.collector.default
+            stages[name] = {'status': 'timeout', 'seconds': round(now - stage.started, 3),
+                            'error': f"exceeded {limit}s timeout"}
+            print(f"    Warning: Gave up on {stage.collector.title} after {limit}s")
+
+    ordered = [collector.name for collector in collectors]
+    return ({name: results[name] for name in ordered}, {name: stages[name] for name in ordered})
+
+
+def run_cached_collectors(names, get_vmm, workers=DEFAULT_WORKERS, timeout=None, cache=None):
+    '''
+    Runs collectors, taking the results the artifact cache already holds for
+    the image. The Vmm is only requested when a collector is not cached.
+
+    :param names: The collector names.
+    :param get_vmm: A function returning an initialized memprocfs.Vmm instance.
+    :param workers: The number of stages running at the same time.
+    :param timeout: Optional timeout in seconds applied to every collector.
+    :param cache: Optional ArtifactCache of the image; successful results are stored in it.
+    :return: A (results, stages) tuple in the order of names, see run_collectors().
+    '''
+    # Take what the cache already holds for this image
+    results = {}
+    stages = {}
+    if cache:
+        for name in names:
+            value = cache.get(name, COLLECTORS[name].version)
+            if value is not None:
+                results[name] = value
+                stages[name] = {'status': 'cached', 'seconds': 0.0}
+        if results:
+            print(f"[*] Loaded {len(results)} collectors from the artifact cache: {', '.join(results)}")
+
+    missing = [name for name in names if name not in results]
+    if missing:
+        vmm = get_vmm()
+        if 'processes' in missing:
+            print_first_screen(vmm)
+        print(f"\n[*] Running {len(missing)} collectors with {workers} workers: {', '.join(missing)}")
+        collected, collected_stages = run_collectors(vmm, missing, workers, timeout)
+        results.update(collected)
+        stages.update(collected_stages)
+        if cache:
+            for name in missing:
+                if stages[name]['status'] == 'ok':
+                    cache.put(name, COLLECTORS[name].version, results[name])
+    return {name: results[name] for name in names}, {name: stages[name] for name in names}
+
+
+def build_report(results, stages, duration):
+    '''
+    Assembles the classification report from collector results.
+
+    :param results: The collector results by name.
+    :param stages: The stage records by collector name, see run_collectors().
+    :param duration: The wall time of the run in seconds.
+    '''
+    report = {'timestamp': datetime.now().isoformat()}
+    report.update(results)
+    # The tree is derived from the process list, so it is also available for cached results
+    if results.get('processes'):
+        report['process_tree'] = ProcessGraph(results['processes']).to_dict()
+    report['stages'] = stages
+    report['duration'] = round(duration, 3)
+    return report
+
+
+def export_tables(results, export_dir, export_format='csv'):
+    '''
+    Writes every parsed table of the results to '<export_dir>/<table>.<ext>'.
+
+    :param results: The collector results.
+    :param export_dir: The directory to write the tables to.
+    :param export_format: 'table', 'jsonl', 'csv' or 'arrow'.
+    :return: A dict mapping the written tables to their number of rows.
+    '''
+    os.makedirs(export_dir, exist_ok=True)
+    written = {}
+    for table, (_, record_class) in TABLES.items():
+        if not results.get(table):
+            continue
+        types = {field: 'int' for field in record_class.INT_FIELDS}
+        path = os.path.join(export_dir, f"{table}.{EXTENSIONS[export_format]}")
+        with open_writer(export_format, path, record_class.__slots__, types) as out:
+            out.write_many(iter_column_rows(results[table]))
+        written[table] = out.count
+    return written
+
+
+def system_classification(vmm_args, output_file=None, collectors=None, workers=DEFAULT_WORKERS, timeout=None,
+                          jsonl_file=None, use_cache=True, cache_dir=DEFAULT_CACHE_DIR, export_dir=None,
+                          export_format='csv'):
+    '''
+    Performs comprehensive system classification.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param output_file: Optional path to save the classification report as JSON.
+    :param collectors: Optional list of collector names to run; defaults to all registered collectors.
+    :param workers: The number of collectors running at the same time.
+    :param timeout: Optional timeout in seconds applied to every collector.
+    :param jsonl_file: Optional path to write the parsed table rows as JSON lines.
+    :param use_cache: Reuse and store collector results in the artifact cache.
+    :param cache_dir: Directory holding the artifact cache.
+    :param export_dir: Optional directory to write every parsed table to, one file per table.
+    :param export_format: 'table', 'jsonl', 'csv' or 'arrow'.
+    '''
+    try:
+        unknown = [name for name in (collectors or []) if name not in COLLECTORS]
+        if unknown:
+            print(f"Error: Unknown collectors: {', '.join(unknown)} (available: {', '.join(COLLECTORS)})")
+            return
+
+        names = collectors or list(COLLECTORS)
+        start_time = time.perf_counter()
+        cache = open_cache(vmm_args, cache_dir) if use_cache else None
+
+        def get_vmm():
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS initialized with args: {vmm_args}")
+            return vmm
 
-        # 4. User Accounts
-        print("\n[*] Collecting user accounts...")
         try:
-            users_path = '/sys/users'
-            users_data = vmm.vfs.readfile(users_path)
-            classification_report['users'] = {
-                'raw': users_data.decode('utf-8', errors='ignore')[:1000]
-            }
-            print(f"    User info collected from {users_path}")
-        except Exception as e:
-            print(f"    Warning: Could not collect user info: {e}")
+            results, stages = run_cached_collectors(names, get_vmm, workers, timeout, cache)
+        finally:
+            if cache:
+                cache.close()
 
-        # Print Summary
+        wall_time = time.perf_counter() - start_time
+        classification_report = build_report(results, stages, wall_time)
+
+        # Print summary
         print("\n" + "="*60)
         print("SYSTEM CLASSIFICATION SUMMARY")
         print("="*60)
         print(f"Timestamp: {classification_report['timestamp']}")
-        print(f"Running Processes: {len(classification_report['processes'])}")
-        print(f"Network Connections: {'Present' if classification_report['network_connections'] else 'Not available'}")
-        print(f"User Accounts: {'Present' if classification_report['users'] else 'Not available'}")
+        if 'processes' in results:
+            print(f"Running Processes: {len(results['processes'])}")
+        if 'network_connections' in results:
+            print(f"Network Connections: {results['network_connections'].get('count', 'Not available')}")
+        if 'users' in results:
+            print(f"User Accounts: {results['users'].get('count', 'Not available')}")
+        if 'services' in results:
+            print(f"Services: {results['services'].get('count', 'Not available')}")
+        if 'drivers' in results:
+            print(f"Drivers: {results['drivers'].get('count', 'Not available')}")
+
+        # Print stage timings
+        print(f"\nCollector Stages ({wall_time:.2f}s total):")
+        for name, stage in stages.items():
+            print(f"  - {name}: {stage['status']} ({stage['seconds']:.2f}s)")
+
+        # Print top processes, unless they were already shown on the first screen
+        if results.get('processes') and stages['processes']['status'] == 'cached':
+            print("\nTop Processes (by PID):")
+            for proc in sorted(results['processes'], key=lambda x: x['pid'])[:TOP_PROCESSES]:
+                print(f"  - {proc['name']} (PID: {proc['pid']}, PPID: {proc['ppid']})")
 
-        # Print top processes
-        print("\nTop Processes (by PID):")
-        for proc in sorted(classification_report['processes'], key=lambda x: x['pid'])[:10]:
-            print(f"  - {proc['name']} (PID: {proc['pid']}, PPID: {proc['ppid']})")
+        # Print the process tree and its suspicious lineage
+        if 'process_tree' in classification_report:
+            tree = classification_report['process_tree']
+            print(f"\nProcess Tree: {len(tree['roots'])} roots, max depth {tree['max_depth']}, "
+                  f"{len(tree['orphans'])} processes without a running parent")
+            for finding in tree['suspicious']:
+                print(f"  - {finding['name']} (PID: {finding['pid']}, PPID: {finding['ppid']}): {finding['reason']}")
 
         # Save report if requested
         if output_file:
             with open(output_file, 'w') as f:
-                json.dump(classification_report, f, indent=2)
+                json.dump(classification_report, f, indent=2, ensure_ascii=False)
             print(f"\nReport saved to: {output_file}")
 
+        # Write the parsed table rows if requested
+        if jsonl_file:
+            with JsonlWriter(jsonl_file) as out:
+                for table in TABLES:
+                    if results.get(table):
+                        out.write_many(dict(table=table, **row) for row in iter_column_rows(results[table]))
+            print(f"{out.count} table rows written to: {jsonl_file}")
+
+        # Export the parsed tables if requested
+        if export_dir:
+            written = export_tables(results, export_dir, export_format)
+            print(f"{sum(written.values())} rows of {len(written)} tables exported to: {export_dir}")
+
     except Exception as e:
         print(f"An error occurred: {e}")
 
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 2:
-        print("Usage: python system_classification.py -device <memory_source> [--output <report_file>]")
+        print("Usage: python system_classification.py -device <memory_source> [--output <report_file>] [--jsonl <rows_file>]")
+        print("           [--export <dir>] [--export-format <table|jsonl|csv|arrow>]")
+        print("           [--collectors <name,...>] [--workers <n>] [--timeout <seconds>] [--plugin <module>]")
+        print("           [--no-cache] [--cache-dir <dir>]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
         print("Example: python system_classification.py -device memory.dmp --output classification.json")
+        print("Example: python system_classification.py -device memory.dmp --export tables --export-format arrow")
         sys.exit(1)
 
     vmm_arguments = []
     output_file = None
+    jsonl_output = None
+    export_directory = None
+    export_format = 'csv'
+    collector_names = None
+    worker_count = DEFAULT_WORKERS
+    stage_timeout = None
+    cache_enabled = True
+    cache_directory = DEFAULT_CACHE_DIR
 
     # Parse arguments
     i = 1
@@ -119,6 +460,35 @@ if __name__ == "__main__":
         if sys.argv[i] == '--output' and i + 1 < len(sys.argv):
             output_file = sys.argv[i + 1]
             i += 2
+        elif sys.argv[i] == '--jsonl' and i + 1 < len(sys.argv):
+            jsonl_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--export' and i + 1 < len(sys.argv):
+            export_directory = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--export-format' and i + 1 < len(sys.argv):
+            export_format = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--collectors' and i + 1 < len(sys.argv):
+            collector_names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            i += 2
+        elif sys.argv[i] == '--workers' and i + 1 < len(sys.argv):
+            worker_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--timeout' and i + 1 < len(sys.argv):
+            stage_timeout = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--no-cache':
+            cache_enabled = False
+            i += 1
+        elif sys.argv[i] == '--cache-dir' and i + 1 < len(sys.argv):
+            cache_directory = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--plugin' and i + 1 < len(sys.argv):
+            # Plugin modules call register_collector() when imported
+            sys.modules.setdefault('system_classification', sys.modules[__name__])
+            importlib.import_module(sys.argv[i + 1])
+            i += 2
         else:
             vmm_arguments.append(sys.argv[i])
             i += 1
@@ -127,4 +497,10 @@ if __name__ == "__main__":
         print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
         sys.exit(1)
 
-    system_classification(vmm_arguments, output_file)
+    if export_format not in FORMATS:
+        print(f"Error: Unknown export format '{export_format}' (available: {', '.join(FORMATS)}).")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        system_classification(vmm_arguments, output_file, collector_names, worker_count, stage_timeout, jsonl_output,
+                              cache_enabled, cache_directory, export_directory, export_format)
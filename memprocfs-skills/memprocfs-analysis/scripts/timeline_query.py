@@ -0,0 +1,446 @@
+'''
+This script indexes the MemProcFS forensic timeline once and then answers
+time-range queries, optionally filtered by event type and PID, without
+rescanning the CSV.
+
+Building streams /forensic/timeline/timeline.csv through a fixed buffer (see
+vfs_stream.py), copies it to '<timeline_dir>/timeline.csv' and writes a
+compact index to '<timeline_dir>/timeline.idx': the event timestamps sorted
+ascending with the byte offset of each event's line, plus per-type and
+per-PID lists of positions in that order. Queries memory-map the index,
+binary-search the time range, walk only the matching positions and seek
+straight to their lines, so MemProcFS is not needed after the build.
+
+Usage: python timeline_query.py --build <timeline_dir> [--csv <timeline_csv>] [vmm_args...]
+       python timeline_query.py <timeline_dir> [--from <time>] [--to <time>] [--type <type,...>] [--pid <pid,...>]
+           [--limit <n>] [--count] [--output <file>]
+
+Times are 'YYYY-MM-DD[ HH:MM[:SS]]' in UTC, or Unix timestamps.
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from vfs_stream import DEFAULT_BUFFER_SIZE, open_vfs
+import os
+import sys
+import json
+import mmap
+import time
+import heapq
+import calendar
+from array import array
+from bisect import bisect_left, bisect_right
+
+TIMELINE_PATH = '/forensic/timeline/timeline.csv'
+CSV_NAME = 'timeline.csv'
+INDEX_NAME = 'timeline.idx'
+
+INDEX_MAGIC = b'MEMPROCFS-TIMELINE-INDEX\n'
+INDEX_VERSION = 1
+
+# Timestamp of events whose time could not be parsed; they sort before all others.
+UNKNOWN_TIME = -1
+
+
+def parse_time(value):
+    '''
+    Converts a 'YYYY-MM-DD HH:MM:SS' timeline time (UTC) to a Unix timestamp, or returns None.
+    Missing time-of-day fields count as zero.
+    '''
+    try:
+        return calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13] or 0),
+                                int(value[14:16] or 0), int(value[17:19] or 0), 0, 0, 0))
+    except ValueError:
+        return None
+
+
+def parse_time_argument(value):
+    '''
+    Converts a command-line time, a Unix timestamp or 'YYYY-MM-DD[ HH:MM[:SS]]', to a Unix timestamp.
+    '''
+    if value.isdigit():
+        return int(value)
+    timestamp = parse_time(value.replace('T', ' '))
+    if timestamp is None:
+        raise ValueError(f"invalid time '{value}'")
+    return timestamp
+
+
+def format_time(timestamp):
+    if timestamp == UNKNOWN_TIME:
+        return 'unknown'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
+
+
+def _align(value):
+    return value + (-value % 8)
+
+
+def _iter_offsets(lines, copy=None):
+    '''
+    Yields (offset, line) pairs of a binary line iterator, optionally copying every line to a file.
+    '''
+    offset = 0
+    for line in lines:
+        if copy is not None:
+            copy.write(line)
+        yield offset, line
+        offset += len(line)
+
+
+def build_index(lines, index_file, csv_file):
+    '''
+    Indexes a timeline CSV and writes the index file.
+
+    :param lines: An iterable of (offset, line) pairs, see _iter_offsets().
+    :param index_file: The path of the index file to write.
+    :param csv_file: The CSV path stored in the index, relative to the index directory or absolute.
+    :return: The index metadata.
+    '''
+    times = array('q')
+    offsets = array('Q')
+    type_ids = array('H')
+    pids = array('I')
+    type_names = []
+    type_lookup = {}
+    header = None
+    columns = (0, 1, 3)
+
+    for offset, line in lines:
+        if header is None and line.startswith(b'Time'):
+            header = line.decode('utf-8', errors='ignore').rstrip('\r\n')
+            titles = [title.strip().lower() for title in header.split(',')]
+            if all(title in titles for title in ('time', 'type', 'pid')):
+                columns = (titles.index('time'), titles.index('type'), titles.index('pid'))
+            continue
+        fields = line.split(b',', max(columns) + 1)
+        if len(fields) <= max(columns):
+            continue
+        timestamp = parse_time(fields[columns[0]].decode('ascii', errors='ignore'))
+        event_type = fields[columns[1]].decode('utf-8', errors='ignore').strip()
+        type_id = type_lookup.get(event_type)
+        if type_id is None:
+            type_id = type_lookup[event_type] = len(type_names)
+            type_names.append(event_type)
+        pid = fields[columns[2]].strip()
+        times.append(UNKNOWN_TIME if timestamp is None else timestamp)
+        offsets.append(offset)
+        type_ids.append(type_id)
+        pids.append(int(pid) if pid.isdigit() else 0)
+
+    # Sort the events by time; positions below refer to this order
+    order = sorted(range(len(times)), key=times.__getitem__)
+    arrays = {'times': array('q', (times[row] for row in order)),
+              'offsets': array('Q', (offsets[row] for row in order))}
+    by_type = [array('I') for _ in type_names]
+    by_pid = {}
+    for position, row in enumerate(order):
+        by_type[type_ids[row]].append(position)
+        positions = by_pid.get(pids[row])
+        if positions is None:
+            positions = by_pid[pids[row]] = array('I')
+        positions.append(position)
+    for type_id, positions in enumerate(by_type):
+        arrays[f"type:{type_names[type_id]}"] = positions
+    for pid, positions in by_pid.items():
+        arrays[f"pid:{pid}"] = positions
+
+    layout = {}
+    data_size = 0
+    for name, values in arrays.items():
+        layout[name] = [values.typecode, data_size, len(values)]
+        data_size = _align(data_size + len(values) * values.itemsize)
+    meta = {'version': INDEX_VERSION, 'byteorder': sys.byteorder, 'csv': csv_file, 'header': header,
+            'events': len(times), 'types': type_names, 'pids': sorted(by_pid),
+            'first': arrays['times'][0] if times else None, 'last': arrays['times'][-1] if times else None,
+            'arrays': layout}
+
+    # Written to a temporary file first, so a failed build never leaves a truncated index behind
+    temp_file = index_file + '.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(json.dumps(meta).encode('utf-8') + b'\n')
+        data_start = _align(f.tell())
+        for name, values in arrays.items():
+            f.seek(data_start + layout[name][1])
+            values.tofile(f)
+        f.truncate(data_start + data_size)
+    os.replace(temp_file, index_file)
+    return meta
+
+
+class TimelineIndex:
+    '''
+    A memory-mapped timeline index and its CSV. Use it in a with statement.
+    '''
+
+    def __init__(self, timeline_dir):
+        '''
+        :param timeline_dir: The directory holding timeline.idx.
+        '''
+        self.file = open(os.path.join(timeline_dir, INDEX_NAME), 'rb')
+        self._views = []
+        try:
+            if self.file.readline() != INDEX_MAGIC:
+                raise ValueError(f"{timeline_dir} does not contain a timeline index")
+            self.meta = json.loads(self.file.readline().decode('utf-8'))
+            if self.meta['version'] != INDEX_VERSION or self.meta['byteorder'] != sys.byteorder:
+                raise ValueError("the timeline index was built by another version or platform; rebuild it")
+            self.data_start = _align(self.file.tell())
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.file.close()
+            raise
+        self.csv_file = os.path.join(timeline_dir, self.meta['csv'])
+        self.types = {name.lower(): name for name in self.meta['types']}
+        self.times = self._array('times')
+        self.offsets = self._array('offsets')
+        self._csv = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.times)
+
+    def _array(self, name):
+        '''
+        Returns an index array as a zero-copy view of the memory map, or an empty tuple if it does not exist.
+        '''
+        entry = self.meta['arrays'].get(name)
+        if entry is None:
+            return ()
+        typecode, offset, count = entry
+        start = self.data_start + offset
+        view = memoryview(self.map)[start:start + count * array(typecode).itemsize].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def _positions(self, name, low, high):
+        positions = self._array(name)
+        positions = positions[bisect_left(positions, low):bisect_left(positions, high)]
+        if isinstance(positions, memoryview):
+            # Slices share the memory map too and must be released before it is closed
+            self._views.append(positions)
+        return positions
+
+    def positions(self, start=None, end=None, types=None, pids=None):
+        '''
+        Yields the positions of the matching events in time order.
+
+        :param start: Optional Unix timestamp; events at or after it.
+        :param end: Optional Unix timestamp; events at or before it.
+        :param types: Optional list of event types (case-insensitive).
+        :param pids: Optional list of PIDs.
+        '''
+        low = 0 if start is None else bisect_left(self.times, start)
+        high = len(self.times) if end is None else bisect_right(self.times, end)
+        selected = None
+        for names in ([f"type:{self.types.get(t.lower(), t)}" for t in types] if types else None,
+                      [f"pid:{pid}" for pid in pids] if pids else None):
+            if names is None:
+                continue
+            matching = heapq.merge(*(self._positions(name, low, high) for name in names))
+            selected = matching if selected is None else _intersect(selected, matching)
+        return iter(range(low, high)) if selected is None else selected
+
+    def read_event(self, position):
+        '''
+        Returns the CSV line of the event at a position, without its line ending.
+        '''
+        if self._csv is None:
+            self._csv = open(self.csv_file, 'rb')
+        self._csv.seek(self.offsets[position])
+        return self._csv.readline().rstrip(b'\r\n').decode('utf-8', errors='ignore')
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.map.close()
+        self.file.close()
+        if self._csv:
+            self._csv.close()
+
+
+def _intersect(a, b):
+    '''
+    Yields the values present in both of two ascending iterables.
+    '''
+    b = iter(b)
+    y = next(b, None)
+    for x in a:
+        while y is not None and y < x:
+            y = next(b, None)
+        if y is None:
+            return
+        if y == x:
+            yield x
+
+
+def build_timeline(timeline_dir, vmm_args=None, csv_file=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    Builds the timeline index, from MemProcFS or from a local timeline CSV.
+
+    :param timeline_dir: The directory for the index (and the copied CSV).
+    :param vmm_args: A list of arguments to initialize MemProcFS; used when csv_file is None.
+    :param csv_file: Optional local timeline CSV to index in place.
+    :param buffer_size: The number of bytes read at once.
+    '''
+    try:
+        start_time = time.perf_counter()
+        os.makedirs(timeline_dir, exist_ok=True)
+        index_file = os.path.join(timeline_dir, INDEX_NAME)
+
+        if csv_file:
+            with open(csv_file, 'rb', buffering=buffer_size) as f:
+                meta = build_index(_iter_offsets(f), index_file, os.path.abspath(csv_file))
+            source = csv_file
+        else:
+            vmm = open_vmm(vmm_args)
+            print(f"MemProcFS initialized with args: {vmm_args}")
+            # The CSV is copied while it is indexed, so the VFS file is read exactly once
+            with open_vfs(vmm, TIMELINE_PATH, buffer_size) as f, \
+                    open(os.path.join(timeline_dir, CSV_NAME), 'wb') as copy:
+                meta = build_index(_iter_offsets(f, copy), index_file, CSV_NAME)
+            source = TIMELINE_PATH
+
+        elapsed = time.perf_counter() - start_time
+        print(f"Indexed {meta['events']} events ({len(meta['types'])} types, {len(meta['pids'])} PIDs) "
+              f"from {source} in {elapsed:.2f}s")
+        if meta['events']:
+            print(f"Time range: {format_time(meta['first'])} - {format_time(meta['last'])} UTC")
+        print(f"Event types: {', '.join(meta['types'])}")
+        print(f"Index written to {index_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def query_timeline(timeline_dir, start=None, end=None, types=None, pids=None, limit=None, count_only=False,
+                   output_file=None):
+    '''
+    Prints or writes the timeline events matching a query.
+
+    :param timeline_dir: The directory holding the index.
+    :param start: Optional Unix timestamp; events at or after it.
+    :param end: Optional Unix timestamp; events at or before it.
+    :param types: Optional list of event types.
+    :param pids: Optional list of PIDs.
+    :param limit: Optional maximum number of events returned.
+    :param count_only: Only print the number of matching events.
+    :param output_file: Optional path to write the matching events as CSV.
+    '''
+    try:
+        with TimelineIndex(timeline_dir) as index:
+            positions = index.positions(start, end, types, pids)
+            if count_only:
+                print(f"{sum(1 for _ in positions)} events match")
+                return
+
+            out = open(output_file, 'w', encoding='utf-8') if output_file else sys.stdout
+            try:
+                if index.meta['header']:
+                    out.write(index.meta['header'] + '\n')
+                written = 0
+                for position in positions:
+                    if limit is not None and written >= limit:
+                        break
+                    out.write(index.read_event(position) + '\n')
+                    written += 1
+            finally:
+                if output_file:
+                    out.close()
+            if output_file:
+                print(f"{written} events written to {output_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 2:
+        print("Usage: python timeline_query.py --build <timeline_dir> [--csv <timeline_csv>] [vmm_args...]")
+        print("       python timeline_query.py <timeline_dir> [--from <time>] [--to <time>] [--type <type,...>] [--pid <pid,...>]")
+        print("           [--limit <n>] [--count] [--output <file>]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python timeline_query.py --build timeline/ -device memory.dmp")
+        print("Example: python timeline_query.py timeline/ --from '2024-01-01 10:00' --to '2024-01-01 11:00' --pid 4242")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    build_dir = None
+    if args[0] == '--build':
+        if len(args) < 2:
+            print("Error: --build requires a timeline directory.")
+            sys.exit(1)
+        build_dir = args[1]
+        args = args[2:]
+    else:
+        query_dir = args[0]
+        args = args[1:]
+
+    vmm_arguments = []
+    local_csv = None
+    time_from = None
+    time_to = None
+    event_types = None
+    event_pids = None
+    max_events = None
+    count_events = False
+    output = None
+
+    # Parse arguments
+    i = 0
+    while i < len(args):
+        if args[i] == '--csv' and i + 1 < len(args):
+            local_csv = args[i + 1]
+            i += 2
+        elif args[i] == '--from' and i + 1 < len(args):
+            time_from = args[i + 1]
+            i += 2
+        elif args[i] == '--to' and i + 1 < len(args):
+            time_to = args[i + 1]
+            i += 2
+        elif args[i] == '--type' and i + 1 < len(args):
+            event_types = [name.strip() for name in args[i + 1].split(',') if name.strip()]
+            i += 2
+        elif args[i] == '--pid' and i + 1 < len(args):
+            event_pids = [int(pid) for pid in args[i + 1].split(',') if pid.strip()]
+            i += 2
+        elif args[i] == '--limit' and i + 1 < len(args):
+            max_events = int(args[i + 1])
+            i += 2
+        elif args[i] == '--count':
+            count_events = True
+            i += 1
+        elif args[i] == '--output' and i + 1 < len(args):
+            output = args[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
+
+    if build_dir:
+        if not local_csv and not vmm_arguments:
+            print("Error: VMM arguments are required (e.g., '-device <path_to_dump>') unless --csv is given.")
+            sys.exit(1)
+        with profiled(**profile_options):
+            build_timeline(build_dir, vmm_arguments, local_csv)
+    else:
+        if vmm_arguments:
+            print(f"Error: Unknown arguments: {' '.join(vmm_arguments)}")
+            sys.exit(1)
+        try:
+            time_from = parse_time_argument(time_from) if time_from else None
+            time_to = parse_time_argument(time_to) if time_to else None
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        with profiled(**profile_options):
+            query_timeline(query_dir, time_from, time_to, event_types, event_pids, max_events, count_events, output)
@@ -0,0 +1,492 @@
+'''
+This script snapshots the processes, modules, handles and network connections
+of a memory image or a live target and reports what changed between two
+snapshots: the entities that were added, removed or changed.
+
+A snapshot holds one table of compact keyed records per entity type, each
+sorted by key:
+
+    processes  (pid, create_time)                    -> name, ppid, path, command_line
+    modules    (pid, name, base)                     -> size, path
+    handles    (pid, handle_value)                   -> type, name
+    network    (pid, protocol, src, src_port, dst, dst_port, occurrence) -> state
+
+so two snapshots are compared in a single merge pass over each table, in
+time linear in their size. Snapshots are saved as zlib-compressed JSON; two
+images are compared by snapshotting each of them and diffing the snapshots.
+
+In live mode (-device pmem or -device fpga) the target is polled. After
+each refresh of MemProcFS, a cheap fingerprint is read for every process:
+the create time, the number of modules and the size of handles.txt, which
+grows with the number of handles since the VFS writes one fixed-width row
+per handle. Only new processes and the processes whose fingerprint changed
+are re-read; the records of all others are taken over from the previous
+poll. A path or command line that changes without a fingerprint change is
+therefore seen at the next change of the fingerprint.
+
+Usage: python triage_diff.py --snapshot <snapshot_file> [--threads <n>] [vmm_args...]
+       python triage_diff.py --diff <old_snapshot> <new_snapshot> [--json <file>] [--limit <n>]
+       python triage_diff.py --live <seconds> [--count <n>] [--jsonl <file>] [--limit <n>]
+           [--threads <n>] [vmm_args...]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
+'''
+
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
+from lazy_processes import ATTRIBUTES
+from sys_parsers import iter_records
+from vfs_stream import read_text, vfs_file_size
+import memprocfs
+import sys
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = 4
+
+# Number of changes printed per table; the JSON output has all of them.
+DEFAULT_LIMIT = 20
+
+# Version of the snapshot file layout.
+SNAPSHOT_VERSION = 2
+
+# Record layout of each table: (key fields, value fields).
+TABLES = {
+    'processes': (('pid', 'create_time'), ('name', 'ppid', 'path', 'command_line')),
+    'modules': (('pid', 'name', 'base'), ('size', 'path')),
+    'handles': (('pid', 'handle_value'), ('type', 'name')),
+    'network': (('pid', 'protocol', 'src', 'src_port', 'dst', 'dst_port', 'occurrence'), ('state',)),
+}
+
+# Tables whose records belong to a process and are re-read with it.
+PROCESS_TABLES = ('processes', 'modules', 'handles')
+
+# Fields printed as hexadecimal.
+HEX_FIELDS = ('base', 'handle_value', 'size')
+
+
+def fingerprint(vmm, pid):
+    '''
+    Returns the (create time, module count, handles.txt size) fingerprint of a
+    process. It is read from the VFS without opening the module or handle
+    tables; parts that cannot be read are None.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param pid: The process ID.
+    '''
+    try:
+        create_time = read_text(vmm, f'/pid/{pid}/time-create.txt').strip()
+    except Exception:
+        create_time = None
+    try:
+        module_count = len(vmm.vfs.list(f'/pid/{pid}/modules'))
+    except Exception:
+        module_count = None
+    return create_time, module_count, vfs_file_size(vmm, f'/pid/{pid}/handles/handles.txt')
+
+
+def read_process(vmm, pid, create_time):
+    '''
+    Reads the process, module and handle records of one process.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param pid: The process ID.
+    :param create_time: The create time of the process, part of its key.
+    :return: A dict of table name to the sorted records of the process.
+    '''
+    process = vmm.process(pid)
+    values = tuple(ATTRIBUTES[field](process) for field in TABLES['processes'][1])
+    return {
+        'processes': [((pid, create_time or ''), values)],
+        'modules': sorted(((pid, module.name.lower(), module.base), (module.image_size, module.fullname))
+                          for module in process.module_all()),
+        'handles': sorted(((pid, handle.handle_value), (handle.type, handle.name))
+                          for handle in process.handle_all()),
+    }
+
+
+def read_network(vmm):
+    '''
+    Returns the sorted records of /sys/net/netstat.txt. Connections with the
+    same endpoints, e.g. several sockets bound to one port, are told apart by
+    an occurrence number at the end of their key.
+    '''
+    def port(value):
+        return value if value is not None else -1
+    connections = sorted(((c.pid or 0, c.protocol or '', c.src_address or '', port(c.src_port),
+                           c.dst_address or '', port(c.dst_port)), (c.state or '',))
+                         for c in iter_records(vmm, 'network_connections'))
+    records = []
+    previous = None
+    occurrence = 0
+    for key, value in connections:
+        occurrence = occurrence + 1 if key == previous else 0
+        previous = key
+        records.append((key + (occurrence,), value))
+    return records
+
+
+class Snapshot:
+    '''
+    The tables of one point in time. The records are kept per process next
+    to its fingerprint, so a later poll can take them over unchanged.
+    '''
+
+    def __init__(self, processes, network, taken=None, source=None):
+        '''
+        :param processes: A dict of PID to a (fingerprint, records) tuple, see read_process().
+        :param network: The sorted network records.
+        :param taken: The time the snapshot was taken, in seconds since the epoch.
+        :param source: The VMM arguments of the snapshot.
+        '''
+        self.processes = processes
+        self.network = network
+        self.taken = taken if taken is not None else time.time()
+        self.source = source
+
+    def table(self, name):
+        '''
+        Returns the sorted records of a table. The keys of the process tables
+        start with the PID, so the records of the processes in PID order are
+        already sorted.
+        '''
+        if name == 'network':
+            return self.network
+        records = []
+        for pid in sorted(self.processes):
+            records.extend(self.processes[pid][1][name])
+        return records
+
+    def counts(self):
+        return {name: len(self.table(name)) for name in TABLES}
+
+    def describe(self):
+        taken = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.taken))
+        return f"{taken} ({' '.join(self.source or [])})"
+
+    def save(self, output_file):
+        data = {
+            'version': SNAPSHOT_VERSION, 'taken': self.taken, 'source': self.source,
+            'processes': [[pid, fp, {name: records[name] for name in PROCESS_TABLES}]
+                          for pid, (fp, records) in sorted(self.processes.items())],
+            'network': self.network,
+        }
+        with open(output_file, 'wb') as f:
+            f.write(zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')))
+
+    @classmethod
+    def load(cls, input_file):
+        with open(input_file, 'rb') as f:
+            data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{input_file} is not a snapshot of version {SNAPSHOT_VERSION}")
+
+        def records(rows):
+            return [(tuple(key), tuple(value)) for key, value in rows]
+        processes = {pid: (tuple(fp), {name: records(tables[name]) for name in PROCESS_TABLES})
+                     for pid, fp, tables in data['processes']}
+        return cls(processes, records(data['network']), data['taken'], data['source'])
+
+
+def take_snapshot(vmm, previous=None, threads=DEFAULT_THREADS, source=None):
+    '''
+    Takes a snapshot of the processes, modules, handles and network connections.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param previous: Optional earlier Snapshot of the same target; the records of
+                     processes with an unchanged fingerprint are taken from it.
+    :param threads: The number of worker threads reading processes.
+    :param source: The VMM arguments, stored in the snapshot.
+    :return: A (snapshot, reread, errors) tuple; reread is the number of processes
+             read, errors maps PIDs to error messages.
+    '''
+    previous_processes = previous.processes if previous else {}
+
+    def read(pid):
+        fp = fingerprint(vmm, pid)
+        old = previous_processes.get(pid)
+        if old and old[0] == fp and any(part is not None for part in fp):
+            return fp, old[1], False
+        return fp, read_process(vmm, pid, fp[0]), True
+
+    processes = {}
+    errors = {}
+    reread = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [(pid, pool.submit(read, pid)) for pid in sorted(vmm.pid_list())]
+        for pid, future in futures:
+            try:
+                fp, records, fresh = future.result()
+            except Exception as e:
+                errors[pid] = str(e)
+                continue
+            processes[pid] = (fp, records)
+            reread += fresh
+    return Snapshot(processes, read_network(vmm), source=source), reread, errors
+
+
+def diff_records(old, new):
+    '''
+    Compares two sorted record lists in a single merge pass.
+
+    :param old: The sorted (key, value) records of the older snapshot.
+    :param new: The sorted (key, value) records of the newer snapshot.
+    :return: A generator of (change, key, old_value, new_value) tuples, where
+             change is 'added', 'removed' or 'changed'.
+    '''
+    i = j = 0
+    while i < len(old) and j < len(new):
+        old_key, old_value = old[i]
+        new_key, new_value = new[j]
+        if old_key == new_key:
+            if old_value != new_value:
+                yield 'changed', old_key, old_value, new_value
+            i += 1
+            j += 1
+        elif old_key < new_key:
+            yield 'removed', old_key, old_value, None
+            i += 1
+        else:
+            yield 'added', new_key, None, new_value
+            j += 1
+    for old_key, old_value in old[i:]:
+        yield 'removed', old_key, old_value, None
+    for new_key, new_value in new[j:]:
+        yield 'added', new_key, None, new_value
+
+
+def diff_snapshots(old, new):
+    '''
+    Returns the changes between two snapshots as a dict of table name to a
+    list of (change, key, old_value, new_value) tuples.
+    '''
+    return {name: list(diff_records(old.table(name), new.table(name))) for name in TABLES}
+
+
+def _format(field, value):
+    if field in HEX_FIELDS and isinstance(value, int):
+        return f"{value:#x}"
+    return str(value)
+
+
+def format_change(table, change, key, old_value, new_value):
+    '''
+    Returns a change as one line of text: '+' for added, '-' for removed and
+    '~' for changed entities, which list only the fields that differ.
+    '''
+    key_fields, value_fields = TABLES[table]
+    text = ', '.join(f"{field}: {_format(field, value)}" for field, value in zip(key_fields, key))
+    if change == 'changed':
+        fields = [f"{field}: {_format(field, a)} -> {_format(field, b)}"
+                  for field, a, b in zip(value_fields, old_value, new_value) if a != b]
+        return f"~ {text}: {'; '.join(fields)}"
+    value = new_value if change == 'added' else old_value
+    fields = ', '.join(f"{field}: {_format(field, v)}" for field, v in zip(value_fields, value))
+    return f"{'+' if change == 'added' else '-'} {text}, {fields}"
+
+
+def change_to_dict(table, change, key, old_value, new_value):
+    '''
+    Returns a change as a JSON-serializable dict.
+    '''
+    key_fields, value_fields = TABLES[table]
+    row = {'table': table, 'change': change}
+    row.update(zip(key_fields, key))
+    if old_value is not None:
+        row['old'] = dict(zip(value_fields, old_value))
+    if new_value is not None:
+        row['new'] = dict(zip(value_fields, new_value))
+    return row
+
+
+def print_changes(changes, limit=DEFAULT_LIMIT):
+    '''
+    Prints the number of changes per table and the first limit changes of each.
+    '''
+    for table, rows in changes.items():
+        counts = {change: 0 for change in ('added', 'removed', 'changed')}
+        for row in rows:
+            counts[row[0]] += 1
+        print(f"--- {table}: {counts['added']} added, {counts['removed']} removed, {counts['changed']} changed ---")
+        for row in rows[:limit]:
+            print(f"  {format_change(table, *row)}")
+        if len(rows) > limit:
+            print(f"  ... and {len(rows) - limit} more")
+
+
+def snapshot(vmm_args, output_file, threads=DEFAULT_THREADS):
+    '''
+    Takes a snapshot of a memory image or live target and saves it.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param output_file: The path of the snapshot file.
+    :param threads: The number of worker threads reading processes.
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+        start_time = time.perf_counter()
+        result, _, errors = take_snapshot(vmm, threads=threads, source=vmm_args)
+        elapsed = time.perf_counter() - start_time
+        for pid, error in errors.items():
+            print(f"  Warning: Could not read PID {pid}: {error}")
+        result.save(output_file)
+        counts = ', '.join(f"{count} {name}" for name, count in result.counts().items())
+        print(f"Snapshot of {counts} taken in {elapsed:.2f}s and written to: {output_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def diff(old_file, new_file, json_file=None, limit=DEFAULT_LIMIT):
+    '''
+    Compares two saved snapshots.
+
+    :param old_file: The path of the older snapshot.
+    :param new_file: The path of the newer snapshot.
+    :param json_file: Optional path to write all changes as JSON.
+    :param limit: The number of changes printed per table.
+    '''
+    try:
+        old, new = Snapshot.load(old_file), Snapshot.load(new_file)
+        print(f"Old: {old.describe()}")
+        print(f"New: {new.describe()}")
+        start_time = time.perf_counter()
+        changes = diff_snapshots(old, new)
+        elapsed = time.perf_counter() - start_time
+        print(f"Compared in {elapsed:.3f}s\n")
+        print_changes(changes, limit)
+
+        if json_file:
+            with open(json_file, 'w') as f:
+                json.dump({'old': {'taken': old.taken, 'source': old.source},
+                           'new': {'taken': new.taken, 'source': new.source},
+                           'changes': [change_to_dict(table, *row) for table, rows in changes.items()
+                                       for row in rows]}, f, indent=2, ensure_ascii=False)
+            print(f"\nChanges written to: {json_file}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def live(vmm_args, interval, count=None, jsonl_file=None, limit=DEFAULT_LIMIT, threads=DEFAULT_THREADS):
+    '''
+    Polls a live target and prints the changes since the previous poll.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param interval: The seconds between the start of two polls.
+    :param count: Optional number of polls after the baseline; polls until interrupted by default.
+    :param jsonl_file: Optional path to append the changes of every poll as JSON lines.
+    :param limit: The number of changes printed per table and poll.
+    :param threads: The number of worker threads reading processes.
+    '''
+    try:
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}")
+        start_time = time.perf_counter()
+        previous, _, _ = take_snapshot(vmm, threads=threads, source=vmm_args)
+        elapsed = time.perf_counter() - start_time
+        print(f"Baseline of {len(previous.processes)} processes taken in {elapsed:.2f}s")
+
+        polls = 0
+        while count is None or polls < count:
+            time.sleep(max(0.0, interval - (time.perf_counter() - start_time)))
+            start_time = time.perf_counter()
+            vmm.set_config(memprocfs.OPT_REFRESH_ALL, 1)
+            current, reread, errors = take_snapshot(vmm, previous, threads, vmm_args)
+            changes = diff_snapshots(previous, current)
+            elapsed = time.perf_counter() - start_time
+            polls += 1
+            total = sum(len(rows) for rows in changes.values())
+            print(f"\n[{time.strftime('%H:%M:%S')}] Poll {polls}: {total} changes, {reread} of "
+                  f"{len(current.processes)} processes re-read in {elapsed:.2f}s")
+            if errors:
+                print(f"  Warning: Could not read {len(errors)} processes")
+            if total:
+                print_changes({table: rows for table, rows in changes.items() if rows}, limit)
+            if jsonl_file and total:
+                with open(jsonl_file, 'a') as f:
+                    for table, rows in changes.items():
+                        for row in rows:
+                            f.write(json.dumps(dict(change_to_dict(table, *row), taken=current.taken),
+                                               ensure_ascii=False) + '\n')
+            previous = current
+
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
+    if len(sys.argv) < 3:
+        print("Usage: python triage_diff.py --snapshot <snapshot_file> [--threads <n>] [vmm_args...]")
+        print("       python triage_diff.py --diff <old_snapshot> <new_snapshot> [--json <file>] [--limit <n>]")
+        print("       python triage_diff.py --live <seconds> [--count <n>] [--jsonl <file>] [--limit <n>]")
+        print("           [--threads <n>] [vmm_args...]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
+        print("Example: python triage_diff.py --snapshot before.snapshot -device memory.dmp")
+        print("Example: python triage_diff.py --diff before.snapshot after.snapshot --json changes.json")
+        print("Example: python triage_diff.py --live 30 --jsonl changes.jsonl -device pmem")
+        sys.exit(1)
+
+    vmm_arguments = []
+    snapshot_output = None
+    diff_files = None
+    poll_interval = None
+    poll_count = None
+    json_output = None
+    jsonl_output = None
+    change_limit = DEFAULT_LIMIT
+    thread_count = DEFAULT_THREADS
+
+    # Parse arguments
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '--snapshot' and i + 1 < len(sys.argv):
+            snapshot_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--diff' and i + 2 < len(sys.argv):
+            diff_files = (sys.argv[i + 1], sys.argv[i + 2])
+            i += 3
+        elif sys.argv[i] == '--live' and i + 1 < len(sys.argv):
+            poll_interval = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--count' and i + 1 < len(sys.argv):
+            poll_count = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--json' and i + 1 < len(sys.argv):
+            json_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--jsonl' and i + 1 < len(sys.argv):
+            jsonl_output = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == '--limit' and i + 1 < len(sys.argv):
+            change_limit = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == '--threads' and i + 1 < len(sys.argv):
+            thread_count = int(sys.argv[i + 1])
+            i += 2
+        else:
+            vmm_arguments.append(sys.argv[i])
+            i += 1
+
+    if diff_files:
+        diff(diff_files[0], diff_files[1], json_output, change_limit)
+        sys.exit(0)
+
+    if snapshot_output is None and poll_interval is None:
+        print("Error: One of --snapshot, --diff or --live is required.")
+        sys.exit(1)
+
+    if not vmm_arguments:
+        print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if snapshot_output:
+            snapshot(vmm_arguments, snapshot_output, thread_count)
+        else:
+            live(vmm_arguments, poll_interval, poll_count, jsonl_output, change_limit, thread_count)
@@ -0,0 +1,158 @@
+'''
+File-like access to the MemProcFS virtual file system.
+
+vmm.vfs.readfile() returns a whole file as one bytes object, which does not
+scale to files like /forensic/timeline/timeline.csv or recovered NTFS files
+that can be gigabytes large. The helpers here expose a VFS file as a
+seekable, buffered stream backed by offset/length reads, so memory use is
+bounded by the buffer size.
+
+Usage from a custom script:
+
+    from vfs_stream import open_vfs, iter_lines, copy_to
+
+    for line in iter_lines(vmm, '/forensic/timeline/timeline.csv'):
+        ...
+    copy_to(vmm, '/forensic/timeline/timeline.csv', 'timeline.csv')
+'''
+
+import io
+import posixpath
+import shutil
+
+# Default size of the read buffer (1 MiB).
+DEFAULT_BUFFER_SIZE = 0x100000
+
+
+def vfs_file_size(vmm, path):
+    '''
+    Returns the size of a VFS file from its directory listing, or None if it is not listed.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param path: The VFS path of the file.
+    '''
+    directory, name = posixpath.split(path.rstrip('/'))
+    try:
+        entry = vmm.vfs.list(directory or '/').get(name)
+    except Exception:
+        return None
+    return entry['size'] if entry else None
+
+
+class VfsRawFile(io.RawIOBase):
+    '''
+    Unbuffered, read-only file object for a VFS file. Every read is a single
+    vmm.vfs.read() call at the current offset.
+    '''
+
+    def __init__(self, vmm, path, size=None):
+        io.RawIOBase.__init__(self)
+        self.vmm = vmm
+        self.name = path
+        self.position = 0
+        self._size = size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def size(self):
+        '''
+        Returns the file size; io.UnsupportedOperation if it cannot be determined.
+        '''
+        if self._size is None:
+            self._size = vfs_file_size(self.vmm, self.name)
+            if self._size is None:
+                raise io.UnsupportedOperation(f"size of {self.name} is unknown")
+        return self._size
+
+    def readall(self):
+        chunks = []
+        while True:
+            data = self.read(DEFAULT_BUFFER_SIZE)
+            if not data:
+                return b''.join(chunks)
+            chunks.append(data)
+
+    def readinto(self, buffer):
+        if self._size is not None and self.position >= self._size:
+            return 0
+        data = self.vmm.vfs.read(self.name, len(buffer), self.position)
+        count = len(data)
+        buffer[:count] = data
+        self.position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size() + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+
+def open_vfs(vmm, path, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    Opens a VFS file as a buffered, seekable binary stream.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param path: The VFS path of the file.
+    :param buffer_size: The number of bytes read from the VFS at once.
+    :return: An io.BufferedReader; use it in a with statement.
+    '''
+    return io.BufferedReader(VfsRawFile(vmm, path), buffer_size)
+
+
+def iter_lines(vmm, path, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+    '''
+    Yields the lines of a VFS file without their line endings.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param path: The VFS path of the file.
+    :param buffer_size: The number of bytes read from the VFS at once.
+    :param encoding: The text encoding; None yields the raw bytes of each line.
+    '''
+    with open_vfs(vmm, path, buffer_size) as f:
+        for line in f:
+            line = line.rstrip(b'\r\n')
+            yield line.decode(encoding, errors='ignore') if encoding else line
+
+
+def read_text(vmm, path, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+    '''
+    Reads a small VFS file as text through a buffered stream.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param path: The VFS path of the file.
+    :param buffer_size: The number of bytes read from the VFS at once.
+    :param encoding: The text encoding.
+    '''
+    with open_vfs(vmm, path, buffer_size) as f:
+        return f.read().decode(encoding, errors='ignore')
+
+
+def copy_to(vmm, path, output_file, buffer_size=DEFAULT_BUFFER_SIZE):
+    '''
+    Copies a VFS file to a local file, holding at most one buffer in memory.
+
+    :param vmm: An initialized memprocfs.Vmm instance.
+    :param path: The VFS path of the file.
+    :param output_file: The local path to write.
+    :param buffer_size: The number of bytes read from the VFS at once.
+    :return: The number of bytes copied.
+    '''
+    with VfsRawFile(vmm, path) as source, open(output_file, 'wb') as f:
+        shutil.copyfileobj(source, f, buffer_size)
+        return source.tell()
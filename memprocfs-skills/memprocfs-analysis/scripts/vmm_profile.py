@@ -0,0 +1,349 @@
+'''
+Opt-in instrumentation of the memprocfs API calls made by the scripts.
+
+While profiling is enabled, open_vmm() (see vmm_session.py) returns the Vmm
+wrapped in proxies that time every call to the process, memory, maps,
+search, handle, module and VFS APIs. For each API, and for each VFS path,
+the number of calls, the failures, a latency histogram and the bytes read
+are recorded. At the end of the run they are written as a JSON summary
+and/or as a trace file in the OpenTelemetry (OTLP/JSON) format, and a
+cProfile dump of the whole run can be written alongside.
+
+The scripts accept the same three options:
+
+    --api-stats <file>   JSON summary per API and per VFS path
+    --trace <file>       OTLP/JSON trace with one span per API call
+    --profile <file>     cProfile dump (pstats format), e.g. for snakeviz or flameprof
+
+Usage from a custom script:
+
+    from vmm_profile import profiled
+    from vmm_session import open_vmm
+
+    with profiled(summary_file='api.json', profile_file='run.prof'):
+        vmm = open_vmm(['-device', 'memory.dmp'])
+        ...
+'''
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets in seconds; the last bucket is unbounded.
+LATENCY_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+# Maximum number of spans kept for the trace file; later calls are only counted.
+MAX_TRACE_SPANS = 100000
+
+# The options split off the command line by split_profile_args(): flag -> profiled() keyword.
+PROFILE_OPTIONS = {'--api-stats': 'summary_file', '--trace': 'trace_file', '--profile': 'profile_file'}
+
+# Instrumented methods and wrapped sub-objects of each proxied memprocfs object.
+_VMM_METHODS = ('process', 'process_all', 'pid_list')
+_VMM_CHILDREN = {'vfs': 'vfs', 'fs': 'vfs', 'memory': 'memory', 'maps': 'maps'}
+_PROCESS_METHODS = ('handle_all', 'module_all', 'module', 'thread_all')
+_PROCESS_CHILDREN = {'memory': 'memory', 'maps': 'maps', 'search': 'search'}
+_CHILD_METHODS = {
+    'vfs': ('read', 'readfile', 'list'),
+    'memory': ('read', 'read_scatter', 'read_type'),
+    'maps': ('pte', 'vad', 'heap', 'handle', 'module', 'thread', 'net', 'unloaded_module', 'memmap', 'pfn'),
+    'search': ('yara',),
+}
+
+_recorder = None
+
+
+def _bucket_label(index):
+    if index == len(LATENCY_BUCKETS):
+        return f"> {LATENCY_BUCKETS[-1]:g}s"
+    return f"<= {LATENCY_BUCKETS[index]:g}s"
+
+
+class ApiStats:
+    '''
+    Call statistics of one API or VFS path.
+    '''
+    __slots__ = ('calls', 'failures', 'seconds', 'max_seconds', 'bytes', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds, nbytes, failed):
+        self.calls += 1
+        self.failures += failed
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += nbytes
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.histogram[index] += 1
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'failure_rate': self.failures / self.calls if self.calls else 0.0,
+            'seconds': self.seconds,
+            'mean_seconds': self.seconds / self.calls if self.calls else 0.0,
+            'max_seconds': self.max_seconds,
+            'bytes': self.bytes,
+            'histogram': {_bucket_label(i): count for i, count in enumerate(self.histogram) if count},
+        }
+
+
+class Recorder:
+    '''
+    Collects the API calls of a run. Thread-safe, since several scripts call
+    the API from worker threads.
+    '''
+
+    def __init__(self, keep_spans=False):
+        '''
+        :param keep_spans: Keep a span per call for write_trace().
+        '''
+        self.lock = threading.Lock()
+        self.apis = {}
+        self.paths = {}
+        self.keep_spans = keep_spans
+        self.spans = []
+        self.dropped_spans = 0
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+
+    def record(self, api, start_ns, seconds, nbytes=0, failed=False, path=None):
+        '''
+        Records one call.
+
+        :param api: The API name, e.g. 'process.memory.read'.
+        :param start_ns: The wall clock start time in nanoseconds.
+        :param seconds: The duration of the call.
+        :param nbytes: The number of bytes returned.
+        :param failed: Whether the call raised an exception.
+        :param path: The VFS path for VFS calls.
+        '''
+        with self.lock:
+            stats = self.apis.get(api)
+            if stats is None:
+                stats = self.apis[api] = ApiStats()
+            stats.add(seconds, nbytes, failed)
+            if path is not None:
+                stats = self.paths.get(path)
+                if stats is None:
+                    stats = self.paths[path] = ApiStats()
+                stats.add(seconds, nbytes, failed)
+            if self.keep_spans:
+                if len(self.spans) < MAX_TRACE_SPANS:
+                    self.spans.append((api, start_ns, int(seconds * 1e9), nbytes, failed, path,
+                                       threading.get_ident()))
+                else:
+                    self.dropped_spans += 1
+
+    def summary(self):
+        '''
+        Returns the statistics per API and per VFS path, sorted by total time.
+        '''
+        def ordered(table):
+            return {name: stats.as_dict()
+                    for name, stats in sorted(table.items(), key=lambda item: -item[1].seconds)}
+        with self.lock:
+            return {'wall_seconds': time.perf_counter() - self.start, 'apis': ordered(self.apis),
+                    'vfs_paths': ordered(self.paths), 'dropped_spans': self.dropped_spans}
+
+    def write_summary(self, output_file):
+        with open(output_file, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_trace(self, output_file, service_name='memprocfs-skill'):
+        '''
+        Writes the recorded calls as an OTLP/JSON trace: one root span for the
+        run with a child span per API call.
+
+        :param output_file: The path of the trace file.
+        :param service_name: The service.name resource attribute.
+        '''
+        trace_id = os.urandom(16).hex()
+        root_id = os.urandom(8).hex()
+        end_ns = self.start_ns + int((time.perf_counter() - self.start) * 1e9)
+        spans = [{'traceId': trace_id, 'spanId': root_id, 'name': os.path.basename(sys.argv[0]) or 'run',
+                  'kind': 1, 'startTimeUnixNano': str(self.start_ns), 'endTimeUnixNano': str(end_ns),
+                  'attributes': [], 'status': {'code': 1}}]
+        with self.lock:
+            for api, start_ns, duration_ns, nbytes, failed, path, thread_id in self.spans:
+                attributes = [{'key': 'memprocfs.bytes', 'value': {'intValue': str(nbytes)}},
+                              {'key': 'thread.id', 'value': {'intValue': str(thread_id)}}]
+                if path is not None:
+                    attributes.append({'key': 'memprocfs.vfs.path', 'value': {'stringValue': path}})
+                spans.append({'traceId': trace_id, 'spanId': os.urandom(8).hex(), 'parentSpanId': root_id,
+                              'name': api, 'kind': 1, 'startTimeUnixNano': str(start_ns),
+                              'endTimeUnixNano': str(start_ns + duration_ns), 'attributes': attributes,
+                              'status': {'code': 2 if failed else 1}})
+        trace = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'vmm_profile'}, 'spans': spans}],
+        }]}
+        with open(output_file, 'w') as f:
+            json.dump(trace, f)
+
+
+def _size(value):
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
+class _Proxy:
+    '''
+    Forwards attribute access to a memprocfs object, timing the listed methods
+    and wrapping the listed sub-objects.
+    '''
+
+    def __init__(self, target, recorder, prefix, methods, children, vfs=False):
+        self.__dict__.update(_target=target, _recorder=recorder, _prefix=prefix, _methods=methods,
+                             _children=children, _vfs=vfs)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name in self._children:
+            kind = self._children[name]
+            return _Proxy(value, self._recorder, f"{self._prefix}.{name}", _CHILD_METHODS[kind], {}, kind == 'vfs')
+        if name in self._methods and callable(value):
+            return self._timed(name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return repr(self._target)
+
+    def _timed(self, name, func):
+        api = f"{self._prefix}.{name}"
+        recorder = self._recorder
+        vfs = self._vfs
+
+        def call(*args, **kwargs):
+            path = args[0] if vfs and args else None
+            start_ns = time.time_ns()
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                recorder.record(api, start_ns, time.perf_counter() - start, 0, True, path)
+                raise
+            recorder.record(api, start_ns, time.perf_counter() - start, _size(result), False, path)
+            return self._wrap_result(name, result)
+        return call
+
+    def _wrap_result(self, name, result):
+        if self._prefix != 'vmm' or result is None:
+            return result
+        if name == 'process':
+            return instrument_process(result, self._recorder)
+        if name == 'process_all':
+            return [instrument_process(process, self._recorder) for process in result]
+        return result
+
+
+def instrument_process(process, recorder):
+    '''
+    Wraps a memprocfs process object so its API calls are recorded.
+    '''
+    return _Proxy(process, recorder, 'process', _PROCESS_METHODS, _PROCESS_CHILDREN)
+
+
+def instrument(vmm, recorder=None):
+    '''
+    Wraps a Vmm so its API calls are recorded. Returns the Vmm unchanged when
+    no recorder is given and profiling is not enabled.
+
+    :param vmm: A memprocfs.Vmm instance or a session proxy.
+    :param recorder: The Recorder; defaults to the one enabled by profiled().
+    '''
+    recorder = recorder or _recorder
+    if recorder is None or isinstance(vmm, _Proxy):
+        return vmm
+    return _Proxy(vmm, recorder, 'vmm', _VMM_METHODS, _VMM_CHILDREN)
+
+
+def split_profile_args(argv):
+    '''
+    Removes the profiling options from a command line.
+
+    :param argv: The command line, e.g. sys.argv.
+    :return: A (remaining argv, profiled() keyword arguments) tuple.
+    '''
+    remaining = []
+    options = {}
+    i = 0
+    while i < len(argv):
+        if argv[i] in PROFILE_OPTIONS and i + 1 < len(argv):
+            options[PROFILE_OPTIONS[argv[i]]] = argv[i + 1]
+            i += 2
+        else:
+            remaining.append(argv[i])
+            i += 1
+    return remaining, options
+
+
+@contextmanager
+def profiled(summary_file=None, trace_file=None, profile_file=None):
+    '''
+    Enables the instrumentation for the duration of a with block and writes
+    the requested outputs when it ends. Does nothing if no output is requested.
+
+    :param summary_file: Optional path of the JSON summary per API and VFS path.
+    :param trace_file: Optional path of the OTLP/JSON trace file.
+    :param profile_file: Optional path of the cProfile dump; only the calling thread is profiled.
+    '''
+    global _recorder
+    if not (summary_file or trace_file or profile_file):
+        yield None
+        return
+
+    recorder = Recorder(keep_spans=bool(trace_file))
+    previous, _recorder = _recorder, recorder
+    profiler = cProfile.Profile() if profile_file else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield recorder
+    finally:
+        if profiler:
+            profiler.disable()
+        _recorder = previous
+        if profiler:
+            profiler.dump_stats(profile_file)
+            print(f"cProfile dump written to {profile_file}", file=sys.stderr)
+        if summary_file:
+            recorder.write_summary(summary_file)
+            print(f"API statistics written to {summary_file}", file=sys.stderr)
+        if trace_file:
+            recorder.write_trace(trace_file)
+            print(f"Trace written to {trace_file}", file=sys.stderr)
+        print_summary(recorder, sys.stderr)
+
+
+def print_summary(recorder, f=sys.stdout, limit=10):
+    '''
+    Prints the APIs with the highest total time.
+
+    :param recorder: A Recorder.
+    :param f: The stream to print to.
+    :param limit: The number of APIs printed.
+    '''
+    summary = recorder.summary()
+    print(f"--- memprocfs API calls ({summary['wall_seconds']:.2f}s wall time) ---", file=f)
+    for api, stats in list(summary['apis'].items())[:limit]:
+        print(f"  {api:<28} {stats['calls']:>9} calls {stats['seconds']:>9.3f}s "
+              f"{stats['bytes']:>14} bytes {stats['failures']:>6} failed", file=f)
+
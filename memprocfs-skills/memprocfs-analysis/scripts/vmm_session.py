@@ -0,0 +1,471 @@
+'''
+Shared MemProcFS session broker.
+
+A long-lived session daemon owns one initialized memprocfs.Vmm per memory image
+and serves it over a Unix socket. The helper scripts call open_vmm(), which
+attaches to a running session for the same VMM arguments and falls back to an
+in-process memprocfs.Vmm when no session is running. Follow-up commands in a
+triage session then skip the MemProcFS initialization entirely.
+
+Objects returned by the session (processes, modules, memory accessors, ...) are
+proxies: attribute reads and method calls are forwarded to the daemon, while
+plain values (numbers, strings, bytes, lists and dicts of them) are copied.
+
+Usage: python vmm_session.py start [vmm_args...]
+       python vmm_session.py status [vmm_args...]
+       python vmm_session.py stop [vmm_args...]
+'''
+
+import memprocfs
+import sys
+import os
+import json
+import stat
+import socket
+import hashlib
+import inspect
+import tempfile
+import threading
+import itertools
+from collections import deque
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from vmm_profile import instrument
+
+# Handle of the Vmm object itself in every connection's object table.
+ROOT_HANDLE = 0
+
+_PLAIN_TYPES = (type(None), bool, int, float, str, bytes)
+
+
+def sessions_supported():
+    '''
+    Returns True if the platform supports Unix sockets, which the session broker requires.
+    '''
+    return hasattr(socket, 'AF_UNIX')
+
+
+def session_dir():
+    '''
+    Returns the private per-user directory holding the session sockets and the
+    auth key, under $XDG_RUNTIME_DIR when it is set. The directory is refused
+    unless it is owned by the current user and closed to everyone else, since
+    whoever controls it can serve the sockets the scripts attach to.
+    '''
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'memprocfs-sessions')
+    else:
+        uid = os.getuid() if hasattr(os, 'getuid') else os.getlogin()
+        path = os.path.join(tempfile.gettempdir(), f"memprocfs-sessions-{uid}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # makedirs() accepts an existing path as it is, which may have been planted
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o077 or
+            (hasattr(os, 'getuid') and info.st_uid != os.getuid())):
+        raise PermissionError(f"{path} is not a private directory of the current user; not using it for sessions")
+    return path
+
+
+def session_address(vmm_args):
+    '''
+    Returns the Unix socket path of the session serving the given VMM arguments.
+    An image file after -device is keyed by its real path, so the same image
+    named from another directory, or by a relative or an absolute path, maps to
+    the same session; device names such as pmem or fpga are kept as given.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    args = list(vmm_args)
+    for i, arg in enumerate(args[:-1]):
+        if arg.lower() == '-device' and os.path.isfile(args[i + 1]):
+            args[i:i + 2] = ['-device', os.path.realpath(args[i + 1])]
+    digest = hashlib.sha1(json.dumps(args).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(session_dir(), f"{digest}.sock")
+
+
+def _session_authkey():
+    '''
+    Returns the auth key shared by the sessions of the current user, creating it on first use.
+    '''
+    path = os.path.join(session_dir(), 'authkey')
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    # The key is written to a temporary file and published complete, so a
+    # concurrent reader never sees a partial key. Linking (unlike os.replace)
+    # fails if another process published its key first; that key is used.
+    fd, temp_path = tempfile.mkstemp(dir=session_dir(), prefix='authkey-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32))
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temp_path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class _Ref:
+    '''
+    Marker sent in place of a proxy passed back to the daemon as an argument.
+    '''
+    __slots__ = ('handle',)
+
+    def __init__(self, handle):
+        self.handle = handle
+
+
+class _ObjectTable:
+    '''
+    The objects handed out to one client, shared by all of its connections.
+    Entries are removed when the client releases their proxies.
+    '''
+
+    def __init__(self, vmm):
+        self.objects = {ROOT_HANDLE: vmm}
+        self.handles = itertools.count(ROOT_HANDLE + 1)
+        self.connections = 0
+
+
+def _encode(value, table):
+    '''
+    Encodes a result for the client. Plain values are copied and any other
+    object is stored in the client's object table and sent as a handle.
+    '''
+    if isinstance(value, _PLAIN_TYPES):
+        return ('v', value)
+    if isinstance(value, (list, tuple)):
+        return ('l', [_encode(item, table) for item in value])
+    if isinstance(value, dict):
+        return ('d', {key: _encode(item, table) for key, item in value.items()})
+    if inspect.isroutine(value):
+        return ('m', None)
+    handle = next(table.handles)
+    table.objects[handle] = value
+    return ('o', handle)
+
+
+def _resolve(value, objects):
+    if isinstance(value, _Ref):
+        return objects[value.handle]
+    if isinstance(value, (list, tuple)):
+        return type(value)(_resolve(item, objects) for item in value)
+    if isinstance(value, dict):
+        return {key: _resolve(item, objects) for key, item in value.items()}
+    return value
+
+
+def _serve_connection(conn, vmm, shutdown, tables, tables_lock):
+    '''
+    Serves requests of a single connection until it disconnects. A client
+    opens one connection per thread; the 'attach' request that starts each
+    connection names the client, whose object table the connections share.
+    '''
+    token = None
+    table = _ObjectTable(vmm)
+    try:
+        while True:
+            op, handle, name, args, kwargs = conn.recv()
+            if op == 'shutdown':
+                conn.send(('v', None))
+                shutdown()
+                return
+            if op == 'attach':
+                with tables_lock:
+                    token = name
+                    table = tables.setdefault(token, table)
+                    table.connections += 1
+                conn.send(('v', None))
+                continue
+            if op == 'del':
+                # Released proxies; no response is sent
+                for released in args:
+                    table.objects.pop(released, None)
+                continue
+            objects = table.objects
+            try:
+                target = objects[handle]
+                if op == 'getattr':
+                    result = getattr(target, name)
+                elif op == 'call':
+                    result = getattr(target, name)(*_resolve(args, objects), **_resolve(kwargs, objects))
+                else:
+                    result = None
+                response = _encode(result, table)
+            except Exception as e:
+                response = ('e', e)
+            try:
+                conn.send(response)
+            except Exception:
+                # The exception itself could not be pickled
+                conn.send(('e', RuntimeError(str(response[1]))))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+        if token is not None:
+            with tables_lock:
+                table.connections -= 1
+                if table.connections == 0:
+                    del tables[token]
+
+
+def serve(vmm_args):
+    '''
+    Initializes MemProcFS and serves it to clients until a 'stop' request arrives.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    address = session_address(vmm_args)
+    if os.path.exists(address):
+        if ping(vmm_args):
+            print(f"Error: A session for {vmm_args} is already running at {address}")
+            return
+        os.unlink(address)
+
+    vmm = memprocfs.Vmm(vmm_args)
+    print(f"MemProcFS initialized with args: {vmm_args}")
+
+    listener = Listener(address, family='AF_UNIX', authkey=_session_authkey())
+    stopping = threading.Event()
+    tables = {}
+    tables_lock = threading.Lock()
+
+    def shutdown():
+        stopping.set()
+        # Closing the listener does not wake up the accept() blocked in the
+        # main loop; a connection does, after which the loop sees the event
+        try:
+            with socket.socket(socket.AF_UNIX) as wake:
+                wake.connect(address)
+        except OSError:
+            pass
+
+    print(f"Session listening on {address} (stop with: python vmm_session.py stop {' '.join(vmm_args)})")
+    try:
+        while not stopping.is_set():
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue
+            except OSError:
+                break
+            threading.Thread(target=_serve_connection, args=(conn, vmm, shutdown, tables, tables_lock),
+                             daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+    print("Session stopped.")
+
+
+class _Session:
+    '''
+    Client side of a session. Every thread talks to the daemon over its own
+    connection, so the threads of a pool do not wait for each other's round
+    trips; all connections share one object table in the daemon. Handles of
+    garbage-collected proxies are released with the next request.
+    '''
+
+    def __init__(self, address):
+        self.address = address
+        self.authkey = _session_authkey()
+        self.token = os.urandom(16).hex()
+        self.local = threading.local()
+        self.connections = []
+        self.released = deque()
+
+    def connection(self):
+        '''
+        Returns the connection of the calling thread, opening it on first use.
+        '''
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            conn.send(('attach', ROOT_HANDLE, self.token, (), {}))
+            conn.recv()
+            self.local.conn = conn
+            self.connections.append(conn)
+        return conn
+
+    def release(self, handle):
+        # Called from finalizers, which may run in the middle of a request
+        self.released.append(handle)
+
+    def request(self, op, owner=None, name=None, args=(), kwargs=None):
+        conn = self.connection()
+        if self.released:
+            handles = []
+            while self.released:
+                handles.append(self.released.popleft())
+            conn.send(('del', ROOT_HANDLE, None, handles, {}))
+        handle = owner._handle if owner is not None else ROOT_HANDLE
+        conn.send((op, handle, name, args, kwargs or {}))
+        return self.decode(conn.recv(), owner, name)
+
+    def decode(self, response, owner=None, name=None):
+        kind, value = response
+        if kind == 'v':
+            return value
+        if kind == 'l':
+            return [self.decode(item) for item in value]
+        if kind == 'd':
+            return {key: self.decode(item) for key, item in value.items()}
+        if kind == 'o':
+            return RemoteObject(self, value)
+        if kind == 'm':
+            return RemoteMethod(self, owner, name)
+        raise value
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+
+def _to_wire(value):
+    if isinstance(value, RemoteObject):
+        return _Ref(value._handle)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_wire(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _to_wire(item) for key, item in value.items()}
+    return value
+
+
+class RemoteMethod:
+    '''
+    Proxy for a method of an object living in the session daemon. Keeps the
+    object's proxy, and so its handle, alive.
+    '''
+    __slots__ = ('_session', '_owner', '_name')
+
+    def __init__(self, session, owner, name):
+        self._session = session
+        self._owner = owner
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        return self._session.request('call', self._owner, self._name, _to_wire(args), _to_wire(kwargs))
+
+
+class RemoteObject:
+    '''
+    Proxy for an object living in the session daemon. The daemon drops the
+    object once the proxy is garbage-collected.
+    '''
+    __slots__ = ('_session', '_handle', '__weakref__')
+
+    def __init__(self, session, handle):
+        self._session = session
+        self._handle = handle
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._session.request('getattr', self, name)
+
+    def __del__(self):
+        if self._handle != ROOT_HANDLE:
+            self._session.release(self._handle)
+
+    def __repr__(self):
+        return f"<RemoteObject #{self._handle} via {self._session.address}>"
+
+
+def connect(vmm_args):
+    '''
+    Connects to the session serving the given VMM arguments.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :return: A RemoteObject proxy for the session's Vmm.
+    '''
+    session = _Session(session_address(vmm_args))
+    # Connects right away so a missing session is reported here
+    session.connection()
+    return RemoteObject(session, ROOT_HANDLE)
+
+
+def ping(vmm_args):
+    '''
+    Returns True if a session is serving the given VMM arguments.
+    '''
+    if not sessions_supported() or not os.path.exists(session_address(vmm_args)):
+        return False
+    try:
+        connect(vmm_args)._session.close()
+        return True
+    except (OSError, EOFError, AuthenticationError):
+        return False
+
+
+def open_vmm(vmm_args):
+    '''
+    Returns a Vmm for the given arguments: a proxy to a running session if one
+    exists, otherwise a new in-process memprocfs.Vmm. While profiling is
+    enabled (see vmm_profile.py), its API calls are recorded.
+
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    '''
+    address = None
+    if sessions_supported():
+        try:
+            address = session_address(vmm_args)
+        except PermissionError as e:
+            print(f"Warning: {e}", file=sys.stderr)
+    if address and os.path.exists(address):
+        try:
+            vmm = connect(vmm_args)
+            print(f"Attached to MemProcFS session at {vmm._session.address}", file=sys.stderr)
+            return instrument(vmm)
+        except (OSError, EOFError, AuthenticationError):
+            pass
+    return instrument(memprocfs.Vmm(vmm_args))
+
+
+def stop(vmm_args):
+    '''
+    Asks the session serving the given VMM arguments to shut down.
+    '''
+    try:
+        vmm = connect(vmm_args)
+        vmm._session.request('shutdown')
+        vmm._session.close()
+        print(f"Session for {vmm_args} stopped.")
+    except (OSError, EOFError, AuthenticationError):
+        print(f"Error: No session is running for {vmm_args}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ('start', 'status', 'stop'):
+        print("Usage: python vmm_session.py start|status|stop [vmm_args...]")
+        print("Example: python vmm_session.py start -device memory.dmp")
+        sys.exit(1)
+
+    if not sessions_supported():
+        print("Error: Sessions require Unix socket support, which is not available on this platform.")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    vmm_arguments = sys.argv[2:]
+
+    try:
+        # Refuses an unsafe session directory before any command uses it
+        session_dir()
+        if command == 'start':
+            serve(vmm_arguments)
+        elif command == 'status':
+            if ping(vmm_arguments):
+                print(f"Session running at {session_address(vmm_arguments)}")
+            else:
+                print(f"No session is running for {vmm_arguments}")
+        else:
+            stop(vmm_arguments)
+    except PermissionError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,207 @@
+'''
+Helpers for compiling YARA rules once and scanning process memory with them.
+
+Compiled rules are cached on disk, keyed by a SHA-256 hash of the rule file,
+so repeated scans with the same rule file skip compilation. Scanning reads the
+mapped regions of a process in chunks (see memory_regions.py) and runs the
+compiled rules over each chunk.
+
+Requires the optional yara-python package (pip install yara-python). When it
+is not installed, load_rules() returns None and callers fall back to
+process.search.yara().
+'''
+
+import os
+import hashlib
+from memory_regions import DEFAULT_CHUNK_SIZE, get_memory_regions, iter_region_chunks
+from region_hashes import iter_unknown_chunks
+
+try:
+    import yara
+except ImportError:
+    yara = None
+
+# Bytes of the previous chunk that are scanned again with the next one, so
+# matches crossing a chunk boundary are still found.
+DEFAULT_OVERLAP = 0x1000
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'memprocfs-skill', 'yara')
+
+
+def rules_digest(rule_file):
+    '''
+    Returns the SHA-256 hex digest of a rule file's contents.
+
+    :param rule_file: Path to the YARA rule file.
+    '''
+    sha256 = hashlib.sha256()
+    with open(rule_file, 'rb') as f:
+        for block in iter(lambda: f.read(0x10000), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_rules(rule_file, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Returns compiled YARA rules for a rule file, compiling them only if no
+    compiled copy for the same file contents is cached in cache_dir.
+
+    :param rule_file: Path to the YARA rule file.
+    :param cache_dir: Directory holding the compiled rules.
+    :return: A yara.Rules object, or None if yara-python is not installed.
+    '''
+    if yara is None:
+        return None
+
+    version = getattr(yara, '__version__', 'unknown')
+    cached_file = os.path.join(cache_dir, f"{rules_digest(rule_file)}-{version}.yarc")
+    if os.path.exists(cached_file):
+        try:
+            return yara.load(cached_file)
+        except yara.Error:
+            pass
+
+    rules = yara.compile(filepath=rule_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_file = f"{cached_file}.{os.getpid()}.tmp"
+    rules.save(temp_file)
+    os.replace(temp_file, cached_file)
+    return rules
+
+
+def iter_string_matches(match):
+    '''
+    Yields (identifier, offset, data) for every string instance of a yara.Match.
+    Supports both the yara-python >= 4.3 StringMatch objects and the older tuples.
+
+    :param match: A yara.Match object.
+    '''
+    for string in match.strings:
+        if isinstance(string, tuple):
+            offset, identifier, data = string
+            yield identifier, offset, data
+        else:
+            for instance in string.instances:
+                yield string.identifier, instance.offset, instance.matched_data
+
+
+def iter_match_hits(match):
+    '''
+    Yields (identifier, offset, data) for every string instance of a yara.Match,
+    or a single (None, None, b'') if the rule matched on its condition alone
+    (e.g. a rule without strings), so such matches are not lost.
+
+    :param match: A yara.Match object.
+    '''
+    found = False
+    for hit in iter_string_matches(match):
+        found = True
+        yield hit
+    if not found:
+        yield None, None, b''
+
+
+def scan_chunks(rules, chunks, overlap=DEFAULT_OVERLAP):
+    '''
+    Scans a sequence of memory chunks and yields each match once.
+
+    The last `overlap` bytes of a chunk are scanned again together with the
+    next contiguous chunk. A match is reported only if it ends past the start
+    of the new chunk, so matches found twice in the overlap are dropped. A rule
+    that matches without string instances is reported once per chunk, at the
+    start of the new chunk, with identifier None and empty data.
+
+    :param rules: A yara.Rules object.
+    :param chunks: An iterable of (address, data) tuples in address order.
+    :param overlap: Number of bytes carried over from the previous chunk.
+    :return: A generator of dicts with 'rule', 'identifier', 'offset' and 'data'.
+    '''
+    tail_address, tail = None, b''
+    for address, data in chunks:
+        if tail and tail_address + len(tail) == address:
+            buffer_address, buffer = address - len(tail), tail + data
+        else:
+            buffer_address, buffer = address, data
+
+        for match in rules.match(data=buffer):
+            for identifier, offset, matched in iter_match_hits(match):
+                if offset is None:
+                    # Rule-level match: report it at the first new byte, not in the carry-over.
+                    yield {'rule': match.rule, 'identifier': None, 'offset': address, 'data': b''}
+                elif buffer_address + offset + len(matched) > address or buffer_address == address:
+                    yield {'rule': match.rule, 'identifier': identifier,
+                           'offset': buffer_address + offset, 'data': matched}
+
+        if overlap:
+            tail = buffer[-overlap:]
+            tail_address = buffer_address + len(buffer) - len(tail)
+
+
+def limit_matches(matches, first_match=False, max_matches_per_rule=None, rule_count=None):
+    '''
+    Applies stop conditions to a match stream. Since the stream is lazy, no
+    further memory is read once a stop condition ends the iteration.
+
+    :param matches: An iterable of match dicts, see scan_chunks().
+    :param first_match: Stop after the first match.
+    :param max_matches_per_rule: Drop matches of a rule once it has this many.
+    :param rule_count: Optional number of rules; the scan stops once every rule reached its maximum.
+    '''
+    counts = {}
+    for match in matches:
+        count = counts.get(match['rule'], 0)
+        if max_matches_per_rule is not None and count >= max_matches_per_rule:
+            continue
+        counts[match['rule']] = count + 1
+        yield match
+        if first_match:
+            return
+        if (max_matches_per_rule is not None and rule_count is not None and len(counts) == rule_count
+                and all(n >= max_matches_per_rule for n in counts.values())):
+            return
+
+
+def count_rules(rules):
+    '''
+    Returns the number of rules in a yara.Rules object, or None if the installed
+    yara-python does not support iterating over the rules.
+    '''
+    try:
+        return sum(1 for _ in rules)
+    except TypeError:
+        return None
+
+
+def scan_process(process, rules, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, stats=None,
+                 first_match=False, max_matches_per_rule=None, known=None, chunk_hook=None):
+    '''
+    Scans the mapped memory of a process with compiled rules.
+
+    :param process: A memprocfs process object.
+    :param rules: A yara.Rules object.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param overlap: Number of bytes carried over between contiguous chunks.
+    :param stats: Optional dict; its 'bytes_scanned' entry is updated while scanning.
+    :param first_match: Stop scanning after the first match.
+    :param max_matches_per_rule: Report at most this many matches per rule.
+    :param known: Optional KnownGoodSet of pages that are not scanned; stats['bytes_skipped'] counts them.
+    :param chunk_hook: Optional function wrapping the iterator of (address, data) chunks, e.g. to pace the reads.
+    :return: A generator of match dicts, see scan_chunks().
+    '''
+    def counted(chunks):
+        for address, data in chunks:
+            if stats is not None:
+                stats['bytes_scanned'] = stats.get('bytes_scanned', 0) + len(data)
+            yield address, data
+
+    regions = get_memory_regions(process)
+    if known is not None:
+        chunks = iter_unknown_chunks(process, known, None, regions, chunk_size, stats=stats)
+    else:
+        chunks = iter_region_chunks(process, regions, chunk_size)
+    if chunk_hook is not None:
+        chunks = chunk_hook(chunks)
+    matches = scan_chunks(rules, counted(chunks), overlap)
+    if first_match or max_matches_per_rule is not None:
+        matches = limit_matches(matches, first_match, max_matches_per_rule, count_rules(rules))
+    return matches
@@ -1,75 +1,454 @@
 '''
 This script performs a YARA scan on a specified process.
 
-Usage: python yara_scan_process.py <process_name_or_pid> <yara_rule_file> [vmm_args...]
+In chunked mode the committed memory regions are scanned in overlapping chunks
+and matches are written in batches while the scan runs, optionally stopping
+early.
+In sweep mode all processes, or a filtered set, are scanned by a pool of
+worker threads with rules that are compiled once and cached on disk. Matches
+are streamed as JSONL while the sweep runs. With --jsonl, each finished
+process is checkpointed to '<output_file>.journal' (see job_journal.py), and
+rerunning the same sweep with --resume skips the processes already scanned.
+
+With --known-good the pages found in a known-good hash set, built from a
+clean baseline image by region_hashes.py, are not scanned (chunked and sweep
+modes, requires yara-python).
+
+The matches of a single process are written as a table, or as JSONL, CSV or
+Arrow with --format, to stdout or to a file with --output (see
+result_writers.py).
+
+Usage: python yara_scan_process.py <process_name_or_pid> <yara_rule_file> [--chunked] [--format <table|jsonl|csv|arrow>] [--output <file>] [scan_options...] [vmm_args...]
+       python yara_scan_process.py --sweep <pid_list|name_glob|all> <yara_rule_file> [--workers <n>] [--jsonl <output_file>] [--resume] [scan_options...] [vmm_args...]
+
+Scan options: [--chunk-size <bytes>] [--overlap <bytes>] [--first-match] [--max-matches-per-rule <n>] [--cache-dir <dir>] [--known-good <set_file>]
+
+Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>] (see vmm_profile.py)
 '''
 
-import memprocfs
+from vmm_session import open_vmm
+from vmm_profile import profiled, split_profile_args
 import sys
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dump_process_memory import resolve_processes
+from memory_regions import DEFAULT_CHUNK_SIZE, get_memory_regions
+from yara_rules import DEFAULT_CACHE_DIR, DEFAULT_OVERLAP, load_rules, rules_digest, scan_process
+from job_journal import JobJournal, image_identity
+from region_hashes import KnownGoodSet
+from result_writers import FORMATS, guess_format, open_writer
 
-def yara_scan_process(proc_identifier, rule_file, vmm_args):
+DEFAULT_WORKERS = 4
+
+# Columns of the match records of a single process.
+MATCH_FIELDS = ('pid', 'process', 'rule', 'identifier', 'offset', 'data', 'text')
+MATCH_TYPES = {'pid': 'int', 'rule': 'str', 'identifier': 'str', 'offset': 'hex', 'data': 'str', 'text': 'str'}
+
+# Printable ASCII, other bytes are shown as '.' in the text of a match.
+PRINTABLE = bytes(c if 0x20 <= c < 0x7f else 0x2e for c in range(256))
+
+def match_record(process, match):
+    '''
+    Returns the record of a YARA match, for a result writer.
+
+    :param process: The scanned process.
+    :param match: A match dict with 'rule', 'offset', 'data' and optionally 'identifier'.
+    '''
+    data = bytes(match['data'])
+    return {'pid': process.pid, 'process': process.name, 'rule': match['rule'],
+            'identifier': match.get('identifier'), 'offset': match['offset'], 'data': data.hex(),
+            'text': data.translate(PRINTABLE).decode('ascii')}
+
+def yara_scan_process(proc_identifier, rule_file, vmm_args, chunked=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                      overlap=DEFAULT_OVERLAP, first_match=False, max_matches_per_rule=None,
+                      cache_dir=DEFAULT_CACHE_DIR, known_good=None, output_format='table', output_file=None):
     '''
     Performs a YARA scan on a process's memory.
 
+    In chunked mode the mapped memory regions are read and scanned chunk by
+    chunk with compiled rules, and the matches are written in batches.
+    The first_match and max_matches_per_rule stop conditions end the scan
+    early so the rest of the process memory is not read.
+
     :param proc_identifier: The name or PID of the process to scan.
     :param rule_file: Path to the YARA rule file.
     :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param chunked: Scan the memory regions in chunks instead of with process.search.yara().
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param overlap: Number of bytes shared by contiguous chunks so boundary-crossing matches are kept.
+    :param first_match: Stop scanning after the first match (chunked mode).
+    :param max_matches_per_rule: Report at most this many matches per rule (chunked mode).
+    :param cache_dir: Directory holding the compiled rules.
+    :param known_good: Optional path of a known-good hash set; its pages are not scanned (chunked mode).
+    :param output_format: 'table', 'jsonl', 'csv' or 'arrow'.
+    :param output_file: Optional path of the output file; defaults to stdout.
     '''
     try:
         # Read YARA rules
-        with open(rule_file, 'r') as f:
-            yara_rules = f.read()
+        if chunked:
+            known = KnownGoodSet.load(known_good) if known_good else None
+            rules = load_rules(rule_file, cache_dir)
+            if rules is None:
+                print("Error: Chunked scanning requires the yara-python package (pip install yara-python).")
+                return
+        else:
+            known = None
+            with open(rule_file, 'r') as f:
+                rules = f.read()
 
-        # Initialize VMM
-        vmm = memprocfs.Vmm(vmm_args)
-        print(f"MemProcFS initialized with args: {vmm_args}")
+        out = open_writer(output_format, output_file, MATCH_FIELDS, MATCH_TYPES)
+        with out:
+            found = scan_to_writer(out, proc_identifier, rule_file, vmm_args, chunked, rules, chunk_size, overlap,
+                                   first_match, max_matches_per_rule, known)
+        if found is not None and output_file:
+            print(f"Wrote {found} matches to {output_file}")
 
-        # Find the process
-        try:
-            pid = int(proc_identifier)
-            process = vmm.process(pid)
-        except ValueError:
-            process = vmm.process(proc_identifier)
+    except FileNotFoundError:
+        print(f"Error: YARA rule file not found at {rule_file}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
 
-        if not process:
-            print(f"Error: Process '{proc_identifier}' not found.")
-            return
+def scan_to_writer(out, proc_identifier, rule_file, vmm_args, chunked, rules, chunk_size, overlap, first_match,
+                   max_matches_per_rule, known):
+    '''
+    Scans a process and writes its matches to a result writer; messages go to
+    out.messages.
 
-        print(f"Scanning process: {process.name} (PID: {process.pid}) with rules from {rule_file}")
+    :param out: An open ResultWriter.
+    :param rules: Compiled rules (chunked mode) or the rule source (process.search.yara()).
+    :return: The number of matches, or None if the process was not found.
+    '''
+    messages = out.messages
 
-        # Perform YARA scan
-        matches = process.search.yara(yara_rules)
+    # Initialize VMM
+    vmm = open_vmm(vmm_args)
+    print(f"MemProcFS initialized with args: {vmm_args}", file=messages)
 
-        if not matches:
-            print("No YARA matches found.")
-            return
+    # Find the process
+    try:
+        pid = int(proc_identifier)
+        process = vmm.process(pid)
+    except ValueError:
+        process = vmm.process(proc_identifier)
+
+    if not process:
+        print(f"Error: Process '{proc_identifier}' not found.", file=messages)
+        return None
+
+    print(f"Scanning process: {process.name} (PID: {process.pid}) with rules from {rule_file}", file=messages)
+
+    # Perform YARA scan
+    stats = {'bytes_scanned': 0, 'bytes_skipped': 0}
+    if chunked:
+        matches = scan_process(process, rules, chunk_size, overlap, stats, first_match, max_matches_per_rule, known)
+    else:
+        matches = process.search.yara(rules) or []
+
+    messages.flush()
+    found = 0
+    for match in matches:
+        found += 1
+        out.write(match_record(process, match))
+    out.flush()
+
+    if found:
+        print(f"{found} YARA matches found.", file=messages)
+    else:
+        print("No YARA matches found.", file=messages)
+    if chunked:
+        print(f"Scanned {stats['bytes_scanned']} bytes of process memory.", file=messages)
+        if known is not None:
+            print(f"Skipped {stats['bytes_skipped']} bytes of known-good pages.", file=messages)
+    return found
+
+def drop_unfinished_records(jsonl_file, finished):
+    '''
+    Rewrites a sweep's JSONL file with only the records of finished processes,
+    so processes scanned again on resume are not reported twice.
+
+    :param jsonl_file: Path of the JSONL output of an interrupted sweep.
+    :param finished: The PIDs of the processes whose records are complete.
+    '''
+    temp_file = f"{jsonl_file}.{os.getpid()}.tmp"
+    with open(jsonl_file, 'rb') as f, open(temp_file, 'wb') as out:
+        for line in f:
+            try:
+                if line.endswith(b'\n') and json.loads(line)['pid'] in finished:
+                    out.write(line)
+            except (ValueError, KeyError, TypeError):
+                pass
+    os.replace(temp_file, jsonl_file)
+
+def sweep_processes(processes, rules, emit, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                    overlap=DEFAULT_OVERLAP, first_match=False, max_matches_per_rule=None, known=None,
+                    rule_source=None, chunk_hook=None):
+    '''
+    Scans processes on a thread pool and passes every record to emit(): one
+    'match' record per match, then one 'process' record per process with the
+    number of matches, the bytes scanned and skipped and the scan time, or an
+    'error' record if the process could not be scanned. emit() is called from
+    the worker threads.
+
+    :param processes: The memprocfs process objects to scan.
+    :param rules: A yara.Rules object, or None to scan with process.search.yara().
+    :param emit: Function called with every record.
+    :param workers: The number of processes scanned at the same time.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param overlap: Number of bytes shared by contiguous chunks so boundary-crossing matches are kept.
+    :param first_match: Stop scanning a process after its first match.
+    :param max_matches_per_rule: Report at most this many matches per rule and process.
+    :param known: Optional KnownGoodSet of pages that are not scanned.
+    :param rule_source: The rule text, used when rules is None.
+    :param chunk_hook: Optional function wrapping the chunk iterator of every process, e.g. to pace the reads.
+    :return: A (matches, bytes scanned, bytes skipped) tuple for the scanned processes.
+    '''
+    def scan(process):
+        process_start = time.perf_counter()
+        stats = {'bytes_scanned': 0, 'bytes_skipped': 0}
+        if rules is not None:
+            matches = scan_process(process, rules, chunk_size, overlap, stats, first_match, max_matches_per_rule,
+                                   known, chunk_hook)
+        else:
+            stats['bytes_scanned'] = sum(size for _, size in get_memory_regions(process))
+            matches = process.search.yara(rule_source) or []
 
-        print("\n--- YARA Matches Found ---")
+        count = 0
         for match in matches:
-            print(f"Rule: {match['rule']}, Offset: {match['offset']:#x}")
-            # Print the matched data in a readable format
+            count += 1
+            emit({'type': 'match', 'pid': process.pid, 'process': process.name,
+                  'rule': match['rule'], 'identifier': match.get('identifier'),
+                  'offset': match['offset'], 'data': match['data'].hex()})
+
+        emit({'type': 'process', 'pid': process.pid, 'process': process.name, 'matches': count,
+              'bytes_scanned': stats['bytes_scanned'], 'bytes_skipped': stats['bytes_skipped'],
+              'seconds': round(time.perf_counter() - process_start, 3)})
+        return count, stats['bytes_scanned'], stats['bytes_skipped']
+
+    total_matches = total_bytes = total_skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(scan, process): process for process in processes}
+        for future in as_completed(futures):
+            process = futures[future]
             try:
-                print(f"  Matched String: {match['data'].decode('utf-8', errors='ignore')}")
-            except:
-                print(f"  Matched Data (hex): {match['data'].hex()}")
+                count, scanned, skipped = future.result()
+                total_matches += count
+                total_bytes += scanned
+                total_skipped += skipped
+            except Exception as e:
+                emit({'type': 'error', 'pid': process.pid, 'process': process.name, 'error': str(e)})
+    return total_matches, total_bytes, total_skipped
+
+def yara_sweep(target, rule_file, vmm_args, workers=DEFAULT_WORKERS, jsonl_file=None, cache_dir=DEFAULT_CACHE_DIR,
+               chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, first_match=False, max_matches_per_rule=None,
+               resume=False, known_good=None):
+    '''
+    Performs a YARA scan on the memory of many processes in parallel.
+
+    Every match is written as a JSONL record as soon as it is found, followed by
+    a per-process record with the number of matches, the bytes scanned and the
+    scan time. Progress messages go to stderr so the JSONL stream stays clean.
+
+    With yara-python installed the rules are compiled once (and cached on disk
+    by a hash of the rule file) and the process memory is scanned chunk by
+    chunk. Without it each process is scanned with process.search.yara().
+
+    With a JSONL file, a process is recorded in '<jsonl_file>.journal' once
+    its records are on disk. On resume the records of processes that were
+    interrupted are dropped from the JSONL file, the processes the journal
+    lists as complete are skipped and the rest are scanned and appended.
+
+    :param target: 'all', or a comma-separated list of PIDs and name globs.
+    :param rule_file: Path to the YARA rule file.
+    :param vmm_args: A list of arguments to initialize MemProcFS.
+    :param workers: The number of processes scanned at the same time.
+    :param jsonl_file: Optional path of the JSONL output; defaults to stdout.
+    :param cache_dir: Directory holding the compiled rules.
+    :param chunk_size: The maximum number of bytes read from memory at once.
+    :param overlap: Number of bytes shared by contiguous chunks so boundary-crossing matches are kept.
+    :param first_match: Stop scanning a process after its first match.
+    :param max_matches_per_rule: Report at most this many matches per rule and process.
+    :param resume: Continue the sweep recorded in the journal of jsonl_file.
+    :param known_good: Optional path of a known-good hash set; its pages are not scanned.
+    '''
+    try:
+        start_time = time.perf_counter()
+        if resume and not jsonl_file:
+            print("Error: --resume requires --jsonl <output_file>.", file=sys.stderr)
+            return
+
+        # Compile (or load the cached) YARA rules once for the whole sweep
+        rules = load_rules(rule_file, cache_dir)
+        rule_source = None
+        known = KnownGoodSet.load(known_good) if known_good else None
+        if rules is None and known is not None:
+            print("Error: --known-good requires the yara-python package (pip install yara-python).", file=sys.stderr)
+            return
+        if rules is None:
+            print("Warning: yara-python is not installed; MemProcFS compiles the rules for every process.", file=sys.stderr)
+            with open(rule_file, 'r') as f:
+                rule_source = f.read()
+
+        vmm = open_vmm(vmm_args)
+        print(f"MemProcFS initialized with args: {vmm_args}", file=sys.stderr)
+
+        processes = resolve_processes(vmm, target)
+        if not processes:
+            print(f"Error: No processes match '{target}'.", file=sys.stderr)
+            return
+
+        journal = None
+        finished = {}
+        if jsonl_file:
+            journal = JobJournal(jsonl_file + '.journal',
+                                 {'operation': 'yara_sweep', 'image': image_identity(vmm_args), 'target': target,
+                                  'rules': rules_digest(rule_file), 'first_match': first_match,
+                                  'max_matches_per_rule': max_matches_per_rule, 'known_good': known_good},
+                                 resume)
+            finished = {pid: record for pid, record in journal.completed().items() if record['status'] == 'done'}
+            if resume and os.path.exists(jsonl_file):
+                drop_unfinished_records(jsonl_file, finished)
+            if finished:
+                print(f"Resuming: {len(finished)} processes already scanned", file=sys.stderr)
+        processes = [process for process in processes if process.pid not in finished]
+
+        print(f"Scanning {len(processes)} processes with rules from {rule_file} using {workers} workers...", file=sys.stderr)
+
+        output = open(jsonl_file, 'a' if finished else 'w') if jsonl_file else sys.stdout
+        lock = threading.Lock()
+
+        def emit(record):
+            with lock:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+                # A process is complete once its records, this one last, are on disk
+                if journal and record['type'] == 'process':
+                    os.fsync(output.fileno())
+                    journal.append({'type': 'process', 'pid': record['pid'], 'status': 'done',
+                                    'matches': record['matches'], 'bytes_scanned': record['bytes_scanned'],
+                                    'bytes_skipped': record['bytes_skipped']})
+
+        total_matches = sum(record['matches'] for record in finished.values())
+        total_bytes = sum(record['bytes_scanned'] for record in finished.values())
+        total_skipped = sum(record.get('bytes_skipped', 0) for record in finished.values())
+        try:
+            matches, scanned, skipped = sweep_processes(processes, rules, emit, workers, chunk_size, overlap,
+                                                        first_match, max_matches_per_rule, known, rule_source)
+            total_matches += matches
+            total_bytes += scanned
+            total_skipped += skipped
+        finally:
+            if jsonl_file:
+                output.close()
+                journal.close()
+
+        wall_time = time.perf_counter() - start_time
+        skipped = f", {total_skipped} known-good bytes skipped" if known is not None else ""
+        print(f"Sweep finished: {total_matches} matches in {len(processes) + len(finished)} processes, "
+              f"{total_bytes} bytes scanned in {wall_time:.2f}s{skipped}", file=sys.stderr)
 
     except FileNotFoundError:
-        print(f"Error: YARA rule file not found at {rule_file}")
+        print(f"Error: YARA rule file not found at {rule_file}", file=sys.stderr)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        print(f"An error occurred: {e}", file=sys.stderr)
 
 if __name__ == "__main__":
+    sys.argv, profile_options = split_profile_args(sys.argv)
     if len(sys.argv) < 4:
-        print("Usage: python yara_scan_process.py <process_name_or_pid> <yara_rule_file> [vmm_args...]")
+        print("Usage: python yara_scan_process.py <process_name_or_pid> <yara_rule_file> [--chunked] [--format <table|jsonl|csv|arrow>] [--output <file>] [scan_options...] [vmm_args...]")
+        print("       python yara_scan_process.py --sweep <pid_list|name_glob|all> <yara_rule_file> [--workers <n>] [--jsonl <output_file>] [--resume] [scan_options...] [vmm_args...]")
+        print("Scan options: [--chunk-size <bytes>] [--overlap <bytes>] [--first-match] [--max-matches-per-rule <n>] [--cache-dir <dir>] [--known-good <set_file>]")
+        print("Profiling options: [--api-stats <file>] [--trace <file>] [--profile <file>]")
         print("Example: python yara_scan_process.py lsass.exe suspicious.yara -device memory.dmp")
+        print("Example: python yara_scan_process.py lsass.exe suspicious.yara --first-match -device memory.dmp")
+        print("Example: python yara_scan_process.py lsass.exe suspicious.yara --output matches.csv -device memory.dmp")
+        print("Example: python yara_scan_process.py --sweep all suspicious.yara --jsonl matches.jsonl -device memory.dmp")
+        print("Example: python yara_scan_process.py --sweep all suspicious.yara --jsonl matches.jsonl --resume -device memory.dmp")
+        print("Example: python yara_scan_process.py --sweep all suspicious.yara --known-good baseline.hashes -device memory.dmp")
         sys.exit(1)
 
-    process_id = sys.argv[1]
-    yara_file = sys.argv[2]
-    vmm_arguments = sys.argv[3:]
+    args = sys.argv[1:]
+    sweep_target = None
+    if args[0] == '--sweep':
+        sweep_target = args[1]
+        args = args[2:]
+
+    positional = args[:1] if sweep_target else args[:2]
+    vmm_arguments = []
+    worker_count = DEFAULT_WORKERS
+    jsonl_output = None
+    rules_cache_dir = DEFAULT_CACHE_DIR
+    chunked_scan = False
+    chunk = DEFAULT_CHUNK_SIZE
+    overlap_size = DEFAULT_OVERLAP
+    stop_at_first = False
+    max_per_rule = None
+    resume_job = False
+    known_good_file = None
+    output_format = None
+    output_path = None
+
+    # Parse arguments
+    i = len(positional)
+    while i < len(args):
+        if args[i] == '--workers' and i + 1 < len(args):
+            worker_count = int(args[i + 1])
+            i += 2
+        elif args[i] == '--jsonl' and i + 1 < len(args):
+            jsonl_output = args[i + 1]
+            i += 2
+        elif args[i] == '--cache-dir' and i + 1 < len(args):
+            rules_cache_dir = args[i + 1]
+            i += 2
+        elif args[i] == '--chunked':
+            chunked_scan = True
+            i += 1
+        elif args[i] == '--chunk-size' and i + 1 < len(args):
+            chunk = int(args[i + 1], 0)
+            i += 2
+        elif args[i] == '--overlap' and i + 1 < len(args):
+            overlap_size = int(args[i + 1], 0)
+            i += 2
+        elif args[i] == '--resume':
+            resume_job = True
+            i += 1
+        elif args[i] == '--first-match':
+            stop_at_first = True
+            i += 1
+        elif args[i] == '--max-matches-per-rule' and i + 1 < len(args):
+            max_per_rule = int(args[i + 1])
+            i += 2
+        elif args[i] == '--known-good' and i + 1 < len(args):
+            known_good_file = args[i + 1]
+            i += 2
+        elif args[i] == '--format' and i + 1 < len(args):
+            output_format = args[i + 1]
+            i += 2
+        elif args[i] == '--output' and i + 1 < len(args):
+            output_path = args[i + 1]
+            i += 2
+        else:
+            vmm_arguments.append(args[i])
+            i += 1
 
     if not vmm_arguments:
         print("Error: VMM arguments are required (e.g., '-device <path_to_dump>').")
         sys.exit(1)
 
-    yara_scan_process(process_id, yara_file, vmm_arguments)
+    output_format = output_format or guess_format(output_path)
+    if output_format not in FORMATS:
+        print(f"Error: Unknown output format '{output_format}' (available: {', '.join(FORMATS)}).")
+        sys.exit(1)
+
+    with profiled(**profile_options):
+        if sweep_target:
+            yara_sweep(sweep_target, positional[0], vmm_arguments, worker_count, jsonl_output, rules_cache_dir,
+                       chunk, overlap_size, stop_at_first, max_per_rule, resume_job, known_good_file)
+        else:
+            # Stop conditions and known-good filtering only apply to the chunked scan
+            chunked_scan = chunked_scan or stop_at_first or max_per_rule is not None or known_good_file is not None
+            yara_scan_process(positional[0], positional[1], vmm_arguments, chunked_scan, chunk, overlap_size,
+                              stop_at_first, max_per_rule, rules_cache_dir, known_good_file, output_format,
+                              output_path)